@@ -24,9 +24,9 @@ mainWindow.setCurrentModule('imscripting')
 time.sleep(2)
 
 getLogger().info('Stopping recording...')
-waitForRecordingToEnd = getWaitForSignal(api.imcontrol.signals().recordingEnded)
-api.imcontrol.stopRecording()  # It's important to call this after getWaitForSignal!
-waitForRecordingToEnd()
+recordingEnded = startAction(api.imcontrol.signals().recordingEnded,
+                             api.imcontrol.stopRecording)
+recordingEnded.result(timeout=60)
 
 getLogger().info('Recording stopped.')
 
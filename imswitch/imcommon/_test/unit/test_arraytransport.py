@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from imswitch.imcommon.model.arraytransport import (
+    availableFormats, decodeArray, encodeArray, negotiateFormat
+)
+
+
+arrays = {
+    'mono16': np.arange(480 * 640, dtype=np.uint16).reshape(480, 640),
+    'rgb8': np.random.default_rng(0).integers(0, 255, (32, 48, 3), dtype=np.uint8),
+    'stack': np.linspace(0, 1, 5 * 8 * 8, dtype=np.float32).reshape(5, 8, 8),
+    'bigEndian': np.arange(10, dtype='>i4'),
+}
+
+
+@pytest.mark.parametrize('arrayFormat', availableFormats())
+@pytest.mark.parametrize('name', arrays)
+def test_arrays_survive_encoding(arrayFormat, name):
+    array = arrays[name]
+    if arrayFormat == 'png' and name in ('stack', 'bigEndian'):
+        with pytest.raises(ValueError):
+            encodeArray(array, arrayFormat)
+        return
+
+    content, headers = encodeArray(array, arrayFormat)
+    decoded = decodeArray(content, headers)
+    np.testing.assert_array_equal(decoded, array)
+    assert decoded.dtype == array.dtype.newbyteorder('=') or decoded.dtype == array.dtype
+    if arrayFormat == 'raw':
+        assert len(content) == array.nbytes
+
+
+def test_binary_formats_are_smaller_than_json():
+    array = arrays['mono16']
+    json = str(array.tolist()).encode()
+    assert len(encodeArray(array, 'raw')[0]) < len(json) / 2
+    assert len(encodeArray(array, 'png')[0]) < len(encodeArray(array, 'raw')[0])
+
+
+def test_format_negotiation():
+    assert negotiateFormat(None) is None
+    assert negotiateFormat('*/*') is None  # e.g. the default of requests
+    assert negotiateFormat('application/x-npy') == 'npy'
+    assert negotiateFormat('application/json;q=0.5, image/tiff;q=0.9') == 'tiff'
+    assert negotiateFormat('text/html, */*;q=0.8, image/png;q=0.9') == 'png'
+    assert negotiateFormat('image/png', requestedFormat='raw') == 'raw'
+    assert negotiateFormat('image/png', requestedFormat='json') is None
+    with pytest.raises(ValueError):
+        negotiateFormat(requestedFormat='gif')
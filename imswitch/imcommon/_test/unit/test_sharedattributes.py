@@ -0,0 +1,82 @@
+import json
+import threading
+
+import pytest
+
+from imswitch.imcommon.model import SharedAttributes
+
+
+@pytest.fixture
+def attrs():
+    attrs = SharedAttributes()
+    attrs.emitted = []
+    attrs.changeSets = []
+    attrs.sigAttributeSet.connect(lambda key, value: attrs.emitted.append((key, value)))
+    attrs.sigAttributesChanged.connect(attrs.changeSets.append)
+    return attrs
+
+
+def test_batch_emits_one_coalesced_change_set(attrs):
+    attrs[('Laser', '488', 'Value')] = 1
+    with attrs.batch():
+        attrs[('Laser', '488', 'Value')] = 2
+        attrs[('Laser', '488', 'Value')] = 3
+        attrs[('Positioner', 'XY', 'X', 'Position')] = 10.0
+        assert attrs.changeSets == [{('Laser', '488', 'Value'): 1}]
+
+    assert attrs.changeSets[1] == {('Laser', '488', 'Value'): 3,
+                                   ('Positioner', 'XY', 'X', 'Position'): 10.0}
+    assert attrs.emitted == [(('Laser', '488', 'Value'), 1), (('Laser', '488', 'Value'), 3),
+                             (('Positioner', 'XY', 'X', 'Position'), 10.0)]
+    assert attrs.version == 2
+
+
+def test_failed_batch_is_rolled_back(attrs):
+    attrs[('Rec', 'Mode')] = 'Snap'
+    before = attrs.getJSON()
+    with pytest.raises(RuntimeError):
+        with attrs.batch():
+            attrs[('Rec', 'Mode')] = 'SpecFrames'
+            attrs[('Rec', 'Frames')] = 100
+            raise RuntimeError
+
+    assert dict(attrs) == {('Rec', 'Mode'): 'Snap'}
+    assert attrs.getHDF5Attributes() == {'Rec:Mode': 'Snap'}
+    assert attrs.getJSON() == before
+    assert len(attrs.changeSets) == 1
+
+
+def test_serialised_forms_follow_changes(attrs):
+    other = SharedAttributes()
+    other[('Scan', 'Stage', 'Size')] = [10, 20]
+    other[('Scan', 'TTL', 'Sequence')] = '0101'
+    attrs.update(other)
+    assert len(attrs.changeSets) == 1
+
+    attrs[('Scan', 'Stage', 'Size')] = [30, 40]
+    hdf5 = attrs.getHDF5Attributes()
+    assert hdf5 == {'Scan:Stage:Size': [30, 40], 'Scan:TTL:Sequence': '0101'}
+    hdf5['Scan:Stage:Size'] = None  # callers get a copy
+    assert json.loads(attrs.getJSON()) == {'Scan': {'Stage': {'Size': [30, 40]},
+                                                   'TTL': {'Sequence': '0101'}}}
+    assert attrs.getJSON() is attrs.getJSON()
+
+
+def test_batch_is_atomic_for_other_threads():
+    attrs = SharedAttributes()
+    inBatch = threading.Event()
+    seen = []
+
+    def read():
+        inBatch.wait()
+        seen.append(attrs.getHDF5Attributes())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    with attrs.batch():
+        attrs[('A', 'x')] = 1
+        inBatch.set()
+        reader.join(0.05)  # the reader waits for the batch
+        attrs[('A', 'y')] = 2
+    reader.join()
+    assert seen == [{'A:x': 1, 'A:y': 2}]
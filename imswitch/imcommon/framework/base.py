@@ -102,3 +102,8 @@ class FrameworkUtils(ABC):
     @abstractmethod
     def processPendingEventsCurrThread() -> None:
         pass
+
+    @staticmethod
+    @abstractmethod
+    def connectDirect(signal: Signal, func: Callable) -> None:
+        pass
@@ -54,3 +54,9 @@ class FrameworkUtils(base.FrameworkUtils):
         QtCore.QAbstractEventDispatcher.instance(
             QtCore.QThread.currentThread()
         ).processEvents(QtCore.QEventLoop.AllEvents)
+
+    @staticmethod
+    def connectDirect(signal, func):
+        """ Connects func so that it is called in the emitting thread, even
+        if the thread that connects it does not run an event loop. """
+        signal.connect(func, QtCore.Qt.DirectConnection)
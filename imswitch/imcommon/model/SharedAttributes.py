@@ -1,46 +1,91 @@
 import json
+import threading
+from contextlib import contextmanager
 
 from imswitch.imcommon.framework import Signal, SignalInterface
 
 
+_missing = object()
+
+
 class SharedAttributes(SignalInterface):
+    """ Attributes shared between controllers and stored as metadata with
+    recordings, keyed by tuples of strings.
+
+    Changes made in a batch() are applied atomically: other threads only see
+    them once the batch is done. sigAttributeSet is then emitted once for
+    every key that changed (with its final value), followed by a single
+    sigAttributesChanged with all changes; outside of a batch, every set emits
+    both. Listeners that act on changes connect to sigAttributesChanged, so
+    that they handle a batch at once. The HDF5 and JSON forms of the attributes are kept up to date as
+    attributes are set, so that they can be retrieved with every frame. """
+
     sigAttributeSet = Signal(object, object)  # (key, value)
+    sigAttributesChanged = Signal(object)  # ({key: value})
 
     def __init__(self):
         super().__init__()
         self._data = {}
+        self._hdf5 = {}
+        self._tree = {}
+        self._json = None
+        self._version = 0
+        self._lock = threading.RLock()
+        self._batchDepth = 0
+        self._changes = {}
+        self._originals = {}
+
+    @property
+    def version(self):
+        """ Number that is incremented with every change set, so that cached
+        metadata can be checked for changes. """
+        return self._version
 
     def getHDF5Attributes(self):
         """ Returns a dictionary of HDF5 attributes representing this object.
         """
-        attrs = {}
-        for key, value in self._data.items():
-            attrs[':'.join(key)] = value
-
-        return attrs
+        with self._lock:
+            return dict(self._hdf5)
 
     def getJSON(self):
         """ Returns a JSON representation of this instance. """
-        attrs = {}
-        for key, value in self._data.items():
-            parent = attrs
-            for i in range(len(key) - 1):
-                if key[i] not in parent:
-                    parent[key[i]] = {}
-                parent = parent[key[i]]
-
-            parent[key[-1]] = value
-
-        return json.dumps(attrs)
+        with self._lock:
+            if self._json is None:
+                self._json = json.dumps(self._tree)
+            return self._json
+
+    @contextmanager
+    def batch(self):
+        """ Context manager that applies all attributes set within it as one
+        change set. If the block raises, the changes are undone and nothing is
+        emitted. Batches can be nested; the outermost one emits the changes.
+        """
+        with self._lock:
+            self._batchDepth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batchDepth -= 1
+                if self._batchDepth == 0:
+                    self._rollback()
+                raise
+            self._batchDepth -= 1
+            if self._batchDepth > 0:
+                return
+            changes, self._changes, self._originals = self._changes, {}, {}
+            if changes:
+                self._version += 1
+        self._emit(changes)
 
     def update(self, data):
         """ Updates this object with the data in the given dictionary or
-        SharedAttributes object. """
+        SharedAttributes object, as one change set. """
         if isinstance(data, SharedAttributes):
             data = data._data
 
-        for key, value in data.items():
-            self[key] = value
+        with self.batch():
+            for key, value in data.items():
+                self[key] = value
 
     def __getitem__(self, key):
         self._validateKey(key)
@@ -48,20 +93,59 @@ class SharedAttributes(SignalInterface):
 
     def __setitem__(self, key, value):
         self._validateKey(key)
-        self._data[key] = value
-        self.sigAttributeSet.emit(key, value)
+        with self._lock:
+            if self._batchDepth > 0:
+                self._originals.setdefault(key, self._data.get(key, _missing))
+                self._set(key, value)
+                self._changes[key] = value
+                return
+            self._set(key, value)
+            self._version += 1
+        self._emit({key: value})
 
     def __iter__(self):
-        yield from self._data.items()
+        with self._lock:
+            items = list(self._data.items())
+        yield from items
+
+    def _set(self, key, value):
+        self._data[key] = value
+        self._hdf5[':'.join(key)] = value
+        parent = self._tree
+        for keySegment in key[:-1]:
+            if not isinstance(parent.get(keySegment), dict):
+                parent[keySegment] = {}
+            parent = parent[keySegment]
+        parent[key[-1]] = value
+        self._json = None
+
+    def _rollback(self):
+        for key, value in self._originals.items():
+            if value is _missing:
+                del self._data[key]
+            else:
+                self._data[key] = value
+        self._changes, self._originals = {}, {}
+        data, self._data, self._hdf5, self._tree = self._data, {}, {}, {}
+        for key, value in data.items():
+            self._set(key, value)
+
+    def _emit(self, changes):
+        if not changes:
+            return
+        for key, value in changes.items():
+            self.sigAttributeSet.emit(key, value)
+        self.sigAttributesChanged.emit(changes)
 
     @classmethod
     def fromHDF5File(cls, file, dataset):
         """ Loads the attributes from a HDF5 file into a SharedAttributes
         object. """
         attrs = cls()
-        for key, value in file[dataset].attrs.items():
-            keyTuple = tuple(key.split(':'))
-            attrs[keyTuple] = value
+        with attrs.batch():
+            for key, value in file[dataset].attrs.items():
+                keyTuple = tuple(key.split(':'))
+                attrs[keyTuple] = value
         return attrs
 
     @staticmethod
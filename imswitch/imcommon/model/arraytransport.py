@@ -0,0 +1,187 @@
+import json
+from io import BytesIO
+
+import numpy as np
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+SHAPE_HEADER = 'X-Array-Shape'
+DTYPE_HEADER = 'X-Array-Dtype'
+FORMAT_PARAMETER = 'arrayFormat'
+
+mediaTypes = {
+    'raw': 'application/x-numpy-raw',
+    'lz4': 'application/x-numpy-raw+lz4',
+    'zstd': 'application/x-numpy-raw+zstd',
+    'npy': 'application/x-npy',
+    'png': 'image/png',
+    'tiff': 'image/tiff',
+}
+""" Media types of the binary array formats, by format name. Raw formats
+are C-ordered little-endian buffers, whose shape and dtype are given in the
+X-Array-Shape and X-Array-Dtype headers. """
+
+
+def availableFormats():
+    """ Returns the names of the binary formats that can be used here; the
+    compressed ones need the optional lz4 and zstandard packages. """
+    return [arrayFormat for arrayFormat in mediaTypes
+            if not (arrayFormat == 'lz4' and lz4frame is None)
+            and not (arrayFormat == 'zstd' and zstandard is None)]
+
+
+def negotiateFormat(accept=None, requestedFormat=None):
+    """ Returns the binary format to send an array in, given the Accept
+    header of a request and the format requested explicitly (e.g. in a
+    query parameter), or None if it should be sent as JSON. Raises
+    ValueError if the requested format is not available. """
+    if requestedFormat is not None:
+        if requestedFormat == 'json':
+            return None
+        if requestedFormat not in availableFormats():
+            raise ValueError(f'Array format "{requestedFormat}" is not available, use one of'
+                             f' {["json"] + availableFormats()}')
+        return requestedFormat
+
+    # Use the most preferred of the accepted media types, the first one on ties
+    formatsByMediaType = {mediaTypes[arrayFormat]: arrayFormat
+                          for arrayFormat in availableFormats()}
+    best, bestQuality = None, 0.0
+    for entry in (accept or '').split(','):
+        mediaType, *parameters = [part.strip() for part in entry.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    pass
+        if mediaType in formatsByMediaType and quality > bestQuality:
+            best, bestQuality = formatsByMediaType[mediaType], quality
+        elif mediaType in ('application/json', '*/*') and quality > bestQuality:
+            best, bestQuality = None, quality
+    return best
+
+
+def encodeArray(array, arrayFormat):
+    """ Encodes array in arrayFormat. Returns the encoded bytes and the
+    headers to send them with, including Content-Type. Raises ValueError if
+    the array cannot be encoded in that format. """
+    array = np.asarray(array)
+    if array.dtype.hasobject or array.dtype.fields is not None:
+        raise ValueError(f'Arrays of dtype {array.dtype} cannot be sent as binary')
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+
+    if arrayFormat == 'raw':
+        content = array.tobytes()
+    elif arrayFormat == 'lz4' and lz4frame is not None:
+        content = lz4frame.compress(array.reshape(-1).view(np.uint8))
+    elif arrayFormat == 'zstd' and zstandard is not None:
+        content = zstandard.ZstdCompressor(level=3).compress(array.reshape(-1).view(np.uint8))
+    elif arrayFormat == 'npy':
+        buffer = BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        content = buffer.getvalue()
+    elif arrayFormat == 'png':
+        content = _encodePNG(array)
+    elif arrayFormat == 'tiff':
+        import tifffile
+        buffer = BytesIO()
+        tifffile.imwrite(buffer, array)
+        content = buffer.getvalue()
+    else:
+        raise ValueError(f'Array format "{arrayFormat}" is not available')
+
+    return content, {'Content-Type': mediaTypes[arrayFormat],
+                     SHAPE_HEADER: ','.join(str(length) for length in array.shape),
+                     DTYPE_HEADER: array.dtype.str}
+
+
+def decodeArray(content, headers):
+    """ Decodes an array sent with encodeArray, given the content and
+    headers of the response. A JSON response is returned as an array too.
+    """
+    headers = {key.lower(): value for key, value in headers.items()}
+    mediaType = headers.get('content-type', '').split(';')[0].strip()
+    arrayFormat = {value: key for key, value in mediaTypes.items()}.get(mediaType)
+
+    if arrayFormat in ('raw', 'lz4', 'zstd'):
+        if arrayFormat == 'lz4':
+            content = lz4frame.decompress(content)
+        elif arrayFormat == 'zstd':
+            content = zstandard.ZstdDecompressor().decompress(content)
+        shapeHeader = headers[SHAPE_HEADER.lower()]
+        shape = tuple(int(length) for length in shapeHeader.split(',')) if shapeHeader else ()
+        return np.frombuffer(content, dtype=headers[DTYPE_HEADER.lower()]).reshape(shape)
+    elif arrayFormat == 'npy':
+        return np.load(BytesIO(content), allow_pickle=False)
+    elif arrayFormat == 'png':
+        from PIL import Image
+        with Image.open(BytesIO(content)) as image:
+            array = np.array(image)
+        dtype = headers.get(DTYPE_HEADER.lower())
+        return array if dtype is None else array.astype(dtype, copy=False)
+    elif arrayFormat == 'tiff':
+        import tifffile
+        return tifffile.imread(BytesIO(content))
+    elif mediaType == 'application/json':
+        return np.asarray(json.loads(content))
+    raise ValueError(f'Cannot decode an array from content of type "{mediaType}"')
+
+
+def fetchArray(url, arrayFormat='raw', session=None, timeout=10, **params):
+    """ Calls an API endpoint of an ImSwitch server that returns an array,
+    e.g. fetchArray('https://localhost:8002/RecordingController/snapNumpy',
+    'zstd', verify=False), and returns the decoded array. Other keyword
+    arguments, like verify, are passed on to requests. """
+    import requests
+    requestArgs = {key: params.pop(key) for key in ('verify', 'cert', 'auth') if key in params}
+    response = (session or requests).get(
+        url, params={**params, FORMAT_PARAMETER: arrayFormat},
+        headers={'Accept': mediaTypes.get(arrayFormat, 'application/json')},
+        timeout=timeout, **requestArgs
+    )
+    response.raise_for_status()
+    return decodeArray(response.content, response.headers)
+
+
+def _encodePNG(array):
+    from PIL import Image
+    if array.dtype == np.uint16 and array.ndim == 2:
+        image = Image.fromarray(array.astype('<u2', copy=False))
+    elif array.dtype in (np.uint8, np.bool_) and (
+        array.ndim == 2 or (array.ndim == 3 and array.shape[2] in (3, 4))
+    ):
+        image = Image.fromarray(array.astype(np.uint8, copy=False))
+    else:
+        raise ValueError(f'Arrays of shape {array.shape} and dtype {array.dtype} cannot be sent'
+                         f' as PNG')
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
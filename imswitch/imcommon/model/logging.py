@@ -46,7 +46,10 @@ def initLogger(obj, *, instanceName=None, tryInheritParent=False):
                 continue
 
             parent = frameLocals['self']
-            parentRef = weakref.ref(parent)
+            try:
+                parentRef = weakref.ref(parent)
+            except TypeError:
+                continue  # e.g. objects with __slots__, which can't have a logger
             if parentRef not in objLoggers:
                 continue
 
@@ -4,7 +4,9 @@ from .BetterSlider import BetterSlider
 from .CheckableComboBox import CheckableComboBox
 from .FloatSlider import FloatSlider
 from .dialogtools import askYesNoQuestion, askForFilePath, askForFolderPath, askForTextInput, informationDisplay
-from .imagetools import bestLevels, minmaxLevels
+from .imagetools import (
+    bestLevels, minmaxLevels, subsample, subsampledMinmaxLevels, displayRegion
+)
 from .stylesheet import getBaseStyleSheet
 from .texttools import ordinalSuffix
 from .FileWatcher import FileWatcher
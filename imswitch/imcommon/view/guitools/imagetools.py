@@ -43,6 +43,57 @@ def minmaxLevels(arr):
     return minlevel, maxlevel
 
 
+def subsample(arr, maxSamples=2 ** 18):
+    """ Returns a strided view of the first two axes of arr with at most about
+    maxSamples pixels. """
+    step = int(np.ceil(np.sqrt(arr.shape[0] * arr.shape[1] / maxSamples)))
+    if step <= 1:
+        return arr
+    return arr[::step, ::step]
+
+
+def subsampledMinmaxLevels(arr, maxSamples=2 ** 18):
+    """ Same as minmaxLevels, but estimated from a strided subsample of arr, so
+    the cost does not grow with the sensor size. """
+    return minmaxLevels(subsample(arr, maxSamples))
+
+
+def displayRegion(imageShape, pixelSize, viewCenter, viewSize, zoom, margin=0.5):
+    """ Returns the part of an image worth drawing in a view, as (rowStart,
+    rowStop, colStart, colStop, step).
+
+    pixelSize is the (y, x) world size of a pixel, viewCenter the (y, x)
+    world coordinate at the centre of the view, viewSize the (height, width)
+    of the view in screen pixels and zoom the number of screen pixels per
+    world unit. step is the largest power of two that keeps at least one
+    image pixel per screen pixel. If the visible part, grown by margin on
+    each side, covers most of the image, the whole image is returned. """
+    height, width = imageShape[:2]
+    screenPerPixel = zoom * min(pixelSize)
+    step = 1
+    if screenPerPixel > 0:
+        step = 2 ** max(0, int(np.floor(np.log2(1 / screenPerPixel))))
+
+    rowStart, rowStop, colStart, colStop = 0, height, 0, width
+    if zoom > 0:
+        halfHeight = viewSize[0] / zoom / 2 * (1 + 2 * margin)
+        halfWidth = viewSize[1] / zoom / 2 * (1 + 2 * margin)
+        visibleRows = (int(np.floor((viewCenter[0] - halfHeight) / pixelSize[0])),
+                       int(np.ceil((viewCenter[0] + halfHeight) / pixelSize[0])))
+        visibleCols = (int(np.floor((viewCenter[1] - halfWidth) / pixelSize[1])),
+                       int(np.ceil((viewCenter[1] + halfWidth) / pixelSize[1])))
+        rows = max(0, visibleRows[0]), min(height, visibleRows[1])
+        cols = max(0, visibleCols[0]), min(width, visibleCols[1])
+        isVisible = rows[1] > rows[0] and cols[1] > cols[0]
+        coversMost = (rows[1] - rows[0]) * (cols[1] - cols[0]) > 0.75 * height * width
+        if isVisible and not coversMost:
+            # Align to the step so that the drawn pixels don't change when panning
+            rowStart, rowStop = rows[0] // step * step, rows[1]
+            colStart, colStop = cols[0] // step * step, cols[1]
+
+    return rowStart, rowStop, colStart, colStop, step
+
+
 # Copyright (C) 2017 Federico Barabas
 # This file is part of Tormenta.
 #
@@ -8,7 +8,7 @@ from vispy.color import Color
 from vispy.scene.visuals import Compound, Line, Markers
 from vispy.visuals.transforms import STTransform
 
-from .imagetools import minmaxLevels
+from .imagetools import subsampledMinmaxLevels
 
 
 def addNapariGrayclipColormap():
@@ -138,7 +138,7 @@ class NapariUpdateLevelsWidget(NapariBaseWidget):
 
     def _on_update_levels(self):
         for layer in self.viewer.layers.selection:
-            layer.contrast_limits = minmaxLevels(layer.data)
+            layer.contrast_limits = subsampledMinmaxLevels(layer.data)
 
 
 class NapariResetViewWidget(NapariBaseWidget):
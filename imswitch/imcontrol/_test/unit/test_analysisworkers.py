@@ -0,0 +1,66 @@
+import threading
+import time
+
+from imswitch.imcontrol.controller.analysisworkers import (
+    AnalysisWorker, DropPolicy, getAnalysisStatistics
+)
+
+
+def test_latest_frame_is_processed(qtbot):
+    release = threading.Event()
+
+    def analyse(frame):
+        release.wait(5)
+        return frame
+
+    delivered = []
+    worker = AnalysisWorker('test_latest', analyse)
+    worker.sigResultReady.connect(delivered.append)
+    try:
+        worker.submit(0)
+        time.sleep(0.1)  # Let the worker pick up the first frame
+        for frame in range(1, 10):
+            worker.submit(frame)
+
+        release.set()
+        qtbot.waitUntil(lambda: delivered[-1:] == [9], timeout=5000)
+        assert len(delivered) <= 2
+
+        stats = worker.getStatistics()
+        assert stats['submitted'] == 10
+        assert stats['processed'] == 2
+        assert stats['dropped'] == 8
+        assert 'test_latest' in getAnalysisStatistics()
+    finally:
+        worker.stop(wait=True)
+
+
+def test_skip_policy_keeps_waiting_frame(qtbot):
+    release = threading.Event()
+    processed = []
+
+    def analyse(frame):
+        release.wait(5)
+        processed.append(frame)
+
+    worker = AnalysisWorker('test_skip', analyse, dropPolicy=DropPolicy.Skip)
+    try:
+        worker.submit(0)
+        time.sleep(0.1)
+        assert worker.submit(1)
+        assert not worker.submit(2)
+        release.set()
+        qtbot.waitUntil(lambda: len(processed) == 2, timeout=5000)
+        assert processed == [0, 1]
+    finally:
+        worker.stop(wait=True)
+
+
+def test_target_rate_skips_frames():
+    worker = AnalysisWorker('test_rate', lambda frame: None, targetRate=1)
+    try:
+        assert worker.submit(0)
+        assert not worker.submit(1)
+        assert worker.getStatistics()['skipped'] == 1
+    finally:
+        worker.stop(wait=True)
@@ -0,0 +1,44 @@
+import numpy as np
+import scipy.ndimage as ndi
+
+from imswitch.imcontrol.model.dpc import DPCSolver
+
+
+def makeSolver(**kwargs):
+    return DPCSolver(wavelength=0.53, na=0.3, NAi=0.0, pixelsize=0.2, regU=1e-3, regP=1e-3, **kwargs)
+
+
+def simulate(solver, phase):
+    """ DPC images of a weak phase object, from the solver's own WOTFs. """
+    _, transferP = solver.getTransferFunctions(phase.shape)
+    contrast = np.fft.ifft2(transferP * np.fft.fft2(phase)).real
+    return 100 * (1 + contrast)
+
+
+def test_recovers_weak_phase_object():
+    rng = np.random.default_rng(0)
+    phase = ndi.gaussian_filter(rng.standard_normal((128, 128)), 4)
+    phase *= 0.05 / phase.std()
+    solver = makeSolver()
+    result = solver.solve(simulate(solver, phase))
+    assert result.shape == (1, 128, 128) and result.dtype == np.complex64
+    assert np.corrcoef(result[0].imag.ravel(), phase.ravel())[0, 1] > 0.9
+
+
+def test_batch_matches_single_time_points():
+    rng = np.random.default_rng(1)
+    images = rng.uniform(100, 200, (3, 4, 64, 64)).astype(np.float32)
+    solver = makeSolver()
+    batch = solver.solve(images)
+    for t in range(3):
+        assert np.allclose(batch[t], solver.solve(images[t])[0], atol=1e-5)
+
+
+def test_filters_are_cached_per_parameters():
+    solver = makeSolver(maxCachedFilters=2)
+    first = solver.getTransferFunctions((32, 32))[0]
+    assert solver.getTransferFunctions((32, 32))[0] is first
+    solver.setParameters(na=0.25)
+    assert solver.getTransferFunctions((32, 32))[0] is not first
+    solver.setParameters(na=0.3)
+    assert solver.getTransferFunctions((32, 32))[0] is first
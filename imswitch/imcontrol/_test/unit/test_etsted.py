@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.etsted import EventDetectionWorker, FrameRing
+
+
+def test_ring_is_bounded_and_reuses_slots():
+    ring = FrameRing(4)
+    for i in range(10):
+        ring.put(np.full((3, 3), i, dtype=np.uint16))
+    assert len(ring) == 4
+    assert [frame[0, 0] for frame in ring.stack()] == [6, 7, 8, 9]
+    assert [frame[0, 0] for frame in ring.history(9, 2)] == [7, 8]
+    with pytest.raises(KeyError):
+        ring.get(5)  # overwritten by frame 9
+
+    ring.clear()
+    assert len(ring) == 0 and ring.latestId is None
+    ring.put(np.zeros((2, 2)))  # another shape reallocates
+    assert ring.stack().shape == (1, 2, 2)
+
+
+def test_worker_processes_newest_frame_and_measures_latency():
+    release = threading.Event()
+    seen = []
+
+    def process(frame, history, latency):
+        release.wait()
+        seen.append((int(frame[0, 0]), len(history)))
+        latency.mark('pipeline')
+        if frame[0, 0] == 5:
+            latency.mark('scanTrigger')
+            return True
+        return False
+
+    worker = EventDetectionWorker(process, historyLength=3, slack=4)
+    worker.start()
+    worker.submit(np.full((4, 4), 0))
+    time.sleep(0.05)
+    for i in range(1, 6):  # arrive while frame 0 is being processed
+        worker.submit(np.full((4, 4), i))
+    release.set()
+    deadline = time.time() + 2
+    while worker.getStatistics()['processed'] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+
+    assert seen == [(0, 0), (5, 3)]
+    statistics = worker.getStatistics()
+    assert statistics['skipped'] == 4
+    assert statistics['events'] == 1
+    summary = worker.latencyLog.summary()
+    assert summary['events']['scanTrigger']['count'] == 1
+    assert summary['frames']['total']['max'] >= 40  # frame 0 waited for the release
+    assert worker.latencyLog.lastEvent().format().startswith('frame=5 queue=')
+
+
+def test_paused_worker_ignores_frames():
+    worker = EventDetectionWorker(lambda frame, history, latency: False)
+    worker.start()
+    worker.pause()
+    assert worker.submit(np.zeros((2, 2))) is None
+    worker.resume()
+    assert worker.submit(np.zeros((2, 2))) == 0
+    worker.stop()
+    assert worker.getStatistics()['received'] == 1
+
+
+def test_slow_pipeline_sees_unchanged_frames():
+    seen = []
+
+    def process(frame, history, latency):
+        before = [int(frame[0, 0])] + [int(previous[0, 0]) for previous in history]
+        time.sleep(0.1)  # frames keep arriving meanwhile
+        after = [int(frame[0, 0])] + [int(previous[0, 0]) for previous in history]
+        seen.append((before, after, np.all(frame == frame[0, 0])))
+        return False
+
+    worker = EventDetectionWorker(process, historyLength=10, slack=4)
+    worker.start()
+    for i in range(60):
+        worker.submit(np.full((8, 8), i, dtype=np.uint16))
+        time.sleep(0.005)
+    time.sleep(0.3)
+    worker.stop()
+
+    assert len(seen) >= 2
+    for before, after, uniform in seen:
+        assert before == after and uniform
+        assert before[1:] == list(range(before[0] - len(before) + 1, before[0]))
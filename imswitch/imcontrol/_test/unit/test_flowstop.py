@@ -0,0 +1,81 @@
+import concurrent.futures
+import json
+import threading
+import time
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcontrol.model.flowstop import FlowStopEngine, FlowStopWriter
+
+
+class Pump:
+    """ Pump whose moves take moveTime on a background thread. """
+
+    def __init__(self, moveTime):
+        self.moveTime = moveTime
+        self.moves = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def move(self, value, speed):
+        self.moves.append(time.perf_counter())
+        return self._executor.submit(time.sleep, self.moveTime)
+
+
+class SlowWriter:
+    def __init__(self, writeTime):
+        self.writeTime = writeTime
+        self.numWritten = 0
+        self.maxQueueLength = 0
+        self.lock = threading.Lock()
+
+    def write(self, frames, metadata):
+        def write():
+            time.sleep(self.writeTime)
+            with self.lock:
+                self.numWritten += len(frames)
+
+        threading.Thread(target=write).start()
+
+
+def test_writer_appends_frames_with_metadata(tmp_path):
+    path = str(tmp_path / 'flowstop.tif')
+    writer = FlowStopWriter(path)
+    for stop in range(3):
+        frames = [np.full((4, 5), stop * 2 + i, dtype=np.uint16) for i in range(2)]
+        writer.write(frames, [{'stopIndex': stop, 'frameIndex': i} for i in range(2)])
+    writer.close()
+
+    with tif.TiffFile(path) as tiff:
+        assert len(tiff.pages) == 6
+        assert [int(page.asarray()[0, 0]) for page in tiff.pages] == list(range(6))
+        assert json.loads(tiff.pages[3].description) == {'stopIndex': 1, 'frameIndex': 1}
+
+
+def test_engine_overlaps_saving_with_pumping():
+    pump = Pump(moveTime=0.05)
+    writer = SlowWriter(writeTime=0.1)
+    frame = np.zeros((4, 4), dtype=np.uint16)
+    engine = FlowStopEngine(pump.move, lambda n: [frame] * n, writer, numStops=5,
+                            volumePerStop=10, timeToStabilize=0.01, frameRate=0,
+                            framesPerStop=3)
+    stops = []
+    engine.sigStopDone.connect(lambda stop, numStops: stops.append(stop))
+
+    start = time.perf_counter()
+    engine.run()
+    duration = time.perf_counter() - start
+
+    # pumping and settling only; a serial loop would also spend 5 x 0.1 s writing
+    assert duration < 0.45
+    assert len(pump.moves) == 5
+    assert stops == [0, 1, 2, 3, 4]
+    assert engine.getStatistics()['frames'] == 15
+
+
+def test_engine_holds_frame_rate():
+    pump = Pump(moveTime=0)
+    engine = FlowStopEngine(pump.move, lambda n: [np.zeros((2, 2))], SlowWriter(0), numStops=3,
+                            volumePerStop=1, timeToStabilize=0, frameRate=20)
+    engine.run()
+    assert np.all(np.diff(pump.moves) >= 0.045)
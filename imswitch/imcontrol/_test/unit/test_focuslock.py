@@ -0,0 +1,110 @@
+import time
+
+import os
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.focuslock import FocusLockEngine, findPeak
+
+
+class FakeSetup:
+    """ Stage whose z position shifts a reflected spot along the columns of
+    the camera frame, 10 pixels per unit of z. """
+
+    def __init__(self, z=0.0):
+        self.z = z
+        self._rows, self._cols = np.mgrid[:64, :128]
+
+    def grabFrame(self):
+        col = 60 + 10 * self.z
+        spot = 1000 * np.exp(-((self._rows - 32) ** 2 + (self._cols - col) ** 2) / 18)
+        return (100 + spot).astype(np.uint16)
+
+    def getPosition(self):
+        return self.z
+
+    def moveRelative(self, value):
+        self.z += value
+
+
+def waitFor(condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_centroid_signal_follows_spot():
+    setup = FakeSetup()
+    engine = FocusLockEngine(setup.grabFrame, setup.getPosition, setup.moveRelative,
+                             smoothingSigma=2)
+    signal = engine.computeSignal(setup.grabFrame())
+    setup.z = 1.5
+    assert abs(engine.computeSignal(setup.grabFrame()) - signal - 15) < 0.5
+
+
+def test_find_peak_two_foci_picks_left_spot():
+    image = np.zeros((50, 200), dtype=np.float32)
+    image[20, 150] = 10
+    image[30, 40] = 5
+    assert tuple(findPeak(image, twoFoci=True, minDistance=20)) == (30, 40)
+
+
+def test_lock_restores_position():
+    setup = FakeSetup()
+    engine = FocusLockEngine(setup.grabFrame, setup.getPosition, setup.moveRelative,
+                             period=0.01, metric='centroid', smoothingSigma=2)
+    engine.start()
+    try:
+        assert waitFor(lambda: engine.latestFrame is not None)
+        engine.lock(kp=20, ki=5)
+        assert engine.locked
+
+        setup.z += 0.5
+        assert waitFor(lambda: abs(setup.z) < 0.05)
+        assert engine.locked
+    finally:
+        engine.stop()
+
+    statistics = engine.getStatistics()
+    assert statistics['iterations'] > 0
+    assert statistics['moves'] > 0
+    assert statistics['jitterStdMs'] is not None
+
+
+def test_lock_works_after_restart():
+    setup = FakeSetup()
+    engine = FocusLockEngine(setup.grabFrame, setup.getPosition, setup.moveRelative,
+                             period=0.01, metric='centroid', smoothingSigma=2)
+    engine.start()
+    engine.stop()
+    engine.start()
+    try:
+        assert waitFor(lambda: engine.latestFrame is not None)
+        engine.lock(kp=20, ki=5)
+        setup.z += 0.5
+        assert waitFor(lambda: abs(setup.z) < 0.05)
+    finally:
+        engine.stop()
+
+
+def test_jpg_signal_peaks_in_focus_on_virtual_microscope():
+    pytest.importorskip('NanoImagingPack')  # computes the defocus PSF of the virtual stage
+    from imswitch.imcontrol.model.managers.rs232.VirtualMicroscopeManager import (
+        VirtualMicroscopy
+    )
+    imagePath = os.path.join(os.path.dirname(__file__), '..', '..', '..', '_data', 'images',
+                             'histoASHLARStitch.jpg')
+    microscope = VirtualMicroscopy(filePath=imagePath)
+    microscope.illuminator.set_intensity(intensity=200)  # stays within 8 bits for JPEG
+    engine = FocusLockEngine(microscope.camera.getLast, lambda: 0, lambda value: None,
+                             metric='JPG')
+
+    signals = {}
+    for z in (-5, 0, 5):
+        microscope.positioner.move(z=z, is_absolute=True)
+        signals[z] = engine.computeSignal(microscope.camera.getLast())
+    assert signals[0] > signals[-5] and signals[0] > signals[5]
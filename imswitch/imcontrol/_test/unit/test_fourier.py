@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.fourier import AngularSpectrumPropagator, FFTMagnitude, binImage
+
+
+@pytest.mark.parametrize('shape', [(64, 64), (63, 65), (48, 80)])
+def test_fft_magnitude_matches_full_fft(shape):
+    image = np.random.default_rng(0).integers(1, 4096, shape).astype(np.uint16)
+    expected = np.fft.fftshift(np.log10(np.abs(np.fft.fft2(image))))
+    np.testing.assert_allclose(FFTMagnitude()(image), expected, atol=1e-4)
+
+
+def test_propagator_real_and_complex_inputs_agree():
+    field = np.random.default_rng(0).random((40, 50))
+    propagator = AngularSpectrumPropagator()
+    params = dict(dz=1e-4, pixelsize=3.45e-6, wavelength=488e-9, NA=0.3)
+    np.testing.assert_allclose(propagator(field, **params),
+                               propagator(field.astype(complex), **params), atol=1e-5)
+
+
+def test_propagator_caches_kernels():
+    propagator = AngularSpectrumPropagator()
+    kernel = propagator.getKernel((16, 16), 1e-4, 1e-6, 5e-7)
+    assert propagator.getKernel((16, 16), 1e-4, 1e-6, 5e-7) is kernel
+
+
+def test_bin_image():
+    assert np.array_equal(binImage(np.ones((5, 7)), 2), np.full((2, 3), 4))
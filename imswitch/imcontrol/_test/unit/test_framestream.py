@@ -0,0 +1,94 @@
+import os
+import time
+
+import numpy as np
+import pytest
+import serial
+
+from imswitch.imcontrol.model.interfaces.framestream import (
+    LatestFrame, MJPEGScanner, MJPEGStreamReader, SerialFrameReader
+)
+from imswitch.imcontrol.model.interfaces.mjpegsimulator import SimulatedMJPEGServer
+from imswitch.imcontrol.model.interfaces.serialsimulator import createSimulatedDevice
+
+
+def mjpegStream(server, numFrames):
+    parts = [b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + server.makeJPEG(i) + b'\r\n'
+             for i in range(numFrames)]
+    return parts, b''.join(parts)
+
+
+@pytest.fixture
+def mjpegServer():
+    server = SimulatedMJPEGServer(frameRate=100)
+    yield server
+    server.close()
+
+
+def test_scanner_finds_frames_split_anywhere(mjpegServer):
+    parts, stream = mjpegStream(mjpegServer, 5)
+    jpegs = [part[part.index(b'\xff\xd8'):part.rindex(b'\xff\xd9') + 2] for part in parts]
+
+    for chunkSize in (1, 7, 4096):
+        scanner = MJPEGScanner()
+        found = [scanner.feed(stream[i:i + chunkSize]) for i in range(0, len(stream), chunkSize)]
+        assert [jpeg for jpeg in found if jpeg is not None] == jpegs
+        assert scanner.numSkipped == 0
+        assert len(scanner._buffer) < 4
+
+    scanner = MJPEGScanner()
+    assert scanner.feed(stream) == jpegs[-1]
+    assert scanner.numFrames == 5 and scanner.numSkipped == 4
+
+
+def test_latest_frame_counts_dropped_frames():
+    frames = LatestFrame()
+    frames.put(1)
+    frames.put(2)  # 1 was never read
+    assert frames.get(returnFrameNumber=True) == (2, 1)
+    frames.put(3)
+    assert frames.waitForFrame(afterId=1, timeout=0.1) == (3, 2)
+    assert frames.waitForFrame(timeout=0.01) == (None, 2)
+    assert frames.numDropped == 1
+
+
+def test_mjpeg_reader_decodes_grayscale_at_stream_rate(mjpegServer):
+    reader = MJPEGStreamReader(mjpegServer.url + '/stream')
+    reader.start()
+    frame, frameId = reader.frames.waitForFrame(timeout=2)
+    time.sleep(0.5)
+    reader.stop()
+
+    assert frame.dtype == np.uint8 and frame.shape == (240, 320)
+    statistics = reader.getStatistics()
+    assert statistics['frames'] >= 30  # 100 frames per second are sent
+    assert statistics['decodeErrors'] == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs pseudo terminals')
+def test_serial_reader_reads_back_to_back_and_realigns():
+    device = createSimulatedDevice({'protocol': 'esp32cam', 'baudrate': None})
+    port = serial.Serial(device.openPty(), timeout=1)
+    reader = SerialFrameReader(port, 320, 240)
+    try:
+        numbers = []
+        for _ in range(3):
+            frame = reader.readFrame()
+            numbers.append(int(frame[0, 10]) + 256 * int(frame[0, 11]))
+        assert numbers == [0, 1, 2]
+
+        device.emit(b'garbage')  # the next frame arrives shifted
+        frame = reader.readFrame()
+        assert frame[0, 10] == 3 and reader.numResyncs == 1
+
+        reader.sendCommand('t250')
+        reader.start()
+        reader.frames.waitForFrame(timeout=2)
+        time.sleep(0.2)
+        reader.stop()
+        assert device.firmware.exposure == 250
+        assert reader.getStatistics()['frames'] > 5
+        assert reader.getStatistics()['errors'] == 0
+    finally:
+        port.close()
+        device.close()
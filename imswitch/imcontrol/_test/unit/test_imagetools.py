@@ -0,0 +1,34 @@
+import numpy as np
+
+from imswitch.imcommon.view.guitools import displayRegion, subsample, subsampledMinmaxLevels
+
+
+def test_subsample_limits_pixel_count():
+    image = np.zeros((4000, 3000), dtype=np.uint16)
+    assert subsample(image, maxSamples=1000).size <= 1100
+    assert subsample(image[:10, :10]).shape == (10, 10)
+
+
+def test_subsampled_levels():
+    image = np.full((2048, 2048), 100, dtype=np.uint16)
+    assert subsampledMinmaxLevels(image) == (0, 102)
+
+
+def test_display_region_full_view_is_subsampled():
+    # 4096 px image, 1 um pixels, shown in a 1024 px view zoomed to fit
+    region = displayRegion((4096, 4096), (1, 1), (2048, 2048), (1024, 1024), 0.25)
+    assert region == (0, 4096, 0, 4096, 4)
+
+
+def test_display_region_zoomed_in_is_cropped():
+    rowStart, rowStop, colStart, colStop, step = displayRegion(
+        (4096, 4096), (1, 1), (1000, 3000), (500, 500), 2
+    )
+    assert step == 1
+    # 250 px visible, plus half the view on each side
+    assert (rowStart, rowStop) == (750, 1250)
+    assert (colStart, colStop) == (2750, 3250)
+
+
+def test_display_region_off_screen_returns_whole_image():
+    assert displayRegion((100, 100), (1, 1), (1000, 1000), (100, 100), 1) == (0, 100, 0, 100, 1)
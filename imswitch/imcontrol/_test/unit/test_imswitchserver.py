@@ -0,0 +1,76 @@
+import os
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import requests
+import uvicorn
+
+from imswitch.imcommon.model import APIExport, arraytransport, generateAPI
+from imswitch.imcontrol.controller.server.ImSwitchServer import (
+    ImSwitchServer, _baseDataFilesDir, app
+)
+
+
+class ArrayController:
+    @APIExport()
+    def getTestImage(self, height: int = 4, width: int = 6) -> np.ndarray:
+        return np.arange(height * width, dtype=np.uint16).reshape(height, width)
+
+    @APIExport()
+    def getTestName(self) -> str:
+        return 'camera'
+
+
+@pytest.fixture(scope='module')
+def baseURL():
+    setupInfo = SimpleNamespace(pyroServerInfo=SimpleNamespace(name='test', host='127.0.0.1',
+                                                               port=0))
+    ImSwitchServer(generateAPI([ArrayController()]), setupInfo).createAPI()
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        app, host='127.0.0.1', port=port, log_level='warning',
+        ssl_keyfile=os.path.join(_baseDataFilesDir, 'ssl', 'key.pem'),
+        ssl_certfile=os.path.join(_baseDataFilesDir, 'ssl', 'cert.pem')
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield f'https://127.0.0.1:{port}/test_imswitchserver'
+    server.should_exit = True
+    thread.join(5)
+
+
+def test_arrays_are_sent_in_negotiated_format(baseURL):
+    expected = np.arange(12, dtype=np.uint16).reshape(3, 4)
+    url = f'{baseURL}/getTestImage'
+
+    response = requests.get(url, params={'height': 3, 'width': 4}, verify=False)
+    assert response.json() == expected.tolist()  # JSON stays the default
+
+    response = requests.get(url, params={'height': 3, 'width': 4}, verify=False,
+                            headers={'Accept': 'application/x-numpy-raw'})
+    assert response.headers['content-type'] == 'application/x-numpy-raw'
+    assert response.headers[arraytransport.SHAPE_HEADER] == '3,4'
+    assert len(response.content) == expected.nbytes
+
+    for arrayFormat in ('npy', 'png', 'tiff'):
+        np.testing.assert_array_equal(
+            arraytransport.fetchArray(url, arrayFormat, height=3, width=4, verify=False),
+            expected
+        )
+
+    response = requests.get(url, params={'arrayFormat': 'gif'}, verify=False)
+    assert response.status_code == 406
+
+    response = requests.get(f'{baseURL}/getTestName', verify=False,
+                            headers={'Accept': 'application/x-numpy-raw'})
+    assert response.json() == 'camera'  # other results are not affected
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcontrol.model.ism import (
+    ISMStreamWriter, PixelReassignmentPreview, findSpots, ismPatternIndex
+)
+
+
+def test_pattern_index_has_one_pixel_per_unit_cell():
+    for nFrame in (0, 17, 255):
+        pattern = np.zeros((256, 256))
+        pattern.flat[ismPatternIndex(nFrame)] = 1
+        cells = pattern.reshape(16, 16, 16, 16).sum(axis=(0, 2))
+        expected = np.zeros((16, 16))
+        expected[nFrame // 16, nFrame % 16] = 16 * 16
+        np.testing.assert_array_equal(cells, expected)
+
+
+def spotFrame(shape, spots, sigma=1.5):
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    frame = np.zeros(shape)
+    for sy, sx in spots:
+        frame += 1000 * np.exp(-((y - sy) ** 2 + (x - sx) ** 2) / (2 * sigma ** 2))
+    return frame.astype(np.uint16)
+
+
+def test_spots_are_found_and_reassigned():
+    spots = [(8, 8), (8, 24), (24, 8), (24, 24)]
+    frame = spotFrame((32, 32), spots)
+    np.testing.assert_array_equal(findSpots(frame), spots)
+
+    preview = PixelReassignmentPreview(radius=3)
+    assert preview.add(frame) == 4
+    image = preview.image()
+    assert image.shape == (64, 64)
+    assert np.argmax(image) == np.ravel_multi_index((16, 16), image.shape)
+    # on the grid of twice the sampling, reassigned spots are less than twice as wide
+    profile, widefield = image[16, 10:23], preview.widefield()[8, 5:12]
+    assert np.sum(profile > profile.max() / 2) < 2 * np.sum(widefield > widefield.max() / 2)
+    assert 0.8 * frame.sum() < image.sum() <= frame.sum()
+
+
+def test_stream_writer_writes_one_file_with_pattern_indices(tmp_path):
+    preview = PixelReassignmentPreview()
+    writer = ISMStreamWriter(str(tmp_path / 'ism.tif'), preview=preview)
+    for i in range(4):
+        writer.write(i, spotFrame((32, 32), [(8 + i, 8)]), {'frameId': 10 + i})
+    writer.close()
+
+    with tif.TiffFile(str(tmp_path / 'ism.tif')) as tiff:
+        assert len(tiff.pages) == 4
+        metadata = [json.loads(page.description) for page in tiff.pages]
+    assert [m['patternIndex'] for m in metadata] == [0, 1, 2, 3]
+    assert [m['frameId'] for m in metadata] == [10, 11, 12, 13]
+    assert preview.numFrames == 4
+    assert writer.getStatistics()['written'] == 4
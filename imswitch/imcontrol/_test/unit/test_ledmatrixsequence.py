@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.SetupInfo import LaserInfo, LEDMatrixInfo, RS232Info
+
+pytest.importorskip('uc2rest')
+# the simulated board is connected through a pseudo terminal
+pytestmark = pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs pseudo terminals')
+
+from imswitch.imcontrol.model.managers.LEDMatrixs.ESP32LEDMatrixManager import (  # noqa: E402
+    ESP32LEDMatrixManager
+)
+from imswitch.imcontrol.model.managers.lasers.ESP32LEDLaserManager import (  # noqa: E402
+    ESP32LEDLaserManager
+)
+from imswitch.imcontrol.model.managers.rs232.ESP32Manager import ESP32Manager  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def ledMatrix():
+    esp32 = ESP32Manager(RS232Info(managerName='ESP32Manager', managerProperties={
+        'serialport': 'simulated', 'simulator': {'commandTime': 0.001, 'numLEDs': 16}
+    }), 'ESP32')
+    ledMatrix = ESP32LEDMatrixManager(LEDMatrixInfo(
+        analogChannel=None, digitalLine=None, managerName='ESP32LEDMatrixManager', managerProperties={
+        'rs232device': 'ESP32', 'Nx': 4, 'Ny': 4
+    }), 'LEDMatrix', rs232sManager={'ESP32': esp32})
+    yield ledMatrix, esp32._simulator.firmware
+    esp32.finalize()
+
+
+def dpcPatterns():
+    patterns = np.zeros((4, 16, 3), dtype=np.uint8)
+    for i, ids in enumerate([[8, 9, 10, 11, 13, 14], [1, 2, 4, 5, 6, 7],
+                             [2, 4, 5, 11, 10, 13], [1, 6, 7, 8, 9, 14]]):
+        patterns[i, ids, 1] = 255
+    return patterns
+
+
+def shownPattern(firmware):
+    pattern = np.zeros((16, 3), dtype=np.uint8)
+    for i, rgb in firmware.ledArray.items():
+        pattern[i] = rgb
+    return pattern
+
+
+def test_sequence_is_cached_by_content(ledMatrix):
+    manager, _ = ledMatrix
+    key = manager.uploadPatternSequence(dpcPatterns())
+    assert manager.uploadPatternSequence(dpcPatterns().tolist()) == key
+    assert manager.uploadPatternSequence(dpcPatterns()[::-1]) != key
+    with pytest.raises(ValueError):
+        manager.setPatternSequenceIndex(0, key='unknown')
+
+
+def test_sequence_sends_changed_leds_only(ledMatrix, monkeypatch):
+    manager, firmware = ledMatrix
+    manager.setAll(state=(0, 0, 0))
+    patterns = dpcPatterns()
+    manager.uploadPatternSequence(patterns)
+
+    sentLeds = []
+    send = manager.mLEDmatrix.send_LEDMatrix_array
+
+    def recordingSend(array, **kwargs):
+        sentLeds.append(len(array))
+        return send(array, **kwargs)
+
+    monkeypatch.setattr(manager.mLEDmatrix, 'send_LEDMatrix_array', recordingSend)
+    for i in range(6):
+        assert manager.advancePatternSequence(getReturn=True) == i % 4
+        assert np.array_equal(shownPattern(firmware), patterns[i % 4])
+
+    assert sentLeds[0] == 16
+    changed = [np.sum(np.any(patterns[i % 4] != patterns[(i - 1) % 4], axis=1)) for i in range(1, 6)]
+    assert sentLeds[1:] == changed
+
+
+def test_other_commands_resend_the_whole_pattern(ledMatrix):
+    manager, firmware = ledMatrix
+    patterns = dpcPatterns()
+    manager.uploadPatternSequence(patterns)
+    manager.setPatternSequenceIndex(0, getReturn=True)
+    manager.setLEDSingle(indexled=0, state=1)
+    manager.setPatternSequenceIndex(0, getReturn=True)
+    assert np.array_equal(shownPattern(firmware), patterns[0])
+
+
+def test_led_laser_channel_resends_the_whole_pattern(ledMatrix):
+    manager, firmware = ledMatrix
+    led = ESP32LEDLaserManager(LaserInfo(
+        analogChannel=None, digitalLine=None, managerName='ESP32LEDLaserManager',
+        managerProperties={'rs232device': 'ESP32', 'channel_index': 'LED'},
+        valueRangeMin=0, valueRangeMax=255, wavelength=0
+    ), 'LED', rs232sManager={'ESP32': manager._rs232manager})
+    patterns = dpcPatterns()
+    manager.uploadPatternSequence(patterns)
+    manager.setPatternSequenceIndex(0, getReturn=True)
+
+    # all LEDs are lit through the setpoint coalescer of the shared link
+    led.setValue(255)
+    led.setEnabled(True)
+    assert led.flushSetpoints()
+    assert np.all(shownPattern(firmware) == 255)
+
+    manager.setPatternSequenceIndex(0, getReturn=True)
+    assert np.array_equal(shownPattern(firmware), patterns[0])
@@ -0,0 +1,50 @@
+import numpy as np
+import zarr
+
+from imswitch.imcontrol.model.lightsheet import FrameClock, PositionTrack, VolumeStore
+
+
+def test_frame_clock_spreads_chunks():
+    clock = FrameClock(start=0)
+    assert clock.timestamps(4, now=1).tolist() == [0.25, 0.5, 0.75, 1]
+    assert clock.timestamps(1, now=3).tolist() == [3]
+
+
+def test_position_track_interpolates_and_clamps():
+    track = PositionTrack()
+    track.addSample(100, timestamp=10)
+    track.addSample(300, timestamp=12)
+    assert track.interpolate([9, 11, 13]).tolist() == [100, 200, 300]
+
+
+def test_volume_store_streams_tiles(tmp_path):
+    store = VolumeStore(str(tmp_path / 'volume.zarr'), chunkPlanes=4, attrs={'pixelSizeUm': 0.5})
+    clock = FrameClock(start=0)
+    for tile, (numPlanes, chunkSize) in enumerate([(21, 3), (10, 5)]):
+        track = PositionTrack()
+        track.addSample(0, timestamp=0)
+        track.addSample(2 * numPlanes, timestamp=numPlanes)
+        clock = FrameClock(start=0)
+        store.startTile({'X': tile * 100, 'Y': 0})
+        for start in range(0, numPlanes, chunkSize):
+            frames = np.arange(start, min(start + chunkSize, numPlanes), dtype=np.uint16)
+            frames = np.broadcast_to(frames[:, None, None], (len(frames), 6, 8))
+            store.append(frames, clock.timestamps(len(frames), now=start + len(frames)))
+        assert store.finishTile(track) == 2
+    store.close()
+
+    root = zarr.open_group(str(tmp_path / 'volume.zarr'), mode='r')
+    assert root['data'].shape == (2, 21, 6, 8)
+    assert root['data'].chunks == (1, 4, 6, 8)
+    assert root['data'][0, :, 0, 0].tolist() == list(range(21))
+    assert root['data'][1, :10, 3, 3].tolist() == list(range(10))
+    assert np.all(root['data'][1, 10:] == 0)
+    assert root['positions'][0, :3].tolist() == [2, 4, 6]
+    assert root.attrs['planeCounts'] == [21, 10]
+    assert root.attrs['planeSpacings'] == [2, 2]
+    assert root.attrs['tilePositions'][1] == {'X': 100, 'Y': 0}
+    assert root.attrs['pixelSizeUm'] == 0.5
+
+    preview, step = store.preview(0, maxPlanes=5)
+    assert step == 5
+    assert preview[:, 0, 0].tolist() == [0, 5, 10, 15, 20]
@@ -0,0 +1,49 @@
+import os
+
+import h5py
+import numpy as np
+
+from imswitch.imcontrol.model.localisation import (
+    IncrementalHistogram, LocalisationPipeline, LocalisationTable
+)
+
+
+def brightestPixel(frameIndex, frame, threshold=0):
+    y, x = np.unravel_index(np.argmax(frame), frame.shape)
+    if frame[y, x] <= threshold:
+        return None
+    return np.array([[x + 0.5, y + 0.5, frame[y, x]]])
+
+
+def test_incremental_histogram():
+    histogram = IncrementalHistogram((4, 4), upsampling=2)
+    histogram.add([0.1, 0.1, 3.9, 10], [0.1, 0.1, 3.9, 0])
+    image = histogram.snapshot()
+    assert image.shape == (8, 8)
+    assert image[0, 0] == 2
+    assert image[7, 7] == 1
+    assert image.sum() == 3
+
+
+def test_pipeline_writes_all_localisations(tmpdir):
+    path = os.path.join(tmpdir, 'localisations.h5')
+    table = LocalisationTable(path, columns=['frame', 'x', 'y', 'intensity'])
+    pipeline = LocalisationPipeline((16, 16), np.uint16, brightestPixel,
+                                    {'threshold': 0}, table=table, upsampling=1,
+                                    batchSize=4, numWorkers=2, numBuffers=8)
+    numFrames = 10
+    for i in range(numFrames):
+        frame = np.zeros((16, 16), dtype=np.uint16)
+        frame[i, 15 - i] = 100 + i
+        assert pipeline.addFrame(frame)
+    pipeline.close()
+
+    assert pipeline.getStatistics()['framesDropped'] == 0
+    assert pipeline.numLocalisations == numFrames
+    assert pipeline.histogram.snapshot().sum() == numFrames
+
+    with h5py.File(path, 'r') as file:
+        assert list(file.attrs['columns']) == ['frame', 'x', 'y', 'intensity']
+        order = np.argsort(file['frame'][:])
+        assert np.array_equal(file['frame'][:][order], np.arange(numFrames))
+        assert np.array_equal(file['y'][:][order], np.arange(numFrames) + 0.5)
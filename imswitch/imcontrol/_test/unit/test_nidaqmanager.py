@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.SetupInfo import LaserInfo, NidaqInfo, PositionerInfo, SetupInfo
+
+pytest.importorskip('nidaqmx')
+
+from imswitch.imcontrol._test.ui import getApp  # noqa: E402
+from imswitch.imcontrol.model.managers.nidaqManager import NidaqManager  # noqa: E402
+from imswitch.imcontrol.model.scanstreaming import SignalStream  # noqa: E402
+
+
+@pytest.fixture
+def manager():
+    app = getApp()
+    setupInfo = SetupInfo(
+        lasers={'488': LaserInfo(analogChannel=None, digitalLine='Dev1/port0/line0',
+                                 managerName='NidaqLaserManager', managerProperties={},
+                                 valueRangeMin=0, valueRangeMax=1, wavelength=488)},
+        positioners={'X': PositionerInfo(analogChannel='Dev1/ao0', digitalLine=None,
+                                         managerName='NidaqPositionerManager',
+                                         managerProperties={}, axes=['X'])},
+        nidaq=NidaqInfo(simulated=True)
+    )
+    manager = NidaqManager(setupInfo, streamBufferChunks=2)
+    events = []
+    manager.sigScanStarted.connect(lambda: events.append('started'))
+    manager.sigScanDone.connect(lambda: events.append('done'))
+    manager.sigScanBuildFailed.connect(lambda: events.append('failed'))
+    yield manager, events, app
+    manager.stopScan()
+
+
+def makeSignalDic(numSamples):
+    return {'scanSignalsDict': {'X': np.linspace(-1, 1, numSamples)},
+            'TTLCycleSignalsDict': {'488': np.arange(numSamples) % 4 == 0}}
+
+
+def waitFor(app, condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            return False
+        app.processEvents()
+        time.sleep(0.01)
+    return True
+
+
+def test_streamed_scan_runs_to_the_end(manager):
+    manager, events, app = manager
+    stream = SignalStream.fromSignals(makeSignalDic(20000), chunkSize=2000)
+    manager.runScan(stream, {})
+    assert events == ['started'] and manager.busy
+    assert waitFor(app, lambda: 'done' in events)
+    assert not manager.busy and not manager.tasks
+    assert manager.getScanStatistics()['samples'] == 20000
+
+
+def test_continuous_scan_runs_until_stopped(manager, caplog):
+    manager, events, app = manager
+    manager.runContinuousScan(makeSignalDic(1000), {})
+    assert events == ['started']
+    time.sleep(0.05)
+    assert waitFor(app, lambda: manager.tasks['ao'].numGenerated > 2000)  # regenerated
+    assert manager.busy and 'done' not in events
+
+    manager.stopScan()
+    assert events == ['started', 'done'] and not manager.busy and not manager.tasks
+    assert not [r for r in caplog.records if r.levelname == 'ERROR']  # stopping is no error
+
+
+def test_underrun_stops_the_scan(manager, caplog):
+    manager, events, app = manager
+    frame = makeSignalDic(1000)
+
+    def makeChunks():
+        for i in range(10):
+            if i == 3:
+                time.sleep(0.2)  # e.g. a slow signal generator
+            yield frame
+
+    manager.runScan(SignalStream(['X'], ['488'], 10000, makeChunks, 1000), {})
+    assert waitFor(app, lambda: 'done' in events)
+    assert events.count('done') == 1 and not manager.busy and not manager.tasks
+    assert any('under-run' in r.getMessage() for r in caplog.records if r.levelname == 'ERROR')
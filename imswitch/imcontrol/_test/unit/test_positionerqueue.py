@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from imswitch.imcontrol.model.SetupInfo import PositionerInfo
+from imswitch.imcontrol.model.managers.positioners.PositionerManager import PositionerManager
+
+
+class LatencyStage(PositionerManager):
+    """ Stage whose moves take a fixed time, like a serial round trip. """
+
+    def __init__(self, latency):
+        info = PositionerInfo(analogChannel=None, digitalLine=None,
+                              managerName='LatencyStage', managerProperties={},
+                              axes=['X', 'Y', 'Z'], forPositioning=True)
+        super().__init__(info, 'stage', initialPosition={axis: 0 for axis in info.axes})
+        self.latency = latency
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def multiAxisMoves(self):
+        return ['XY', 'XYZ']
+
+    def move(self, value=0, axis='X', is_absolute=False, speed=None):
+        self.started.set()
+        self.release.wait()
+        time.sleep(self.latency)
+        self.calls.append((axis, value, is_absolute))
+        values = value if len(axis) > 1 else (value,)
+        for a, v in zip(axis, values):
+            self._position[a] = v if is_absolute else self._position[a] + v
+
+    def moveForever(self, speed=(0, 0, 0, 0), is_stop=False):
+        pass
+
+    def setSpeed(self, speed, axis=None):
+        pass
+
+
+def test_moves_resolve_in_order():
+    stage = LatencyStage(0.01)
+    futures = [stage.moveAsync(1, 'X') for _ in range(3)]
+    assert futures[-1].result(timeout=5)['X'] == 3
+    assert stage.waitForMoves(timeout=5)
+    assert stage.position['X'] == 3
+
+
+def test_queued_moves_are_merged():
+    stage = LatencyStage(0)
+    stage.release.clear()
+    first = stage.moveAsync(1, 'Z')
+    assert stage.started.wait(5)  # first move is running, the rest have to wait
+
+    futures = [stage.moveAsync(1, 'X'), stage.moveAsync(2, 'X'), stage.moveAsync(5, 'Y')]
+    absolute = stage.moveAsync(10, 'Z', is_absolute=True)
+    stage.release.set()
+
+    assert first.result(timeout=5)['Z'] == 1
+    assert all(future.result(timeout=5) == {'X': 3, 'Y': 5, 'Z': 1} for future in futures)
+    assert absolute.result(timeout=5)['Z'] == 10
+    assert stage.calls == [('Z', 1, False), ('XY', (3, 5), False), ('Z', 10, True)]
+    assert stage.getCommandQueueStatistics() == {'submitted': 5, 'executed': 3, 'merged': 2}
+
+
+def test_different_move_options_are_not_merged():
+    stage = LatencyStage(0)
+    stage.release.clear()
+    stage.moveAsync(1, 'X')
+    assert stage.started.wait(5)
+    stage.moveAsync(1, 'X', speed=100)
+    stage.moveAsync(1, 'X', speed=200)
+    stage.release.set()
+    assert stage.waitForMoves(timeout=5)
+    assert len(stage.calls) == 3
+
+
+class RelativeStage(LatencyStage):
+    """ Stage whose move() takes (dist, axis), like BSC203StageManager. """
+
+    def move(self, dist, axis):
+        self.calls.append((axis, dist))
+        self._position[axis] += dist
+
+
+def test_moves_are_queued_for_other_move_signatures():
+    stage = RelativeStage(0)
+    assert stage.moveAsync(2, 'Y').result(timeout=5)['Y'] == 2
+    assert stage.calls == [('Y', 2)]
+
+    with pytest.raises(ValueError):
+        stage.moveAsync(2, 'Y', is_absolute=True)
+    with pytest.raises(TypeError):
+        stage.moveAsync(2, 'Y', speed=100)
+
+
+def test_finalize_stops_the_queue():
+    stage = LatencyStage(0)
+    stage.release.clear()
+    running = stage.moveAsync(1, 'X')
+    assert stage.started.wait(5)
+    waiting = stage.moveAsync(1, 'Y')
+
+    threading.Timer(0.05, stage.release.set).start()
+    stage.finalize()
+    assert running.result(timeout=5)['X'] == 1 and waiting.cancelled()
+    assert not stage._PositionerManager__commandQueue._thread.is_alive()
+    with pytest.raises(RuntimeError):
+        stage.moveAsync(1, 'X')
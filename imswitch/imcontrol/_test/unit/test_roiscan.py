@@ -0,0 +1,73 @@
+import itertools
+import json
+
+import numpy as np
+import pytest
+import tifffile as tif
+
+from imswitch.imcontrol.model.roiscan import (
+    PositionStackWriter, ROIScanRound, ScanPosition, SettleModel, orderPositions, pathLength,
+    scanPositionsFromDicts
+)
+
+
+def test_order_visits_every_point_once():
+    points = np.random.default_rng(1).uniform(0, 1000, (40, 3))
+    order = orderPositions(points, start=(0, 0, 0))
+    assert sorted(order) == list(range(40))
+
+
+def test_order_is_optimal_for_small_sets():
+    points = np.random.default_rng(2).uniform(0, 1000, (7, 2))
+    start = (500, 500)
+    best = min(pathLength(points, perm, start) for perm in itertools.permutations(range(7)))
+    assert pathLength(points, orderPositions(points, start), start) <= best * 1.05
+
+
+def test_order_beats_list_order_on_a_plate():
+    # a 8 x 12 well plate saved column by column in a zigzag
+    wells = [(col * 9000, row * 9000, 0) for row in range(8) for col in range(12)]
+    points = np.array(wells)[np.random.default_rng(3).permutation(96)]
+    order = orderPositions(points, start=(0, 0, 0))
+    assert pathLength(points, order, (0, 0, 0)) < 0.2 * pathLength(points, range(96), (0, 0, 0))
+    assert pathLength(points, order, (0, 0, 0)) <= 96 * 9000 * 1.1
+
+
+def test_settle_time_grows_with_distance():
+    model = SettleModel(minTime=0.01, timePerDistance=1e-4, maxTime=0.3)
+    assert model.settleTime(0) == 0.01
+    assert model.settleTime(1000) == 0.11
+    assert model.settleTime(1e6) == 0.3
+
+
+def test_positions_without_id_get_free_ids():
+    positions = scanPositionsFromDicts([{"x": 0, "y": 0, "z": 0},
+                                        {"id": 1, "x": 1, "y": 0, "z": 0},
+                                        {"x": 2, "y": 0, "z": 0},
+                                        {"id": 3, "x": 3, "y": 0, "z": 0}])
+    assert [p.id for p in positions] == [2, 1, 4, 3]
+    with pytest.raises(ValueError):
+        scanPositionsFromDicts([{"id": 1, "x": 0, "y": 0, "z": 0},
+                                {"id": 1, "x": 1, "y": 0, "z": 0}])
+
+
+def test_rounds_append_to_one_file_per_position(tmp_path):
+    positions = [ScanPosition(i + 1, x, 0, 0) for i, x in enumerate([0, 300, 100, 200])]
+    moves = []
+    writer = PositionStackWriter(str(tmp_path), 'exp')
+    frameCounter = itertools.count()
+    scanRound = ROIScanRound(positions, moves.append,
+                             lambda: np.full((3, 3), next(frameCounter), dtype=np.uint16), writer,
+                             SettleModel(0, 0, 0), start=(0, 0, 0))
+    for roundIndex in range(3):
+        assert len(scanRound.run(roundIndex)) == 4
+    writer.close()
+
+    # rounds alternate direction, so no move is needed between rounds
+    assert [p.id for p in moves] == [3, 4, 2, 4, 3, 1, 3, 4, 2]
+    assert len(list(tmp_path.iterdir())) == 4
+    with tif.TiffFile(writer.filePath(2)) as tiff:
+        assert len(tiff.pages) == 3
+        metadata = [json.loads(page.description) for page in tiff.pages]
+    assert [m['round'] for m in metadata] == [0, 1, 2]
+    assert metadata[0]['x'] == 300 and metadata[0]['id'] == 2
@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+from imswitch.imcontrol.model.interfaces.daqsimulator import SimulatedDAQTask
+from imswitch.imcontrol.model.scanstreaming import OutputStreamer, SignalStream
+
+
+def makeSignalDic(numSamples):
+    return {'scanSignalsDict': {'X': np.linspace(-1, 1, numSamples),
+                                'Z': np.zeros(numSamples)},
+            'TTLCycleSignalsDict': {'488': np.arange(numSamples) % 4 == 0}}
+
+
+def test_frames_are_streamed_with_step_values():
+    stream = SignalStream.fromFrames(makeSignalDic(100), 3, stepSignals={'Z': [0.0, 0.5, 1.0]},
+                                     chunkSize=40)
+    chunks = list(stream)
+    assert stream.numSamples == 300 and len(chunks) == 9
+    assert [len(chunk['scanSignalsDict']['X']) for chunk in chunks[:3]] == [40, 40, 20]
+    assert all(np.all(chunk['scanSignalsDict']['Z'] == 0.5) for chunk in chunks[3:6])
+    assert set(stream.scanTargets) == {'X', 'Z'}
+    assert len(list(stream)) == 9  # can be iterated again
+
+
+def test_streamer_feeds_bounded_buffers_without_underrun():
+    signalDic = makeSignalDic(20000)
+    stream = SignalStream.fromSignals(signalDic, chunkSize=1000)
+    aoTask = SimulatedDAQTask('ao', 100000, numSamples=20000, bufferSize=4000,
+                              regenerate=False, recordOutput=True)
+    doTask = SimulatedDAQTask('do', 100000, numSamples=20000, bufferSize=4000,
+                              regenerate=False, recordOutput=True)
+    streamer = OutputStreamer(stream, [(aoTask, 'scanSignalsDict', ['X', 'Z'], float),
+                                       (doTask, 'TTLCycleSignalsDict', ['488'], bool)],
+                              prefillChunks=4)
+    streamer.prefill()
+    assert streamer.numSamples == 4000
+    aoTask.start()
+    doTask.start()
+    streamer.start()
+    aoTask.wait_until_done(5)
+    doTask.wait_until_done(5)
+    streamer.stop()
+
+    assert streamer.getStatistics()['samples'] == 20000 and not streamer.isUnderrun
+    np.testing.assert_array_equal(aoTask.output, [signalDic['scanSignalsDict']['X'],
+                                                  signalDic['scanSignalsDict']['Z']])
+    np.testing.assert_array_equal(doTask.output[0], signalDic['TTLCycleSignalsDict']['488'])
+
+
+def test_stalled_stream_is_an_underrun():
+    frame = makeSignalDic(1000)
+
+    def makeChunks():
+        for i in range(10):
+            if i == 3:
+                time.sleep(0.2)  # e.g. a slow signal generator
+            yield frame
+
+    stream = SignalStream(['X', 'Z'], ['488'], 10000, makeChunks, 1000)
+    task = SimulatedDAQTask('ao', 100000, numSamples=10000, bufferSize=2000, regenerate=False)
+    errors = []
+    streamer = OutputStreamer(stream, [(task, 'scanSignalsDict', ['X', 'Z'], float)],
+                              prefillChunks=2, onError=errors.append)
+    streamer.prefill()
+    task.start()
+    streamer.start()
+    streamer._thread.join(5)
+
+    assert streamer.isUnderrun and errors == [streamer.error]
+    assert task.numUnderruns == 1
+
+
+def test_continuous_task_regenerates_written_frame():
+    frame = np.arange(100, dtype=float)
+    task = SimulatedDAQTask('ao', 100000, recordOutput=True)
+    task.write(frame)
+    task.start()
+    time.sleep(0.05)
+    task.stop()
+
+    output = task.output[0]
+    assert task.numGenerated > 300 and task.numUnderruns == 0
+    np.testing.assert_array_equal(output, np.resize(frame, len(output)))
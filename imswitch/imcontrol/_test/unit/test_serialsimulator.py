@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+import pytest
+
+from imswitch.imcontrol.model.interfaces.serialsimulator import (
+    SimulatedRS232Driver, createSimulatedDevice
+)
+
+
+def readResponse(device):
+    """ Reads one "++" / JSON / "--" framed UC2 response. """
+    assert device.readline() == b'++\n'
+    response = json.loads(device.readline())
+    assert device.readline() == b'--\n'
+    return response
+
+
+def test_uc2_move_is_acknowledged_then_reported_done():
+    device = createSimulatedDevice({'protocol': 'uc2', 'baudrate': None})
+    start = time.monotonic()
+    device.write(json.dumps({'task': '/motor_act', 'qid': 3, 'motor': {'steppers': [
+        {'stepperid': 1, 'position': 2000, 'speed': 20000, 'isabs': 0}
+    ]}}) + '\n')
+
+    assert readResponse(device)['qid'] == 3
+    assert time.monotonic() - start < 0.05
+    done = readResponse(device)
+    assert done['steppers'] == [{'stepperid': 1, 'position': 2000, 'isDone': 1}]
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+    device.write('{"task": "/motor_get", "qid": 4}\n')
+    steppers = readResponse(device)['motor']['steppers']
+    assert [stepper['position'] for stepper in steppers] == [0, 2000, 0, 0]
+    device.close()
+
+
+def test_baudrate_limits_throughput():
+    device = createSimulatedDevice({'protocol': 'scripted', 'baudrate': 9600,
+                                    'defaultResponse': 'x' * 94})
+    start = time.monotonic()
+    device.write(b'a\n')
+    assert len(device.readline()) == 96
+    # 2 + 96 bytes at 10 bits per byte
+    assert time.monotonic() - start == pytest.approx(0.102, abs=0.03)
+    device.close()
+
+
+def test_grbl_full_planner_delays_ok():
+    device = createSimulatedDevice({'protocol': 'grbl', 'baudrate': None, 'plannerSize': 2})
+    start = time.monotonic()
+    for _ in range(4):
+        device.write(b'G91 G1 X1 F600\n')  # 0.1 s per move
+    times = []
+    for _ in range(4):
+        assert device.readline() == b'ok\n'
+        times.append(time.monotonic() - start)
+    assert times[1] < 0.05
+    assert times[2] == pytest.approx(0.1, abs=0.05)
+    assert times[3] == pytest.approx(0.2, abs=0.05)
+
+    device.write(b'?')
+    assert device.readline().startswith(b'<Run|MPos:')
+    time.sleep(0.25)
+    device.write(b'?')
+    assert device.readline() == b'<Idle|MPos:4.000,0.000,0.000|FS:600,0>\n'
+    device.close()
+
+
+def test_rs232_driver_queries():
+    device = createSimulatedDevice({'protocol': 'scripted', 'responses': {'*IDN?': 'SIM,1'}})
+    driver = SimulatedRS232Driver(device, {'send_termination': '\r', 'recv_termination': '\r\n'})
+    assert driver.query('*IDN?') == 'SIM,1'
+    driver.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs pseudo terminals')
+def test_pty_round_trip():
+    serial = pytest.importorskip('serial')
+    device = createSimulatedDevice({'protocol': 'uc2'})
+    port = serial.Serial(device.portInfo().device, 115200, timeout=2)
+    try:
+        port.write(b'{"task": "/state_get", "qid": 1}\n')
+        assert readResponse(port)['identifier_name'] == 'UC2_Feather'
+    finally:
+        port.close()
+        device.close()
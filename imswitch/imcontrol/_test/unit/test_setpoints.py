@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+import pytest
+
+from imswitch.imcontrol.model.SetupInfo import LaserInfo, RS232Info
+from imswitch.imcontrol.model.setpoints import SetpointCoalescer
+
+
+class RecordingSend:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(args)
+
+
+def test_single_request_is_sent_immediately():
+    send = RecordingSend()
+    coalescer = SetpointCoalescer(send=send, window=0.05)
+    coalescer.request(1, 10)
+    assert send.calls == [(1, 10)]
+    assert coalescer.getState(1)['applied'] == 10
+    coalescer.close()
+
+
+def test_burst_keeps_latest_value_per_channel():
+    send = RecordingSend()
+    coalescer = SetpointCoalescer(send=send, window=0.05)
+    start = time.monotonic()
+    for value in range(100):
+        coalescer.request(1, value)
+        coalescer.request(2, -value)
+    assert coalescer.flush()
+    assert time.monotonic() - start < 0.2
+
+    assert send.calls[0] == (1, 0)
+    assert set(send.calls[-2:]) == {(1, 99), (2, -99)}
+    assert len(send.calls) <= 5
+    state = coalescer.getState()
+    assert state[1]['applied'] == state[1]['requested'] == 99
+    assert not state[2]['pending']
+    assert coalescer.getStatistics()['coalesced'] >= 190
+    coalescer.close()
+
+
+def test_channels_are_batched_with_send_many():
+    send, sendMany = RecordingSend(), RecordingSend()
+    coalescer = SetpointCoalescer(send=send, sendMany=sendMany, window=0.05)
+    coalescer.request('A', 1)
+    coalescer.request('A', 2)
+    coalescer.request('B', 3)
+    assert coalescer.getState('B')['pending']
+    assert coalescer.flush()
+    assert send.calls == [('A', 1)]
+    assert sendMany.calls == [({'A': 2, 'B': 3},)]
+    coalescer.close()
+
+
+def test_failed_send_is_reported():
+    def send(channel, value):
+        raise IOError('link down')
+
+    coalescer = SetpointCoalescer(send=send, window=0.05)
+    coalescer.request(1, 5)
+    state = coalescer.getState(1)
+    assert state['requested'] == 5
+    assert state['applied'] is None
+    assert state['error'] == 'link down'
+    with pytest.raises(IOError):
+        coalescer.apply(1, 6)
+    assert coalescer.getStatistics()['errors'] == 2
+    coalescer.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs pseudo terminals')
+def test_esp32_laser_ramp_sends_few_commands():
+    pytest.importorskip('uc2rest')
+    from imswitch.imcontrol.model.managers.lasers.ESP32LEDLaserManager import (
+        ESP32LEDLaserManager
+    )
+    from imswitch.imcontrol.model.managers.rs232.ESP32Manager import ESP32Manager
+
+    esp32 = ESP32Manager(RS232Info(managerName='ESP32Manager', managerProperties={
+        'serialport': 'simulated', 'simulator': {'commandTime': 0.001}, 'setpointWindow': 0.05
+    }), 'ESP32')
+    try:
+        laser = ESP32LEDLaserManager(LaserInfo(
+            analogChannel=None, digitalLine=None, managerName='ESP32LEDLaserManager',
+            managerProperties={'rs232device': 'ESP32', 'channel_index': 1},
+            valueRangeMin=0, valueRangeMax=1023, wavelength=488
+        ), 'Laser488', rs232sManager={'ESP32': esp32})
+        firmware = esp32._simulator.firmware
+        laser.setEnabled(True)
+        numCommands = firmware.numCommands
+        for value in range(0, 1024, 8):
+            laser.setValue(value)
+        assert laser.flushSetpoints()
+        time.sleep(0.1)
+
+        assert firmware.lasers[1] == 1016
+        assert firmware.numCommands - numCommands <= 5
+        state = laser.getSetpointState()
+        assert state['requested'] == state['applied'] == 1016
+    finally:
+        esp32.finalize()
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.interfaces.simpatternserver import SimulatedPatternServer
+from imswitch.imcontrol.model.simacquisition import (
+    FrameGrabber, FrameSyncedSIMAcquisition, detectorFrameSource
+)
+
+pytest.importorskip('requests')
+
+from imswitch.imcontrol.controller.controllers.SIMController import SIMClient  # noqa: E402
+
+EXPOSURE = 0.02
+
+
+class FreeRunningCamera:
+    """ Exposes one frame every EXPOSURE seconds; a frame holds the pattern
+    shown during its whole exposure, or -1 if the pattern changed. """
+
+    def __init__(self, server):
+        self.server = server
+        self.frameId = -1
+        self.frame = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        start = time.time()
+        self.server.trigger(start)
+        while self.running:
+            stop = start + EXPOSURE
+            time.sleep(max(0.0, stop - time.time()))
+            self.server.trigger(stop)  # next exposure starts
+            patterns = self.server.patternsBetween(start, stop)
+            value = patterns.pop() if len(patterns) == 1 else -1
+            with self.condition:
+                self.frameId += 1
+                self.frame = np.full((4, 4), -2 if value is None else value)
+                self.condition.notify_all()
+            start = stop
+
+    def getLatestFrame(self, returnFrameNumber=True):
+        with self.condition:
+            frameId = self.frameId
+            self.condition.wait_for(lambda: self.frameId > frameId, timeout=1)
+            return self.frame, self.frameId
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+@pytest.fixture(params=[False, True], ids=['immediate', 'triggered'])
+def setup(request):
+    server = SimulatedPatternServer(triggered=request.param)
+    client = SIMClient('127.0.0.1', server.port)
+    camera = FreeRunningCamera(server)
+    grabber = FrameGrabber(camera.getLatestFrame)
+    grabber.start()
+    acquisition = FrameSyncedSIMAcquisition(client.display_pattern_async, grabber,
+                                            triggered=request.param)
+    yield acquisition, server
+    grabber.stop()
+    camera.stop()
+    client.close()
+    server.close()
+
+
+def test_every_frame_shows_its_pattern(setup):
+    acquisition, server = setup
+    time.sleep(3 * EXPOSURE)
+    for _ in range(3):
+        start = time.time()
+        stack, frameIds = acquisition.acquire()
+        cycleTime = time.time() - start
+
+        assert [frame[0, 0] for frame in stack] == list(range(9))
+        assert frameIds == sorted(frameIds)
+        if acquisition.triggered:
+            assert frameIds[-1] - frameIds[0] == 8
+            assert cycleTime < 14 * EXPOSURE
+        else:
+            assert cycleTime < 24 * EXPOSURE
+    assert acquisition.getStatistics()['stacks'] == 3
+    assert server.numRequests == 27
+
+
+def test_client_keeps_connection_open():
+    server = SimulatedPatternServer()
+    client = SIMClient('127.0.0.1', server.port)
+    try:
+        for i in range(3):
+            assert client.display_pattern(i) == {'pattern': i}
+        assert client.display_pattern_async(5).result(timeout=1) == {'pattern': 5}
+        assert server.pattern == 5
+        adapter = client.session.get_adapter(client.base_url)
+        assert len(adapter.poolmanager.pools) == 1
+    finally:
+        client.close()
+        server.close()
+
+
+class UnnumberedCamera:
+    """ Returns the last frame right away and without a frame number, like
+    most detector managers. """
+
+    def __init__(self):
+        self.start = time.time()
+        self.numCalls = 0
+
+    def getLatestFrame(self):
+        self.numCalls += 1
+        return np.full((4, 4), int((time.time() - self.start) / EXPOSURE))
+
+
+def test_grabber_numbers_frames_of_unnumbered_detectors():
+    camera = UnnumberedCamera()
+    grabber = FrameGrabber(detectorFrameSource(camera))
+    grabber.start()
+    try:
+        time.sleep(20 * EXPOSURE)
+        frames = [grabber.waitForFrame(i, timeout=1) for i in range(10)]
+    finally:
+        grabber.stop()
+    values = [frame[0, 0] for frame in frames]
+    assert values == sorted(set(values))  # every id is a new frame
+    assert camera.numCalls < 12 * 20  # not every millisecond, which were 20 per frame
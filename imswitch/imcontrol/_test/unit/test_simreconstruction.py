@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.simreconstruction import (
+    SIMCalibrationStore, SIMReconstructionService, carriersDrifted, estimateCarriers
+)
+
+
+def simStack(frequencies, phase0=0.3, modulation=0.8, shape=(128, 128)):
+    """ Nine frames of a random sample under three rotated gratings with
+    three phase steps each. """
+    rng = np.random.default_rng(0)
+    sample = 1 + 0.2 * rng.random(shape)
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    frames = []
+    for kx, ky in frequencies:
+        for step in range(3):
+            grating = 1 + modulation * np.cos(2 * np.pi * (kx * x + ky * y) + phase0
+                                              + 2 * np.pi * step / 3)
+            frames.append(100 * sample * grating)
+    return np.array(frames, dtype=np.float32)
+
+
+FREQUENCIES = [(0.2, 0.0), (-0.1, 0.173), (-0.1, -0.173)]
+
+
+def test_carriers_are_estimated():
+    carriers = estimateCarriers(simStack(FREQUENCIES))
+    np.testing.assert_allclose(carriers[:, :2], FREQUENCIES, atol=2e-3)
+    centrePhases = [0.3 + 2 * np.pi * 64 * (kx + ky) for kx, ky in FREQUENCIES]
+    np.testing.assert_allclose(np.angle(np.exp(1j * (carriers[:, 2] - centrePhases))), 0,
+                               atol=0.2)
+    np.testing.assert_allclose(carriers[:, 3], 0.8, atol=0.1)
+
+
+def test_drift_is_detected():
+    reference = estimateCarriers(simStack(FREQUENCIES))
+    same = estimateCarriers(simStack(FREQUENCIES))
+    shifted = estimateCarriers(simStack([(0.22, 0.0)] + FREQUENCIES[1:]))
+    dephased = estimateCarriers(simStack(FREQUENCIES, phase0=1.5))
+    assert not carriersDrifted(reference, same, (128, 128))
+    assert carriersDrifted(reference, shifted, (128, 128))
+    assert carriersDrifted(reference, dephased, (128, 128))
+
+
+def test_calibration_store_persists(tmp_path):
+    key = SIMCalibrationStore.makeKey('napari', 0.52, 1.4, 60, 6.5)
+    SIMCalibrationStore(str(tmp_path)).save(key, {'kx': np.ones((3, 1)), 'otf': None},
+                                            {'wavelength': 0.52})
+    arrays, metadata = SIMCalibrationStore(str(tmp_path)).load(key)
+    np.testing.assert_array_equal(arrays['kx'], np.ones((3, 1)))
+    assert 'otf' not in arrays
+    assert metadata['wavelength'] == 0.52
+    assert SIMCalibrationStore(str(tmp_path)).load('other') == (None, None)
+
+
+def test_service_keeps_every_stack_and_blocks_when_full():
+    release = threading.Event()
+
+    def reconstruct(stack):
+        release.wait()
+        return np.repeat(np.repeat(stack.mean(axis=0), 2, axis=0), 2, axis=1)
+
+    service = SIMReconstructionService(numWorkers=1, maxQueued=2)
+    futures = [service.submit(reconstruct, np.full((9, 4, 4), i, dtype=np.uint16))
+               for i in range(3)]  # one is running, two are queued
+    with pytest.raises(queue.Full):
+        service.submit(reconstruct, np.zeros((9, 4, 4)), block=False)
+
+    threading.Timer(0.1, release.set).start()
+    start = time.perf_counter()
+    futures.append(service.submit(reconstruct, np.full((9, 4, 4), 3, dtype=np.uint16)))
+    assert time.perf_counter() - start >= 0.05
+
+    results = [future.result(timeout=2) for future in futures]
+    assert [result[0, 0] for result in results] == [0, 1, 2, 3]
+    assert all(result.dtype == np.float32 and result.shape == (8, 8) for result in results)
+    statistics = service.getStatistics()
+    assert statistics['completed'] == 4
+    assert statistics['rejected'] == 1
+    assert statistics['blockedTime'] > 0
+    service.close()
+
+
+def test_service_results_are_not_copied_or_reused():
+    service = SIMReconstructionService(numWorkers=1, maxQueued=4)
+    outputs = []
+
+    def reconstruct(stack):
+        outputs.append(stack.sum(axis=0, dtype=np.float32))
+        return outputs[-1]
+
+    results = [service.submit(reconstruct, np.full((9, 4, 4), i)).result(timeout=2)
+               for i in range(3)]
+    assert all(result is output for result, output in zip(results, outputs))
+    assert [result[0, 0] for result in results] == [0, 9, 18]
+    service.close()
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.managers.SLMManager import Mask
+
+
+def referenceAberrations(mask, factors):
+    """ Aberration phase as computed with np.fromfunction before the Zernike
+    basis was cached. """
+    def rho(i, j):
+        return np.sqrt(((i - mask.centerx) / mask.radius) ** 2
+                       + ((j - mask.centery) / mask.radius) ** 2)
+
+    def phi(i, j):
+        return np.arctan2((j - mask.centery) / mask.radius, (i - mask.centerx) / mask.radius)
+
+    terms = {
+        'tilt': lambda i, j: 2 * rho(i, j) * np.sin(phi(i, j)),
+        'tip': lambda i, j: 2 * rho(i, j) * np.cos(phi(i, j)),
+        'defocus': lambda i, j: np.sqrt(3) * (2 * rho(i, j) ** 2 - 1),
+        'spherical': lambda i, j: np.sqrt(5) * (6 * (rho(i, j) ** 2) ** 4
+                                                - 6 * rho(i, j) ** 2 + 1),
+        'verticalComa': lambda i, j: (np.sqrt(8) * np.sin(phi(i, j))
+                                      * (3 * rho(i, j) ** 3 - 2 * rho(i, j))),
+        'horizontalComa': lambda i, j: (np.sqrt(8) * np.cos(phi(i, j))
+                                        * (3 * rho(i, j) ** 3 - 2 * rho(i, j))),
+        'verticalAstigmatism': lambda i, j: (np.sqrt(6) * np.cos(2 * phi(i, j))
+                                             * rho(i, j) ** 2),
+        'obliqueAstigmatism': lambda i, j: (np.sqrt(6) * np.sin(2 * phi(i, j))
+                                            * rho(i, j) ** 2),
+    }
+    phase = np.zeros((mask.height, mask.width))
+    for key, term in terms.items():
+        phase += factors[key] * np.fromfunction(term, (mask.height, mask.width), dtype='float')
+    return phase % (2 * math.pi)
+
+
+def makeFactors(**factors):
+    return {key: factors.get(key, 0.0)
+            for key in ('tilt', 'tip', 'defocus', 'spherical', 'verticalComa',
+                        'horizontalComa', 'verticalAstigmatism', 'obliqueAstigmatism')}
+
+
+@pytest.mark.parametrize('factors', [
+    makeFactors(tilt=1.0),
+    makeFactors(defocus=0.5, spherical=-0.2),
+    makeFactors(tilt=0.3, tip=-0.7, defocus=1.2, spherical=0.1, verticalComa=0.4,
+                horizontalComa=-0.6, verticalAstigmatism=0.8, obliqueAstigmatism=-0.25),
+])
+def test_aberrations_match_fromfunction_formula(factors):
+    mask = Mask(60, 80, 561)
+    mask.setCenter((25, 42))
+    mask.setRadius(30)
+    mask.setAberrationFactors(factors)
+    mask.setAberrations()
+
+    expected = np.rint(referenceAberrations(mask, factors) * mask.value_max / (2 * math.pi))
+    difference = np.abs(mask.image().astype(int) - expected.astype(int))
+    # Rounding may differ by one level, and 0 and value_max are both a phase of 0
+    assert np.all((difference <= 1) | (difference >= mask.value_max - 1))
+    assert np.mean(difference == 0) > 0.99
+
+
+def test_phase_lut_quantises_and_wraps_at_two_pi():
+    mask = Mask(1, 6, 561)
+    mask.setPhaseLut(16)
+    step = 2 * math.pi / 16
+    mask.img = np.array([[0.0, 0.5 * step, 1.5 * step, 15.5 * step,
+                          np.nextafter(np.float32(2 * math.pi), 0), 2 * math.pi]],
+                        dtype=np.float32)
+    mask.pi2uint8()
+
+    lut = np.round(np.arange(16) * mask.value_max / 16).astype(np.uint8)
+    np.testing.assert_array_equal(mask.image()[0], lut[[0, 0, 1, 15, 15, 0]])
+    assert mask.image().dtype == np.uint8
+
+    mask.setPhaseLut(None)
+    mask.img = np.array([[0.0, math.pi, 2 * math.pi]], dtype=np.float32)
+    mask.pi2uint8()
+    np.testing.assert_array_equal(mask.image()[0],
+                                  [0, round(mask.value_max / 2), mask.value_max])
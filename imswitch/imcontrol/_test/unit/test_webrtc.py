@@ -0,0 +1,66 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip('aiortc')
+
+from aiortc import RTCPeerConnection  # noqa: E402
+
+from imswitch.imcontrol.model.webrtc import DetectorVideoTrack, StreamFrameScaler  # noqa: E402
+
+
+def test_scaler_scales_12bit_into_luma_plane():
+    frame = np.tile(np.linspace(0, 4095, 300), (200, 1)).astype(np.uint16)
+    array, format = StreamFrameScaler(maxWidth=150, maxHeight=150)(frame)
+    assert format == 'yuv420p'
+    assert array.shape == (150, 150)  # 100 luma rows + 50 chroma rows
+    assert array[:100].min() == 0 and array[:100].max() == 255
+    assert np.all(array[100:] == 128)
+
+
+def test_scaler_keeps_colour_frames():
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    array, format = StreamFrameScaler()(frame)
+    assert format == 'rgb24'
+    assert array.shape == (64, 64, 3)
+
+
+def test_track_paces_frames():
+    frame = np.random.default_rng(0).integers(0, 4096, (480, 640)).astype(np.uint16)
+    track = DetectorVideoTrack(lambda: frame, fps=50, maxWidth=320, maxHeight=320)
+
+    async def receive(numFrames):
+        return [await track.recv() for _ in range(numFrames)]
+
+    frames = asyncio.run(receive(5))
+    track.stop()
+    assert [(f.width, f.height) for f in frames] == [(320, 240)] * 5
+    assert np.diff([f.pts for f in frames]).tolist() == [1800] * 4
+    assert track.getStatistics()['framesSent'] == 5
+
+
+def test_loopback_stream():
+    frame = np.random.default_rng(0).integers(0, 4096, (600, 800)).astype(np.uint16)
+
+    async def stream():
+        sender, receiver = RTCPeerConnection(), RTCPeerConnection()
+        track = DetectorVideoTrack(lambda: frame, fps=30, maxWidth=400, maxHeight=400)
+        sender.addTrack(track)
+        received = asyncio.get_running_loop().create_future()
+        receiver.on('track', lambda remoteTrack: received.set_result(remoteTrack))
+
+        await sender.setLocalDescription(await sender.createOffer())
+        await receiver.setRemoteDescription(sender.localDescription)
+        await receiver.setLocalDescription(await receiver.createAnswer())
+        await sender.setRemoteDescription(receiver.localDescription)
+        try:
+            remoteTrack = await asyncio.wait_for(received, 10)
+            remoteFrame = await asyncio.wait_for(remoteTrack.recv(), 10)
+            return remoteFrame.width, remoteFrame.height
+        finally:
+            await sender.close()
+            await receiver.close()
+            track.stop()
+
+    assert asyncio.run(stream()) == (400, 300)
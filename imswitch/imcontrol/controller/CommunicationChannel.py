@@ -5,6 +5,7 @@ import numpy as np
 from imswitch.imcommon.framework import Signal, SignalInterface
 from imswitch.imcommon.model import pythontools, APIExport, SharedAttributes
 from imswitch.imcommon.model import initLogger
+from .analysisworkers import getAnalysisStatistics
 
 import numpy as np
 from PIL import Image
@@ -181,6 +182,13 @@ class CommunicationChannel(SignalInterface):
         image = self.get_image()
         self.output.append(image)
 
+    @APIExport()
+    def getAnalysisStatistics(self) -> Mapping[str, Mapping[str, float]]:
+        """ Returns processing counters (submitted, processed, dropped,
+        skipped, coalesced frames) and latencies of the live analysis workers
+        of all plugins, by worker name. """
+        return getAnalysisStatistics()
+
     def runScript(self, text):
         self.output = []
         self._scriptExecution = True
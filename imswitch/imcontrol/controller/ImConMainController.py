@@ -101,6 +101,10 @@ class ImConMainController(MainController):
     def shortcuts(self):
         return self.__shortcuts
 
+    @property
+    def commChannel(self):
+        return self.__commChannel
+
     def loadParamsFromHDF5(self):
         """ Set detector, positioner, laser etc. params from values saved in a
         user-picked HDF5 snap/recording. """
@@ -49,7 +49,7 @@ class MasterController:
         self.simManager = SIMManager(self.__setupInfo.sim)
         self.dpcManager = DPCManager(self.__setupInfo.dpc)
         self.mctManager = MCTManager(self.__setupInfo.mct)
-        self.nidaqManager = NidaqManager(self.__setupInfo.nidaq)
+        self.nidaqManager = NidaqManager(self.__setupInfo)
         self.roiscanManager = ROIScanManager(self.__setupInfo.roiscan)
         self.lightsheetManager = LightsheetManager(self.__setupInfo.lightsheet)
         self.webrtcManager = WebRTCManager(self.__setupInfo.webrtc)
@@ -0,0 +1,208 @@
+import enum
+import threading
+import time
+import weakref
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+
+class DropPolicy(enum.Enum):
+    """ What an AnalysisWorker does with an incoming frame while another frame
+    is still waiting to be processed. """
+
+    Latest = 'latest'
+    """ Replace the waiting frame with the incoming one. """
+
+    Skip = 'skip'
+    """ Keep the waiting frame and drop the incoming one. """
+
+
+class AnalysisWorker(SignalInterface):
+    """ Runs an analysis function on live frames on a small pool of worker
+    threads.
+
+    Frames are passed through a single-slot mailbox, so a slow analysis never
+    builds up a backlog, and frames arriving faster than the target rate are
+    skipped before they are queued. Results are coalesced: if the UI thread
+    has not yet picked up the previous result, it is replaced by the newer
+    one, and sigResultReady is emitted once on the UI thread. """
+
+    sigResultReady = Signal(object)  # (result)
+    _sigResultPending = Signal()
+
+    def __init__(self, name, func, numWorkers=1, targetRate=None,
+                 dropPolicy=DropPolicy.Latest):
+        super().__init__()
+        self.__logger = initLogger(self, instanceName=name)
+
+        self.name = name
+        self._func = func
+        self._dropPolicy = DropPolicy(dropPolicy)
+        self._targetPeriod = None
+        self.setTargetRate(targetRate)
+
+        self._cond = threading.Condition()
+        self._running = True
+        self._pending = None  # (seq, submitTime, args)
+        self._lastAccepted = 0.0
+        self._seq = 0
+
+        self._resultLock = threading.Lock()
+        self._result = None
+        self._resultSeq = -1
+        self._resultPending = False
+
+        self._numSubmitted = 0
+        self._numProcessed = 0
+        self._numDropped = 0
+        self._numSkipped = 0
+        self._numCoalesced = 0
+        self._numErrors = 0
+        self._latency = None
+        self._processingTime = None
+
+        self._sigResultPending.connect(self._deliverResult)
+
+        self._threads = []
+        for i in range(max(1, numWorkers)):
+            thread = threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        _workers.add(self)
+
+    def setTargetRate(self, targetRate):
+        """ Sets the maximum number of frames per second that are accepted for
+        processing. None or 0 accepts every frame. """
+        self._targetPeriod = 1 / targetRate if targetRate else None
+
+    def submit(self, *args):
+        """ Offers a frame (or any arguments of the analysis function) for
+        processing. Returns whether it was accepted. Never blocks. """
+        now = time.perf_counter()
+        with self._cond:
+            self._numSubmitted += 1
+            if (self._targetPeriod is not None
+                    and now - self._lastAccepted < self._targetPeriod):
+                self._numSkipped += 1
+                return False
+
+            if self._pending is not None:
+                self._numDropped += 1
+                if self._dropPolicy == DropPolicy.Skip:
+                    return False
+
+            self._seq += 1
+            self._pending = (self._seq, now, args)
+            self._lastAccepted = now
+            self._cond.notify()
+            return True
+
+    def getStatistics(self):
+        """ Returns processing counters and latencies (in milliseconds, as
+        exponential moving averages) of this worker. """
+        with self._cond:
+            return {
+                'submitted': self._numSubmitted,
+                'processed': self._numProcessed,
+                'dropped': self._numDropped,
+                'skipped': self._numSkipped,
+                'coalesced': self._numCoalesced,
+                'errors': self._numErrors,
+                'latencyMs': None if self._latency is None else self._latency * 1e3,
+                'processingMs': (None if self._processingTime is None
+                                 else self._processingTime * 1e3)
+            }
+
+    def stop(self, wait=False):
+        """ Stops the worker threads. The frame currently being processed is
+        finished; a waiting frame is discarded. """
+        with self._cond:
+            self._running = False
+            self._pending = None
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                seq, submitTime, args = self._pending
+                self._pending = None
+
+            startTime = time.perf_counter()
+            try:
+                result = self._func(*args)
+            except Exception:
+                self.__logger.exception('Analysis failed')
+                with self._cond:
+                    self._numErrors += 1
+                continue
+            endTime = time.perf_counter()
+
+            with self._cond:
+                self._numProcessed += 1
+                self._latency = _ema(self._latency, endTime - submitTime)
+                self._processingTime = _ema(self._processingTime, endTime - startTime)
+
+            if result is not None:
+                self._postResult(seq, result)
+
+    def _postResult(self, seq, result):
+        with self._resultLock:
+            if seq < self._resultSeq:
+                return  # A newer frame has already produced a result
+            if self._resultPending:
+                self._numCoalesced += 1
+            self._result = result
+            self._resultSeq = seq
+            notify = not self._resultPending
+            self._resultPending = True
+
+        if notify:
+            self._sigResultPending.emit()
+
+    def _deliverResult(self):
+        with self._resultLock:
+            result = self._result
+            self._result = None
+            self._resultPending = False
+
+        if result is not None:
+            self.sigResultReady.emit(result)
+
+
+def getAnalysisStatistics():
+    """ Returns the statistics of all live analysis workers, by worker name. """
+    return {worker.name: worker.getStatistics() for worker in list(_workers)}
+
+
+def _ema(previous, value, alpha=0.1):
+    return value if previous is None else previous + alpha * (value - previous)
+
+
+_workers = weakref.WeakSet()
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
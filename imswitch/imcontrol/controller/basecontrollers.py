@@ -7,6 +7,7 @@ from imswitch.imcommon.controller import WidgetController, WidgetControllerFacto
 from imswitch.imcontrol.model import InvalidChildClassError
 from imswitch.imcommon.model import APIExport, dirtools, initLogger
 from imswitch.imcontrol.view import guitools
+from .analysisworkers import AnalysisWorker, DropPolicy
 
 
 class ImConWidgetControllerFactory(WidgetControllerFactory):
@@ -40,10 +41,35 @@ class LiveUpdatedController(ImConWidgetController):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.active = False
+        self._analysisWorkers = []
 
     def update(self, detectorName, im, init, isCurrentDetector):
         raise NotImplementedError
 
+    def _createAnalysisWorker(self, func, resultSlot=None, *, numWorkers=1, targetRate=None,
+                              dropPolicy=DropPolicy.Latest):
+        """ Creates an AnalysisWorker that runs func on frames passed to its
+        submit method. If resultSlot is given, it is called on the UI thread
+        with the latest result. The worker is stopped when the controller is
+        closed. """
+        worker = AnalysisWorker(f'{type(self).__name__}.{func.__name__}', func,
+                                numWorkers=numWorkers, targetRate=targetRate,
+                                dropPolicy=dropPolicy)
+        if resultSlot is not None:
+            worker.sigResultReady.connect(resultSlot)
+        self._analysisWorkers.append(worker)
+        return worker
+
+    def getAnalysisStatistics(self):
+        """ Returns processing counters and latencies of this controller's
+        analysis workers, by worker name. """
+        return {worker.name: worker.getStatistics() for worker in self._analysisWorkers}
+
+    def closeEvent(self):
+        for worker in self._analysisWorkers:
+            worker.stop()
+        super().closeEvent()
+
 
 class SuperScanController(ImConWidgetController):
     def __init__(self, *args, **kwargs):
@@ -87,7 +113,7 @@ class SuperScanController(ImConWidgetController):
         # Connect CommunicationChannel signals
         self._commChannel.sigRunScan.connect(self.runScanExternal)
         self._commChannel.sigAbortScan.connect(self.abortScan)
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigToggleBlockScanWidget.connect(lambda block: self.toggleBlockWidget(block))
         self._commChannel.sigRequestScanParameters.connect(self.sendScanParameters)
         self._commChannel.sigSetAxisCenters.connect(lambda devices, centers: self.setCenterParameters(devices, centers))
@@ -205,34 +231,49 @@ class SuperScanController(ImConWidgetController):
                 if scannerSet == scannerAxis:
                     self._widget.setScanCenterPos(scannerSet, centerpos)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 2:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        if key[0] == _attrCategoryStage:
-            self._analogParameterDict[key[1]] = value
-            self.setParameters()
-        elif key[0] == _attrCategoryTTL:
-            self._digitalParameterDict[key[1]] = value
-            self.setParameters()
+        parametersChanged = False
+        for key, value in changes.items():
+            if len(key) != 2:
+                continue
+
+            if key[0] == _attrCategoryStage:
+                self._analogParameterDict[key[1]] = value
+                parametersChanged = True
+            elif key[0] == _attrCategoryTTL:
+                self._digitalParameterDict[key[1]] = value
+                parametersChanged = True
+
+        if parametersChanged:
+            self.setParameters()  # once per change set
             
     def toggleBlockWidget(self, block):
         """ Blocks/unblocks scan widget if scans are run from elsewhere. """
         self._widget.setEnabled(block)
 
     def setSharedAttr(self, category, attr, value):
-        self.settingAttr = True
+        settingAttr, self.settingAttr = self.settingAttr, True
         try:
             self._commChannel.sharedAttrs[(category, attr)] = value
+        finally:
+            self.settingAttr = settingAttr
+
+    def setSharedAttrs(self, category, attrs):
+        """ Sets the attributes in the dict attrs as one change set. """
+        self.settingAttr = True
+        try:
+            with self._commChannel.sharedAttrs.batch():
+                for attr, value in attrs.items():
+                    self.setSharedAttr(category, attr, value)
         finally:
             self.settingAttr = False
 
     def updateScanStageAttrs(self):
         self.getParameters()
 
-        for key, value in self._analogParameterDict.items():
-            self.setSharedAttr(_attrCategoryStage, key, value)
-
         positiveDirections = []
         for i in range(len(self.positioners)):
             positionerName = self._analogParameterDict['target_device'][i]
@@ -240,13 +281,12 @@ class SuperScanController(ImConWidgetController):
                 positiveDirection = self._setupInfo.positioners[positionerName].isPositiveDirection
                 positiveDirections.append(positiveDirection)
 
-        self.setSharedAttr(_attrCategoryStage, 'positive_direction', positiveDirections)
+        self.setSharedAttrs(_attrCategoryStage, {**self._analogParameterDict,
+                                                 'positive_direction': positiveDirections})
 
     def updateScanTTLAttrs(self):
         self.getParameters()
-
-        for key, value in self._digitalParameterDict.items():
-            self.setSharedAttr(_attrCategoryTTL, key, value)
+        self.setSharedAttrs(_attrCategoryTTL, self._digitalParameterDict)
 
     @APIExport(runOnUIThread=True)
     def runScan(self) -> None:
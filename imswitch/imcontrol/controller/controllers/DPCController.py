@@ -1,6 +1,7 @@
     
 import json
 import os
+import queue
 
 import numpy as np
 import time
@@ -11,6 +12,7 @@ import tifffile as tif
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
+from imswitch.imcontrol.model.dpc import DPCSolver
 
 from ..basecontrollers import LiveUpdatedController
 
@@ -20,11 +22,6 @@ import numpy as np
 from pathlib import Path
 import tifffile
 
-pi    = np.pi
-naxis = np.newaxis
-F     = lambda x: np.fft.fft2(x)
-IF    = lambda x: np.fft.ifft2(x)
-
 class DPCController(ImConWidgetController):
     """Linked to DPCWidget."""
 
@@ -182,6 +179,7 @@ class DPCController(ImConWidgetController):
             self._widget.isRecordingButton.setText("Stop Recording")
         else:
             self._widget.isRecordingButton.setText("Start Recording")
+            self.DPCProcessor.stopRecording()
     
 
             
@@ -190,7 +188,6 @@ class DPCController(ImConWidgetController):
         Iterate over all DPC patterns, display them and acquire images 
         """     
         self.patternID = 0
-        self.isReconstructing = False
         while self.active:
             
             if not self.active:
@@ -229,26 +226,15 @@ class DPCController(ImConWidgetController):
                 processor.addFrameToStack(frame)
                 '''
 
-            for iPatternName in self.allDPCPatternNames:
+            # the patterns are uploaded once; switching only sends the LEDs that change
+            self.ledMatrix.uploadPatternSequence(self.getDPCPatternSequence())
+            for iPattern, iPatternName in enumerate(self.allDPCPatternNames):
                 if not self.active:
                     break
-                self.ledMatrix.mLEDmatrix.setAll(0)
-                time.sleep(self.tWait)
-
 
                 # 1. display the pattern
-                ledIDs = self.allDPCPatterns[iPatternName]
                 self._logger.debug("Showing pattern: "+iPatternName)
-                ledPattern = []
-                ledIntensity = (0,255,0)
-                
-                # no sparse update :( 
-                for iLED in range(self.nLEDs): 
-                    if iLED in ledIDs:
-                        ledPattern.append(ledIntensity)
-                    else:
-                        ledPattern.append((0,0,0))
-                self.ledMatrix.mLEDmatrix.send_LEDMatrix_array(np.array(ledPattern), getReturn = True)
+                self.ledMatrix.setPatternSequenceIndex(iPattern, getReturn=True)
                 # wait a moment
                 time.sleep(self.tWait)
                 
@@ -258,16 +244,20 @@ class DPCController(ImConWidgetController):
             
 
             # We will collect N*M images and process them with the DPC processor
-            # process the frames and display
-            if not self.isReconstructing:
-                self.isReconstructing=True
-                # reconstruct and save the stack in background to not block the main thread
-                processor.reconstruct(self.isRecording)
+            # the worker reconstructs all queued time points in one batch
+            processor.reconstruct(self.isRecording)
                 
-                # reset the per-colour stack to add new frames in the next imaging series
-                processor.clearStack()
+            # reset the per-colour stack to add new frames in the next imaging series
+            processor.clearStack()
         
 
+    def getDPCPatternSequence(self, ledIntensity=(0,255,0)):
+        """ Returns the DPC patterns as an (nPatterns, nLEDs, 3) array. """
+        patterns = np.zeros((len(self.allDPCPatternNames), self.nLEDs, 3), dtype=np.uint8)
+        for iPattern, iPatternName in enumerate(self.allDPCPatternNames):
+            patterns[iPattern, self.allDPCPatterns[iPatternName]] = ledIntensity
+        return patterns
+
     def getInfoDict(self, generalParams=None):
         state_general = None
         if generalParams is not None:
@@ -302,13 +292,21 @@ class DPCProcessor(object):
         self.n= 1
         self.wavelength = .53
         self.rotation = [0, 180, 90, 270]    
+        self.dpc_num = len(self.rotation)
         
-        self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize, rotation=self.rotation)
+        # the solver caches its transfer functions per shape and parameters
+        self.dpc_solver_obj = DPCSolver(wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize, rotation=self.rotation)
         #parameters for Tikhonov regurlarization [absorption, phase] ((need to tune this based on SNR)
         self.dpc_solver_obj.setTikhonovRegularization(reg_u = 1e-1, reg_p = 5e-3)
         
-        # stack to store the individual DPC images
-        self.stack = []
+        # frames of the current time point, and complete time points waiting for reconstruction
+        self.stack = None
+        self.nFrames = 0
+        self.queue = queue.Queue()
+        self.recordingFile = None
+        self.nReconstructed = 0
+        self.mReconstructionThread = threading.Thread(target=self.reconstructThread, name="DPCReconstruction", daemon=True)
+        self.mReconstructionThread.start()
         
     def setParameters(self, dpc_info_dict):
         # uses parameters from GUI
@@ -319,163 +317,103 @@ class DPCProcessor(object):
         self.wavelength = dpc_info_dict["wavelength"]
         self.rotation = [0, 180, 90, 270] 
         self.dpc_num = 4
+        self.dpc_solver_obj.setParameters(wavelength=self.wavelength, na=self.NA, NAi=self.NAi,
+                                          pixelsize=self.pixelsize, rotation=self.rotation)
         
     def addFrameToStack(self, frame):
         '''
-        append stacks to to-be-processed stack
+        append frame to the stack of the current time point
         '''
-        self.stack.append(frame)
+        frame = np.asarray(frame)
+        if self.stack is None or self.stack.shape[1:] != frame.shape:
+            self.stack = np.empty((self.dpc_num,) + frame.shape, dtype=np.float32)
+            self.nFrames = 0
+        self.stack[self.nFrames % self.dpc_num] = frame
+        self.nFrames += 1
         # display the BF image
-        if len(self.stack) % 4 == 0 and len(self.stack)>0:
-            bfFrame = np.sum(np.array(self.stack[-3:]), 0)
+        if self.nFrames % self.dpc_num == 0:
+            bfFrame = np.sum(self.stack[1:], 0)
             self.parent.sigDPCProcessorImageComputed.emit(bfFrame, "Widefield SUM")
 
     def getDPCStack(self):
         '''
         return the imagestack
         '''
-        return np.array(self.stack)
+        return self.stack[:min(self.nFrames, self.dpc_num)] if self.stack is not None else np.array([])
         
     def clearStack(self):
         '''
         reset the stack 
         '''
-        self.stack=[]
+        self.nFrames = 0
         
     def reconstruct(self, isRecording=False):
         '''
-        reconstruction
+        queue the current time point for reconstruction on the worker thread
         '''
-        self.stackToReconstruct = np.array(self.stack)
-        self.mReconstructionThread = threading.Thread(target=self.reconstructThread, args=(isRecording,), daemon=True)
-        self.mReconstructionThread.start()
-
-    def reconstructThread(self, isRecording):
-        # compute image
-        # initialize the model
+        if self.stack is None or self.nFrames < self.dpc_num:
+            return
+        self.queue.put((self.stack.copy(), isRecording, time.time()))
+
+    def stopRecording(self):
+        self.queue.put(None)
+
+    def reconstructThread(self):
+        while True:
+            # reconstruct everything that is waiting in one batch
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            isRecordingStopped = any(item is None for item in items)
+            items = [item for item in items if item is not None]
+            if items:
+                self.reconstructItems(items)
+            if isRecordingStopped:
+                self.closeRecordingFile()
+
+    def reconstructItems(self, items):
         try:
-            self._logger.debug("Processing frames")
-            qdpc_result = self.dpc_solver_obj.solve(dpc_imgs=self.stackToReconstruct)
+            self._logger.debug(f"Processing {len(items)} time points")
+            stacks = np.stack([item[0] for item in items])
+            qdpc_result = self.dpc_solver_obj.solve(stacks)
+            self.nReconstructed += len(items)
 
             # save images eventually
-            if isRecording:
-                date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
-                mFilenameRecon = f"{date}_DPC_Reconstruction.tif"   
-                tif.imsave(mFilenameRecon, qdpc_result)         
-            
-            # compute gradient images
-            dpc_result_1 = (self.stackToReconstruct[0]-self.stackToReconstruct[1])/(self.stackToReconstruct[0]+self.stackToReconstruct[1])
-            dpc_result_2 = (self.stackToReconstruct[2]-self.stackToReconstruct[3])/(self.stackToReconstruct[2]+self.stackToReconstruct[3])
+            for (_, isRecording, timestamp), result in zip(items, qdpc_result):
+                if isRecording:
+                    self.getRecordingFile().write(result, description=json.dumps({"timestamp": timestamp}),
+                                                  metadata=None, contiguous=False)
+
+            # compute gradient images of the latest time point
+            stack = stacks[-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dpc_result_1 = (stack[0]-stack[1])/(stack[0]+stack[1])
+                dpc_result_2 = (stack[2]-stack[3])/(stack[2]+stack[3])
 
             # display images
-            self.parent.sigDPCProcessorImageComputed.emit(np.angle(np.array(qdpc_result)), "qDPC Reconstruction (Phase)")
-            self.parent.sigDPCProcessorImageComputed.emit(np.abs(np.array(qdpc_result)), "qDPC Reconstruction (Magnitude)")
-            self.parent.sigDPCProcessorImageComputed.emit(np.array(dpc_result_1), "DPC left/right")
-            self.parent.sigDPCProcessorImageComputed.emit(np.array(dpc_result_2), "DPC top/bottom")
-            self.parent.isReconstructing = False
-            return dpc_result_1, dpc_result_2, qdpc_result
+            self.parent.sigDPCProcessorImageComputed.emit(qdpc_result[-1].imag, "qDPC Reconstruction (Phase)")
+            self.parent.sigDPCProcessorImageComputed.emit(qdpc_result[-1].real, "qDPC Reconstruction (Absorption)")
+            self.parent.sigDPCProcessorImageComputed.emit(dpc_result_1, "DPC left/right")
+            self.parent.sigDPCProcessorImageComputed.emit(dpc_result_2, "DPC top/bottom")
         except Exception as e:
             self._logger.error(f"Error during reconstruction: {e}")
-            self.parent.isReconstructing = False
-            return None
 
-# (C) Wallerlab 2019
-# https://github.com/Waller-Lab/DPC/blob/master/python_code/dpc_algorithm.py
-import numpy as np
-import matplotlib.pyplot as plt
-from os import listdir
-from skimage import io
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-import numpy as np
-from scipy.ndimage import uniform_filter
+    def getRecordingFile(self):
+        ''' Returns the file that reconstructions are appended to while
+        recording, one per recording. '''
+        if self.recordingFile is None:
+            dirPath = os.path.join(dirtools.UserFileDirs.Root, 'recordings')
+            os.makedirs(dirPath, exist_ok=True)
+            date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
+            self.recordingFile = tif.TiffWriter(os.path.join(dirPath, f"{date}_DPC_Reconstruction.tif"),
+                                                bigtiff=True, append=True)
+        return self.recordingFile
+
+    def closeRecordingFile(self):
+        if self.recordingFile is not None:
+            self.recordingFile.close()
+            self.recordingFile = None
 
-class DPCSolver:
-    def __init__(self, shape, wavelength, na, NAi, pixelsize, rotation):
-        self.shape = shape
-        if self.shape[0] == 0:
-            self.shape = (512, 512)
-            
-        self.wavelength = wavelength
-        self.na         = na
-        self.NAi      = NAi
-        self.pixel_size = pixelsize
-        self.dpc_num    = len(rotation)
-        self.rotation   = rotation
-        self.fxlin      = np.fft.ifftshift(self.genGrid(self.shape[-1], 1.0/self.shape[-1]/self.pixel_size))
-        self.fylin      = np.fft.ifftshift(self.genGrid(self.shape[-2], 1.0/self.shape[-2]/self.pixel_size))
-        self.pupil      = self.pupilGen(self.fxlin, self.fylin, self.wavelength, self.na)
-        self.sourceGen()
-        self.WOTFGen()
-        
-    def setTikhonovRegularization(self, reg_u = 1e-6, reg_p = 1e-6):
-        self.reg_u      = reg_u
-        self.reg_p      = reg_p
-        
-    def normalization(self):
-        for img in self.dpc_imgs:
-            img          /= uniform_filter(img, size=img.shape[0]//2)
-            meanIntensity = img.mean()
-            img          /= meanIntensity        # normalize intensity with DC term
-            img          -= 1.0                  # subtract the DC term
-        
-    def sourceGen(self):
-        self.source = []
-        pupil = self.pupilGen(self.fxlin, self.fylin, self.wavelength, self.na, NAi=self.NAi)
-        for rotIdx in range(self.dpc_num):
-            self.source.append(np.zeros((self.shape)))
-            rotdegree = self.rotation[rotIdx]
-            if rotdegree < 180:
-                self.source[-1][self.fylin[:, naxis]*np.cos(np.deg2rad(rotdegree))+1e-15>=
-                                self.fxlin[naxis, :]*np.sin(np.deg2rad(rotdegree))] = 1.0
-                self.source[-1] *= pupil
-            else:
-                self.source[-1][self.fylin[:, naxis]*np.cos(np.deg2rad(rotdegree))+1e-15<
-                                self.fxlin[naxis, :]*np.sin(np.deg2rad(rotdegree))] = -1.0
-                self.source[-1] *= pupil
-                self.source[-1] += pupil
-        self.source = np.asarray(self.source)
-        
-    def WOTFGen(self):
-        self.Hu = []
-        self.Hp = []
-        for rotIdx in range(self.source.shape[0]):
-            FSP_cFP  = F(self.source[rotIdx]*self.pupil)*F(self.pupil).conj()
-            I0       = (self.source[rotIdx]*self.pupil*self.pupil.conj()).sum()
-            self.Hu.append(2.0*IF(FSP_cFP.real)/I0)
-            self.Hp.append(2.0j*IF(1j*FSP_cFP.imag)/I0)
-        self.Hu = np.asarray(self.Hu)
-        self.Hp = np.asarray(self.Hp)
-
-    def solve(self, dpc_imgs, xini=None, plot_verbose=False, **kwargs):
-        self.dpc_imgs   = dpc_imgs.astype('float64')
-        self.normalization()
-
-        dpc_result  = []
-        AHA         = [(self.Hu.conj()*self.Hu).sum(axis=0)+self.reg_u,            (self.Hu.conj()*self.Hp).sum(axis=0),\
-                       (self.Hp.conj()*self.Hu).sum(axis=0)           , (self.Hp.conj()*self.Hp).sum(axis=0)+self.reg_p]
-        determinant = AHA[0]*AHA[3]-AHA[1]*AHA[2]
-        for frame_index in range(self.dpc_imgs.shape[0]//self.dpc_num):
-            fIntensity = np.asarray([F(self.dpc_imgs[frame_index*self.dpc_num+image_index]) for image_index in range(self.dpc_num)])
-            AHy        = np.asarray([(self.Hu.conj()*fIntensity).sum(axis=0), (self.Hp.conj()*fIntensity).sum(axis=0)])
-            absorption = IF((AHA[3]*AHy[0]-AHA[1]*AHy[1])/determinant).real
-            phase      = IF((AHA[0]*AHy[1]-AHA[2]*AHy[0])/determinant).real
-            dpc_result.append(absorption+1.0j*phase)
-            
-        return np.asarray(dpc_result)
-    
-    
-    def pupilGen(self, fxlin, fylin, wavelength, na, NAi=0.0):
-        pupil = np.array(fxlin[naxis, :]**2+fylin[:, naxis]**2 <= (na/wavelength)**2)
-        if NAi != 0.0:
-            pupil[fxlin[naxis, :]**2+fylin[:, naxis]**2 < (NAi/wavelength)**2] = 0.0
-        return pupil
-
-    def genGrid(self, size, dx):
-        xlin = np.arange(size, dtype='complex128')
-        return (xlin-size//2)*dx
-
-
-    
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
@@ -5,6 +5,7 @@ import sys
 import ctypes
 import importlib
 import enum
+import time
 import h5py
 
 from collections import deque
@@ -21,8 +22,10 @@ try:
 except:
     IS_TKINTER = False
 
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import APIExport
 from imswitch.imcontrol.model import configfiletools
+from imswitch.imcontrol.model.etsted import EventDetectionWorker, FrameRing
 from imswitch.imcommon.model import dirtools
 from imswitch.imcontrol.view import guitools
 from ..basecontrollers import ImConWidgetController
@@ -62,6 +65,11 @@ def millis():
 class EtSTEDController(ImConWidgetController):
     """ Linked to EtSTEDWidget."""
 
+    sigAnalysisImage = Signal(object, object)  # (img_ana, exinfo)
+    sigEventCoords = Signal(object)  # (coords)
+    sigEventScanned = Signal(object)  # (coords)
+    sigValidationDone = Signal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
@@ -101,6 +109,10 @@ class EtSTEDController(ImConWidgetController):
         self._widget.setBusyFalseButton.clicked.connect(self.setBusyFalse)
         self._commChannel.sigSendScanParameters.connect(lambda analogParams, digitalParams, positionersScan: self.assignScanParameters(analogParams, digitalParams, positionersScan))
         self._commChannel.sigSendScanFreq.connect(lambda scanFreq: self.logScanFreq(scanFreq))
+        self.sigAnalysisImage.connect(self.setAnalysisHelpImg)
+        self.sigEventCoords.connect(self.updateScatter)
+        self.sigEventScanned.connect(self.eventScanned)
+        self.sigValidationDone.connect(self.validationDone)
 
         # initiate log for each detected event
         self.resetDetLog()
@@ -109,19 +121,19 @@ class EtSTEDController(ImConWidgetController):
         self.__runMode = RunMode.Experiment
         self.__running = False
         self.__validating = False
-        self.__busy = False
         self.__bkg = None
-        self.__prevFrames = deque(maxlen=10)
         self.__prevAnaFrames = deque(maxlen=10)
         self.__binary_mask = None
-        self.__binary_stack = None
         self.__binary_frames = 10
+        self.__binary_stack = FrameRing(self.__binary_frames)
         self.__init_frames = 5
         self.__validationFrames = 0
         self.__frame = 0
-        self.t_call = 0
         self.__maxAnaImgVal = 0
 
+        # event detection runs on its own thread, on frames copied into a ring buffer
+        self.__worker = EventDetectionWorker(self.processFrame, historyLength=10)
+
 
     def initiate(self):
         """ Initiate or stop an etSTED experiment. """
@@ -156,7 +168,10 @@ class EtSTEDController(ImConWidgetController):
             # load selected coordinate transform
             self.loadTransform()
             self.__transformCoeffs = self.__coordTransformHelper.getTransformCoeffs()
-            # connect communication channel signals and turn on wf laser
+            # start event detection, connect communication channel signals and turn on wf laser
+            self.__worker.frames.clear()
+            self.__worker.latencyLog.clear()
+            self.__worker.start()
             self._commChannel.sigUpdateImage.connect(self.runPipeline)
             if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
                 self._commChannel.sigToggleBlockScanWidget.emit(False)
@@ -170,7 +185,9 @@ class EtSTEDController(ImConWidgetController):
             self.__running = True
         else:
             # disconnect communication channel signals and turn off wf laser
-            self._commChannel.sigUpdateImage.disconnect(self.runPipeline)
+            if self.__running:
+                self._commChannel.sigUpdateImage.disconnect(self.runPipeline)
+            self.__worker.stop()
             if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
                 self._commChannel.sigToggleBlockScanWidget.emit(True)
                 self._commChannel.sigScanEnded.disconnect(self.scanEnded)
@@ -185,7 +202,7 @@ class EtSTEDController(ImConWidgetController):
 
     def scanEnded(self):
         """ End an etSTED slow method scan. """
-        self.setDetLogLine("scan_end",datetime.now().strftime('%Ss%fus'))
+        self.setDetLogLine("scan_end", time.perf_counter_ns())
         if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
             self._commChannel.sigSnapImg.emit()
             frame_period = self.scanInfoDict['scan_samples_frame'] * 10e-6  # length (s) of total scan signal
@@ -202,7 +219,7 @@ class EtSTEDController(ImConWidgetController):
 
     def runSlowScan(self):
         """ Run a scan of the slow method (STED). """
-        self.__detLog[f"scan_start"] = datetime.now().strftime('%Ss%fus')
+        self.__detLog["scan_start"] = time.perf_counter_ns()
         if self.scanInitiationMode == ScanInitiationMode.RecordingWidget:
             # Run recording from RecWidget
             self.triggerRecordingWidgetScan()
@@ -245,6 +262,7 @@ class EtSTEDController(ImConWidgetController):
         """ Continue the fast method, after an event scan has been performed. """
         if self._widget.endlessScanCheck.isChecked() and not self.__running:
             # connect communication channel signals
+            self.__worker.resume(clearHistory=True)
             self._commChannel.sigUpdateImage.connect(self.runPipeline)
             self._master.lasersManager.execOn(self.laserFast, lambda l: l.setEnabled(True))
             
@@ -259,6 +277,7 @@ class EtSTEDController(ImConWidgetController):
             elif self.scanInitiationMode == ScanInitiationMode.RecordingWidget:
                 self._commChannel.sigRecordingEnded.disconnect(self.scanEnded)
             self.__running = False
+            self.__worker.stop()
             self.resetParamVals()
 
     def loadTransform(self):
@@ -275,7 +294,7 @@ class EtSTEDController(ImConWidgetController):
 
     def initiateBinaryMask(self):
         """ Initiate the process of calculating a binary mask of the region of interest. """
-        self.__binary_stack = None
+        self.__binary_stack.clear()
         laserFastIdx = self._widget.fastImgLasersPar.currentIndex()
         self.laserFast = self._widget.fastImgLasers[laserFastIdx]
         detectorFastIdx = self._widget.fastImgDetectorsPar.currentIndex()
@@ -287,19 +306,12 @@ class EtSTEDController(ImConWidgetController):
     def addImgBinStack(self, detectorName, img, init, scale, isCurrentDetector):
         """ Add image to the stack of images used to calculate a binary mask of the region of interest. """
         if detectorName == self.detectorFast:
-            if self.__binary_stack is None:
-                self.__binary_stack = img
-            elif len(self.__binary_stack) == self.__binary_frames:
+            if len(self.__binary_stack) == self.__binary_frames:
                 self._commChannel.sigUpdateImage.disconnect(self.addImgBinStack)
                 self._master.lasersManager.execOn(self.laserFast, lambda l: l.setEnabled(False))
-                self.calculateBinaryMask(self.__binary_stack)
+                self.calculateBinaryMask(self.__binary_stack.stack())
             else:
-                if np.ndim(self.__binary_stack) == 2:
-                    self.__binary_stack = np.stack((self.__binary_stack, img))
-                else:
-                    #self.__logger.debug(np.shape(img))
-                    #self.__logger.debug(np.shape(self.__binary_stack))
-                    self.__binary_stack = np.concatenate((self.__binary_stack,  [img]), axis=0)
+                self.__binary_stack.put(img)
 
     def calculateBinaryMask(self, img_stack):
         """ Calculate the binary mask of the region of interest. """
@@ -347,7 +359,9 @@ class EtSTEDController(ImConWidgetController):
         self._master.detectorsManager.setUpdatePeriod(self.__updatePeriod)
 
     def setBusyFalse(self):
-        self.__busy = False
+        """ Resume event detection, if it was paused. """
+        if self.__running:
+            self.__worker.resume()
 
     def assignScanParameters(self, analogParams, digitalParams, positionersScan):
         """ Assign scan parameters from the scanning widget. """
@@ -371,9 +385,9 @@ class EtSTEDController(ImConWidgetController):
         self.__detLog = dict()
         self.__detLog = {
             "pipeline": "",
-            "pipeline_start": "",
-            "pipeline_end": "",
-            "coord_transf_start": "",
+            "pipeline_start": 0,
+            "pipeline_end": 0,
+            "coord_transf_start": 0,
             "fastscan_x_center": 0,
             "fastscan_y_center": 0,
             "slowscan_x_center": 0,
@@ -390,108 +404,121 @@ class EtSTEDController(ImConWidgetController):
         self.__maxAnaImgVal = 0
 
     def runPipeline(self, detectorName, img, init, scale, isCurrentDetector):
-        """ If detector is detectorFast: run the analyis pipeline, called after every fast method frame. """
+        """ If detector is detectorFast: queue the frame for the analysis pipeline, called after every fast method frame. """
         if detectorName == self.detectorFast:
-            if not self.__busy:
-                t_sincelastcall = millis() - self.t_call
-                self.t_call = millis()
-                self.setDetLogLine("pipeline_rep_period", str(t_sincelastcall))
-                self.setDetLogLine("pipeline_start", datetime.now().strftime('%Ss%fus'))
-                self.__busy = True
-                t_pre = millis()
-                if self.__runMode == RunMode.Visualize or self.__runMode == RunMode.Validate:
-                    coords_detected, self.__exinfo, img_ana = self.pipeline(img, self.__prevFrames, self.__binary_mask, (self.__runMode==RunMode.Visualize or self.__runMode==RunMode.Validate), self.__exinfo, *self.__param_vals)
+            self.__worker.submit(img)
+
+    def processFrame(self, img, prevFrames, latency):
+        """ Run the analysis pipeline on a fast method frame and, if an event is detected, initiate
+        the slow method scan. Called on the event detection thread; returns True for an event. """
+        testmode = self.__runMode == RunMode.Visualize or self.__runMode == RunMode.Validate
+        if testmode:
+            coords_detected, self.__exinfo, img_ana = self.pipeline(img, prevFrames, self.__binary_mask, testmode, self.__exinfo, *self.__param_vals)
+        else:
+            coords_detected, self.__exinfo = self.pipeline(img, prevFrames, self.__binary_mask, testmode, self.__exinfo, *self.__param_vals)
+        latency.mark('pipeline')
+
+        if self.__frame > self.__init_frames:
+            # run if the initial frames have passed
+            if self.__runMode == RunMode.Visualize:
+                self.sigEventCoords.emit(coords_detected)
+                self.sigAnalysisImage.emit(img_ana, self.__exinfo)
+            elif self.__runMode == RunMode.Validate:
+                self.sigEventCoords.emit(coords_detected)
+                self.sigAnalysisImage.emit(img_ana, None)
+                if self.__validating:
+                    if self.__validationFrames > 5:
+                        self.__worker.pause()
+                        self.__prevAnaFrames.append(img_ana)
+                        self.__frame = 0
+                        self.__validating = False
+                        self.sigValidationDone.emit()
+                        return False
+                    self.__validationFrames += 1
+                elif coords_detected.size != 0:
+                    # if some events where detected
+                    if np.size(coords_detected) > 2:
+                        coords_scan = coords_detected[0,:]
+                    else:
+                        coords_scan = coords_detected[0]
+                    # log detected center coordinate
+                    self.setDetLogLine("fastscan_x_center", coords_scan[0])
+                    self.setDetLogLine("fastscan_y_center", coords_scan[1])
+                    # log all detected coordinates
+                    if np.size(coords_detected) > 2:
+                        for i in range(np.size(coords_detected,0)):
+                            self.setDetLogLine("det_coord_x_", coords_detected[i,0], i)
+                            self.setDetLogLine("det_coord_y_", coords_detected[i,1], i)
+                    self.__validating = True
+                    self.__validationFrames = 0
+            elif coords_detected.size != 0:
+                # if some events were detected: stop the fast method and start the scan from here
+                self.__worker.pause()
+                if np.size(coords_detected) > 2:
+                    coords_scan = np.copy(coords_detected[0,:])
                 else:
-                    coords_detected, self.__exinfo = self.pipeline(img, self.__prevFrames, self.__binary_mask, self.__runMode==RunMode.Visualize, self.__exinfo, *self.__param_vals)
-                t_post = millis()
-                self.setDetLogLine("pipeline_end", datetime.now().strftime('%Ss%fus'))
-                #self.__logger.debug(f'Pipeline time: {t_post-t_pre} ms')
-                #self.__logger.debug(coords_detected)
-
-                if self.__frame > self.__init_frames:
-                    # run if the initial frames have passed
-                    #self.__logger.debug(self.__runMode)
-                    if self.__runMode == RunMode.Visualize:
-                        self.updateScatter(coords_detected, clear=True)
-                        self.setAnalysisHelpImg(img_ana, self.__exinfo)
-                    elif self.__runMode == RunMode.Validate:
-                        self.updateScatter(coords_detected, clear=True)
-                        self.setAnalysisHelpImg(img_ana)
-                        if self.__validating:
-                            if self.__validationFrames > 5:
-                                self.saveValidationImages(prev=True, prev_ana=True)
-                                self.pauseFastModality()
-                                self.endRecording()
-                                self.continueFastModality()
-                                self.__frame = 0
-                                self.__validating = False
-                            self.__validationFrames += 1
-                        elif coords_detected.size != 0:
-                            # if some events where detected
-                            if np.size(coords_detected) > 2:
-                                coords_scan = coords_detected[0,:]
-                            else:
-                                coords_scan = coords_detected[0]
-                            # log detected center coordinate
-                            self.setDetLogLine("fastscan_x_center", coords_scan[0])
-                            self.setDetLogLine("fastscan_y_center", coords_scan[1])
-                            # log all detected coordinates
-                            if np.size(coords_detected) > 2:
-                                for i in range(np.size(coords_detected,0)):
-                                    self.setDetLogLine("det_coord_x_", coords_detected[i,0], i)
-                                    self.setDetLogLine("det_coord_y_", coords_detected[i,1], i)
-                            self.__validating = True
-                            self.__validationFrames = 0
-                    elif coords_detected.size != 0:
-                        # if some events were detected
-                        if np.size(coords_detected) > 2:
-                            coords_scan = np.copy(coords_detected[0,:])
-                        else:
-                            coords_scan = np.copy(coords_detected[0])
-                        self.setDetLogLine("prepause", datetime.now().strftime('%Ss%fus'))
-                        coords_scan = np.flip(np.copy(coords_scan))
-                        self.setDetLogLine("fastscan_x_center", coords_scan[0])
-                        self.setDetLogLine("fastscan_y_center", coords_scan[1])
-                        coords_scan[1] = np.shape(img)[0] - coords_scan[1]
-                        self.pauseFastModality()
-                        self.setDetLogLine("coord_transf_start", datetime.now().strftime('%Ss%fus'))
-                        coords_center_scan = self.transform(coords_scan, self.__transformCoeffs)
-                        self.setDetLogLine("slowscan_x_center", coords_center_scan[0])
-                        self.setDetLogLine("slowscan_y_center", coords_center_scan[1])
-                        self.setDetLogLine("scan_initiate", datetime.now().strftime('%Ss%fus'))
-                        # save all detected coordinates in the log
-                        if np.size(coords_detected) > 2:
-                            for i in range(np.size(coords_detected,0)):
-                                self.setDetLogLine("det_coord_x_", coords_scan[0], i)
-                                self.setDetLogLine("det_coord_y_", coords_scan[1], i)
-                        
-                        #self.__logger.debug(coords_scan)
-                        #self.__logger.debug(coords_center_scan)
-                        self.initiateSlowScan(position=coords_center_scan)
-                        self.runSlowScan()
-
-                        # update scatter plot of event coordinates in the shown fast method image
-                        self.updateScatter(np.flip(np.copy(coords_detected)), clear=True)
-
-                        self.__prevFrames.append(img)
-                        self.saveValidationImages(prev=True, prev_ana=False)
-                        self.__exinfo = None
-                        self.__busy = False
-                        return
-                self.__bkg = img
-                self.__prevFrames.append(img)
-                if self.__runMode == RunMode.Validate:
-                    self.__prevAnaFrames.append(img_ana)
-                self.__frame += 1
-                self.setBusyFalse()
+                    coords_scan = np.copy(coords_detected[0])
+                coords_scan = np.flip(coords_scan)
+                self.setDetLogLine("fastscan_x_center", coords_scan[0])
+                self.setDetLogLine("fastscan_y_center", coords_scan[1])
+                coords_scan[1] = np.shape(img)[0] - coords_scan[1]
+                self._master.lasersManager.execOn(self.laserFast, lambda l: l.setEnabled(False))
+                latency.mark('pause')
+                coords_center_scan = self.transform(coords_scan, self.__transformCoeffs)
+                latency.mark('transform')
+                self.setDetLogLine("slowscan_x_center", coords_center_scan[0])
+                self.setDetLogLine("slowscan_y_center", coords_center_scan[1])
+                # save all detected coordinates in the log
+                if np.size(coords_detected) > 2:
+                    for i in range(np.size(coords_detected,0)):
+                        self.setDetLogLine("det_coord_x_", coords_detected[i,1], i)
+                        self.setDetLogLine("det_coord_y_", coords_detected[i,0], i)
+                self.initiateSlowScan(position=coords_center_scan)
+                latency.mark('scanParameters')
+                self.runSlowScan()
+                latency.mark('scanTrigger')
+                self.logLatency(latency)
+
+                # update the GUI: scatter plot of event coordinates and validation images
+                self.sigEventScanned.emit(np.flip(np.copy(coords_detected)))
+                self.__exinfo = None
+                return True
+        self.__bkg = img.copy()  # img is reused by the event detection worker
+        if self.__runMode == RunMode.Validate:
+            self.__prevAnaFrames.append(img_ana)
+        self.__frame += 1
+        return False
+
+    def logLatency(self, latency):
+        """ Put the timestamps (perf_counter_ns) and stage durations of an event in the log file. """
+        timestamps = dict(latency.stages)
+        self.setDetLogLine("frame_received", latency.received)
+        self.setDetLogLine("pipeline_start", timestamps['queue'])
+        self.setDetLogLine("pipeline_end", timestamps['pipeline'])
+        self.setDetLogLine("coord_transf_start", timestamps['pause'])
+        self.setDetLogLine("scan_initiate", timestamps['scanParameters'])
+        for stage, duration in latency.durations().items():
+            self.setDetLogLine(f"latency_{stage}_ms", round(duration, 3))
+        self.__logger.debug(f'Event latency: {latency.format()}')
+
+    def eventScanned(self, coords):
+        """ Update the GUI after an event scan was initiated by the event detection thread. """
+        if self.__running:
+            self._commChannel.sigUpdateImage.disconnect(self.runPipeline)
+            self.__running = False
+        self.updateScatter(coords, clear=True)
+        self.saveValidationImages(prev=True, prev_ana=False)
+
+    def validationDone(self):
+        """ Save the validation images of an event and continue, in validation mode. """
+        self.saveValidationImages(prev=True, prev_ana=True)
+        self.pauseFastModality()
+        self.endRecording()
+        self.continueFastModality()
 
     def initiateSlowScan(self, position=[0.0,0.0,0.0]):
         """ Initiate a STED scan. """
-        dt = datetime.now()
-        time_curr_before = round(dt.microsecond/1000)
         self.setCenterScanParameter(position)
-        dt = datetime.now()
-        time_curr_mid = round(dt.microsecond/1000)
         if self.scanInitiationMode == ScanInitiationMode.ScanWidget:
             self.__logger.debug('Initiating scan with ScanWidget')
             try:
@@ -507,10 +534,6 @@ class EtSTEDController(ImConWidgetController):
             # Set scan axis centers in scanwidget
             self.setCentersScanWidget()
         #self.scanInfoDict['phase_delay'] = np.float(self._widget.phase_delay_edit.text())
-        dt = datetime.now()
-        time_curr_after = round(dt.microsecond/1000)
-        print(f'Time for curve parameters: {time_curr_mid-time_curr_before} ms')
-        print(f'Time for signal curve generation: {time_curr_after-time_curr_mid}')
 
     def setCenterScanParameter(self, position):
         """ Set the scanning center from the detected event coordinates. """
@@ -569,9 +592,9 @@ class EtSTEDController(ImConWidgetController):
     def saveValidationImages(self, prev=True, prev_ana=True):
         """ Save the widefield validation images of an event detection. """
         if prev:
-            img = np.array(list(self.__prevFrames))
+            img = self.__worker.frames.stack(self.__worker.historyLength)
             self._commChannel.sigSnapImgPrev.emit(self.detectorFast, img, 'raw')
-            self.__prevFrames.clear()
+            self.__worker.frames.clear()
         if prev_ana:
             img = np.array(list(self.__prevAnaFrames))
             self._commChannel.sigSnapImgPrev.emit(self.detectorFast, img, 'ana')
@@ -580,12 +603,23 @@ class EtSTEDController(ImConWidgetController):
     def pauseFastModality(self):
         """ Pause the fast method, when an event has been detected. """
         if self.__running:
+            self.__worker.pause()
             self._commChannel.sigUpdateImage.disconnect(self.runPipeline)
             self._master.lasersManager.execOn(self.laserFast, lambda l: l.setEnabled(False))
             self.__running = False
 
+    @APIExport()
+    def getEtSTEDLatencies(self) -> dict:
+        """ Returns the mean and maximum duration in ms of every stage of the
+        event detection, from the arrival of a frame to the slow method scan
+        trigger, for all frames and for the frames with an event, and the
+        number of frames received, processed and skipped. """
+        return {**self.__worker.latencyLog.summary(), 'statistics': self.__worker.getStatistics()}
+
     def closeEvent(self):
-        pass
+        if self._setupInfo.etSTED is not None:
+            self.__worker.stop()
+        super().closeEvent()
 
 
 class EtSTEDCoordTransformHelper():
@@ -1,6 +1,7 @@
 import numpy as np
 
-from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
+from imswitch.imcommon.model import APIExport
+from imswitch.imcontrol.model.fourier import FFTMagnitude, binImage, centerCrop
 from imswitch.imcontrol.view import guitools
 from ..basecontrollers import LiveUpdatedController
 
@@ -8,22 +9,19 @@ from ..basecontrollers import LiveUpdatedController
 class FFTController(LiveUpdatedController):
     """ Linked to FFTWidget."""
 
-    sigImageReceived = Signal()
-
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.updateRate = 10
         self.it = 0
         self.init = False
         self.showPos = False
+        self.roiSize = None
+        self.binning = 1
 
         # Prepare image computation worker
-        self.imageComputationWorker = self.FFTImageComputationWorker()
-        self.imageComputationWorker.sigFftImageComputed.connect(self.displayImage)
-        self.imageComputationThread = Thread()
-        self.imageComputationWorker.moveToThread(self.imageComputationThread)
-        self.sigImageReceived.connect(self.imageComputationWorker.computeFFTImage)
-        self.imageComputationThread.start()
+        self.fftMagnitude = FFTMagnitude()
+        self.imageComputationWorker = self._createAnalysisWorker(self.computeFFTImage,
+                                                                 self.displayImage)
 
         # Connect CommunicationChannel signals
         self._commChannel.sigUpdateImage.connect(self.update)
@@ -39,12 +37,6 @@ class FFTController(LiveUpdatedController):
         self.setShowFFT(self._widget.getShowFFTChecked())
         self.setShowPos(self._widget.getShowPosChecked())
 
-    def __del__(self):
-        self.imageComputationThread.quit()
-        self.imageComputationThread.wait()
-        if hasattr(super(), '__del__'):
-            super().__del__()
-
     def setShowFFT(self, enabled):
         """ Show or hide FFT. """
         self.active = enabled
@@ -55,6 +47,15 @@ class FFTController(LiveUpdatedController):
         self.showPos = enabled
         self.changePos(self._widget.getPos())
 
+    @APIExport()
+    def setFFTProcessingRegion(self, roiSize: int = None, binning: int = 1) -> None:
+        """ Restricts the FFT to a centred square ROI of roiSize pixels (the
+        full frame if None) that is binned by the given factor before the
+        transform. """
+        self.roiSize = roiSize
+        self.binning = binning
+        self.init = False
+
     def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
         if not isCurrentDetector or not self.active:
@@ -62,8 +63,7 @@ class FFTController(LiveUpdatedController):
 
         if self.it == self.updateRate:
             self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
-            self.sigImageReceived.emit()
+            self.imageComputationWorker.submit(im)
         else:
             self.it += 1
 
@@ -105,33 +105,12 @@ class FFTController(LiveUpdatedController):
             self._widget.updatePosLines(pos, imgWidth, imgHeight)
             self._widget.setPosLinesVisible(True)
 
-    class FFTImageComputationWorker(Worker):
-        sigFftImageComputed = Signal(np.ndarray)
-
-        def __init__(self):
-            super().__init__()
-            self._numQueuedImages = 0
-            self._numQueuedImagesMutex = Mutex()
-
-        def computeFFTImage(self):
-            """ Compute FFT of an image. """
-            try:
-                if self._numQueuedImages > 1:
-                    return  # Skip this frame in order to catch up
-
-                fftImage = np.fft.fftshift(np.log10(abs(np.fft.fft2(self._image))))
-                self.sigFftImageComputed.emit(fftImage)
-            finally:
-                self._numQueuedImagesMutex.lock()
-                self._numQueuedImages -= 1
-                self._numQueuedImagesMutex.unlock()
-
-        def prepareForNewImage(self, image):
-            """ Must always be called before the worker receives a new image. """
-            self._image = image
-            self._numQueuedImagesMutex.lock()
-            self._numQueuedImages += 1
-            self._numQueuedImagesMutex.unlock()
+    def computeFFTImage(self, image):
+        """ Compute FFT of an image. """
+        if image.ndim > 2:
+            image = image.mean(axis=-1)
+        image = binImage(centerCrop(image, self.roiSize), self.binning)
+        return self.fftMagnitude(image)
 
 
 # Copyright (C) 2020-2023 ImSwitch developers
@@ -16,6 +16,7 @@ from ..basecontrollers import LiveUpdatedController
 import imswitch
 from threading import Thread
 from imswitch.imcontrol.model import RecMode, SaveMode, SaveFormat
+from imswitch.imcontrol.model.flowstop import FlowStopEngine, FlowStopWriter
 
 class FlowStopController(LiveUpdatedController):
     """ Linked to FlowStopWidget."""
@@ -43,6 +44,8 @@ class FlowStopController(LiveUpdatedController):
         self.detectorFlowCam = self._master.detectorsManager[allDetectorNames[0]]
         
         self.is_measure = False
+        self.imagesTaken = 0
+        self.flowStopEngine = None
         
         # select light source and activate
         allIlluNames = self._master.lasersManager.getAllDeviceNames()
@@ -124,13 +127,14 @@ class FlowStopController(LiveUpdatedController):
     @APIExport(runOnUIThread=True)
     def startFlowStopExperiment(self, timeStamp: str, experimentName: str, experimentDescription: str, 
                                 uniqueId: str, numImages: int, volumePerImage: float, timeToStabilize: float, 
-                                delayToStart: float=1, frameRate: float=1, filePath: str="./"):
+                                delayToStart: float=1, frameRate: float=1, filePath: str="./",
+                                framesPerStop: int=1):
         """ Start FlowStop experiment. """
         self.thread = Thread(target=self.flowExperimentThread, 
                              name="FlowStopExperiment", 
                              args=(timeStamp, experimentName, experimentDescription, 
                                    uniqueId, numImages, volumePerImage, timeToStabilize,
-                                   delayToStart, frameRate, filePath))
+                                   delayToStart, frameRate, filePath, framesPerStop))
         self.thread.start()
 
     def stopFlowStopExperimentByButton(self):
@@ -168,6 +172,8 @@ class FlowStopController(LiveUpdatedController):
     @APIExport(runOnUIThread=True)
     def stopFlowStopExperiment(self):
         self.is_measure=False
+        if self.flowStopEngine is not None:
+            self.flowStopEngine.stop()
         if not imswitch.IS_HEADLESS:
             self._widget.buttonStart.setEnabled(True)
             self._widget.buttonStop.setEnabled(False)
@@ -178,16 +184,16 @@ class FlowStopController(LiveUpdatedController):
                              experimentDescription: str, uniqueId: str, 
                              numImages: int, volumePerImage: float, 
                              timeToStabilize: float, delayToStart: float=0, 
-                             frameRate: float=1, filePath:str="./"):
+                             frameRate: float=1, filePath:str="./", framesPerStop: int=1):
         ''' FlowStop experiment thread.
         The device captures images periodically by moving the pump at n-steps / ml, waits for a certain time
         and then moves on to the next step. The experiment is stopped when the user presses the stop button or
         it acquried N-images.
 
-        User supplied parameters:
-
+        The stops run pipelined in a FlowStopEngine: the next pump move starts as soon as the frames of a
+        stop are grabbed, while a background writer appends them to one TIFF file per experiment.
         '''
-        self._logger.debug("Starting the FlowStop experiment thread in {delayToStart} seconds.")
+        self._logger.debug(f"Starting the FlowStop experiment thread in {delayToStart} seconds.")
         time.sleep(delayToStart)
         self._commChannel.sigStartLiveAcquistion.emit(True)
         self.is_measure = True
@@ -196,41 +202,66 @@ class FlowStopController(LiveUpdatedController):
         dirPath  = os.path.join(dirtools.UserFileDirs.Root, 'recordings', timeStamp)
         if not os.path.exists(dirPath):
             os.makedirs(dirPath)
-        while True:
-            currentTime = time.time()
-            self.imagesTaken += 1
-            if self.imagesTaken > numImages: break
-            if self.is_measure:
-                stepsToMove = volumePerImage
-                self.positioner.move(value=stepsToMove, speed=1000, axis=self.pumpAxis, is_absolute=False, is_blocking=True)
-                time.sleep(timeToStabilize)
-                metaData = {
-                    'timeStamp': timeStamp,
-                    'experimentName': experimentName,
-                    'experimentDescription': experimentDescription,
-                    'uniqueId': uniqueId,
-                    'numImages': numImages,
-                    'volumePerImage': volumePerImage,
-                    'timeToStabilize': timeToStabilize,
-                }
-                self.setSharedAttr('FlowStop', _metaDataAttr, metaData)
-                
-
-                # save image                    
-                mFileName = f'{timeStamp}_{experimentName}_{uniqueId}_{self.imagesTaken}'
-                mFilePath = os.path.join(dirPath, mFileName)
-                self.snapImageFlowCam(mFilePath, metaData)
-                
-                # maintain framerate
-                while (time.time()-currentTime)<(1/frameRate):
-                    time.sleep(0.05)
-                if not imswitch.IS_HEADLESS:
-                    self._widget.labelStatusValue.setText(f'Running: {self.imagesTaken+1}/{numImages}')
-            else:
-                break
+        metaData = {
+            'timeStamp': timeStamp,
+            'experimentName': experimentName,
+            'experimentDescription': experimentDescription,
+            'uniqueId': uniqueId,
+            'numImages': numImages if np.isfinite(numImages) else -1,
+            'volumePerImage': volumePerImage,
+            'timeToStabilize': timeToStabilize,
+        }
+        self.setSharedAttr('FlowStop', _metaDataAttr, metaData)
+
+        mFilePath = os.path.join(dirPath, f'{timeStamp}_{experimentName}_{uniqueId}.tif')
+        writer = FlowStopWriter(mFilePath)
+        self.flowStopEngine = FlowStopEngine(
+            movePump=lambda value, speed: self.positioner.moveAsync(
+                value, self.pumpAxis, speed=speed, is_blocking=True
+            ),
+            grabFrames=self.grabFrames, writer=writer, numStops=numImages,
+            volumePerStop=volumePerImage, timeToStabilize=timeToStabilize,
+            frameRate=frameRate, framesPerStop=framesPerStop, metadata=metaData
+        )
+        self.flowStopEngine.sigStopDone.connect(self.stopDone)
+        try:
+            self.flowStopEngine.run()
+        finally:
+            writer.close()
+            self._logger.info(f"FlowStop statistics: {self.flowStopEngine.getStatistics()}")
 
         self.stopFlowStopExperiment()
 
+    def stopDone(self, stopIndex, numStops):
+        self.imagesTaken = stopIndex + 1
+        if not imswitch.IS_HEADLESS:
+            self._widget.labelStatusValue.setText(f'Running: {self.imagesTaken}/{numStops}')
+
+    def grabFrames(self, numFrames, timeout=2):
+        """ Returns numFrames frames captured after this call, or the latest
+        frame if the detector does not deliver them within timeout. """
+        self.detectorFlowCam.flushBuffers()
+        frames = []
+        startTime = time.time()
+        while len(frames) < numFrames and time.time() - startTime < timeout:
+            chunk = self.detectorFlowCam.getChunk()
+            if chunk is not None and len(chunk) > 0 and np.ndim(chunk) == 3:
+                frames.extend(chunk[:numFrames - len(frames)])
+            else:
+                time.sleep(0.005)
+        if not frames:
+            mFrame = self.detectorFlowCam.getLatestFrame()
+            if mFrame is not None:
+                frames.append(mFrame)
+        return frames
+
+    @APIExport(runOnUIThread=False)
+    def getFlowStopStatistics(self):
+        """ Returns throughput statistics of the running or last experiment. """
+        if self.flowStopEngine is None:
+            return {}
+        return self.flowStopEngine.getStatistics()
+
     def setSharedAttr(self, laserName, attr, value):
         self.settingAttr = True
         try:
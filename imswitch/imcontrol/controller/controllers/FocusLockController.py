@@ -1,25 +1,10 @@
 import time
-import cv2 
 import numpy as np
 from time import perf_counter
-import scipy.ndimage as ndi
-from skimage.feature import peak_local_max
-
-import numpy as np
-import matplotlib.pyplot as plt
-import tifffile as tif
-import serial
-import time
-import serial.tools.list_ports
-from PIL import Image, ImageFile
-ImageFile.LOAD_TRUNCATED_IMAGES = True
-import base64
-import io
-import serial.tools.list_ports
-import threading
 
 from imswitch.imcommon.framework import Thread, Timer
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import APIExport, initLogger
+from imswitch.imcontrol.model.focuslock import FocusLockEngine, PI
 from ..basecontrollers import ImConWidgetController
 
 
@@ -47,10 +32,9 @@ class FocusLockController(ImConWidgetController):
             self._master.detectorsManager[self.camera].crop(*self.cropFrame)
         self._widget.setKp(self._setupInfo.focusLock.piKp)
         self._widget.setKi(self._setupInfo.focusLock.piKi)
-        try:
-            self.focusLockMetric = self._setupInfo.focusLockMetric
-        except:
-            self.focusLockMetric = "JPG"
+        self.focusLockMetric = self._setupInfo.focusLock.metric or "JPG"
+        if self._master.detectorsManager[self.camera].model == "ESP32SerialCamera":
+            self.focusLockMetric = "ratio"
 
         # Connect FocusLockWidget buttons
         self._widget.kpEdit.textChanged.connect(self.unlockFocus)
@@ -70,64 +54,86 @@ class FocusLockController(ImConWidgetController):
 
         self.setPointSignal = 0
         self.locked = False
-        self.aboutToLock = False
         self.zStackVar = False
         self.twoFociVar = False
-        self.noStepVar = True
         self.focusTime = 1000 / self.updateFreq  # focus signal update interval (ms)
-        self.zStepLimLo = 0
-        self.aboutToLockDiffMax = 0.4
-        self.lockPosition = 0
-        self.currentPosition = 0
-        self.lastPosition = 0
+        self.displayTime = max(self.focusTime, 100)  # graphics update interval (ms)
         self.buffer = 40
         self.currPoint = 0
         self.setPointData = np.zeros(self.buffer)
         self.timeData = np.zeros(self.buffer)
 
         self._master.detectorsManager[self.camera].startAcquisition()
-        self.__processDataThread = ProcessDataThread(self)
+        positioner = self._master.positionersManager[self.positioner]
+        self.focusLockEngine = FocusLockEngine(
+            grabFrame=self._master.detectorsManager[self.camera].getLatestFrame,
+            getPosition=positioner.get_abs,
+            moveRelative=lambda value: positioner.move(value, 0),
+            period=self.focusTime / 1000,
+            roi=self._setupInfo.focusLock.processingRoi,
+            metric=self.focusLockMetric,
+            swapAxes=self._setupInfo.focusLock.swapImageAxes
+        )
+        self.focusLockEngine.sigLocked.connect(self.focusLocked)
+        self.focusLockEngine.sigUnlocked.connect(self.focusUnlocked)
         self.__focusCalibThread = FocusCalibThread(self)
-        self.__processDataThread.setFocusLockMetric(self.focusLockMetric)
 
+        # The control loop runs on the engine's own thread at a fixed period,
+        # the timer only refreshes the graphics
+        self.focusLockEngine.start()
         self.timer = Timer()
         self.timer.timeout.connect(self.update)
-        self.timer.start(int(self.focusTime))
+        self.timer.start(int(self.displayTime))
         self.startTime = perf_counter()
 
     def __del__(self):
-        self.__processDataThread.quit()
-        self.__processDataThread.wait()
+        self.focusLockEngine.stop()
         self.__focusCalibThread.quit()
         self.__focusCalibThread.wait()
-        self.ESP32Camera.stopStreaming()
         if hasattr(super(), '__del__'):
             super().__del__()
 
+    def closeEvent(self):
+        if self._setupInfo.focusLock is None:
+            return
+        self.timer.stop()
+        self.focusLockEngine.stop()
+
     def unlockFocus(self):
+        self.focusLockEngine.unlock()
+
+    def focusUnlocked(self, reason):
         if self.locked:
             self.locked = False
             self._widget.lockButton.setChecked(False)
+            self._widget.lockButton.setText('Lock')
             self._widget.focusPlot.removeItem(self._widget.focusLockGraph.lineLock)
 
+    def focusLocked(self, setPoint):
+        if not self.locked:
+            self.locked = True
+            self._widget.focusLockGraph.lineLock = self._widget.focusPlot.addLine(
+                y=setPoint, pen='r'
+            )
+            self._widget.lockButton.setChecked(True)
+            self._widget.lockButton.setText('Unlock')
+
     def toggleFocus(self):
-        self.aboutToLock = False
         if self._widget.lockButton.isChecked():
-            zpos = self._master.positionersManager[self.positioner].get_abs()
-            self.lockFocus(zpos)
+            self.lockFocus()
             self._widget.lockButton.setText('Unlock')
         else:
             self.unlockFocus()
             self._widget.lockButton.setText('Lock')
 
     def cameraDialog(self):
-        if not self.isESP32: self._master.detectorsManager[self.camera].openPropertiesDialog()
+        self._master.detectorsManager[self.camera].openPropertiesDialog()
 
     def setGain(self, gain):
-        self.ESP32Camera.setGain(gain)
+        self._master.detectorsManager[self.camera].setParameter('gain', gain)
 
     def setExposureTime(self, exposureTime):
-        self.ESP32Camera.setExposureTime(exposureTime)
+        self._master.detectorsManager[self.camera].setParameter('exposure', exposureTime)
         
     def focusCalibrationStart(self):
         self.__focusCalibThread.start()
@@ -136,45 +142,35 @@ class FocusLockController(ImConWidgetController):
         self._widget.showCalibrationCurve(self.__focusCalibThread.getData())
 
     def zStackVarChange(self):
-        if self.zStackVar:
-            self.zStackVar = False
-        else:
-            self.zStackVar = True
+        self.zStackVar = not self.zStackVar
+        self.focusLockEngine.zStackMode = self.zStackVar
 
     def twoFociVarChange(self):
-        if self.twoFociVar:
-            self.twoFociVar = False
-        else:
-            self.twoFociVar = True
+        self.twoFociVar = not self.twoFociVar
+        self.focusLockEngine.twoFoci = self.twoFociVar
 
     def update(self):
-        # get data
-        img = self.__processDataThread.grabCameraFrame()
-        self.setPointSignal = self.__processDataThread.update(self.twoFociVar)
-        # move
-        if self.locked:
-            value_move = self.updatePI()
-            if self.noStepVar and abs(value_move) > 0.002:
-                self._master.positionersManager[self.positioner].move(value_move, 0)
-        elif self.aboutToLock:
-           self.aboutToLockUpdate()
-        # udpate graphics
+        # udpate graphics with the latest state of the focus lock engine
+        img = self.focusLockEngine.latestFrame
+        if img is None:
+            return
+        self.setPointSignal = self.focusLockEngine.latestSignal
         self.updateSetPointData()
+        if self._setupInfo.focusLock.swapImageAxes:
+            img = np.swapaxes(img, 0, 1)
         self._widget.camImg.setImage(img)
         if self.currPoint < self.buffer:
             self._widget.focusPlotCurve.setData(self.timeData[1:self.currPoint],
                                                 self.setPointData[1:self.currPoint])
         else:
             self._widget.focusPlotCurve.setData(self.timeData, self.setPointData)
-    
-    def aboutToLockUpdate(self):
-        self.aboutToLockDataPoints = np.roll(self.aboutToLockDataPoints,1)
-        self.aboutToLockDataPoints[0] = self.setPointSignal
-        averageDiff = np.std(self.aboutToLockDataPoints)
-        if averageDiff < self.aboutToLockDiffMax:
-            zpos = self._master.positionersManager[self.positioner].get_abs()
-            self.lockFocus(zpos)
-            self.aboutToLock = False
+
+    @APIExport()
+    def getFocusLockStatistics(self) -> dict:
+        """ Returns the focus lock loop statistics: iterations, mean period,
+        period jitter and processing time (in ms), overruns and issued
+        moves. """
+        return self.focusLockEngine.getStatistics()
 
     def updateSetPointData(self):
         if self.currPoint < self.buffer:
@@ -187,139 +183,15 @@ class FocusLockController(ImConWidgetController):
             self.timeData[-1] = perf_counter() - self.startTime
         self.currPoint += 1
 
-    def updatePI(self):
-        if not self.noStepVar:
-            self.noStepVar = True
-        self.currentPosition = self._master.positionersManager[self.positioner].get_abs()
-        self.stepDistance = np.abs(self.currentPosition - self.lastPosition)
-        distance = self.currentPosition - self.lockPosition
-        move = self.pi.update(self.setPointSignal)
-        self.lastPosition = self.currentPosition
-
-        if abs(distance) > 5 or abs(move) > 3:
-            self._logger.warning(f'Safety unlocking! Distance to lock: {distance:.3f}, current move step: {move:.3f}.')
-            self.unlockFocus()
-        elif self.zStackVar:
-            if self.stepDistance > self.zStepLimLo:
-                self.unlockFocus()
-                self.aboutToLockDataPoints = np.zeros(5)
-                self.aboutToLock = True
-                self.noStepVar = False
-        return move
-
-    def lockFocus(self, zpos):
+    def lockFocus(self):
         if not self.locked:
             kp = float(self._widget.kpEdit.text())
             ki = float(self._widget.kiEdit.text())
-            self.pi = PI(self.setPointSignal, 0.001, kp, ki)
-            self.lockPosition = zpos
-            self.locked = True
-            self._widget.focusLockGraph.lineLock = self._widget.focusPlot.addLine(
-                y=self.setPointSignal, pen='r'
-            )
-            self._widget.lockButton.setChecked(True)
             self.updateZStepLimits()
+            self.focusLockEngine.lock(kp, ki)
 
     def updateZStepLimits(self):
-        self.zStepLimLo = 0.001 * float(self._widget.zStepFromEdit.text())
-
-
-class ProcessDataThread(Thread):
-    def __init__(self, controller, *args, **kwargs):
-        self._controller = controller
-        super().__init__(*args, **kwargs)
-        self.focusLockMetric = None
-        
-
-    def grabCameraFrame(self):
-        detectorManager = self._controller._master.detectorsManager[self._controller.camera]
-        self.latestimg = detectorManager.getLatestFrame()
-            
-        # 1.5 swap axes of frame (depending on setup, make this a variable in the json)
-        if self._controller._setupInfo.focusLock.swapImageAxes:
-            self.latestimg = np.swapaxes(self.latestimg,0,1)
-        return self.latestimg
-    
-    def setFocusLockMetric(self, focuslockMetric):
-        self.focusLockMetric = focuslockMetric
-
-    def update(self, twoFociVar):
-
-        if self._controller._master.detectorsManager[self._controller.camera].model == "ESP32SerialCamera":
-            imagearraygf = ndi.filters.gaussian_filter(self.latestimg, 5)
-            # mBackground = np.mean(mStack, (0)) #np.ones(mStack.shape[1:])# 
-            mBackground = ndi.filters.gaussian_filter(self.latestimg,15)
-            mFrame = imagearraygf/mBackground # mStack/mBackground
-            massCenterGlobal=np.max(np.mean(mFrame**2, 1))/np.max(np.mean(mFrame**2, 0))
-            
-        else:
-            if self.focusLockMetric == "JPG":
-
-                def extract(marray, crop_size):
-                    center_x, center_y = marray.shape[1] // 2, marray.shape[0] // 2
-
-                    # Calculate the starting and ending indices for cropping
-                    x_start = center_x - crop_size // 2
-                    x_end = x_start + crop_size
-                    y_start = center_y - crop_size // 2
-                    y_end = y_start + crop_size
-
-                    # Crop the center region
-                    return marray[y_start:y_end, x_start:x_end]
-                imagearraygf = extract(self.latestimg, 512)
-                is_success, buffer = cv2.imencode(".jpg", imagearraygf, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-                # Check if encoding was successful
-                if is_success:
-                    # Get the size of the JPEG image
-                    focusquality = len(buffer)
-                else:
-                    focusquality = 0
-                    print("Failed to encode image")
-                massCenterGlobal = focusquality
-            else:
-                # Gaussian filter the image, to remove noise and so on, to get a better center estimate
-                imagearraygf = ndi.filters.gaussian_filter(self.latestimg, 7)
-
-                # Update the focus signal
-                if twoFociVar:
-                        allmaxcoords = peak_local_max(imagearraygf, min_distance=60)
-                        size = allmaxcoords.shape
-                        maxvals = np.zeros(size[0])
-                        maxvalpos = np.zeros(2)
-                        for n in range(0, size[0]):
-                            if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[0]:
-                                if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[1]:
-                                    tempval = maxvals[1]
-                                    maxvals[0] = tempval
-                                    maxvals[1] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                                    tempval = maxvalpos[1]
-                                    maxvalpos[0] = tempval
-                                    maxvalpos[1] = n
-                                else:
-                                    maxvals[0] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                                    maxvalpos[0] = n
-                        xcenter = allmaxcoords[maxvalpos[0]][0]
-                        ycenter = allmaxcoords[maxvalpos[0]][1]
-                        if allmaxcoords[maxvalpos[1]][1] < ycenter:
-                            xcenter = allmaxcoords[maxvalpos[1]][0]
-                            ycenter = allmaxcoords[maxvalpos[1]][1]
-                        centercoords2 = np.array([xcenter, ycenter])
-                else:
-                    centercoords = np.where(imagearraygf == np.array(imagearraygf.max()))
-                    centercoords2 = np.array([centercoords[0][0], centercoords[1][0]])
-
-                subsizey = 50
-                subsizex = 50
-                xlow = max(0, (centercoords2[0] - subsizex))
-                xhigh = min(1024, (centercoords2[0] + subsizex))
-                ylow = max(0, (centercoords2[1] - subsizey))
-                yhigh = min(1280, (centercoords2[1] + subsizey))
-
-                imagearraygfsub = imagearraygf[xlow:xhigh, ylow:yhigh]
-                massCenter = np.array(ndi.measurements.center_of_mass(imagearraygfsub))
-                # add the information about where the center of the subarray is
-                massCenterGlobal = massCenter[1] + centercoords2[1]  # - subsizey - self.sensorSize[1] / 2
-        return massCenterGlobal
+        self.focusLockEngine.zStepLimLo = 0.001 * float(self._widget.zStepFromEdit.text())
 
 
 class FocusCalibThread(Thread):
@@ -337,7 +209,7 @@ class FocusCalibThread(Thread):
         for z in self.scan_list:
             self._controller._master.positionersManager[self._controller.positioner].setPosition(z, 0)
             time.sleep(0.5)
-            self.focusCalibSignal = self._controller.setPointSignal
+            self.focusCalibSignal = self._controller.focusLockEngine.latestSignal
             self.signalData.append(self.focusCalibSignal)
             self.positionData.append(self._controller._master.positionersManager[self._controller.positioner].get_abs())
         self.poly = np.polyfit(self.positionData, self.signalData, 1)
@@ -358,73 +230,6 @@ class FocusCalibThread(Thread):
         return data
 
 
-class PI:
-    """Simple implementation of a discrete PI controller.
-    Taken from http://code.activestate.com/recipes/577231-discrete-pid-controller/
-    Author: Federico Barabas"""
-    def __init__(self, setPoint, multiplier=1, kp=0, ki=0):
-        self._kp = multiplier * kp
-        self._ki = multiplier * ki
-        self._setPoint = setPoint
-        self.multiplier = multiplier
-        self.error = 0.0
-        self._started = False
-
-    def update(self, currentValue):
-        """ Calculate PI output value for given reference input and feedback.
-        Using the iterative formula to avoid integrative part building. """
-        self.error = self.setPoint - currentValue
-        if self.started:
-            self.dError = self.error - self.lastError
-            self.out = self.out + self.kp * self.dError + self.ki * self.error
-        else:
-            # This only runs in the first step
-            self.out = self.kp * self.error
-            self.started = True
-        self.lastError = self.error
-        return self.out
-
-    def restart(self):
-        self.started = False
-
-    @property
-    def started(self):
-        return self._started
-
-    @started.setter
-    def started(self, value):
-        self._started = value
-
-    @property
-    def setPoint(self):
-        return self._setPoint
-
-    @setPoint.setter
-    def setPoint(self, value):
-        self._setPoint = value
-
-    @property
-    def kp(self):
-        return self._kp
-
-    @kp.setter
-    def kp(self, value):
-        self._kp = value
-
-    @property
-    def ki(self):
-        return self._ki
-
-    @ki.setter
-    def ki(self, value):
-        self._ki = value
-        
-
-
-
-
-
-
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -7,37 +7,44 @@ except:
     isNIP = False
 
 
-from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
-from imswitch.imcontrol.view import guitools
-from imswitch.imcommon.model import initLogger
 from ..basecontrollers import LiveUpdatedController
 
 
 class HistogrammController(LiveUpdatedController):
     """ Linked to HistogrammWidget."""
 
-    sigImageReceived = Signal()
-
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
         self.updateRate = 10
         self.it = 0
-        
+
+        # Compute the histogram off the UI thread
+        self.histogrammWorker = self._createAnalysisWorker(self.computeHistogramm,
+                                                           self.displayHistogramm,
+                                                           targetRate=self.updateRate)
+
         # Connect CommunicationChannel signals
         self._commChannel.sigUpdateImage.connect(self.update)
 
-    def update(self, detectorName, im, init, isCurrentDetector):
+    def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
+        if not isCurrentDetector:
+            return
+        self.histogrammWorker.submit(im)
 
-
-        # compute histogramm and show
-        nBins = 100
-        hist, bins = np.histogram(im[:], bins=nBins)
+    @staticmethod
+    def computeHistogramm(im, nBins=100):
+        """ Compute the histogramm of an image. """
+        hist, bins = np.histogram(im, bins=nBins)
         units = np.linspace(0, 2**10, nBins)
-        # display the curve
-        self._widget.setHistogrammData(units,hist)
-        
+        return units, hist
+
+    def displayHistogramm(self, histogramm):
+        """ Display the curve. """
+        units, hist = histogramm
+        self._widget.setHistogrammData(units, hist)
+
 
 
 
@@ -7,12 +7,11 @@ except:
     print("HoloController needs NIP to work!")
     isNIP = False
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
-from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
+from imswitch.imcommon.framework import Worker
+from imswitch.imcontrol.model.fourier import AngularSpectrumPropagator, binImage, centerCrop
 from imswitch.imcontrol.view import guitools
 from imswitch.imcommon.model import initLogger
 from ..basecontrollers import LiveUpdatedController
-import threading
-import time
 import imswitch
 
 '''
@@ -30,8 +29,6 @@ except:
 class HoloController(LiveUpdatedController):
     """ Linked to HoloWidget."""
 
-    sigImageReceived = Signal()
-
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -48,7 +45,6 @@ class HoloController(LiveUpdatedController):
         self.mWavelength = 488*1e-9
         self.NA=.3
         self.k0 = 2*np.pi/(self.mWavelength)
-        self.lastProcessedTime = time.time()
 
         if not isNIP:
             return
@@ -64,12 +60,10 @@ class HoloController(LiveUpdatedController):
         self.imageComputationWorker.set_pixelsize(self.pixelsize)
         self.imageComputationWorker.set_dz(self.dz)
         self.imageComputationWorker.set_PSFpara(self.PSFpara)
-        self.imageComputationWorker.sigHoloImageComputed.connect(self.displayImage)
-
-        self.imageComputationThread = Thread()
-        self.imageComputationWorker.moveToThread(self.imageComputationThread)
-        #self.sigImageReceived.connect(self.imageComputationWorker.computeHoloImage)
-        self.imageComputationThread.start()
+        self.holoAnalysisWorker = self._createAnalysisWorker(
+            self.imageComputationWorker.computeHoloImage, self.displayImages,
+            targetRate=self.updateRate
+        )
 
         # Connect CommunicationChannel signals
         self._commChannel.sigUpdateImage.connect(self.update)
@@ -129,12 +123,6 @@ class HoloController(LiveUpdatedController):
         self.dz = magnitude*1e-3
         self.imageComputationWorker.set_dz(self.dz)
 
-    def __del__(self):
-        self.imageComputationThread.quit()
-        self.imageComputationThread.wait()
-        if hasattr(super(), '__del__'):
-            super().__del__()
-
     def setShowInLineHolo(self, enabled):
         """ Show or hide Holo. """
         self.pixelsize = self._widget.getPixelSize()
@@ -174,23 +162,32 @@ class HoloController(LiveUpdatedController):
         if  not self.active or not isNIP:# or not isCurrentDetector:
             return
 
-        if time.time()-self.lastProcessedTime<1/self.updateRate:
-            return
         if self.it == self.updateRate:
             self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
-            self.sigImageReceived.emit()
-            self.lastProcessedTime = time.time()
+            if self.imageComputationWorker.active:
+                self.holoAnalysisWorker.submit(im)
         else:
             self.it += 1
 
+    @APIExport()
+    def setHoloProcessingRegion(self, roiSize: int = 1024, binning: int = 1) -> None:
+        """ Restricts the inline reconstruction to a centred square ROI of
+        roiSize pixels (the full frame if None) that is binned by the given
+        factor before propagation. """
+        self.imageComputationWorker.set_processingRegion(roiSize, binning)
+
     @APIExport(runOnUIThread=True)
     def displayImageNapari(self, im, name):
         self.displayImage(np.array(im), name)
 
+    def displayImages(self, images):
+        """ Displays the (image, name) pairs computed by the worker. """
+        for im, name in images:
+            self.displayImage(im, name)
+
     def displayImage(self, im, name):
         """ Displays the image in the view. """
-        if im.dtype=="complex":
+        if np.iscomplexobj(im):
             self._widget.setImage(np.abs(im), name+"_abs")
             self._widget.setImage(np.angle(im), name+"_angle")
         else:
@@ -204,10 +201,10 @@ class HoloController(LiveUpdatedController):
             updateRate = 1
         self.updateRate = updateRate
         self.it = 0
+        if isNIP:
+            self.holoAnalysisWorker.setTargetRate(updateRate)
 
     class HoloImageComputationWorker(Worker):
-        sigHoloImageComputed = Signal(np.ndarray, str)
-
         def __init__(self):
             super().__init__()
 
@@ -219,7 +216,9 @@ class HoloController(LiveUpdatedController):
             self.active = False
             self.CCCenter = None
             self.CCRadius = 100
-            self.isBusy = False
+            self.roiSize = 1024
+            self.binning = 1
+            self.propagator = AngularSpectrumPropagator()
 
         def set_CCCenter(self, CCCenter):
             self.CCCenter = CCCenter
@@ -241,35 +240,30 @@ class HoloController(LiveUpdatedController):
             print(Main.eval("sin.(mimage)"))
             '''
             # FIXME: @Aaron, you can change this code to have yours instead
+            # The propagation kernels are cached by the propagator, so only the
+            # FFTs are computed per frame as long as the parameters do not change
             if self.reconstructionMode == "offaxis" and self.CCCenter is not None:
                 mimage = np.sqrt(nip.image(mimage.copy()))  # get e-field
                 mpupil = nip.ft(mimage.copy())             # bring to FT space
                 mpupil = nip.extract(mpupil, ROIsize=(int(self.CCRadius),int(self.CCRadius)), centerpos=(int(self.CCCenter[0]), int(self.CCCenter[1])), checkComplex=False) # cut out CC-term
 
-                mimage = np.squeeze(nip.ift(mpupil))        # this is still complex
+                mimage = np.squeeze(np.asarray(nip.ift(mpupil)))  # this is still complex
                 if self.dz != 0:
-                    mimage.pixelsize=(pixelsize, pixelsize)
-                    cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
                     defocus = self.dz * 0.1 #  defocus factor
-                    PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-                    propagated = np.exp(1j * PhaseMap)*mimage
-                    return propagated
+                    return self.propagator(mimage, defocus, pixelsize, PSFpara.wavelength,
+                                           NA=PSFpara.NA, n=getattr(PSFpara, 'n', 1.0))
                 else:
                     return mimage
             elif self.reconstructionMode == "inline":
+                mimage = binImage(centerCrop(mimage, N_subroi), self.binning)
+                mimage = np.sqrt(mimage, dtype=np.float32)
                 if self.dz != 0:
-                    mimage = nip.image(np.sqrt(mimage.copy()))
-                    mimage = nip.extract(mimage, [N_subroi,N_subroi], checkComplex=False)
-                    mimage.pixelsize=(pixelsize, pixelsize)
-                    mpupil = nip.ft(mimage)
-                    #nip.__make_propagator__(mpupil, PSFpara, doDampPupil=True, shape=mpupil.shape, distZ=dz)
-                    cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
                     defocus = self.dz #  defocus factor
-                    PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-                    propagated = nip.ft2d((np.exp(1j * PhaseMap))*mpupil)
-                    return np.squeeze(propagated)
+                    return self.propagator(mimage, defocus, pixelsize * self.binning,
+                                           PSFpara.wavelength, NA=PSFpara.NA,
+                                           n=getattr(PSFpara, 'n', 1.0))
                 else:
-                    return np.squeeze(mimage)
+                    return mimage
             else:
                 return np.squeeze(np.zeros_like(mimage))
 
@@ -279,35 +273,24 @@ class HoloController(LiveUpdatedController):
             return np.squeeze(np.zeros_like(mimage))
 
         def computeHoloImage(self, mHologram):
-            """ Compute Holo of an image. """
-            self.isBusy = True
-            try:
-                if 0:
-                    holorecon = np.flip(self.reconholo(mHologram, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz),1)
-                else:
-                    # here comes Aarons code
-                    holorecon = self.reconHoloAaron(mHologram, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)
-
-                self.sigHoloImageComputed.emit(np.array(holorecon), "Hologram")
-                if self.reconstructionMode == "offaxis":
-                    mFT = nip.ft2d(mHologram)
-                    self.sigHoloImageComputed.emit(np.abs(np.array(np.log(1+mFT))), "FFT")
-            except Exception as e:
-                self._logger.error(f"Error in computeHoloImage: {e}")
-            self.isBusy = False
-
-        def prepareForNewImage(self, image):
-            """ Must always be called before the worker receives a new image. """
-            self._image = image
-            if self.active and not self.isBusy:
-                self.isBusy = True
-                mThread = threading.Thread(target=self.computeHoloImage, args=(self._image,))
-                mThread.start()
+            """ Compute Holo of an image. Returns a list of (image, name)
+            pairs to display. """
+            holorecon = self.reconholo(mHologram, PSFpara=self.PSFpara, N_subroi=self.roiSize, pixelsize=self.pixelsize, dz=self.dz)
+
+            images = [(np.array(holorecon), "Hologram")]
+            if self.reconstructionMode == "offaxis":
+                mFT = nip.ft2d(mHologram)
+                images.append((np.abs(np.array(np.log(1+mFT))), "FFT"))
+            return images
 
 
         def set_dz(self, dz):
             self.dz = dz
 
+        def set_processingRegion(self, roiSize, binning):
+            self.roiSize = roiSize
+            self.binning = binning
+
         def set_PSFpara(self, PSFpara):
             self.PSFpara = PSFpara
 
@@ -5,12 +5,17 @@ import numpy as np
 import time
 import tifffile as tif
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
+from imswitch.imcontrol.model.ism import ISMStreamWriter, PixelReassignmentPreview, ismPatternIndex
+from imswitch.imcontrol.model.simacquisition import (
+    FrameGrabber, FrameSyncedSIMAcquisition, detectorFrameSource
+)
 
 
 from ..basecontrollers import LiveUpdatedController
@@ -21,6 +26,7 @@ class ISMController(LiveUpdatedController):
     """Linked to ISMWidget."""
 
     sigImageReceived = Signal()
+    sigISMPreviewUpdated = Signal(np.ndarray)  # (image)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -37,7 +43,18 @@ class ISMController(LiveUpdatedController):
 
         self.updateRate=2
 
-        self.tUnshake = .1
+        # scan geometry: one lit scanner pixel per unit cell, nUnitCell**2 patterns
+        self.nUnitCell = 16
+        self.nPixels = 256
+
+        # time the scanner needs to settle after a pattern is confirmed;
+        # with a triggered scanner the next pattern is queued while a frame exposes
+        self.tUnshake = 0.0
+        self.isScannerTriggered = False
+        self.ISMAcquisition = None
+        self.ISMWriter = None
+        self.ISMPreview = PixelReassignmentPreview()
+        self.LastISMPreview = None
 
         if self._setupInfo.ism is None:
             self._widget.replaceWithError('ISM is not configured in your setup file.')
@@ -51,6 +68,7 @@ class ISMController(LiveUpdatedController):
         self._widget.ISMShowSinglePatternButton.clicked.connect(self.initFilter)
 
         self._widget.sigSliderLaser1ValueChanged.connect(self.valueLaser1Changed)
+        self.sigISMPreviewUpdated.connect(self.displayStack)
 
         # select detectors
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
@@ -69,18 +87,17 @@ class ISMController(LiveUpdatedController):
 
 
     def getISMFrame(self, nFrame=0):
-        # try pattern
-        nPixels = 256
-        nUnitCell = 16
-        unitCell = np.zeros((nUnitCell,nUnitCell))
-        iX = nFrame//nUnitCell
-        iY = nFrame%nUnitCell
-        unitCell[iX,iY]=1
-        ismPattern = np.matlib.repmat(unitCell, int(nPixels//nUnitCell), int(nPixels//nUnitCell))
-        ismPatternIndex =  np.where(ismPattern.flatten()>0)[0]
-        return ismPatternIndex
+        return ismPatternIndex(nFrame, self.nUnitCell, self.nPixels)
+
+    def supportsScannerPatterns(self):
+        """ Whether the selected laser can display ISM scanner patterns. """
+        supports = getattr(self.laser, 'supportsScannerPatterns', None)
+        return supports is not None and supports()
 
     def initFilter(self):
+        if not self.supportsScannerPatterns():
+            self._widget.setText("The laser can't display scanner patterns")
+            return
         ismPatternIndex = self.getISMFrame(nFrame=0)
         self.laser.sendScannerPattern(ismPatternIndex, scannernFrames=1,
             scannerLaserVal=32000,
@@ -92,6 +109,13 @@ class ISMController(LiveUpdatedController):
         # this is not a thread!
         self._widget.ISMStartButton.setEnabled(False)
 
+        if not self.supportsScannerPatterns():
+            self._logger.error(f"ISM needs a laser that displays scanner patterns, "
+                               f"{self.laser.name} doesn't")
+            self._widget.setText("The laser can't display scanner patterns")
+            self._widget.ISMStartButton.setEnabled(True)
+            return
+
         if not self.isISMrunning and self.Laser1Value>0:
             self.nImages = 0
             self._widget.setText("Starting ISM...")
@@ -154,6 +178,11 @@ class ISMController(LiveUpdatedController):
         except  Exception as e:
             self._logger.error(e)
 
+        try:
+            self._widget.setImage(self.LastISMPreview, colormap="gray", name="ISM preview")
+        except Exception as e:
+            self._logger.error(e)
+
         try:
             self._widget.setImage(self.LastStackLaser2ArrayLast, colormap="red", name="Red")
         except Exception as e:
@@ -171,35 +200,84 @@ class ISMController(LiveUpdatedController):
 
 
 
+    def displayPatternAsync(self, patternIndices):
+        """ Returns a function that queues ISM pattern i to the scanner and
+        returns a Future that is done when the scanner confirmed it. """
+        def displayPattern(iISMimage):
+            return self._scannerExecutor.submit(
+                self.laser.sendScannerPattern, patternIndices[iISMimage], scannernFrames=10,
+                scannerLaserVal=32000, scannerExposure=500, scannerDelay=500, isBlocking=True
+            )
+        return displayPattern
+
     def takeISMImageThread(self):
         # this wil run i nthe background
         self._logger.debug("Take ISM images")
-
-        # reserve and free space for displayed stacks
-        self.LastStackLaser1 = []
-
-        for iISMimage in range(16*16):
-            # 1: Display ISM Frame
-            ismPatternIndex = self.getISMFrame(nFrame=iISMimage)
-            self._widget.setText("Displaying pattern # "+str(iISMimage))
-            self.laser.sendScannerPattern(ismPatternIndex, scannernFrames=10,
-                scannerLaserVal=32000,
-                scannerExposure=500, scannerDelay=500, isBlocking=False)
-            filePath = self.getSaveFilePath(date=self.ISMDate, filename=f'{self.ISMFilename}_{iISMimage}', extension=".tif")
-            time.sleep(self.tUnshake) # wait for display
-            lastFrame = self.detector.getLatestFrame()
-            self.LastStackLaser1.append(lastFrame)
-            tif.imwrite(filePath, lastFrame, append=True)
-
+        nPatterns = self.nUnitCell**2
+        patternIndices = [self.getISMFrame(nFrame=i) for i in range(nPatterns)]
+
+        # all frames go to one multi-page file and into the reassignment preview
+        filePath = self.getSaveFilePath(date=self.ISMDate, filename=self.ISMFilename, extension="tif")
+        self.ISMPreview.reset()
+        self.ISMWriter = ISMStreamWriter(filePath, preview=self.ISMPreview)
+        self._scannerExecutor = ThreadPoolExecutor(max_workers=1)
+        grabber = FrameGrabber(detectorFrameSource(self.detector))
+        grabber.start()
+        self.ISMAcquisition = FrameSyncedSIMAcquisition(
+            self.displayPatternAsync(patternIndices), grabber, numPatterns=nPatterns,
+            triggered=self.isScannerTriggered, displayDelay=self.tUnshake
+        )
+
+        def onFrame(iISMimage, frame, frameId):
+            self.ISMWriter.write(iISMimage, frame, {'frameId': int(frameId), 'timestamp': time.time()})
             self.nImages += 1
-            self._widget.setText(self.nImages)
+            if (iISMimage + 1) % self.nUnitCell == 0:
+                self._widget.setText(f"Pattern {iISMimage + 1}/{nPatterns}")
+                preview = self.ISMPreview.image()
+                if preview is not None:
+                    self.sigISMPreviewUpdated.emit(preview)
+
+        try:
+            self.ISMAcquisition.acquire(onFrame=onFrame, keepFrames=False,
+                                        isRunning=lambda: self.isISMrunning)
+        except Exception as e:
+            self._logger.error(f"ISM scan failed: {e}")
+        finally:
+            grabber.stop()
+            self._scannerExecutor.shutdown()
+            self.ISMWriter.close()
 
         self.isISMrunning = False
 
-        self.LastStackLaser1ArrayLast = np.array(self.LastStackLaser1)
+        # the raw frames are only kept in the file, read them back once for showLast
+        try:
+            self.LastStackLaser1ArrayLast = tif.imread(filePath, key=slice(None))
+        except Exception as e:
+            self._logger.error(f"Could not read back the ISM stack: {e}")
+        self.LastISMPreview = self.ISMPreview.image()
+        if self.LastISMPreview is not None:
+            self.sigISMPreviewUpdated.emit(self.LastISMPreview)
         self._widget.ISMShowLastButton.setEnabled(True)
         self._widget.ISMStartButton.setEnabled(True)
 
+    @APIExport()
+    def getISMStatistics(self) -> dict:
+        """ Returns the timing of the last ISM scan (time per scan, pattern
+        confirmation latency, frames not used) and of the file writer. """
+        statistics = {}
+        if self.ISMAcquisition is not None:
+            statistics.update(self.ISMAcquisition.getStatistics())
+        if self.ISMWriter is not None:
+            statistics.update(self.ISMWriter.getStatistics())
+        return statistics
+
+    @APIExport()
+    def setISMScannerTiming(self, settleTime: float = 0.0, triggered: bool = False) -> None:
+        """ Sets the time the scanner needs to settle after a pattern, and
+        whether it is advanced by the camera trigger so that the next pattern
+        can be queued while a frame exposes. """
+        self.tUnshake = settleTime
+        self.isScannerTriggered = triggered
 
     def switchOffIllumination(self):
         # switch off all illu sources
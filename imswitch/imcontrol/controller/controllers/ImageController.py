@@ -59,7 +59,7 @@ class ImageController(LiveUpdatedController):
                 im = self._widget.getImage(detectorName)
 
             # self._widget.setImageDisplayLevels(detectorName, *guitools.bestLevels(im))
-            self._widget.setImageDisplayLevels(detectorName, *guitools.minmaxLevels(im))
+            self._widget.setImageDisplayLevels(detectorName, *guitools.subsampledMinmaxLevels(im))
 
     def addItemToVb(self, item):
         """ Add item from communication channel to viewbox."""
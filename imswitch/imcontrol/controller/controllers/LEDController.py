@@ -36,7 +36,7 @@ class LEDController(ImConWidgetController):
         self._widget.setScanDefaultPreset(self._setupInfo.defaultLEDPresetForScan)
 
         # Connect CommunicationChannel signals
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigScanStarting.connect(lambda: self.scanChanged(True))
         self._commChannel.sigScanBuilt.connect(self.scanBuilt)
         self._commChannel.sigScanEnded.connect(lambda: self.scanChanged(False))
@@ -204,15 +204,19 @@ class LEDController(ImConWidgetController):
             if lName not in deviceList:
                 self._widget.setLEDEditable(lName, True)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 3 or key[0] != _attrCategory:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        ledName = key[1]
-        if key[2] == _enabledAttr:
-            self.setLEDActive(ledName, value)
-        elif key[2] == _valueAttr:
-            self.setLEDValue(ledName, value)
+        for key, value in changes.items():
+            if len(key) != 3 or key[0] != _attrCategory:
+                continue
+
+            ledName = key[1]
+            if key[2] == _enabledAttr:
+                self.setLEDActive(ledName, value)
+            elif key[2] == _valueAttr:
+                self.setLEDValue(ledName, value)
 
     def setSharedAttr(self, ledName, attr, value):
         self.settingAttr = True
@@ -1,9 +1,11 @@
 from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from qtpy import QtCore, QtWidgets
 import numpy as np
 
 
+from imswitch.imcommon.framework import FrameworkUtils
 from imswitch.imcommon.model import APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcontrol.view import guitools as guitools
@@ -22,6 +24,8 @@ class LEDMatrixController(ImConWidgetController):
         self.nLedsY = self._master.LEDMatrixsManager._subManagers['ESP32 LEDMatrix'].Ny
 
         self._ledmatrixMode = ""
+        self._isSequenceTriggered = False
+        self._sequenceExecutor = None
 
         # get the name that looks like an LED Matrix
         self.ledMatrix_name = self._master.LEDMatrixsManager.getAllDeviceNames()[0]
@@ -101,6 +105,61 @@ class LEDMatrixController(ImConWidgetController):
         pattern = self.ledMatrix.getPattern()
         self._widget.leds[str(LEDid)].setChecked(state)
 
+    @APIExport()
+    def uploadPatternSequence(self, patterns: list) -> str:
+        """ Uploads a sequence of patterns, each a list with the (r, g, b)
+        value of every LED, and returns its key. Patterns are then shown with
+        setPatternSequenceIndex or advancePatternSequence. """
+        return self.ledMatrix.uploadPatternSequence(patterns)
+
+    @APIExport()
+    def setPatternSequenceIndex(self, index: int, key: str = None):
+        self._ledmatrixMode = "sequence"
+        self.ledMatrix.setPatternSequenceIndex(int(index), key=key)
+
+    @APIExport()
+    def advancePatternSequence(self) -> int:
+        self._ledmatrixMode = "sequence"
+        return self.ledMatrix.advancePatternSequence()
+
+    @APIExport(runOnUIThread=True)
+    def setPatternSequenceTriggered(self, enabled: bool = True):
+        """ Advances the active pattern sequence on every new frame of the
+        current detector. The serial commands are sent on a worker thread, in
+        frame order, so that neither the UI nor the camera waits for them. """
+        if enabled == self._isSequenceTriggered:
+            return
+        if enabled:
+            self._sequenceExecutor = ThreadPoolExecutor(max_workers=1,
+                                                        thread_name_prefix='LEDMatrixSequence')
+            FrameworkUtils.connectDirect(self._commChannel.sigUpdateImage, self._advanceOnFrame)
+        else:
+            self._commChannel.sigUpdateImage.disconnect(self._advanceOnFrame)
+            self._sequenceExecutor.shutdown(wait=False)
+            self._sequenceExecutor = None
+        self._isSequenceTriggered = enabled
+
+    def _advanceOnFrame(self, detectorName, image, init, scale, isCurrentDetector):
+        # called on the thread that emits the frame
+        executor = self._sequenceExecutor
+        if not isCurrentDetector or executor is None:
+            return
+        try:
+            executor.submit(self._advancePatternSequence)
+        except RuntimeError:
+            pass  # triggering was switched off meanwhile
+
+    def _advancePatternSequence(self):
+        try:
+            self.ledMatrix.advancePatternSequence()
+        except Exception as e:
+            self.__logger.error(f'Failed to advance the pattern sequence: {e}')
+
+    def closeEvent(self):
+        if self._isSequenceTriggered:
+            self.setPatternSequenceTriggered(False)
+        super().closeEvent()
+
     def connect_leds(self):
         """Connect leds (Buttons) to the Sample Pop-Up Method"""
         # Connect signals for all buttons
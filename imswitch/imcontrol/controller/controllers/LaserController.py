@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import Dict, List, Union
 
 from imswitch.imcommon.model import APIExport
 from imswitch.imcontrol.model import configfiletools
@@ -16,18 +16,19 @@ class LaserController(ImConWidgetController):
         self.presetBeforeScan = None
 
         # Set up lasers
-        for lName, lManager in self._master.lasersManager:
-            self._widget.addLaser(
-                lName, lManager.valueUnits, lManager.valueDecimals, lManager.wavelength,
-                (lManager.valueRangeMin, lManager.valueRangeMax) if not lManager.isBinary else None,
-                lManager.valueRangeStep if lManager.valueRangeStep is not None else None,
-                (lManager.freqRangeMin, lManager.freqRangeMax, lManager.freqRangeInit) if lManager.isModulated else (0, 0, 0)
-            )
-            if not lManager.isBinary:
-                self.valueChanged(lName, lManager.valueRangeMin)
-
-            self.setSharedAttr(lName, _enabledAttr, self._widget.isLaserActive(lName))
-            self.setSharedAttr(lName, _valueAttr, self._widget.getValue(lName))
+        with self._commChannel.sharedAttrs.batch():
+            for lName, lManager in self._master.lasersManager:
+                self._widget.addLaser(
+                    lName, lManager.valueUnits, lManager.valueDecimals, lManager.wavelength,
+                    (lManager.valueRangeMin, lManager.valueRangeMax) if not lManager.isBinary else None,
+                    lManager.valueRangeStep if lManager.valueRangeStep is not None else None,
+                    (lManager.freqRangeMin, lManager.freqRangeMax, lManager.freqRangeInit) if lManager.isModulated else (0, 0, 0)
+                )
+                if not lManager.isBinary:
+                    self.valueChanged(lName, lManager.valueRangeMin)
+
+                self.setSharedAttr(lName, _enabledAttr, self._widget.isLaserActive(lName))
+                self.setSharedAttr(lName, _valueAttr, self._widget.getValue(lName))
 
         # Load presets
         for laserPresetName in self._setupInfo.laserPresets:
@@ -37,7 +38,7 @@ class LaserController(ImConWidgetController):
         self._widget.setScanDefaultPreset(self._setupInfo.defaultLaserPresetForScan)
 
         # Connect CommunicationChannel signals
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigScanStarting.connect(lambda: self.scanChanged(True))
         self._commChannel.sigScanBuilt.connect(self.scanBuilt)
         self._commChannel.sigScanEnded.connect(lambda: self.scanChanged(False))
@@ -226,15 +227,19 @@ class LaserController(ImConWidgetController):
             if lName not in deviceList:
                 self._widget.setLaserEditable(lName, True)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 3 or key[0] != _attrCategory:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        laserName = key[1]
-        if key[2] == _enabledAttr:
-            self.setLaserActive(laserName, value)
-        elif key[2] == _valueAttr:
-            self.setLaserValue(laserName, value)
+        for key, value in changes.items():
+            if len(key) != 3 or key[0] != _attrCategory:
+                continue
+
+            laserName = key[1]
+            if key[2] == _enabledAttr:
+                self.setLaserActive(laserName, value)
+            elif key[2] == _valueAttr:
+                self.setLaserValue(laserName, value)
 
     def setSharedAttr(self, laserName, attr, value):
         self.settingAttr = True
@@ -260,6 +265,26 @@ class LaserController(ImConWidgetController):
         uses. """
         self._widget.setValue(laserName, value)
 
+    @APIExport()
+    def getLaserSetpointStates(self) -> Dict[str, dict]:
+        """ Returns the requested and the applied output of the lasers whose
+        setpoint commands are coalesced, with the time of the request and of
+        the last command sent, whether the request is still held back and the
+        error of the last failed command. """
+        states = {}
+        for laserName, laserManager in self._master.lasersManager:
+            state = laserManager.getSetpointState()
+            if state is not None:
+                states[laserName] = state
+        return states
+
+    @APIExport()
+    def waitForLaserSetpoints(self, timeout: float = 1.0) -> bool:
+        """ Waits until the requested outputs of all lasers have been sent.
+        Returns False if that takes longer than timeout seconds. """
+        return all([laserManager.flushSetpoints(timeout)
+                    for _, laserManager in self._master.lasersManager])
+
     @APIExport()
     def changeScanPower(self, laserName, laserValue):
         defaultPreset = self._setupInfo.laserPresets[self._setupInfo.defaultLaserPresetForScan]
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import threading
 from datetime import datetime
 import time
@@ -9,10 +10,10 @@ import scipy
 import scipy.ndimage as ndi
 import scipy.signal as signal
 import skimage.transform as transform
-import tifffile as tif
 
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
+from imswitch.imcontrol.model.lightsheet import FrameClock, PositionTrack, VolumeStore
 from skimage.registration import phase_cross_correlation
 from ..basecontrollers import ImConWidgetController
 
@@ -26,6 +27,7 @@ class LightsheetController(ImConWidgetController):
 
         self.lightsheetTask = None
         self.lightsheetStack = np.ones((1,1,1))
+        self.lightsheetPixelSizeZ = 1
         self._widget.startButton.clicked.connect(self.startLightsheet)
         self._widget.stopButton.clicked.connect(self.stopLightsheet)
         
@@ -101,12 +103,19 @@ class LightsheetController(ImConWidgetController):
                 yPosition = mScanParams['y_min']+j*ySpacing
                 xyPositions.append((int(xPosition), int(yPosition)))
         
-        # perform the scanning in the background
+        # perform the scanning in the background, all tiles go to one store
         def performScanning(xyPositions, zMin, zMax, speed, axis, illuSource, illuValue):
             if not self.isLightsheetRunning:
                 self.isLightsheetRunning = True
-                for x, y in xyPositions:
-                    self.lightsheetThread(zMin, zMax, x, y, speed, axis, illuSource, illuValue)
+                volumeStore = self.createVolumeStore()
+                try:
+                    for x, y in xyPositions:
+                        if not self.isLightsheetRunning:
+                            break
+                        self.lightsheetThread(zMin, zMax, x, y, speed, axis, illuSource, illuValue,
+                                              volumeStore=volumeStore)
+                finally:
+                    volumeStore.close()
                 self.isLightsheetRunning = False
         self._logger.info("Scan started")
         mThread = threading.Thread(target=performScanning, args=(xyPositions, mScanParams['z_min'], mScanParams['z_max'], mScanParams['speed'], mScanParams['stage_axis'], mScanParams['illu_source'], mScanParams['illu_value']))
@@ -201,12 +210,10 @@ class LightsheetController(ImConWidgetController):
     def displayImage(self):
         # a bit weird, but we cannot update outside the main thread
         name = "Lightsheet Stack"
-        # subsample stack 
-        # if the stack is too large, we have to subsample it 
-        if self.lightsheetStack.shape[0] > 200:
-            subsample = 10
-            self.lightsheetStack = self.lightsheetStack[::subsample,:,:]
-        self._widget.setImage(np.uint16(self.lightsheetStack ), colormap="gray", name=name, pixelsize=(20,1,1), translation=(0,0,0))
+        # the stack is already subsampled to a displayable number of planes
+        pixelSizeXY = self.detector.pixelSizeUm[-1]
+        self._widget.setImage(np.uint16(self.lightsheetStack), colormap="gray", name=name,
+                              pixelsize=(self.lightsheetPixelSizeZ, pixelSizeXY, pixelSizeXY), translation=(0,0,0))
 
     def valueIlluChanged(self):
         illuSource = self._widget.getIlluminationSource()
@@ -256,7 +263,7 @@ class LightsheetController(ImConWidgetController):
             self.lightsheetTask.start()
         
         
-    def lightsheetThread(self, minPosZ, maxPosZ, posX=None, posY=None, speed=10000, axis="A", illusource=None, illuvalue=None, isSave=True):
+    def lightsheetThread(self, minPosZ, maxPosZ, posX=None, posY=None, speed=10000, axis="A", illusource=None, illuvalue=None, isSave=True, volumeStore=None):
         self._logger.debug("Lightsheet thread started.")
         # TODO Have button for is save
         if posX is not None:
@@ -266,77 +273,65 @@ class LightsheetController(ImConWidgetController):
         self.detector.startAcquisition()
         # move to minPos
         self.stages.move(value=minPosZ, axis=axis, is_absolute=False, is_blocking=True)
-        
-        # now start acquiring images and move the stage in Background
+
+        isOwnStore = volumeStore is None
+        if isOwnStore:
+            volumeStore = self.createVolumeStore(isSave)
+        allPositions = self.stages.getPosition()
+        tile = volumeStore.startTile({"X": allPositions.get("X"), "Y": allPositions.get("Y")})
+
+        # now stream the frames to the store while the stage moves in the background
+        positionTrack = PositionTrack()
+        positionTrack.addSample(allPositions[axis])
+        self.detector.flushBuffers()
+        frameClock = FrameClock()
         controller = MovementController(self.stages)
         controller.move_to_position(maxPosZ+np.abs(minPosZ), axis, speed, is_absolute=False)
 
-        iFrame = 0
-        allFrames = []
         while self.isLightsheetRunning:
-            '''
-            from juliacall import Main as jl 
-            jl.seval('import Pkg; Pkg.add("FourierTools")')
-            # jl.seval("Pkg.add(\"FourierTools\")") 
-            jl.seval("using FourierTools") 
-            jl.tofft = jl.copy(frame) 
-            fftImage = np.array(jl.seval("abs.(log10.(abs.(ft(tofft))))")) 
-            print(fftImage) 
-            jl.println("hello from Julia")
-            '''
-            # Todo: Need to ensure thatwe have the right pattern displayed and the buffer is free - this heavily depends on the exposure time..
-            mFrame = None
-            lastFrameNumber = -1
-            timeoutFrameRequest = .3 # seconds
-            cTime = time.time()
-            
-            while(1):
-                # something went wrong while capturing the frame
-                if time.time()-cTime> timeoutFrameRequest:
-                    break
-                mFrame, currentFrameNumber = self.detector.getLatestFrame(returnFrameNumber=True)
-                if currentFrameNumber <= lastFrameNumber:
-                    time.sleep(0.01)
-                    continue  
-                print(f"Frame number used for stack: {currentFrameNumber}") 
-                lastFrameNumber = currentFrameNumber
+            isTargetReached = controller.is_target_reached()
+            frames = self.detector.getChunk()
+            if frames is not None and len(frames) > 0 and frames[0].shape[0] != 0:
+                volumeStore.append(frames, frameClock.timestamps(len(frames)))
+            if isTargetReached:
                 break
-                            
-            if mFrame is not None and mFrame.shape[0] != 0:
-                allFrames.append(mFrame.copy())
-            if controller.is_target_reached():
-                break 
-            
-            iFrame += 1
-            # self._logger.debug(iFrame)
-        
+            time.sleep(0.01)
+
+        if controller.is_target_reached():
+            positionTrack.addSample(self.getPositionByAxis(axis), controller.reachedTime)
+        else:
+            # stopped during the sweep, the position is the one reached now
+            positionTrack.addSample(self.getPositionByAxis(axis))
+        pixelSizeZ = volumeStore.finishTile(positionTrack)
+        if isOwnStore:
+            volumeStore.close()
 
         # move back to initial position
         self.stages.move(value=-maxPosZ, axis=axis, is_absolute=False, is_blocking=True)
-        
-        # do something with the frames 
-        def displayAndSaveImageStack(isSave):
-            if len(allFrames) == 0:
-                self._logger.error("No frames captured.")
-                return
-            self.lightsheetStack = np.array(allFrames).copy()
+
+        if volumeStore.planeCounts[tile] == 0:
+            self._logger.error("No frames captured.")
+        else:
+            self._logger.info(f"Captured {volumeStore.planeCounts[tile]} planes, "
+                              f"spacing {pixelSizeZ}, saved to {volumeStore.path}")
+            self.lightsheetStack, step = volumeStore.preview(tile)
+            self.lightsheetPixelSizeZ = (pixelSizeZ or 1) * step
             self.sigImageReceived.emit()
-            # retreive positions and store the data if necessary
-            pixelSizeZ = (maxPosZ-minPosZ)/len(allFrames)
-            pixelSizeXY = self.detector.pixelSizeUm[-1]
-            allPositions = self.stages.getPosition()
-            posX = allPositions["X"]
-            posY = allPositions["Y"]
-            posZ = allPositions["Z"]
-            if isSave:
-                # save image stack with metadata
-                tif.imsave(f"lightsheet_stack_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_x_{posX}_y_{posY}_z_{posZ}_pz_{pixelSizeZ}_pxy_{pixelSizeXY}.tif", self.lightsheetStack)
-        saveImageThread = threading.Thread(target=displayAndSaveImageStack, args =(isSave,))
-        saveImageThread.start()
-        self.stopLightsheet()
-        
-        
-        
+        if isOwnStore:
+            self.stopLightsheet()
+
+    def createVolumeStore(self, isSave=True):
+        """ Creates the store that light-sheet volumes are streamed to; a
+        temporary one if the data is not to be saved. """
+        if isSave:
+            dirPath = os.path.join(dirtools.UserFileDirs.Root, 'recordings')
+            os.makedirs(dirPath, exist_ok=True)
+            path = os.path.join(dirPath, f"lightsheet_stack_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zarr")
+        else:
+            path = tempfile.mkdtemp(suffix='.zarr')
+        return VolumeStore(path, attrs={"pixelSizeUm": self.detector.pixelSizeUm[-1],
+                                        "detector": self.detector.name})
+
     def stopLightsheet(self):
         self.isLightsheetRunning = False
         self._widget.startButton.setEnabled(True)
@@ -359,6 +354,7 @@ class MovementController:
         self.target_reached = False
         self.target_position = None
         self.axis = None
+        self.reachedTime = None
 
     def move_to_position(self, minPos, axis, speed, is_absolute):
         self.target_position = minPos
@@ -371,6 +367,7 @@ class MovementController:
     def _move(self):
         self.target_reached = False
         self.stages.move(value=self.target_position, axis=self.axis, speed=self.speed, is_absolute=self.is_absolute, is_blocking=True)
+        self.reachedTime = time.time()
         self.target_reached = True
 
     def is_target_reached(self):
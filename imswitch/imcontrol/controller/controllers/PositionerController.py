@@ -19,25 +19,26 @@ class PositionerController(ImConWidgetController):
         self.__logger = initLogger(self, tryInheritParent=True)
 
         # Set up positioners
-        for pName, pManager in self._master.positionersManager:
-            if not pManager.forPositioning:
-                continue
-
-            hasSpeed = hasattr(pManager, 'speed')
-            hasHome = hasattr(pManager, 'home')
-            hasStop = hasattr(pManager, 'stop')
-            self._widget.addPositioner(pName, pManager.axes, hasSpeed, hasHome, hasStop)
-            for axis in pManager.axes:
-                self.setSharedAttr(pName, axis, _positionAttr, pManager.position[axis])
-                if hasSpeed:
-                    self.setSharedAttr(pName, axis, _speedAttr, pManager.speed[axis])
-                if hasHome:
-                    self.setSharedAttr(pName, axis, _homeAttr, pManager.home[axis])
-                if hasStop:
-                    self.setSharedAttr(pName, axis, _stopAttr, pManager.stop[axis])
+        with self._commChannel.sharedAttrs.batch():
+            for pName, pManager in self._master.positionersManager:
+                if not pManager.forPositioning:
+                    continue
+
+                hasSpeed = hasattr(pManager, 'speed')
+                hasHome = hasattr(pManager, 'home')
+                hasStop = hasattr(pManager, 'stop')
+                self._widget.addPositioner(pName, pManager.axes, hasSpeed, hasHome, hasStop)
+                for axis in pManager.axes:
+                    self.setSharedAttr(pName, axis, _positionAttr, pManager.position[axis])
+                    if hasSpeed:
+                        self.setSharedAttr(pName, axis, _speedAttr, pManager.speed[axis])
+                    if hasHome:
+                        self.setSharedAttr(pName, axis, _homeAttr, pManager.home[axis])
+                    if hasStop:
+                        self.setSharedAttr(pName, axis, _stopAttr, pManager.stop[axis])
 
         # Connect CommunicationChannel signals
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigUpdateMotorPosition.connect(self.updateAllPositionGUI) # force update position in GUI
 
         # Connect PositionerWidget signals
@@ -111,11 +112,16 @@ class PositionerController(ImConWidgetController):
         self._widget.setSpeedSize(positionerName, axis, speed)
         
     def updateAllPositionGUI(self):
-        # update all positions for all axes in GUI
-        for positionerName in self._master.positionersManager.getAllDeviceNames():
-            for axis in self._master.positionersManager[positionerName].axes:
-                self.updatePosition(positionerName, axis)
-                self.updateSpeed(positionerName, axis)
+        # update all positions for all axes in GUI, as one change of the shared attributes
+        self.settingAttr = True
+        try:
+            with self._commChannel.sharedAttrs.batch():
+                for positionerName in self._master.positionersManager.getAllDeviceNames():
+                    for axis in self._master.positionersManager[positionerName].axes:
+                        self.updatePosition(positionerName, axis)
+                        self.updateSpeed(positionerName, axis)
+        finally:
+            self.settingAttr = False
                 
     def updatePosition(self, positionerName, axis):
         if axis == "XY":
@@ -146,21 +152,25 @@ class PositionerController(ImConWidgetController):
         self.__logger.debug(f"Stopping axis {axis}")
         self._master.positionersManager[positionerName].forceStop(axis)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 4 or key[0] != _attrCategory:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        positionerName = key[1]
-        axis = key[2]
-        if key[3] == _positionAttr:
-            self.setPositioner(positionerName, axis, value)
+        for key, value in changes.items():
+            if len(key) != 4 or key[0] != _attrCategory:
+                continue
+
+            positionerName = key[1]
+            axis = key[2]
+            if key[3] == _positionAttr:
+                self.setPositioner(positionerName, axis, value)
 
     def setSharedAttr(self, positionerName, axis, attr, value):
-        self.settingAttr = True
+        settingAttr, self.settingAttr = self.settingAttr, True
         try:
             self._commChannel.sharedAttrs[(_attrCategory, positionerName, axis, attr)] = value
         finally:
-            self.settingAttr = False
+            self.settingAttr = settingAttr
 
     def setXYPosition(self, x, y):
         positionerX = self.getPositionerNames()[0]
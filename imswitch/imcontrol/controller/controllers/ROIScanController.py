@@ -9,16 +9,17 @@ import scipy
 import scipy.ndimage as ndi
 import scipy.signal as signal
 import skimage.transform as transform
-import tifffile as tif
 import imswitch
 
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
+from imswitch.imcontrol.model.roiscan import (
+    PositionStackWriter, ROIScanRound, ScanPosition, SettleModel, scanPositionsFromDicts
+)
 from skimage.registration import phase_cross_correlation
 from ..basecontrollers import ImConWidgetController
 
 
-T_SETTLE=0.2
 class ROIScanController(ImConWidgetController):
     """Linked to ROIScanWidget."""
 
@@ -30,6 +31,8 @@ class ROIScanController(ImConWidgetController):
 
         self.roiscanTask = None
         self.roiscanStack = np.ones((1,1,1))
+        self.scanPositions = []
+        self.settleModel = SettleModel()
 
 
         # connect GUI
@@ -85,7 +88,8 @@ class ROIScanController(ImConWidgetController):
             z = xyzpositions["Z"]
 
             # Create a new item for the list
-            coordinate_id = self._widget.coordinatesList.count() + 1
+            coordinate_id = max((p.id for p in self.scanPositions), default=0) + 1
+            self.scanPositions.append(ScanPosition(coordinate_id, x, y, z))
             item_text = f"ID: {coordinate_id}, X: {x}, Y: {y}, Z: {z}"
             self._widget.coordinatesList.addItem(item_text)
         threading.Thread(target=save_coordinatesThread).start()
@@ -98,6 +102,7 @@ class ROIScanController(ImConWidgetController):
         if selected_item:
             row = self._widget.coordinatesList.row(selected_item)
             self._widget.coordinatesList.takeItem(row)
+            del self.scanPositions[row]
 
 
     def go_to_selected_coordinates(self):
@@ -106,8 +111,8 @@ class ROIScanController(ImConWidgetController):
 
         # If an item is selected, parse the coordinates and move to that location
         if selected_item:
-            item_text = selected_item.text()
-            _, x, y, z = [float(val.split(":")[1].strip()) for val in item_text.split(",")]
+            position = self.scanPositions[self._widget.coordinatesList.row(selected_item)]
+            x, y, z = position.x, position.y, position.z
 
             # move x
             self.stages.move(value=x, axis="X", is_absolute=True, is_blocking=False)
@@ -156,55 +161,75 @@ class ROIScanController(ImConWidgetController):
             self.roiscanTask = threading.Thread(target=self.roiscanThread, args=(nTimes, tPeriod, experimentName))
             self.roiscanTask.start()
 
+    @APIExport()
+    def getScanPositions(self):
+        """ Returns the positions visited by the ROI scan. """
+        return [{"id": p.id, "x": p.x, "y": p.y, "z": p.z} for p in self.scanPositions]
+
+    @APIExport(runOnUIThread=True)
+    def setScanPositions(self, positions: list):
+        """ Replaces the positions visited by the ROI scan; positions is a list
+        of {"x", "y", "z"} dicts with an optional, unique "id". """
+        self.scanPositions = scanPositionsFromDicts(positions)
+        if not imswitch.IS_HEADLESS:
+            self._widget.coordinatesList.clear()
+            for p in self.scanPositions:
+                self._widget.coordinatesList.addItem(f"ID: {p.id}, X: {p.x}, Y: {p.y}, Z: {p.z}")
+
+    @APIExport()
+    def setSettleTime(self, minTime: float = 0.05, timePerDistance: float = 2e-5, maxTime: float = 0.5):
+        """ Sets the settle time model: minTime plus timePerDistance seconds
+        per stage unit moved, at most maxTime. """
+        self.settleModel = SettleModel(minTime, timePerDistance, maxTime)
+
     def roiscanThread(self, nTimes, tPeriod, experimentName):
         # move to all coordinates in the list and take an image
         self._logger.debug("ROI scanning thread started.")
+        if not self.scanPositions:
+            self._logger.warning("No ROI scan positions set.")
+            self.isRoiscanRunning = False
+            return
+
+        # every position gets one file that grows by a frame per round
+        currentTime = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+        savepath = self.getSaveFilePath(currentTime, '', experimentName, "tif")
+        writer = PositionStackWriter(os.path.dirname(savepath), f"{currentTime}_{experimentName}")
+        allPositions = self.stages.getPosition()
+        scanRound = ROIScanRound(
+            self.scanPositions,
+            moveTo=lambda p: self.stages.move(value=(p.x, p.y, p.z), axis="XYZ", is_absolute=True, is_blocking=True),
+            grabFrame=self.detector.getLatestFrame, writer=writer, settleModel=self.settleModel,
+            start=(allPositions["X"], allPositions["Y"], allPositions["Z"])
+        )
+
+        def showPosition(position):
+            self._widget.infoText.setText(f"Taking image at {(position.x, position.y, position.z)} ({iImage}/{nTimes})")
 
-        # get all coordinates from coordinatesList
-        coordinates = []
-        for i in range(self._widget.coordinatesList.count()):
-            item_text = self._widget.coordinatesList.item(i).text()
-            _, x, y, z = [float(val.split(":")[1].strip()) for val in item_text.split(",")]
-            coordinates.append((x, y, z))
-
-        # move to all coordinates and take an image
-        iImage = 0
-        for i in range(nTimes):
-            if not self.isRoiscanRunning:
-                return
-            currentTime = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-            t0 = time.time()
-            allFrames = []
-            for coordinate in coordinates:
-                self._widget.infoText.setText("Taking image at "+str(coordinate) + " ("+str(iImage)+"/"+str(nTimes)+")")
-                # move xyz
-                self.stages.move(value=(coordinate[0],coordinate[1],coordinate[2]), axis="XYZ", is_absolute=True, is_blocking=True)
-                time.sleep(T_SETTLE)
-                # take an image
-                mImage = self.detector.getLatestFrame().copy()
-                allFrames.append(mImage)
-                #self.sigImageReceived.emit()
-            # save the stack as ometiff
-            self.roiscanStack = np.stack(allFrames, axis=0)
-            self.sigImageReceived.emit()
-            # save the stack as ometiff including metadata including coordinates and time
-            savepath = self.getSaveFilePath(currentTime, '', experimentName, ".tif")
-            tif.imsave(savepath, self.roiscanStack)#, metadata={"X":x, "Y":y, "Z":z, "t":datetime.now().strftime("%d-%m-%Y %H:%M:%S")})
-            self._logger.debug("Savepath: "+savepath)
-            # if the experiment is stopped, stop the thread
-            if iImage > nTimes:
-                self.stop_experiment()
-                return
-            # wait for tPeriod seconds
-            while 1:
-                self._widget.infoText.setText("Waiting for "+str(tPeriod-(time.time()-t0)) + " seconds")
-                if time.time()-t0 > tPeriod:
-                    break
+        try:
+            for iImage in range(nTimes):
                 if not self.isRoiscanRunning:
                     return
-                time.sleep(1)
-            iImage += 1
-
+                t0 = time.time()
+                allFrames = scanRound.run(iImage, isRunning=lambda: self.isRoiscanRunning,
+                                          onPosition=showPosition)
+                self._logger.debug(f"Round {iImage} took {time.time()-t0:.2f} s")
+                if allFrames:
+                    self.roiscanStack = np.stack(allFrames, axis=0)
+                    self.sigImageReceived.emit()
+                if iImage == nTimes - 1:
+                    break
+                # wait for tPeriod seconds
+                while 1:
+                    self._widget.infoText.setText("Waiting for "+str(tPeriod-(time.time()-t0)) + " seconds")
+                    if time.time()-t0 > tPeriod:
+                        break
+                    if not self.isRoiscanRunning:
+                        return
+                    time.sleep(min(1, max(0.0, tPeriod-(time.time()-t0))))
+        finally:
+            writer.close()
+            self._logger.debug("Saved ROI scan to "+writer.filePath("<id>"))
+        self.isRoiscanRunning = False
 
     def getSaveFilePath(self, date, timestamp, filename, extension):
         mFilename =  f"{date}_{filename}.{extension}"
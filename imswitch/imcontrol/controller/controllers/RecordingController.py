@@ -56,7 +56,7 @@ class RecordingController(ImConWidgetController):
         self._commChannel.sigScanDone.connect(self.scanDone)
         self._commChannel.sigUpdateRecFrameNum.connect(self.updateRecFrameNum)
         self._commChannel.sigUpdateRecTime.connect(self.updateRecTime)
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigSnapImg.connect(self.snap)
         self._commChannel.sigSnapImgPrev.connect(self.snapImagePrev)
         self._commChannel.sigStartRecordingExternal.connect(self.startRecording)
@@ -340,47 +340,54 @@ class RecordingController(ImConWidgetController):
             filename = time.strftime('%Hh%Mm%Ss')
         return filename
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 2 or key[0] != _attrCategory or value == 'null':
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        if key[1] == _recModeAttr:
-            if value == 'Snap':
-                return
-            self.setRecMode(RecMode[value])
-        elif key[1] == _framesAttr:
-            self._widget.setNumExpositions(value)
-        elif key[1] == _timeAttr:
-            self._widget.setTimeToRec(value)
-        elif key[1] == _lapseTimeAttr:
-            self._widget.setTimelapseTime(value)
-        elif key[1] == _freqAttr:
-            self._widget.setTimelapseFreq(value)
+        for key, value in changes.items():
+            if len(key) != 2 or key[0] != _attrCategory or value == 'null':
+                continue
+
+            if key[1] == _recModeAttr:
+                if value != 'Snap':
+                    self.setRecMode(RecMode[value])
+            elif key[1] == _framesAttr:
+                self._widget.setNumExpositions(value)
+            elif key[1] == _timeAttr:
+                self._widget.setTimeToRec(value)
+            elif key[1] == _lapseTimeAttr:
+                self._widget.setTimelapseTime(value)
+            elif key[1] == _freqAttr:
+                self._widget.setTimelapseFreq(value)
 
     def setSharedAttr(self, attr, value):
-        self.settingAttr = True
+        settingAttr, self.settingAttr = self.settingAttr, True
         try:
             self._commChannel.sharedAttrs[(_attrCategory, attr)] = value
         finally:
-            self.settingAttr = False
+            self.settingAttr = settingAttr
 
     def updateRecAttrs(self, *, isSnapping):
-        self.setSharedAttr(_framesAttr, 'null')
-        self.setSharedAttr(_timeAttr, 'null')
-        self.setSharedAttr(_lapseTimeAttr, 'null')
-        self.setSharedAttr(_freqAttr, 'null')
-
+        attrs = {_framesAttr: 'null', _timeAttr: 'null', _lapseTimeAttr: 'null', _freqAttr: 'null'}
         if isSnapping:
-            self.setSharedAttr(_recModeAttr, 'Snap')
+            attrs[_recModeAttr] = 'Snap'
         else:
-            self.setSharedAttr(_recModeAttr, self.recMode.name)
+            attrs[_recModeAttr] = self.recMode.name
             if self.recMode == RecMode.SpecFrames:
-                self.setSharedAttr(_framesAttr, self._widget.getNumExpositions())
+                attrs[_framesAttr] = self._widget.getNumExpositions()
             elif self.recMode == RecMode.SpecTime:
-                self.setSharedAttr(_timeAttr, self._widget.getTimeToRec())
+                attrs[_timeAttr] = self._widget.getTimeToRec()
             elif self.recMode == RecMode.ScanLapse:
-                self.setSharedAttr(_lapseTimeAttr, self._widget.getTimelapseTime())
-                self.setSharedAttr(_freqAttr, self._widget.getTimelapseFreq())
+                attrs[_lapseTimeAttr] = self._widget.getTimelapseTime()
+                attrs[_freqAttr] = self._widget.getTimelapseFreq()
+
+        self.settingAttr = True
+        try:
+            with self._commChannel.sharedAttrs.batch():
+                for attr, value in attrs.items():
+                    self.setSharedAttr(attr, value)
+        finally:
+            self.settingAttr = False
 
     def sendScanFreq(self):
         freq = self.getTimelapseFreq()
@@ -5,10 +5,16 @@ import os
 import numpy as np
 import time
 import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import tifffile as tif
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport, ostools
+from imswitch.imcontrol.model.simacquisition import FrameGrabber, FrameSyncedSIMAcquisition
+from imswitch.imcontrol.model.simreconstruction import (
+    SIMCalibrationStore, SIMReconstructionService, carriersDrifted, estimateCarriers
+)
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 
@@ -88,6 +94,13 @@ class SIMController(ImConWidgetController):
         self.simFrameVal = 0
         self.nsimFrameSyncVal = 3
 
+        # frame-synchronised acquisition for cameras without a frame buffer
+        self.isFrameSync = False
+        self.isFrameSyncTriggered = False
+        self.frameSyncDisplayDelay = 0.0
+        self.frameSync = None
+        self.frameGrabber = None
+
         # Choose which laser will be recorded
         self.is488 = True
         self.is635 = True
@@ -143,6 +156,11 @@ class SIMController(ImConWidgetController):
         self.positionerName = self._master.positionersManager.getAllDeviceNames()[0]
         self.positioner = self._master.positionersManager[self.positionerName]
 
+        # stacks are reconstructed in a queue that never drops a stack;
+        # calibrations are kept per wavelength and objective across sessions
+        self.simService = SIMReconstructionService(numWorkers=2, maxQueued=4)
+        self.simCalibrationStore = SIMCalibrationStore(os.path.join(self.simDir, 'calibration'))
+
         # setup the SIM processors
         sim_parameters = SIMParameters()
         self.SimProcessorLaser1 = SIMProcessor(self, sim_parameters, wavelength=sim_parameters.wavelength_1)
@@ -221,6 +239,78 @@ class SIMController(ImConWidgetController):
         #self.imageComputationThread.quit()
         #self.imageComputationThread.wait()
 
+    def closeEvent(self):
+        self.stopFrameSync()
+        if hasattr(self, 'simService'):
+            self.simService.close()
+        if hasattr(self, 'SIMClient'):
+            self.SIMClient.close()
+        super().closeEvent()
+
+    def startFrameSync(self):
+        '''
+        grabs frames with their frame ids in the background and selects the
+        frame of every pattern by id, see FrameSyncedSIMAcquisition; returns
+        False if the detector can't number its frames
+        '''
+        self.stopFrameSync()
+        self.frameSync = None
+        if not self.detector.supportsFrameNumbers:
+            self._logger.error(f"Frame-synchronised SIM needs a detector that returns frame "
+                               f"numbers, {self.detector.name} doesn't")
+            return False
+
+        self.frameGrabber = FrameGrabber(lambda: self.detector.getLatestFrame(returnFrameNumber=True))
+        self.frameGrabber.start()
+        self.frameSync = FrameSyncedSIMAcquisition(
+            self.SIMClient.display_pattern_async, self.frameGrabber, numPatterns=9,
+            triggered=self.isFrameSyncTriggered, displayDelay=self.frameSyncDisplayDelay
+        )
+        return True
+
+    def stopFrameSync(self):
+        if self.frameGrabber is not None:
+            self.frameGrabber.stop()
+            self.frameGrabber = None
+
+    @APIExport()
+    def setSIMFrameSync(self, enabled: bool, triggered: bool = False,
+                        displayDelay: float = 0.0) -> None:
+        """ Selects the frame of every SIM pattern by its frame id instead of
+        waiting one exposure and skipping frames (cameras without a frame
+        buffer only). If triggered is True, the pattern server shows a
+        requested pattern at the next camera trigger, so the next pattern is
+        requested during the current exposure. displayDelay is the time in
+        seconds a pattern needs to appear after the server confirmed it. Takes
+        effect at the next start. """
+        self.isFrameSync = enabled
+        self.isFrameSyncTriggered = triggered
+        self.frameSyncDisplayDelay = displayDelay
+
+    @APIExport()
+    def getSIMFrameSyncStatistics(self) -> dict:
+        """ Returns the number of stacks acquired frame-synchronised, the
+        average time per stack and per pattern request and the number of
+        frames that were not used. """
+        if self.frameSync is None:
+            return {}
+        return self.frameSync.getStatistics()
+
+    @APIExport()
+    def getSIMReconstructionStatistics(self) -> dict:
+        """ Returns the number of SIM stacks queued, reconstructed, failed
+        and rejected, how long the acquisition waited for a free queue slot
+        and the average reconstruction time. """
+        return self.simService.getStatistics()
+
+    @APIExport()
+    def resetSIMCalibration(self) -> None:
+        """ Forgets all stored SIM calibrations, so that the next stack of
+        every wavelength is calibrated from scratch. """
+        self.simCalibrationStore.remove()
+        self.SimProcessorLaser1.isCalibrated = False
+        self.SimProcessorLaser2.isCalibrated = False
+
     def toggleSIMDisplay(self, enabled=True):
         self._widget.setSIMDisplayVisible(enabled)
 
@@ -260,6 +350,7 @@ class SIMController(ImConWidgetController):
     def stopSIM(self):
         self.active = False
         self.simThread.join()
+        self.stopFrameSync()
         self.lasers[0].setEnabled(False)
         self.lasers[1].setEnabled(False)
         if self.isPCO:
@@ -280,6 +371,12 @@ class SIMController(ImConWidgetController):
             self.detector.flushBuffers()
         #self._commChannel.sigStartLiveAcquistion.emit(True)
 
+        elif self.isFrameSync:
+            if not self.startFrameSync():
+                return
+        else:
+            self.frameSync = None
+
         # start the background thread
         self.active = True
         sim_parameters = self.getSIMParametersFromGUI()
@@ -454,6 +551,14 @@ class SIMController(ImConWidgetController):
                         if self.SIMStack is None:
                             self._logger.error("No image received")
                             continue
+                    elif self.frameSync is not None:
+                        # patterns and frames are matched by frame id
+                        try:
+                            self.SIMStack, frameIds = self.frameSync.acquire()
+                            self._logger.debug(f"Frames used for stack: {frameIds}")
+                        except (TimeoutError, concurrent.futures.TimeoutError, KeyError) as e:
+                            self._logger.error(f"Frame-synchronised acquisition failed: {e}")
+                            continue
                     else:
                         # we need to capture images and display patterns one-by-one
                         self.SIMStack = []
@@ -704,13 +809,15 @@ class SIMProcessor(object):
         self.use_phases = True
         self.find_carrier = True
         self.isCalibrated = False
+        self.calibrationKey = None
+        self.referenceCarriers = None
         self.use_gpu = isPytorch
         self.stack = []
+        self._lock = threading.Lock()
 
         # processing parameters
         self.isRecording = False
         self.allPatterns = []
-        self.isReconstructing = False
 
         # initialize logger
         self._logger = initLogger(self, tryInheritParent=False)
@@ -843,8 +950,7 @@ class SIMProcessor(object):
             if self.use_gpu:
                 self.h.calibrate_pytorch(imRaw, self.find_carrier)
             else:
-                #self.h.calibrate(imRaw, self.find_carrier)
-                self.h.calibrate(imRaw)
+                self.h.calibrate(imRaw, self.find_carrier)
             self.isCalibrated = True
             if self.find_carrier: # store the value found
                 self.kx_input = self.h.kx
@@ -894,22 +1000,100 @@ class SIMProcessor(object):
 
             # clear GPU memory
             imgset.delete()
+            self.isCalibrated = True
 
     def getIsCalibrated(self):
         return self.isCalibrated
 
+    def getCalibrationKey(self):
+        return SIMCalibrationStore.makeKey(self.reconstructionMethod, self.wavelength, self.NA,
+                                           getattr(self, 'magnification', 90), self.pixelsize)
+
+    def getCalibration(self):
+        '''
+        returns the parameters found by the last calibration
+        '''
+        if self.reconstructionMethod == "napari":
+            return {"kx": self.kx_input, "ky": self.ky_input, "p": self.p_input,
+                    "ampl": self.ampl_input}
+        return {"frqs": self.mcSIMfrqs, "phases": self.mcSIMphases,
+                "mod_depths": self.mcSIMmod_depths, "otf": self.mcSIMotf}
+
+    def applyCalibration(self, calibration, imRaw):
+        '''
+        reuses stored calibration parameters; only the napari processor has
+        to be set up again, with the carrier search skipped
+        '''
+        if self.reconstructionMethod == "napari":
+            self.kx_input = calibration["kx"]
+            self.ky_input = calibration["ky"]
+            self.p_input = calibration["p"]
+            self.ampl_input = calibration["ampl"]
+            self.find_carrier = False
+            try:
+                self.setReconstructor()
+                self.calibrate(imRaw)
+            finally:
+                self.find_carrier = True
+        else:
+            self.mcSIMfrqs = calibration["frqs"]
+            self.mcSIMphases = calibration["phases"]
+            self.mcSIMmod_depths = calibration["mod_depths"]
+            self.mcSIMotf = calibration.get("otf")
+        self.isCalibrated = True
+
+    def ensureCalibrated(self, imRaw):
+        '''
+        calibrates on imRaw unless the current or a stored calibration for
+        this wavelength and objective still matches the illumination pattern
+        '''
+        store = self.parent.simCalibrationStore
+        key = self.getCalibrationKey()
+        if key != self.calibrationKey:
+            self.isCalibrated = False
+            self.calibrationKey = key
+        carriers = estimateCarriers(imRaw, self.angles_number, self.phases_number)
+
+        if self.isCalibrated:
+            if not carriersDrifted(self.referenceCarriers, carriers, imRaw.shape):
+                return
+            self._logger.info("SIM pattern drifted, recalibrating")
+        else:
+            calibration, _ = store.load(key)
+            if calibration is not None and "carriers" in calibration:
+                if not carriersDrifted(calibration["carriers"], carriers, imRaw.shape):
+                    self._logger.debug(f"Using stored SIM calibration {key}")
+                    self.applyCalibration(calibration, imRaw)
+                    self.referenceCarriers = calibration["carriers"]
+                    return
+                self._logger.info(f"Stored SIM calibration {key} does not match the pattern")
+
+        self.setReconstructor()
+        self.calibrate(imRaw)
+        self.referenceCarriers = carriers
+        store.save(key, {**self.getCalibration(), "carriers": carriers},
+                   {"wavelength": float(self.wavelength), "NA": float(self.NA),
+                    "pixelsize": float(self.pixelsize), "method": self.reconstructionMethod})
+
+    def processStack(self, mStack):
+        '''
+        calibrates if needed and reconstructs; the processor is used by one
+        reconstruction worker at a time
+        '''
+        with self._lock:
+            self.ensureCalibrated(mStack)
+            return self.reconstruct(mStack)
 
     def reconstructSIMStack(self):
         '''
-        reconstruct the image stack asychronously
+        queues the current stack for reconstruction; if the queue is full,
+        this waits for a free slot, so that no stack is dropped
         '''
-        # TODO: Perhaps we should work with quees?
-        # reconstruct and save the stack in background to not block the main thread
-        if not self.isReconstructing:  # not
-            self.isReconstructing=True
-            mStackCopy = np.array(self.stack.copy())
-            self.mReconstructionThread = threading.Thread(target=self.reconstructSIMStackBackground, args=(mStackCopy,), daemon=True)
-            self.mReconstructionThread.start()
+        metadata = {"isRecording": self.isRecording, "date": getattr(self, "date", None),
+                    "wavelength": getattr(self, "LaserWL", self.wavelength)}
+        future = self.parent.simService.submit(self.processStack, np.array(self.stack))
+        future.add_done_callback(lambda future: self.reconstructionDone(future, metadata))
+        return future
 
     def setRecordingMode(self, isRecording):
         self.isRecording = isRecording
@@ -927,35 +1111,25 @@ class SIMProcessor(object):
         elif self.LaserWL == 635:
             self.h.wavelength = sim_parameters.wavelength_2
 
-    def reconstructSIMStackBackground(self, mStack):
+    def reconstructionDone(self, future, metadata):
         '''
-        reconstruct the image stack asychronously
-        the stack is a list of 9 images (3 angles, 3 phases)
+        saves and displays a reconstruction; runs on the reconstruction worker
         '''
-        # compute image
-        # initialize the model
-
-        self._logger.debug("Processing frames")
-        if not self.getIsCalibrated():
-            self.setReconstructor()
-            self.calibrate(mStack)
-        SIMReconstruction = self.reconstruct(mStack)
+        if future.cancelled() or future.exception() is not None:
+            return
+        SIMReconstruction = future.result()
 
         # save images eventually
-        if self.isRecording:
-            def saveImageInBackground(image, filename = None):
-                try:
-                    self.folder = SIMParameters.path
-                    self.filename = os.path.join(self.folder,filename) #FIXME: Remove hardcoded path
-                    tif.imwrite(self.filename, image)
-                    self._logger.debug("Saving file: "+self.filename)
-                except  Exception as e:
-                    self._logger.error(e)
-            mFilenameRecon = f"{self.date}_SIM_Reconstruction_{self.LaserWL}nm.tif"
-            threading.Thread(target=saveImageInBackground, args=(SIMReconstruction, mFilenameRecon,)).start()
-
-        self.parent.sigSIMProcessorImageComputed.emit(np.array(SIMReconstruction), "SIM Reconstruction")
-        self.isReconstructing = False
+        if metadata["isRecording"]:
+            try:
+                mFilenameRecon = f"{metadata['date']}_SIM_Reconstruction_{metadata['wavelength']}nm.tif"
+                filename = os.path.join(SIMParameters.path, mFilenameRecon) #FIXME: Remove hardcoded path
+                tif.imwrite(filename, SIMReconstruction)
+                self._logger.debug("Saving file: "+filename)
+            except Exception as e:
+                self._logger.error(e)
+
+        self.parent.sigSIMProcessorImageComputed.emit(SIMReconstruction, "SIM Reconstruction")
 
 
     def reconstruct(self, currentImage):
@@ -1054,16 +1228,25 @@ class SIMClient:
         self.itime = 120
         self.laser_power = (400, 250)
 
+        # one persistent connection; asynchronous requests are sent in order
+        # by a single worker, so a pattern can be requested during an exposure
+        self.session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SIMClient")
+
     def get_request(self, url, timeout=0.3):
         try:
-            response = requests.get(url, timeout=timeout)
+            response = self.session.get(url, timeout=timeout)
             return response.json()
         except Exception as e:
             print(e)
             return -1
 
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
     def start_viewer(self):
-        url = self.base_url + self.commands["start_viewer"]
+        url = self.base_url + self.commands["start"]
         return self.get_request(url)
 
     def start_viewer_single_loop(self, number_of_runs, timeout=2):
@@ -1088,7 +1271,11 @@ class SIMClient:
 
     def display_pattern(self, iPattern):
         url = f"{self.base_url}{self.commands['display_pattern']}{iPattern}"
-        self.get_request(url)
+        return self.get_request(url)
+
+    def display_pattern_async(self, iPattern):
+        ''' returns a Future of the answer to display_pattern '''
+        return self._executor.submit(self.display_pattern, iPattern)
 
 
 
@@ -1,12 +1,10 @@
 import numpy as np
-import time
 import tifffile as tif
 import os
 from datetime import datetime
 
-from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
-from imswitch.imcontrol.view import guitools
-from imswitch.imcommon.model import initLogger, dirtools
+from imswitch.imcommon.model import dirtools
+from imswitch.imcontrol.model.localisation import LocalisationPipeline, LocalisationTable
 from ..basecontrollers import LiveUpdatedController
 
 from imswitch.imcommon.model import APIExport
@@ -27,8 +25,6 @@ except:
 class STORMReconController(LiveUpdatedController):
     """ Linked to STORMReconWidget."""
 
-    sigImageReceived = Signal()
-
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
@@ -36,12 +32,13 @@ class STORMReconController(LiveUpdatedController):
         self.it = 0
         self.showPos = False
         self.threshold = 0.2
+        self.fit_roi_size = 13
+        self.upsampling = 4
+        self.batchSize = 16
 
-        # reconstruction related settings
-        #TODO: Make parameters adaptable from Plugin
-        # Prepare image computation worker
-        self.imageComputationWorker = self.STORMReconImageComputationWorker()
-        self.imageComputationWorker.sigSTORMReconImageComputed.connect(self.displayImage)
+        # localisations are computed in batches on a process pool and written
+        # to disk as they arrive, see LocalisationPipeline
+        self.localisationPipeline = None
             
         # get the detector
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
@@ -49,11 +46,6 @@ class STORMReconController(LiveUpdatedController):
 
 
         if isMicroEye:
-            self.imageComputationThread = Thread()
-            self.imageComputationWorker.moveToThread(self.imageComputationThread)
-            self.sigImageReceived.connect(self.imageComputationWorker.computeSTORMReconImage)
-            self.imageComputationThread.start()
-
             # Connect CommunicationChannel signals
             self._commChannel.sigUpdateImage.connect(self.update)
 
@@ -62,69 +54,88 @@ class STORMReconController(LiveUpdatedController):
             self._widget.sigUpdateRateChanged.connect(self.changeRate)
             self._widget.sigSliderValueChanged.connect(self.valueChanged)
 
-            self.changeRate(self.updateRate)
-            self.setShowSTORMRecon(False)
-            
             # setup reconstructor
             self.peakDetector = CV_BlobDetector()
             self.preFilter = BandpassFilter()
+            self.fittingMethod = FittingMethod._2D_Phasor_CPU
 
-            self.imageComputationWorker.setDetector(self.peakDetector)
-            self.imageComputationWorker.setFilter(self.preFilter)
+            self.changeRate(self.updateRate)
+            self.setShowSTORMRecon(False)
 
     def valueChanged(self, magnitude):
         """ Change magnitude. """
         self.dz = magnitude*1e-3
-        self.imageComputationWorker.set_dz(self.dz)
 
-    def __del__(self):
-        self.imageComputationThread.quit()
-        self.imageComputationThread.wait()
-        if hasattr(super(), '__del__'):
-            super().__del__()
+    def closeEvent(self):
+        self.stopLocalisation()
+        super().closeEvent()
 
     def setShowSTORMRecon(self, enabled):
         """ Show or hide STORMRecon. """
         
         # read parameters from GUI for reconstruction the data on the fly
         # Filters + Blob detector params
-        filter = self._widget.image_filter.currentData().filter
-        tempEnabled = self._widget.tempMedianFilter.enabled.isChecked()
-        detector = self._widget.detection_method.currentData().detector
-        threshold = self._widget.th_min_slider.value()
-        fit_roi_size = self._widget.fit_roi_size.value()
-        fitting_method = self._widget.fitting_cbox.currentData()
-        
-        # write parameters to worker
-        self.imageComputationWorker.setFilter(filter)
-        self.imageComputationWorker.setTempEnabled(tempEnabled)
-        self.imageComputationWorker.setDetector(detector)
-        self.imageComputationWorker.setThreshold(threshold)
-        self.imageComputationWorker.setFitRoiSize(fit_roi_size)
-        self.imageComputationWorker.setFittingMethod(fitting_method)
+        self.preFilter = self._widget.image_filter.currentData().filter
+        self.tempEnabled = self._widget.tempMedianFilter.enabled.isChecked()
+        self.peakDetector = self._widget.detection_method.currentData().detector
+        self.threshold = self._widget.th_min_slider.value()
+        self.fit_roi_size = self._widget.fit_roi_size.value()
+        self.fittingMethod = self._widget.fitting_cbox.currentData()
         
         self.active = enabled
         
         # if it will be deactivated, trigger an image-save operation
         if not self.active:
-            self.imageComputationWorker.saveImage()
-        else:
-            # this will activate/deactivate the live reconstruction
-            self.imageComputationWorker.setActive(enabled)
-            
-
-    def update(self, detectorName, im, init, isCurrentDetector):
+            self.stopLocalisation()
+
+    def startLocalisation(self, frameShape, frameDtype):
+        """ Starts a new localisation pipeline, writing to a new localisation
+        table in the recordings folder. """
+        Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
+        self.tablePath = self.getSaveFilePath(date=Ntime, filename="STORMRecon", extension="h5")
+        table = LocalisationTable(self.tablePath,
+                                  columns=['frame', 'x', 'y', 'background', 'intensity'])
+        self.localisationPipeline = LocalisationPipeline(
+            frameShape, frameDtype, localiseFrame,
+            dict(preFilter=self.preFilter, peakDetector=self.peakDetector,
+                 rel_threshold=self.threshold, roiSize=self.fit_roi_size,
+                 method=self.fittingMethod),
+            table=table, upsampling=self.upsampling, batchSize=self.batchSize
+        )
+        self.localisationPipeline.sigLocalisationsAdded.connect(self.displayLocalisations)
+        self._logger.debug(f"Writing localisations to {self.tablePath}")
+
+    def stopLocalisation(self):
+        """ Finishes the running localisation pipeline and saves the rendered
+        image next to the localisation table. """
+        if self.localisationPipeline is None:
+            return
+        pipeline, self.localisationPipeline = self.localisationPipeline, None
+        pipeline.close()
+        self._logger.debug(f"Localisation statistics: {pipeline.getStatistics()}")
+        if pipeline.numLocalisations > 0:
+            tif.imwrite(os.path.splitext(self.tablePath)[0] + ".tif",
+                        pipeline.histogram.snapshot(), append=False)
+
+    def update(self, detectorName, im, init, scale, isCurrentDetector):
         """ Update with new detector frame. """
         if not isCurrentDetector or not self.active:
             return
 
         if self.it == self.updateRate:
             self.it = 0
-            self.imageComputationWorker.prepareForNewImage(im)
-            self.sigImageReceived.emit()
+            if self.localisationPipeline is None:
+                self.startLocalisation(im.shape, im.dtype)
+            self.localisationPipeline.addFrame(im)
         else:
             self.it += 1
 
+    def displayLocalisations(self, numLocalisations):
+        """ Displays the super-resolved render of the localisations. """
+        if self.localisationPipeline is None:
+            return
+        self.displayImage(self.localisationPipeline.histogram.snapshot())
+
     def displayImage(self, im):
         """ Displays the image in the view. """
         self._widget.setImage(im)
@@ -139,151 +150,59 @@ class STORMReconController(LiveUpdatedController):
         """ Trigger reconstruction. """
         if frame is None:
             frame = self.detector.getLatestFrame()
-        self.imageComputationWorker.reconSTORMFrame(frame=frame)
-                
-
-    class STORMReconImageComputationWorker(Worker):
-        sigSTORMReconImageComputed = Signal(np.ndarray)
-
-        def __init__(self):
-            super().__init__()
-            
-            self.threshold = 0.2 # default threshold
-            self.fit_roi_size = 13 # default roi size
-            
-            self._logger = initLogger(self, tryInheritParent=False)
-            self._numQueuedImages = 0
-            self._numQueuedImagesMutex = Mutex()
-            
-            # store the sum of all reconstructed frames
-            self.sumReconstruction = None
-            self.allParameters = []
-            
-            self.active = False
-
-
-        def reconSTORMFrame(self, frame, preFilter=None, peakDetector=None,
-                            rel_threshold=0.4, PSFparam=np.array([1.5]), 
-                            roiSize=13, method=None):
-            # tune parameters
-            if method is None: # avoid error when microeye is not installed..
-                method = FittingMethod._2D_Phasor_CPU
-            if preFilter is None:
-                preFilter = self.preFilter
-            if peakDetector is None:
-                peakDetector = self.peakDetector
-                
-            # parameters are read only once the SMLM reconstruction is initiated
-            # cannot be altered during recroding
-            index = 1
-            filtered = frame.copy() # nip.gaussf(frame, 1.5)
-            varim = None
-
-            # localize  frame 
-            # params = > x,y,background, max(0, intensity), magnitudeX / magnitudeY
-            frames, params, crlbs, loglike = localize_frame(
-                        index,
-                        frame,
-                        filtered,
-                        varim,
-                        preFilter,
-                        peakDetector,
-                        rel_threshold,
-                        PSFparam,
-                        roiSize,
-                        method)
-
-            # create a simple render
-            frameLocalized = np.zeros(frame.shape)
-            try:
-                allX = np.int32(params[:,0])
-                allY = np.int32(params[:,1])
-                frameLocalized[(allY, allX)] = 1
-            except Exception as e:
-                pass
-
-            return frameLocalized, params
-
-        def setThreshold(self, threshold):
-            self.threshold = threshold
-            
-        def setFitRoiSize(self, roiSize):
-            self.fit_roi_size = roiSize
-            
-        def computeSTORMReconImage(self):
-            """ Compute STORMRecon of an image. """
-            try:
-                if self._numQueuedImages > 1 or not self.active:
-                    return  # Skip this frame in order to catch up
-                STORMReconrecon, params = self.reconSTORMFrame(frame=self._image, 
-                                                               preFilter=self.preFilter, 
-                                                               peakDetector=self.peakDetector, 
-                                                               rel_threshold=self.threshold, 
-                                                               roiSize=self.fit_roi_size)
-                self.allParameters.append(params)
-                
-                if self.sumReconstruction is None:
-                    self.sumReconstruction = STORMReconrecon
-                else:
-                    self.sumReconstruction += STORMReconrecon
-                self.sigSTORMReconImageComputed.emit(np.array(self.sumReconstruction))
-            finally:
-                self._numQueuedImagesMutex.lock()
-                self._numQueuedImages -= 1
-                self._numQueuedImagesMutex.unlock()
-
-        def prepareForNewImage(self, image):
-            """ Must always be called before the worker receives a new image. """
-            self._image = image
-            self._numQueuedImagesMutex.lock()
-            self._numQueuedImages += 1
-            self._numQueuedImagesMutex.unlock()
-
-        def setFittingMethod(self, method):
-            self.fittingMethod = method
-        def setFilter(self, filter):
-            self.preFilter = filter
-        
-        def setTempEnabled(self, tempEnabled):
-            self.tempEnabled = tempEnabled
-            
-        def setDetector(self, detector):
-            self.peakDetector = detector
-            
-        def saveImage(self, filename="STORMRecon", fileExtension="tif"):
-            if self.sumReconstruction is None:
-                return
-            
-            # wait to finish all queued images
-            while self._numQueuedImages > 0:
-                time.sleep(0.1)
-                
-            Ntime = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")            
-            filePath = self.getSaveFilePath(date=Ntime, 
-                                filename=filename, 
-                                extension=fileExtension)
-            
-            # self.switchOffIllumination()
-            self._logger.debug(filePath)
-            tif.imwrite(filePath, self.sumReconstruction, append=False)
-            
-            # Reset sumReconstruction
-            self.sumReconstruction *= 0
-            self.allParameters = []
-            
-        def getSaveFilePath(self, date, filename, extension):
-            mFilename =  f"{date}_{filename}.{extension}"
-            dirPath  = os.path.join(dirtools.UserFileDirs.Root, 'recordings', date)
-
-            newPath = os.path.join(dirPath,mFilename)
-
-            if not os.path.exists(dirPath):
-                os.makedirs(dirPath)
+        if self.localisationPipeline is not None:
+            self.localisationPipeline.addFrame(frame)
+        else:
+            localiseFrame(0, frame, preFilter=self.preFilter, peakDetector=self.peakDetector,
+                          rel_threshold=self.threshold, roiSize=self.fit_roi_size,
+                          method=self.fittingMethod)
 
-            return newPath
-        
-        def setActive(self, enabled):
-            self.active = enabled
+    @APIExport()
+    def getSTORMReconStatistics(self):
+        """ Returns the number of localised and dropped frames and of
+        localisations of the running reconstruction. """
+        if self.localisationPipeline is None:
+            return {}
+        return self.localisationPipeline.getStatistics()
+
+    def getSaveFilePath(self, date, filename, extension):
+        mFilename =  f"{date}_{filename}.{extension}"
+        dirPath  = os.path.join(dirtools.UserFileDirs.Root, 'recordings', date)
+
+        newPath = os.path.join(dirPath,mFilename)
+
+        if not os.path.exists(dirPath):
+            os.makedirs(dirPath)
+
+        return newPath
+
+
+def localiseFrame(index, frame, preFilter, peakDetector, rel_threshold=0.4,
+                  PSFparam=np.array([1.5]), roiSize=13, method=None):
+    """ Localises the emitters of a single frame with microEye. Returns the
+    fit parameters (x, y, background, intensity, ...) per localisation. Runs
+    in the worker processes of the LocalisationPipeline. """
+    # tune parameters
+    if method is None: # avoid error when microeye is not installed..
+        method = FittingMethod._2D_Phasor_CPU
+
+    filtered = frame.copy() # nip.gaussf(frame, 1.5)
+    varim = None
+
+    # localize  frame 
+    # params = > x,y,background, max(0, intensity), magnitudeX / magnitudeY
+    frames, params, crlbs, loglike = localize_frame(
+                index,
+                frame,
+                filtered,
+                varim,
+                preFilter,
+                peakDetector,
+                rel_threshold,
+                PSFparam,
+                roiSize,
+                method)
+    return params
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
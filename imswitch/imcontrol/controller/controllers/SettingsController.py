@@ -68,7 +68,7 @@ class SettingsController(ImConWidgetController):
 
         # Connect CommunicationChannel signals
         self._commChannel.sigDetectorSwitched.connect(self.detectorSwitched)
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
 
         # Connect SettingsWidget signals
         self._widget.sigROIChanged.connect(self.ROIchanged)
@@ -443,19 +443,23 @@ class SettingsController(ImConWidgetController):
         return (detectorsManager.execOnAll if currentParams.allDetectorsFrame.value()
                 else detectorsManager.execOnCurrent)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) < 3 or key[0] != _attrCategory:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
 
-        detectorName = key[1]
-        if len(key) == 3:
-            if key[2] == _binningAttr:
-                self.setDetectorBinning(detectorName, value)
-            elif key[2] == _ROIAttr:
-                self.setDetectorROI(detectorName, (value[0], value[1]), (value[2], value[3]))
-        if len(key) == 4:
-            if key[2] == _detectorParameterSubCategory:
-                self.setDetectorParameter(detectorName, key[3], value)
+        for key, value in changes.items():
+            if len(key) < 3 or key[0] != _attrCategory:
+                continue
+
+            detectorName = key[1]
+            if len(key) == 3:
+                if key[2] == _binningAttr:
+                    self.setDetectorBinning(detectorName, value)
+                elif key[2] == _ROIAttr:
+                    self.setDetectorROI(detectorName, (value[0], value[1]), (value[2], value[3]))
+            if len(key) == 4:
+                if key[2] == _detectorParameterSubCategory:
+                    self.setDetectorParameter(detectorName, key[3], value)
 
     def setSharedAttr(self, detectorName, attr, value, *, isDetectorParameter=False):
         self.settingAttr = True
@@ -28,7 +28,7 @@ class StandaPositionerController(PositionerController):
                     self.setSharedAttr(pName, axis, _speedAttr, pManager.speed[axis])
 
         # Connect CommunicationChannel signals
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigSetSpeed.connect(lambda speed: self.setSpeedGUI(speed))
 
         # Connect PositionerWidget signals
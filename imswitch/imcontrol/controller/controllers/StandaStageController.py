@@ -33,7 +33,7 @@ class StandaStageController(ImConWidgetController):
 
 
         # Connect CommunicationChannel signals
-        self._commChannel.sharedAttrs.sigAttributeSet.connect(self.attrChanged)
+        self._commChannel.sharedAttrs.sigAttributesChanged.connect(self.attrsChanged)
         self._commChannel.sigSetSpeed.connect(lambda speed: self.setSpeedGUI(speed))
 
         # TODO: Can I overwrite these definitions with the OTDeckController? Then this would be completely independant,
@@ -86,13 +86,16 @@ class StandaStageController(ImConWidgetController):
         self._widget.updatePosition(positionerName, axis, newPos)
         self.setSharedAttr(positionerName, axis, _positionAttr, newPos)
 
-    def attrChanged(self, key, value):
-        if self.settingAttr or len(key) != 4 or key[0] != _attrCategory:
+    def attrsChanged(self, changes):
+        if self.settingAttr:
             return
-        positionerName = key[1]
-        axis = key[2]
-        if key[3] == _positionAttr:
-            self.setPositioner(positionerName, axis, value)
+        for key, value in changes.items():
+            if len(key) != 4 or key[0] != _attrCategory:
+                continue
+            positionerName = key[1]
+            axis = key[2]
+            if key[3] == _positionAttr:
+                self.setPositioner(positionerName, axis, value)
 
     def setSharedAttr(self, positionerName, axis, attr, value):
         self.settingAttr = True
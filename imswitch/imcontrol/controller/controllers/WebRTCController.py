@@ -21,11 +21,9 @@ from aiohttp import web
 
 from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription
-from aiortc.contrib.media import MediaPlayer, MediaRelay, MediaStreamTrack
 from aiortc.rtcrtpsender import RTCRtpSender
-from av import VideoFrame
-import fractions
-import numpy as np
+
+from imswitch.imcontrol.model.webrtc import DetectorVideoTrack, adaptToReceiverReports
 
 
 ROOT = os.path.dirname(__file__)
@@ -49,6 +47,12 @@ class WebRTCController(LiveUpdatedController):
         self.init = False
         self.showPos = False
 
+        # stream defaults, clients can request a lower rate or size in their offer
+        webrtcInfo = self._setupInfo.webrtc
+        self.streamFps = webrtcInfo.fps if webrtcInfo is not None else 15
+        self.streamMaxWidth = webrtcInfo.maxWidth if webrtcInfo is not None else 1280
+        self.streamMaxHeight = webrtcInfo.maxHeight if webrtcInfo is not None else 720
+
         # rtc-related
         self.pcs = set()
         host = "0.0.0.0"
@@ -130,21 +134,30 @@ class WebRTCController(LiveUpdatedController):
         pc = RTCPeerConnection()
         self.pcs.add(pc)
 
+        # open media source, paced and sized as requested by the client
+        detectorManager = self._master.detectorsManager
+        detectorNum1Name = detectorManager.getAllDeviceNames()[0]
+        detector = detectorManager[detectorNum1Name]
+        video = DetectorVideoTrack(detector.getLatestFrame,
+                                   fps=self.streamFps,
+                                   maxWidth=self.streamMaxWidth,
+                                   maxHeight=self.streamMaxHeight)
+        video.setTarget(fps=params.get("fps"),
+                        maxWidth=params.get("width"),
+                        maxHeight=params.get("height"))
+
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
             self.__logger.debug("Connection state is %s" % pc.connectionState)
-            if pc.connectionState == "failed":
+            if pc.connectionState in ("failed", "closed"):
+                video.stop()
                 await pc.close()
                 self.pcs.discard(pc)
 
-        # open media source
-        video = VideoTransformTrack()
-        detectorManager = self._master.detectorsManager
-        detectorNum1Name = detectorManager.getAllDeviceNames()[0]
-        detector =  detectorManager[detectorNum1Name]
-        video.setDetector(detector)
         video_sender = pc.addTrack(video)
-        self.force_codec(pc, video_sender, "video/H264")
+        if params.get("codec"):
+            self.force_codec(pc, video_sender, params["codec"])
+        asyncio.ensure_future(adaptToReceiverReports(video_sender, video))
         
         await pc.setRemoteDescription(offer)
 
@@ -159,46 +172,6 @@ class WebRTCController(LiveUpdatedController):
         )
 
 
-
-
-
-
-
-
-
-
-class VideoTransformTrack(MediaStreamTrack):
-    """
-    A video stream track that transforms frames from an another track.
-    """
-
-    kind = "video"
-
-    def __init__(self):
-        super().__init__()  # don't forget this!
-        self.count = 0
-    
-    def setDetector(self, detector):
-        self.detector = detector
-
-    async def recv(self):
-        # frame = await self.track.recv()
-        img = self.detector.getLatestFrame().astype('uint8')
-        if img is not None:
-            if len(img.shape)<3:
-                img = np.array((img,img,img))
-                img = np.transpose(img, (1,2,0))
-            #img = np.random.randint(0, 155, (150, 300, 3)).astype('uint8')
-        else:
-            img = np.random.randint(0, 155, (150, 300, 3)).astype('uint8')
-        new_frame = VideoFrame.from_ndarray(img, format="bgr24")
-        new_frame.pts = self.count # frame.pts
-        self.count+=1
-        new_frame.time_base = fractions.Fraction(1, 1000)
-        return new_frame
-
-
-
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -5,17 +5,19 @@ from Pyro5.api import expose
 import multiprocessing
 from imswitch.imcommon.framework import Worker
 from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import arraytransport
 from ._serialize import register_serializers
 from fastapi.middleware.cors import CORSMiddleware
 from io import BytesIO
 import numpy as np
 from PIL import Image
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 import imswitch
 import uvicorn
 from functools import wraps
+import inspect
 import os
 import socket 
 import os
@@ -62,6 +64,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[arraytransport.SHAPE_HEADER, arraytransport.DTYPE_HEADER],
 )
 
 _baseDataFilesDir = os.path.join(os.path.dirname(os.path.realpath(imswitch.__file__)), '_data')
@@ -90,6 +93,21 @@ class ServerThread(threading.Thread):
             self.server.should_exit = True
             self.server.lifespan.shutdown()
             print("Server is stopping...")
+_requestParameter = 'imswitchHTTPRequest'
+
+
+def _withRequestParameter(signature):
+    """ Adds a keyword-only Request parameter to signature, before **kwargs
+    if there are any. """
+    parameters = list(signature.parameters.values())
+    index = len(parameters)
+    if parameters and parameters[-1].kind == inspect.Parameter.VAR_KEYWORD:
+        index -= 1
+    parameters.insert(index, inspect.Parameter(_requestParameter, inspect.Parameter.KEYWORD_ONLY,
+                                               annotation=Request))
+    return signature.replace(parameters=parameters)
+
+
 class ImSwitchServer(Worker):
 
     def __init__(self, api, setupInfo):
@@ -160,6 +178,21 @@ class ImSwitchServer(Worker):
         finally:
             s.close()
         return IP
+    def _arrayResponse(self, array, request):
+        """ Sends array in the binary format asked for in the Accept header
+        or arrayFormat query parameter of request, or as JSON. """
+        try:
+            arrayFormat = None if request is None else arraytransport.negotiateFormat(
+                request.headers.get('accept'),
+                request.query_params.get(arraytransport.FORMAT_PARAMETER)
+            )
+            if arrayFormat is None:
+                return array.tolist()
+            content, headers = arraytransport.encodeArray(array, arrayFormat)
+        except ValueError as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        return Response(content, media_type=headers.pop('Content-Type'), headers=headers)
+
     #@expose: FIXME: Remove
     def testMethod(self):
         return "Hello World"
@@ -181,11 +214,21 @@ class ImSwitchServer(Worker):
         functions = api_dict.keys()
 
         def includeAPI(str, func):
-            @app.get(str) # TODO: Perhaps we want POST instead?
             @wraps(func)
             async def wrapper(*args, **kwargs):
-                return func(*args, **kwargs)
-            return wrapper
+                request = kwargs.pop(_requestParameter, None)
+                result = func(*args, **kwargs)
+                if isinstance(result, np.ndarray):
+                    return self._arrayResponse(result, request)
+                return result
+
+            # FastAPI passes the request, for negotiating the format of array results
+            signature = inspect.signature(func)
+            wrapper.__signature__ = _withRequestParameter(signature)
+            routeArgs = {}
+            if signature.return_annotation is np.ndarray:
+                routeArgs['response_model'] = None  # not a pydantic type, sent as is
+            return app.get(str, **routeArgs)(wrapper) # TODO: Perhaps we want POST instead?
 
         def includePyro(func):
             @expose
@@ -148,6 +148,10 @@ class SLMInfo:
     at various wavelengths. A combination will be chosen based on the
     wavelength. """
 
+    phaseLutLevels: Optional[int] = None
+    """ Number of levels used for lookup-table based phase quantisation of the
+    masks. ``null`` to convert phase to pixel values directly. """
+
 
 @dataclass(frozen=True)
 class UC2ConfigInfo:
@@ -239,7 +243,14 @@ class LightsheetInfo:
 
 @dataclass(frozen=True)
 class WebRTCInfo:
-    pass
+    fps: int = 15
+    """ Default frame rate of the stream. """
+
+    maxWidth: int = 1280
+    """ Default maximum width of the stream, in pixels. """
+
+    maxHeight: int = 720
+    """ Default maximum height of the stream, in pixels. """
 
 @dataclass(frozen=True)
 class HyphaInfo:
@@ -319,6 +330,16 @@ class FocusLockInfo:
     piKi: float
     """ Default ki value of feedback loop. """
 
+    metric: Optional[str] = None
+    """ Focus signal metric: ``centroid``, ``astigmatism``, ``JPG`` or
+    ``ratio``. Defaults to ``JPG``, and ``ratio`` is always used with the
+    ESP32 serial camera. """
+
+    processingRoi: Optional[List[int]] = None
+    """ Region of the (axis-swapped) camera frame, as [x, y, width, height],
+    that the focus signal is computed from. The full frame is used if not
+    set. """
+
 @dataclass(frozen=True)
 class FOVLockInfo:
     camera: str
@@ -436,6 +457,10 @@ class NidaqInfo:
     startTrigger: bool = False
     """ Boolean for start triggering for sync. """
 
+    simulated: bool = False
+    """ Whether to run scans on simulated tasks instead of an NI-DAQ device.
+    """
+
     def getTimerCounterChannel(self):
         """ :meta private: """
         if isinstance(self.timerCounterChannel, int):
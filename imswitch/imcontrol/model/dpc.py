@@ -0,0 +1,152 @@
+from collections import OrderedDict
+
+import numpy as np
+import scipy.fft as sfft
+from scipy.ndimage import uniform_filter
+
+
+class DPCSolver:
+    """ Quantitative differential phase contrast (qDPC) reconstruction with
+    Tikhonov regularisation, after the Waller lab implementation
+    (https://github.com/Waller-Lab/DPC).
+
+    The weak object transfer functions (WOTFs) of the half-circle sources and
+    the per-image inversion filters that follow from them are cached per
+    image shape and parameter set, so a reconstruction only costs the
+    normalisation and the FFTs. Everything runs in float32/complex64, and
+    several time points are reconstructed in one batched FFT call. """
+
+    def __init__(self, wavelength, na, NAi, pixelsize, rotation=(0, 180, 90, 270),
+                 regU=1e-1, regP=5e-3, workers=-1, maxCachedFilters=4):
+        self.wavelength = wavelength
+        self.na = na
+        self.NAi = NAi
+        self.pixelsize = pixelsize
+        self.rotation = tuple(rotation)
+        self.regU = regU
+        self.regP = regP
+        self.workers = workers
+        self.maxCachedFilters = maxCachedFilters
+        self._filters = OrderedDict()
+
+    @property
+    def dpcNum(self):
+        return len(self.rotation)
+
+    def setParameters(self, **parameters):
+        """ Sets any of wavelength, na, NAi, pixelsize, rotation, regU and
+        regP. Filters of earlier parameter sets stay cached. """
+        for name, value in parameters.items():
+            if name not in ('wavelength', 'na', 'NAi', 'pixelsize', 'rotation', 'regU', 'regP'):
+                raise ValueError(f'Unknown DPC parameter "{name}"')
+            setattr(self, name, tuple(value) if name == 'rotation' else value)
+
+    def setTikhonovRegularization(self, reg_u=1e-6, reg_p=1e-6):
+        self.setParameters(regU=reg_u, regP=reg_p)
+
+    def getTransferFunctions(self, shape):
+        """ Returns the absorption and phase WOTFs (Hu, Hp), each of shape
+        (dpcNum, height, width). """
+        return self._getCached(shape)[:2]
+
+    def normalize(self, images):
+        """ Returns images (..., height, width) as float32 contrast: each image
+        is divided by its local mean over half the image size and by its
+        overall mean, minus one. """
+        images = np.array(images, dtype=np.float32)
+        size = images.shape[-2] // 2
+        background = uniform_filter(images, size=(1,) * (images.ndim - 2) + (size, size))
+        np.maximum(background, np.finfo(np.float32).tiny, out=background)
+        images /= background
+        images /= images.mean(axis=(-2, -1), keepdims=True)
+        images -= 1.0
+        return images
+
+    def solve(self, images):
+        """ Reconstructs (absorption + 1j * phase) from DPC images of shape
+        (numTimePoints * dpcNum, height, width) or (numTimePoints, dpcNum,
+        height, width). Returns a complex64 array of shape (numTimePoints,
+        height, width). """
+        images = np.asarray(images)
+        shape = images.shape[-2:]
+        images = images.reshape(-1, self.dpcNum, *shape)
+        _, _, filterU, filterP = self._getCached(shape)
+
+        spectra = sfft.fft2(self.normalize(images), workers=self.workers)
+        absorption = sfft.ifft2(np.einsum('tkyx,kyx->tyx', spectra, filterU),
+                                workers=self.workers, overwrite_x=True).real
+        phase = sfft.ifft2(np.einsum('tkyx,kyx->tyx', spectra, filterP),
+                           workers=self.workers, overwrite_x=True).real
+        result = np.empty(absorption.shape, dtype=np.complex64)
+        result.real = absorption
+        result.imag = phase
+        return result
+
+    def _getCached(self, shape):
+        key = (tuple(shape), self.wavelength, self.na, self.NAi, self.pixelsize,
+               self.rotation, self.regU, self.regP)
+        cached = self._filters.get(key)
+        if cached is None:
+            cached = self._makeFilters(tuple(shape))
+            self._filters[key] = cached
+            while len(self._filters) > self.maxCachedFilters:
+                self._filters.popitem(last=False)
+        else:
+            self._filters.move_to_end(key)
+        return cached
+
+    def _makeFilters(self, shape):
+        height, width = shape
+        fy = sfft.fftfreq(height, d=self.pixelsize)[:, None]
+        fx = sfft.fftfreq(width, d=self.pixelsize)[None, :]
+        radiusSq = fx ** 2 + fy ** 2
+        pupil = (radiusSq <= (self.na / self.wavelength) ** 2).astype(np.float64)
+        sourcePupil = pupil.copy()
+        if self.NAi != 0.0:
+            sourcePupil[radiusSq < (self.NAi / self.wavelength) ** 2] = 0.0
+
+        # half-circle sources
+        sources = []
+        for rotation in self.rotation:
+            cos, sin = np.cos(np.deg2rad(rotation)), np.sin(np.deg2rad(rotation))
+            if rotation < 180:
+                source = (fy * cos + 1e-15 >= fx * sin) * sourcePupil
+            else:
+                source = sourcePupil - (fy * cos + 1e-15 < fx * sin) * sourcePupil
+            sources.append(source)
+        sources = np.asarray(sources)
+
+        # WOTFs
+        pupilSpectrum = np.fft.fft2(pupil).conj()
+        crossSpectra = np.fft.fft2(sources * pupil) * pupilSpectrum
+        intensities = (sources * pupil * pupil).sum(axis=(-2, -1))[:, None, None]
+        transferU = 2.0 * np.fft.ifft2(crossSpectra.real) / intensities
+        transferP = 2.0j * np.fft.ifft2(1j * crossSpectra.imag) / intensities
+
+        # Tikhonov inversion, folded into one filter per image and unknown
+        aha = [(transferU.conj() * transferU).sum(axis=0) + self.regU,
+               (transferU.conj() * transferP).sum(axis=0),
+               (transferP.conj() * transferU).sum(axis=0),
+               (transferP.conj() * transferP).sum(axis=0) + self.regP]
+        determinant = aha[0] * aha[3] - aha[1] * aha[2]
+        filterU = (aha[3] * transferU.conj() - aha[1] * transferP.conj()) / determinant
+        filterP = (aha[0] * transferP.conj() - aha[2] * transferU.conj()) / determinant
+        return tuple(array.astype(np.complex64)
+                     for array in (transferU, transferP, filterU, filterP))
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
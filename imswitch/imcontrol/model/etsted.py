@@ -0,0 +1,304 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+class FrameRing:
+    """ A fixed number of frame slots that are allocated once, on the first
+    frame, and overwritten in turn. Every frame gets an increasing id and the
+    perf_counter_ns timestamp of its arrival. A frame of another shape or
+    dtype than the slots reallocates them and forgets the frames before it. """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._frames = None
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._count = 0
+        self._first = 0  # the oldest id that belongs to the history
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._count - max(self._first, self._count - self.capacity)
+
+    @property
+    def latestId(self):
+        with self._lock:
+            return self._count - 1 if self._count > self._first else None
+
+    def put(self, frame, timestamp=None):
+        """ Copies frame into the next slot and returns its id. """
+        timestamp = time.perf_counter_ns() if timestamp is None else timestamp
+        frame = np.asarray(frame)
+        with self._lock:
+            if (self._frames is None or self._frames.shape[1:] != frame.shape or
+                    self._frames.dtype != frame.dtype):
+                self._frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+                self._ids[:] = -1
+                self._first = self._count
+            slot = self._count % self.capacity
+            np.copyto(self._frames[slot], frame)
+            self._ids[slot] = self._count
+            self._timestamps[slot] = timestamp
+            self._count += 1
+            return self._count - 1
+
+    def get(self, frameId):
+        """ Returns the frame frameId (a view of its slot) and its timestamp.
+        Raises KeyError if it was overwritten. """
+        with self._lock:
+            slot = frameId % self.capacity
+            if frameId < self._first or self._ids[slot] != frameId:
+                raise KeyError(f'Frame {frameId} is not in the buffer')
+            return self._frames[slot], int(self._timestamps[slot])
+
+    def history(self, frameId, length):
+        """ Returns views of at most length frames before frameId, oldest
+        first. They stay valid until capacity - length further frames have
+        arrived. """
+        with self._lock:
+            first = max(frameId - length, self._first, self._count - self.capacity, 0)
+            return [self._frames[i % self.capacity] for i in range(first, min(frameId, self._count))]
+
+    def copy(self, frameId, length, out=None):
+        """ Copies frame frameId and at most length frames before it into
+        out, oldest first, so that later frames cannot overwrite them. out is
+        reallocated if it does not fit. Returns the copied frames (a view of
+        out, frameId last), the timestamp of frameId and out. Raises KeyError
+        if frameId was overwritten. """
+        with self._lock:
+            slot = frameId % self.capacity
+            if frameId < self._first or self._ids[slot] != frameId:
+                raise KeyError(f'Frame {frameId} is not in the buffer')
+            first = max(frameId - length, self._first, self._count - self.capacity, 0)
+            shape = (length + 1,) + self._frames.shape[1:]
+            if out is None or out.shape != shape or out.dtype != self._frames.dtype:
+                out = np.empty(shape, dtype=self._frames.dtype)
+            for index, frameIndex in enumerate(range(first, frameId + 1)):
+                np.copyto(out[index], self._frames[frameIndex % self.capacity])
+            return out[:frameId - first + 1], int(self._timestamps[slot]), out
+
+    def stack(self, length=None):
+        """ Returns a copy of the last length frames (all frames if None),
+        oldest first. """
+        with self._lock:
+            first = max(self._first, self._count - self.capacity)
+            if length is not None:
+                first = max(first, self._count - length)
+            if self._frames is None or first >= self._count:
+                return np.empty((0,), dtype=np.float32)
+            slots = [i % self.capacity for i in range(first, self._count)]
+            return self._frames[slots]
+
+    def clear(self):
+        """ Forgets the frames received so far; the slots are kept. """
+        with self._lock:
+            self._first = self._count
+
+
+class EventLatency:
+    """ The perf_counter_ns timestamps of the stages one frame went through,
+    starting with its arrival. """
+
+    __slots__ = ('frameId', 'received', 'stages')
+
+    def __init__(self, frameId, received):
+        self.frameId = frameId
+        self.received = received
+        self.stages = []
+
+    def mark(self, stage):
+        self.stages.append((stage, time.perf_counter_ns()))
+
+    def durations(self):
+        """ Returns the duration of every stage since the stage before it,
+        and the total since the arrival of the frame, in milliseconds. """
+        durations = {}
+        previous = self.received
+        for stage, timestamp in self.stages:
+            durations[stage] = (timestamp - previous) * 1e-6
+            previous = timestamp
+        durations['total'] = (previous - self.received) * 1e-6
+        return durations
+
+    def format(self):
+        """ Returns the durations as one compact log line. """
+        return f'frame={self.frameId} ' + ' '.join(
+            f'{stage}={duration:.3f}' for stage, duration in self.durations().items()
+        ) + ' ms'
+
+
+class LatencyLog:
+    """ Keeps the latencies of the last maxRecords frames and of the last
+    maxEvents events separately, so that the rare events are not pushed out
+    by the frames without one. """
+
+    def __init__(self, maxRecords=1000, maxEvents=100):
+        self._frames = collections.deque(maxlen=maxRecords)
+        self._events = collections.deque(maxlen=maxEvents)
+        self._lock = threading.Lock()
+
+    def add(self, latency, event=False):
+        with self._lock:
+            (self._events if event else self._frames).append(latency)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._events.clear()
+
+    def summary(self):
+        """ Returns the mean and maximum duration of every stage in ms, for
+        frames and for events. """
+        with self._lock:
+            groups = {'frames': list(self._frames), 'events': list(self._events)}
+        summary = {}
+        for group, latencies in groups.items():
+            stages = collections.defaultdict(list)
+            for latency in latencies:
+                for stage, duration in latency.durations().items():
+                    stages[stage].append(duration)
+            summary[group] = {
+                stage: {'mean': float(np.mean(durations)), 'max': float(np.max(durations)),
+                        'count': len(durations)}
+                for stage, durations in stages.items()
+            }
+        return summary
+
+    def lastEvent(self):
+        with self._lock:
+            return self._events[-1] if self._events else None
+
+
+class EventDetectionWorker:
+    """ Runs an event-detection pipeline on its own thread.
+
+    submit() copies a frame into a FrameRing of historyLength + slack slots
+    and returns at once. The worker calls process(frame, history, latency)
+    with the newest frame, the list of up to historyLength frames before it
+    and an EventLatency on which process marks its stages; process returns
+    True if it detected an event. The frames are copied out of the ring into
+    a buffer of the worker first, so that frames submitted meanwhile cannot
+    change them; the buffer is reused for the next call, so process has to
+    copy the frames it keeps. Frames that arrive while process is running
+    are skipped, except for the newest one. While paused, submitted frames
+    are ignored. """
+
+    def __init__(self, process, historyLength=10, slack=4, latencyLog=None, name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self._process = process
+        self.historyLength = historyLength
+        self.frames = FrameRing(historyLength + slack)
+        self.latencyLog = latencyLog if latencyLog is not None else LatencyLog()
+        self._condition = threading.Condition()
+        self._lastProcessed = -1
+        self._paused = False
+        self._running = False
+        self._thread = None
+        self._buffer = None
+        self._statistics = {'received': 0, 'processed': 0, 'skipped': 0, 'events': 0,
+                            'failed': 0}
+
+    @property
+    def isRunning(self):
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._paused = False
+        self._thread = threading.Thread(target=self._run, name='EventDetectionWorker',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def pause(self):
+        """ Ignores frames until resume() is called. """
+        with self._condition:
+            self._paused = True
+
+    def resume(self, clearHistory=False):
+        with self._condition:
+            if clearHistory:
+                self.frames.clear()
+            latestId = self.frames.latestId
+            self._lastProcessed = max(self._lastProcessed, -1 if latestId is None else latestId)
+            self._paused = False
+
+    def submit(self, frame):
+        """ Queues frame and returns its id, or None if paused. """
+        received = time.perf_counter_ns()
+        with self._condition:
+            if self._paused or not self._running:
+                return None
+            frameId = self.frames.put(frame, received)
+            self._statistics['received'] += 1
+            self._condition.notify_all()
+        return frameId
+
+    def getStatistics(self):
+        with self._condition:
+            return dict(self._statistics)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (self._paused or self._newestId() <= self._lastProcessed):
+                    self._condition.wait()
+                if not self._running:
+                    return
+                frameId = self._newestId()
+                self._statistics['skipped'] += frameId - self._lastProcessed - 1
+                self._lastProcessed = frameId
+            try:
+                frames, received, self._buffer = self.frames.copy(frameId, self.historyLength,
+                                                                  self._buffer)
+            except KeyError:
+                continue
+            latency = EventLatency(frameId, received)
+            latency.mark('queue')
+            try:
+                event = bool(self._process(frames[-1], list(frames[:-1]), latency))
+            except Exception:
+                self.__logger.exception('Event detection failed')
+                with self._condition:
+                    self._statistics['failed'] += 1
+                continue
+            self.latencyLog.add(latency, event)
+            with self._condition:
+                self._statistics['processed'] += 1
+                self._statistics['events'] += event
+
+    def _newestId(self):
+        latestId = self.frames.latestId
+        return -1 if latestId is None else latestId
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,165 @@
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+
+class FlowStopWriter:
+    """ Appends frames to a single BigTIFF file on a background thread.
+
+    Every frame is one page whose description holds its metadata as JSON.
+    Frames wait in a queue of at most maxQueued stops, so that a slow disk
+    eventually holds back the acquisition instead of filling the memory. """
+
+    def __init__(self, filePath, maxQueued=32):
+        self.__logger = initLogger(self)
+        self.filePath = filePath
+        self.numWritten = 0
+        self.maxQueueLength = 0
+        self.writeTime = 0.0
+        self._queue = queue.Queue(maxsize=maxQueued)
+        self._tiff = tif.TiffWriter(filePath, bigtiff=True, append=True)
+        self._thread = threading.Thread(target=self._run, name='FlowStopWriter', daemon=True)
+        self._thread.start()
+
+    def write(self, frames, metadata):
+        """ Queues frames (a list of 2D arrays) with a metadata dict each. """
+        self._queue.put((frames, metadata))
+        self.maxQueueLength = max(self.maxQueueLength, self._queue.qsize())
+
+    def close(self):
+        """ Writes the remaining frames and closes the file. """
+        self._queue.put(None)
+        self._thread.join()
+        self._tiff.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            start = time.perf_counter()
+            for frame, metadata in zip(*item):
+                try:
+                    self._tiff.write(np.asarray(frame), description=json.dumps(metadata),
+                                     metadata=None, contiguous=False)
+                    self.numWritten += 1
+                except Exception:
+                    self.__logger.exception(f'Failed to write frame to {self.filePath}')
+            self.writeTime += time.perf_counter() - start
+
+
+class FlowStopEngine(SignalInterface):
+    """ Pipelined stop-and-image loop of a flow cell.
+
+    For every stop, the pump move that brings in new sample has to be done
+    and the flow has to settle; then framesPerStop frames are grabbed. The
+    frames are handed to the writer and the next pump move is started right
+    away, so saving overlaps with pumping and settling. Stops start no more
+    often than frameRate per second. """
+
+    sigStopDone = Signal(int, int)  # (stopIndex, numStops)
+
+    def __init__(self, movePump, grabFrames, writer, numStops, volumePerStop, timeToStabilize,
+                 frameRate=1, framesPerStop=1, pumpSpeed=1000, metadata=None):
+        super().__init__()
+        self.__logger = initLogger(self)
+
+        self._movePump = movePump
+        self._grabFrames = grabFrames
+        self._writer = writer
+        self.numStops = numStops
+        self.volumePerStop = volumePerStop
+        self.timeToStabilize = timeToStabilize
+        self.frameRate = frameRate
+        self.framesPerStop = framesPerStop
+        self.pumpSpeed = pumpSpeed
+        self.metadata = metadata or {}
+
+        self.stopsDone = 0
+        self.framesTaken = 0
+        self._isRunning = False
+        self._timings = {'pumpWait': 0.0, 'grab': 0.0}
+
+    def run(self):
+        """ Runs the stops on the calling thread, until numStops are done or
+        stop() is called. """
+        self._isRunning = True
+        period = 1 / self.frameRate if self.frameRate else 0
+        pumpMove = self._movePump(self.volumePerStop, self.pumpSpeed)
+        cycleStart = time.time()
+        try:
+            while self._isRunning and self.stopsDone < self.numStops:
+                start = time.perf_counter()
+                pumpMove.result()
+                self._timings['pumpWait'] += time.perf_counter() - start
+                time.sleep(self.timeToStabilize)
+
+                start = time.perf_counter()
+                frames = self._grabFrames(self.framesPerStop)
+                self._timings['grab'] += time.perf_counter() - start
+                grabTime = time.time()
+
+                stopIndex = self.stopsDone
+                if frames:
+                    self._writer.write(frames, [
+                        {**self.metadata, 'stopIndex': stopIndex, 'frameIndex': i,
+                         'timestamp': grabTime}
+                        for i in range(len(frames))
+                    ])
+                    self.framesTaken += len(frames)
+                else:
+                    self.__logger.warning(f'No frame received at stop {stopIndex}')
+                self.stopsDone += 1
+                self.sigStopDone.emit(stopIndex, self.numStops)
+
+                if self._isRunning and self.stopsDone < self.numStops:
+                    # sample flows in while the frames are written
+                    time.sleep(max(0.0, cycleStart + period - time.time()))
+                    cycleStart = time.time()
+                    pumpMove = self._movePump(self.volumePerStop, self.pumpSpeed)
+        finally:
+            self._isRunning = False
+
+    def stop(self):
+        self._isRunning = False
+
+    @property
+    def isRunning(self):
+        return self._isRunning
+
+    def getStatistics(self):
+        """ Returns the number of stops and frames done and the average time
+        per stop spent waiting for the pump and grabbing frames. """
+        stops = max(1, self.stopsDone)
+        return {
+            'stops': self.stopsDone,
+            'frames': self.framesTaken,
+            'framesWritten': self._writer.numWritten,
+            'maxWriteQueue': self._writer.maxQueueLength,
+            'pumpWaitMs': self._timings['pumpWait'] / stops * 1e3,
+            'grabMs': self._timings['grab'] / stops * 1e3
+        }
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,416 @@
+import concurrent.futures
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import scipy.ndimage as ndi
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+
+def cropRoi(frame, roi):
+    """ Returns the (x, y, width, height) ROI of frame, or frame if roi is
+    None, together with the (row, col) offset of the ROI. """
+    if roi is None:
+        return frame, (0, 0)
+    x, y, width, height = roi
+    return frame[y:y + height, x:x + width], (y, x)
+
+
+def smooth(image, sigma):
+    """ Separable Gaussian smoothing in single precision. """
+    image = np.asarray(image, dtype=np.float32)
+    if not sigma:
+        return image
+    return cv2.GaussianBlur(image, (0, 0), sigmaX=sigma, sigmaY=sigma,
+                            borderType=cv2.BORDER_REPLICATE)
+
+
+def findPeak(image, twoFoci=False, minDistance=60):
+    """ Returns the (row, col) of the brightest pixel of image. With twoFoci,
+    the two brightest local maxima at least minDistance apart are found, and
+    the one with the lower column index is returned. """
+    if not twoFoci:
+        return np.unravel_index(np.argmax(image), image.shape)
+
+    size = 2 * minDistance + 1
+    peaks = (image == ndi.maximum_filter(image, size=size, mode='nearest'))
+    peakIndices = np.flatnonzero(peaks)
+    if len(peakIndices) < 2:
+        return np.unravel_index(np.argmax(image), image.shape)
+    values = image.reshape(-1)[peakIndices]
+    brightest = peakIndices[np.argpartition(values, -2)[-2:]]
+    rows, cols = np.unravel_index(brightest, image.shape)
+    first = np.argmin(cols)
+    return rows[first], cols[first]
+
+
+def spotMoments(image, center, halfSize=50):
+    """ Background-subtracted centroid (row, col) and variances (row, col) of
+    the spot in a window around center, computed from the row and column
+    projections. Coordinates are relative to image. """
+    row, col = center
+    rowLow, colLow = max(0, row - halfSize), max(0, col - halfSize)
+    window = image[rowLow:row + halfSize, colLow:col + halfSize]
+    window = window - window.min()
+
+    rowProfile = window.sum(axis=1)
+    colProfile = window.sum(axis=0)
+    total = rowProfile.sum()
+    if total <= 0:
+        return (float(row), float(col)), (0.0, 0.0)
+
+    rows = np.arange(window.shape[0], dtype=np.float32)
+    cols = np.arange(window.shape[1], dtype=np.float32)
+    rowMean = rowProfile @ rows / total
+    colMean = colProfile @ cols / total
+    rowVar = rowProfile @ (rows - rowMean) ** 2 / total
+    colVar = colProfile @ (cols - colMean) ** 2 / total
+    return (rowLow + float(rowMean), colLow + float(colMean)), (float(rowVar), float(colVar))
+
+
+def jpgSizeMetric(image, cropSize=512, quality=80):
+    """ Size of the JPEG encoded centre of image, a measure of sharpness. """
+    height, width = image.shape[:2]
+    top, left = max(0, height // 2 - cropSize // 2), max(0, width // 2 - cropSize // 2)
+    success, buffer = cv2.imencode('.jpg', image[top:top + cropSize, left:left + cropSize],
+                                   [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return len(buffer) if success else 0
+
+
+class FocusLockEngine(SignalInterface):
+    """ Closed focus-lock loop running on its own thread with a fixed control
+    period.
+
+    Every period, the latest frame is grabbed, cropped to the processing ROI
+    and reduced to a focus signal with the selected metric:
+
+    - ``centroid``: column position of the (smoothed) reflected spot
+    - ``astigmatism``: normalised difference of the spot's row and column
+      variances
+    - ``JPG``: JPEG size of the frame centre, a sharpness measure
+    - ``ratio``: row/column energy ratio of the background-normalised frame,
+      as used with the ESP32 serial camera
+
+    While locked, a PI controller turns the signal into z corrections, which
+    are issued on a separate thread so that a slow stage never delays the
+    loop. Loop period jitter and processing times are recorded. """
+
+    sigUnlocked = Signal(str)  # (reason)
+    sigLocked = Signal(float)  # (setPoint)
+
+    def __init__(self, grabFrame, getPosition, moveRelative, period=0.05, roi=None,
+                 metric='centroid', smoothingSigma=7, twoFoci=False, swapAxes=False,
+                 minMove=0.002, maxDistance=5, maxMove=3):
+        super().__init__()
+        self.__logger = initLogger(self)
+
+        self._grabFrame = grabFrame
+        self._getPosition = getPosition
+        self._moveRelative = moveRelative
+
+        self.period = period
+        self.roi = roi
+        self.metric = metric
+        self.smoothingSigma = smoothingSigma
+        self.twoFoci = twoFoci
+        self.swapAxes = swapAxes
+        self.minMove = minMove
+        self.maxDistance = maxDistance
+        self.maxMove = maxMove
+
+        self.zStackMode = False
+        self.zStepLimLo = 0
+        self.aboutToLockDiffMax = 0.4
+
+        self.latestFrame = None
+        self.latestSignal = 0.0
+        self.latestTime = 0.0
+
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._mover = None
+        self._moveFuture = None
+        self._pi = None
+        self._locked = False
+        self._aboutToLock = False
+        self._aboutToLockSignals = []
+        self._lockPosition = 0.0
+        self._lastPosition = None
+        self._lastFrame = None
+        self._resetStatistics()
+
+    @property
+    def locked(self):
+        return self._locked
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopEvent.clear()
+        if self._mover is None:
+            self._mover = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._thread = threading.Thread(target=self._run, name='FocusLockEngine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._mover is not None:
+            self._mover.shutdown(wait=False)  # a new one is made if started again
+            self._mover = None
+            self._moveFuture = None
+
+    def lock(self, kp, ki, setPoint=None):
+        """ Locks the focus to setPoint, or to the current signal if None. """
+        with self._lock:
+            setPoint = self.latestSignal if setPoint is None else setPoint
+            self._pi = PI(setPoint, 0.001, kp, ki)
+            self._lockPosition = self._getPosition()
+            self._lastPosition = self._lockPosition
+            self._locked = True
+            self._aboutToLock = False
+        self.sigLocked.emit(setPoint)
+
+    def unlock(self, reason=''):
+        with self._lock:
+            wasLocked = self._locked
+            self._locked = False
+        if wasLocked:
+            self.sigUnlocked.emit(reason)
+
+    def computeSignal(self, frame):
+        """ Reduces a frame to the focus signal of the selected metric. """
+        if self.swapAxes:
+            frame = np.swapaxes(frame, 0, 1)
+        roi, (rowOffset, colOffset) = cropRoi(frame, self.roi)
+
+        if self.metric == 'JPG':
+            return float(jpgSizeMetric(roi))
+        if self.metric == 'ratio':
+            normalised = (smooth(roi, 5) / smooth(roi, 15)) ** 2
+            return float(np.max(normalised.mean(axis=1)) / np.max(normalised.mean(axis=0)))
+
+        smoothed = smooth(roi, self.smoothingSigma)
+        peak = findPeak(smoothed, twoFoci=self.twoFoci)
+        (row, col), (rowVar, colVar) = spotMoments(smoothed, peak)
+        if self.metric == 'astigmatism':
+            return (colVar - rowVar) / (colVar + rowVar) if colVar + rowVar > 0 else 0.0
+        return col + colOffset
+
+    def getStatistics(self):
+        """ Returns loop statistics: number of iterations, mean period, period
+        jitter (standard deviation and maximum of the deviation from the
+        schedule), mean processing time (all in milliseconds), overruns and
+        issued/skipped moves. """
+        with self._lock:
+            n = self._numIterations
+            return {
+                'iterations': n,
+                'periodMs': self.period * 1e3,
+                'meanPeriodMs': (self._periodSum / (n - 1) * 1e3) if n > 1 else None,
+                'jitterStdMs': math.sqrt(self._jitterM2 / n) * 1e3 if n > 0 else None,
+                'jitterMaxMs': self._jitterMax * 1e3,
+                'processingMs': (self._processingSum / n * 1e3) if n > 0 else None,
+                'overruns': self._numOverruns,
+                'moves': self._numMoves,
+                'skippedMoves': self._numSkippedMoves
+            }
+
+    def _resetStatistics(self):
+        self._numIterations = 0
+        self._periodSum = 0.0
+        self._jitterMean = 0.0
+        self._jitterM2 = 0.0
+        self._jitterMax = 0.0
+        self._processingSum = 0.0
+        self._numOverruns = 0
+        self._numMoves = 0
+        self._numSkippedMoves = 0
+        self._lastStart = None
+
+    def _run(self):
+        _raiseThreadPriority()
+        deadline = time.perf_counter()
+        while not self._stopEvent.is_set():
+            start = time.perf_counter()
+            try:
+                self._step()
+            except Exception:
+                self.__logger.exception('Focus lock step failed')
+            end = time.perf_counter()
+            self._recordIteration(start, deadline, end)
+
+            deadline += self.period
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                self._stopEvent.wait(remaining)
+            else:
+                # Skip the missed periods instead of trying to catch up
+                with self._lock:
+                    self._numOverruns += 1
+                deadline = time.perf_counter()
+
+    def _recordIteration(self, start, deadline, end):
+        with self._lock:
+            jitter = abs(start - deadline)
+            self._numIterations += 1
+            delta = jitter - self._jitterMean
+            self._jitterMean += delta / self._numIterations
+            self._jitterM2 += delta * (jitter - self._jitterMean)
+            self._jitterMax = max(self._jitterMax, jitter)
+            self._processingSum += end - start
+            if self._lastStart is not None:
+                self._periodSum += start - self._lastStart
+            self._lastStart = start
+
+    def _step(self):
+        frame = self._grabFrame()
+        if frame is None or frame is self._lastFrame:
+            return  # No new information
+        self._lastFrame = frame
+
+        signal = self.computeSignal(frame)
+        self.latestFrame = frame
+        self.latestSignal = signal
+        self.latestTime = time.perf_counter()
+
+        if self._locked:
+            self._control(signal)
+        elif self._aboutToLock:
+            self._aboutToLockUpdate(signal)
+
+    def _control(self, signal):
+        with self._lock:
+            move = self._pi.update(signal)
+        position = self._getPosition()
+        distance = position - self._lockPosition
+        stepDistance = abs(position - self._lastPosition)
+        self._lastPosition = position
+
+        if abs(distance) > self.maxDistance or abs(move) > self.maxMove:
+            self.__logger.warning(f'Safety unlocking! Distance to lock: {distance:.3f},'
+                                  f' current move step: {move:.3f}.')
+            self.unlock('safety')
+            return
+        if self.zStackMode and stepDistance > self.zStepLimLo:
+            # The stage was moved externally, wait for the signal to settle
+            self.unlock('zstack')
+            self._aboutToLockSignals = []
+            self._aboutToLock = True
+            return
+
+        if abs(move) > self.minMove:
+            self._issueMove(move)
+
+    def _aboutToLockUpdate(self, signal):
+        self._aboutToLockSignals = (self._aboutToLockSignals + [signal])[-5:]
+        if (len(self._aboutToLockSignals) == 5
+                and np.std(self._aboutToLockSignals) < self.aboutToLockDiffMax):
+            with self._lock:
+                pi = self._pi
+            self.lock(pi.kp / pi.multiplier, pi.ki / pi.multiplier, setPoint=signal)
+
+    def _issueMove(self, move):
+        if self._mover is None:
+            return  # stopped
+        if self._moveFuture is not None and not self._moveFuture.done():
+            with self._lock:
+                self._numSkippedMoves += 1
+            return
+        with self._lock:
+            self._numMoves += 1
+        self._moveFuture = self._mover.submit(self._moveRelative, move)
+
+
+class PI:
+    """Simple implementation of a discrete PI controller.
+    Taken from http://code.activestate.com/recipes/577231-discrete-pid-controller/
+    Author: Federico Barabas"""
+    def __init__(self, setPoint, multiplier=1, kp=0, ki=0):
+        self._kp = multiplier * kp
+        self._ki = multiplier * ki
+        self._setPoint = setPoint
+        self.multiplier = multiplier
+        self.error = 0.0
+        self._started = False
+
+    def update(self, currentValue):
+        """ Calculate PI output value for given reference input and feedback.
+        Using the iterative formula to avoid integrative part building. """
+        self.error = self.setPoint - currentValue
+        if self.started:
+            self.dError = self.error - self.lastError
+            self.out = self.out + self.kp * self.dError + self.ki * self.error
+        else:
+            # This only runs in the first step
+            self.out = self.kp * self.error
+            self.started = True
+        self.lastError = self.error
+        return self.out
+
+    def restart(self):
+        self.started = False
+
+    @property
+    def started(self):
+        return self._started
+
+    @started.setter
+    def started(self, value):
+        self._started = value
+
+    @property
+    def setPoint(self):
+        return self._setPoint
+
+    @setPoint.setter
+    def setPoint(self, value):
+        self._setPoint = value
+
+    @property
+    def kp(self):
+        return self._kp
+
+    @kp.setter
+    def kp(self, value):
+        self._kp = value
+
+    @property
+    def ki(self):
+        return self._ki
+
+    @ki.setter
+    def ki(self, value):
+        self._ki = value
+
+
+def _raiseThreadPriority():
+    """ Best effort: raise the scheduling priority of the calling thread. """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -5)
+    except (AttributeError, OSError):
+        pass
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,151 @@
+import numpy as np
+import scipy.fft as sfft
+
+
+def centerCrop(image, size):
+    """ Returns a centred view of at most size x size pixels of image. """
+    if not size:
+        return image
+    height, width = image.shape[-2:]
+    cropHeight, cropWidth = min(size, height), min(size, width)
+    top, left = (height - cropHeight) // 2, (width - cropWidth) // 2
+    return image[..., top:top + cropHeight, left:left + cropWidth]
+
+
+def binImage(image, binning):
+    """ Sums binning x binning blocks of image. Trailing rows and columns that
+    do not fill a block are discarded. """
+    if not binning or binning <= 1:
+        return image
+    height, width = image.shape[-2:]
+    height, width = height - height % binning, width - width % binning
+    blocks = image[..., :height, :width].reshape(
+        image.shape[:-2] + (height // binning, binning, width // binning, binning)
+    )
+    return blocks.sum(axis=(-3, -1), dtype=np.float32)
+
+
+class FFTMagnitude:
+    """ Computes the centred log10-magnitude spectrum of real images.
+
+    The spectrum is computed with a real-input FFT in single precision, and
+    the missing half is filled in from the Hermitian symmetry with a gather
+    index that also applies the fftshift. Index and work buffers are cached
+    per image shape, so instances must not be shared between threads. """
+
+    def __init__(self, workers=-1):
+        self.workers = workers
+        self._shape = None
+        self._input = None
+        self._magnitude = None
+        self._index = None
+
+    def __call__(self, image):
+        if image.shape != self._shape:
+            self._prepare(image.shape)
+
+        np.copyto(self._input, image, casting='unsafe')
+        spectrum = sfft.rfft2(self._input, workers=self.workers)
+        np.abs(spectrum, out=self._magnitude)
+        with np.errstate(divide='ignore'):
+            np.log10(self._magnitude, out=self._magnitude)
+        return np.take(self._magnitude, self._index)
+
+    def _prepare(self, shape):
+        height, width = shape
+        halfWidth = width // 2 + 1
+
+        # Unshifted frequency indices of each pixel of the shifted spectrum
+        rows = (np.arange(height) - height // 2) % height
+        cols = (np.arange(width) - width // 2) % width
+        rows, cols = np.meshgrid(rows, cols, indexing='ij')
+
+        # Columns beyond the half spectrum are mirrored through the origin
+        mirrored = cols >= halfWidth
+        rows[mirrored] = (-rows[mirrored]) % height
+        cols[mirrored] = width - cols[mirrored]
+
+        indexType = np.int32 if height * halfWidth < 2 ** 31 else np.intp
+        self._index = (rows * halfWidth + cols).astype(indexType)
+        self._input = np.empty(shape, dtype=np.float32)
+        self._magnitude = np.empty((height, halfWidth), dtype=np.float32)
+        self._shape = shape
+
+
+class AngularSpectrumPropagator:
+    """ Propagates complex fields or real amplitudes by a distance dz with the
+    angular spectrum method.
+
+    Transfer functions are cached per (shape, pixel size, wavelength, NA,
+    refractive index, dz), so refocusing a live stream only costs the FFTs.
+    Real inputs are propagated with real-input FFTs. Instances must not be
+    shared between threads. """
+
+    def __init__(self, workers=-1, maxCachedKernels=8):
+        self.workers = workers
+        self.maxCachedKernels = maxCachedKernels
+        self._kernels = {}
+
+    def __call__(self, field, dz, pixelsize, wavelength, NA=1.0, n=1.0):
+        if np.iscomplexobj(field):
+            field = field.astype(np.complex64, copy=False)
+            kernel = self.getKernel(field.shape, dz, pixelsize, wavelength, NA, n, real=False)
+            spectrum = sfft.fft2(field, workers=self.workers)
+            spectrum *= kernel
+            return sfft.ifft2(spectrum, workers=self.workers, overwrite_x=True)
+
+        # For a real field, the spectrum is Hermitian and the kernel depends
+        # on |k| only, so the real and imaginary parts of the kernel each give
+        # a real output and the whole propagation runs on half spectra
+        field = field.astype(np.float32, copy=False)
+        kernelReal, kernelImag = self.getKernel(field.shape, dz, pixelsize, wavelength, NA, n,
+                                                real=True)
+        spectrum = sfft.rfft2(field, workers=self.workers)
+        result = np.empty(field.shape, dtype=np.complex64)
+        result.real = sfft.irfft2(spectrum * kernelReal, s=field.shape, workers=self.workers)
+        result.imag = sfft.irfft2(spectrum * kernelImag, s=field.shape, workers=self.workers)
+        return result
+
+    def getKernel(self, shape, dz, pixelsize, wavelength, NA=1.0, n=1.0, real=False):
+        """ Returns the cached transfer function for the given parameters. For
+        real=True, it is returned on the rfft2 half spectrum, split into real
+        and imaginary parts. """
+        key = (tuple(shape), dz, pixelsize, wavelength, NA, n, real)
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            if len(self._kernels) >= self.maxCachedKernels:
+                self._kernels.pop(next(iter(self._kernels)))
+            kernel = self._makeKernel(shape, dz, pixelsize, wavelength, NA, n, real)
+            self._kernels[key] = kernel
+        return kernel
+
+    @staticmethod
+    def _makeKernel(shape, dz, pixelsize, wavelength, NA, n, real):
+        height, width = shape
+        fy = sfft.fftfreq(height, d=pixelsize)
+        fx = sfft.rfftfreq(width, d=pixelsize) if real else sfft.fftfreq(width, d=pixelsize)
+        sinAlphaSq = (wavelength / n) ** 2 * (fy[:, None] ** 2 + fx[None, :] ** 2)
+        pupil = sinAlphaSq <= min(NA / n, 1) ** 2
+        cosAlpha = np.sqrt(np.clip(1 - sinAlphaSq, 0, None))
+        phase = (2 * np.pi * n / wavelength * dz) * cosAlpha
+        if real:
+            return (np.where(pupil, np.cos(phase), 0).astype(np.float32),
+                    np.where(pupil, np.sin(phase), 0).astype(np.float32))
+        return np.where(pupil, np.exp(1j * phase), 0).astype(np.complex64)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
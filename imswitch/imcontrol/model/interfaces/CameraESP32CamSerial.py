@@ -1,15 +1,11 @@
 import time
 from imswitch.imcommon.model import initLogger
-from threading import Thread
+from imswitch.imcontrol.model.interfaces.framestream import LatestFrame, SerialFrameReader
 import numpy as np
 import serial.tools.list_ports
-import base64
-from PIL import Image
-import io
-import math
 
 class CameraESP32CamSerial:
-    def __init__(self, port=None):
+    def __init__(self, port=None, serialdevice=None):
         super().__init__()
         self.__logger = initLogger(self, tryInheritParent=True)
 
@@ -33,15 +29,16 @@ class CameraESP32CamSerial:
         self.frame = np.ones((self.SensorHeight,self.SensorWidth))
         self.isRunning = False
         
-        # string to send data to camera
-        self.newCommand = ""
         self.exposureTime = -1
         self.gain = -1
         
-        self.waitForNextFrame = True
+        # an already open device (e.g. a simulator) can be passed instead of a port
+        self.serialdevice = serialdevice if serialdevice is not None else self.connect_to_usb_device()
 
-
-        self.serialdevice = self.connect_to_usb_device()
+        # frames are requested and read back to back on a background thread
+        self.frames = LatestFrame()
+        self.reader = SerialFrameReader(self.serialdevice, self.SensorWidth, self.SensorHeight,
+                                        frames=self.frames, reconnect=self.reconnect)
 
     def connect_to_usb_device(self):
         if self.port is not None:
@@ -65,14 +62,6 @@ class CameraESP32CamSerial:
         self.__logger.debug("No matching USB device found.")
         return None
 
-    def calculate_base64_length(self, width, height):
-        """Calculate the length of a base64 string for an image of given dimensions."""
-        num_bytes = width * height
-        base64_length = math.ceil((num_bytes * 4) / 3)
-        # ensure length is multiple of 4
-        base64_length = base64_length + (4 - base64_length % 4) % 4
-        return base64_length
-
     def initCam(self):
         """Initialize the camera."""
         # adjust exposure time
@@ -86,23 +75,22 @@ class CameraESP32CamSerial:
 
     def start_live(self):
         self.isRunning = True
-        self.mThread = Thread(target=self.startStreamingThread) 
-        self.mThread.start()
+        self.reader.start()
 
     def stop_live(self):
         self.isRunning = False
-        self.mThread.join()
-        try:self.serialdevice.close()
-        except:pass
+        self.reader.stop()
 
     def suspend_live(self):
         self.isRunning = False
+        self.reader.stop()
 
     def prepare_live(self):
         pass
 
     def close(self):
-        try:self.serialdevice.close()
+        self.reader.stop()
+        try:self.reader.serialdevice.close()
         except:pass
 
     def setPropertyValue(self, property_name, property_value):
@@ -129,104 +117,41 @@ class CameraESP32CamSerial:
 
 
     def set_exposure_time(self, exposureTime):
-        self.newCommand = "t"+str(exposureTime)
+        self.reader.sendCommand("t"+str(exposureTime))
         self.exposureTime = exposureTime
 
     def set_analog_gain(self, gain):
-        self.newCommand = "g"+str(gain)
+        self.reader.sendCommand("g"+str(gain))
         self.gain = gain
         
-    def getLast(self):
-        return self.frame
-
-    def startStreamingThread(self):
-        # if we have never connected anything we should return and not always try to reconnecnt
-        if self.serialdevice is None:
-            return
-        nFrame = 0
-        nTrial = 0
-        # Calculate the length of the base64 string
-        base64_length = self.calculate_base64_length(self.SensorWidth, self.SensorHeight)
-        lineBreakLength = 2
-        waitForNextFrame = True
-        while self.isRunning:
-            try:
-
-                # send new comamand to change camera settings, reset command    
-                if not self.newCommand == "":
-                    self.serialdevice.write((self.newCommand+' \n').encode())
-                    self.newCommand = ""
-
-                # request new image
-                self.serialdevice.write((' \n').encode())
-                    
-                # don't read to early
-                time.sleep(.05)
-                # readline of camera
-                frame_size = 320 * 240
-        
-                # Read the base64 string from the serial port
-                lineBreakLength = 2
-                base64_image_string  = self.serialdevice.read(base64_length+lineBreakLength)
-
-                # Decode the base64 string into a 1D numpy array
-                image_bytes = base64.b64decode(base64_image_string)
-                image_1d = np.frombuffer(image_bytes, dtype=np.uint8)
-
-                # Reshape the 1D array into a 2D image
-                frame = image_1d.reshape(self.SensorHeight, self.SensorWidth)
-                                
-                frame_bytes = self.serialdevice.read(frame_size)
-                frame_flat = np.frombuffer(frame_bytes, dtype=np.uint8)
-                
-                # Display the image
-                if waitForNextFrame:
-                    waitForNextFrame = False
-
-                else:
-                    # publish frame frame
-                    self.frame = frame_flat.reshape((240, 320))
-                
-                '''
-                # find 0,1,0,1... pattern to sync
-                pattern = (0,1,0,1,0,1,0,1,0,1)
-                window_size = len(pattern)
-                for i in range(len(frame_flat) - window_size + 1):
-                    # Check if the elements in the current window match the pattern
-                    if np.array_equal(frame_flat[i:i+window_size], pattern):
-                        break
-                '''                
-
-                nFrame += 1
-                
-            except Exception as e:
-                # try to reconnect 
-                #print(e) # most of the time "incorrect padding of the bytes "
-                nFrame = 0
-                nTrial+=1
-
-                # Clear the serial buffer
-                while(self.serialdevice.read()):
-                    pass
-                # Re-initialize the camera
-                self.initCam()
-                waitForNextFrame = True
-                
-                # Attempt a hard reset every 20 errors
-                if nTrial > 10 and type(e)==serial.serialutil.SerialException:
-                    try:
-                        # close the device - similar to hard reset
-                        self.serialdevice.setDTR(False)
-                        self.serialdevice.setRTS(True)
-                        time.sleep(.1)
-                        self.serialdevice.setDTR(False)
-                        self.serialdevice.setRTS(False)
-                        time.sleep(.5)
-                        #self.serialdevice.close()
-                    except: pass
-                    self.serialdevice = self.connect_to_usb_device()
-                    nTrial = 0
-                
+    def getLast(self, returnFrameNumber=False):
+        frame, frameNumber = self.frames.get(returnFrameNumber=True)
+        if frame is not None:
+            self.frame = frame
+        return (self.frame, frameNumber) if returnFrameNumber else self.frame
+
+    def getStatistics(self):
+        """ Returns the number of frames received, dropped before they were
+        read, incomplete and realigned. """
+        return self.reader.getStatistics()
+
+    def reconnect(self):
+        """ Hard-resets the camera and connects to it again; called by the
+        frame reader after repeated failures. """
+        try:
+            # close the device - similar to hard reset
+            self.serialdevice.setDTR(False)
+            self.serialdevice.setRTS(True)
+            time.sleep(.1)
+            self.serialdevice.setDTR(False)
+            self.serialdevice.setRTS(False)
+            time.sleep(.5)
+            self.serialdevice.close()
+        except: pass
+        self.serialdevice = self.connect_to_usb_device()
+        if self.serialdevice is not None:
+            self.initCam()
+        return self.serialdevice
                 
     def getLastChunk(self):
         return self.frame
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BufferUnderrunError(RuntimeError):
+    """ Raised by a SimulatedDAQTask whose output buffer ran empty. The
+    error code is that of the corresponding NI-DAQmx error. """
+
+    error_code = -200290
+
+
+class SimulatedDAQTask:
+    """ Stand-in for an NI-DAQmx output task, for running scans without
+    hardware.
+
+    Samples written with write() are generated at sampleRate once the task
+    is started. A finite task (numSamples given) is done after numSamples
+    samples; a continuous one runs until stopped. With regenerate, a
+    continuous task repeats what was written, like a regenerating DAQ
+    buffer. Otherwise written samples are consumed, the buffer holds at most
+    bufferSize samples per channel (write blocks until there is space), and
+    running out of samples before the end is an under-run that stops the
+    task and is raised by the next write or wait_until_done. With
+    recordOutput, the generated samples are kept in output. """
+
+    def __init__(self, name, sampleRate, numSamples=None, bufferSize=None, regenerate=True,
+                 recordOutput=False, tickTime=0.001):
+        self.name = name
+        self.sampleRate = sampleRate
+        self.numSamples = numSamples
+        self.bufferSize = bufferSize
+        self.regenerate = regenerate
+        self.recordOutput = recordOutput
+        self.tickTime = tickTime
+        self.numGenerated = 0
+        self.numUnderruns = 0
+        self.minBuffered = None
+        self._recorded = []
+        self._buffer = deque()  # arrays of shape (channels, samples)
+        self._offset = 0  # samples of the first array already generated
+        self._numBuffered = 0
+        self._written = []  # everything written, for regeneration
+        self._error = None
+        self._running = False
+        self._done = threading.Event()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def output(self):
+        """ The generated samples, as an array of shape (channels, samples). """
+        with self._condition:
+            return np.concatenate(self._recorded, axis=1) if self._recorded else None
+
+    def write(self, data, auto_start=False, timeout=10.0):
+        data = np.asarray(data)
+        data = data.reshape(-1, data.shape[-1]) if data.ndim > 0 else data.reshape(1, 1)
+        numSamples = data.shape[1]
+        with self._condition:
+            self._raiseError()
+            if self.bufferSize is not None and not self.regenerate:
+                if not self._condition.wait_for(
+                    lambda: (self._numBuffered + numSamples <= self.bufferSize
+                             or self._error is not None or self._done.is_set()),
+                    timeout
+                ):
+                    raise TimeoutError(f'{self.name}: no space in the output buffer'
+                                       f' within {timeout} s')
+                self._raiseError()
+            self._buffer.append(data)
+            self._numBuffered += numSamples
+            if self.regenerate:
+                self._written.append(data)
+        if auto_start:
+            self.start()
+        return numSamples
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, name=f'SimulatedDAQTask {self.name}',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._done.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def close(self):
+        self.stop()
+
+    def is_task_done(self):
+        return self._done.is_set()
+
+    def wait_until_done(self, timeout=10.0):
+        if timeout is not None and timeout < 0:
+            timeout = None  # nidaqmx.constants.WAIT_INFINITELY
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'{self.name} is not done after {timeout} s')
+        with self._condition:
+            self._raiseError()
+
+    def _raiseError(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        start = time.perf_counter()
+        while self._running:
+            due = int((time.perf_counter() - start) * self.sampleRate)
+            if self.numSamples is not None:
+                due = min(due, self.numSamples)
+            with self._condition:
+                self._generate(due - self.numGenerated)
+                finished = self.numSamples is not None and self.numGenerated >= self.numSamples
+                if finished or self._error is not None:
+                    self._running = False
+                    self._done.set()
+                self._condition.notify_all()
+            if self._running:
+                time.sleep(self.tickTime)
+
+    def _generate(self, numSamples):
+        """ Takes numSamples samples from the buffer; called with the lock. """
+        while numSamples > 0:
+            if not self._buffer:
+                if self.regenerate and self._written:
+                    self._buffer.extend(self._written)
+                    self._numBuffered = sum(data.shape[1] for data in self._written)
+                    continue
+                self.numUnderruns += 1
+                self._error = BufferUnderrunError(
+                    f'{self.name}: output buffer under-run after {self.numGenerated} samples'
+                )
+                return
+            data = self._buffer[0]
+            count = min(numSamples, data.shape[1] - self._offset)
+            if self.recordOutput:
+                self._recorded.append(data[:, self._offset:self._offset + count])
+            self._offset += count
+            self._numBuffered -= count
+            self.numGenerated += count
+            numSamples -= count
+            if self._offset >= data.shape[1]:
+                self._buffer.popleft()
+                self._offset = 0
+        if self.minBuffered is None or self._numBuffered < self.minBuffered:
+            self.minBuffered = self._numBuffered
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
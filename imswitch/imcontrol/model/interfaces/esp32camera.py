@@ -1,17 +1,12 @@
 from imswitch.imcommon.model import initLogger
-from imswitch.imcontrol.model.interfaces.restapicamera import RestPiCamera
+from imswitch.imcontrol.model.interfaces.framestream import LatestFrame, MJPEGStreamReader, decodeJPEG
 
-from PIL import Image
-import io
 import requests
-import time
 import cv2
 import numpy as np
-from threading import Thread
-import urllib
 
 class CameraESP32Cam:
-    def __init__(self, host, port):
+    def __init__(self, host, port, stream_port=81):
         super().__init__()
         self.__logger = initLogger(self, tryInheritParent=True)
 
@@ -32,13 +27,14 @@ class CameraESP32Cam:
         self.SensorHeight = 480
         #%% starting the camera thread
         
-        self.camera = ESP32Camera(self.host, self.port, is_debug=True)
+        self.camera = ESP32Camera(self.host, self.port, is_debug=True, stream_port=stream_port)
         
         self.frame = np.zeros((self.SensorHeight,self.SensorWidth))
         
     def put_frame(self, frame):
+        if frame.shape != (self.SensorHeight, self.SensorWidth):
+            frame = cv2.resize(frame, (self.SensorWidth, self.SensorHeight))
         self.frame = frame
-        self.frame = cv2.resize(self.frame, (self.SensorWidth, self.SensorHeight))
         return frame
 
     def start_live(self):
@@ -55,7 +51,7 @@ class CameraESP32Cam:
         pass
 
     def close(self):
-        pass #TODO: self.camera.close()
+        self.camera.stop_stream()
         
     def set_exposure_time(self,exposure_time):
         self.exposure_time=exposure_time
@@ -76,10 +72,15 @@ class CameraESP32Cam:
     def set_pixel_format(self,format):
         pass
         
-    def getLast(self):
+    def getLast(self, returnFrameNumber=False):
         # get frame and save
+        if returnFrameNumber:
+            return self.frame, self.camera.frames.frameId
         return self.frame
 
+    def getStatistics(self):
+        return self.camera.getStatistics()
+
     def getLastChunk(self):
         return self.camera.getframe()
        
@@ -135,9 +136,10 @@ class ESP32Camera(object):
     # headers = {'ESP32-version': '*'}
     headers={"Content-Type":"application/json"}
 
-    def __init__(self, host, port=80, is_debug=False):
+    def __init__(self, host, port=80, is_debug=False, stream_port=81):
         self.host = host
         self.port = port
+        self.stream_port = stream_port
         #self.get_json(self.base_uri)
         #self.populate_extensions()
         self.is_stream = False
@@ -152,6 +154,8 @@ class ESP32Camera(object):
         self.framesize = 0
         
         self.frame = np.zeros((self.SensorHeight,self.SensorWidth))
+        self.frames = LatestFrame()
+        self.stream_reader = None
         
         self.__logger = initLogger(self, tryInheritParent=True)
 
@@ -256,72 +260,32 @@ class ESP32Camera(object):
         return r
 
     def start_stream(self, callback_fct = None):
-        # Create and launch a thread    
-        self.stream_url = "http://"+self.host+":81"
-        
-        self.is_stream = True
-        self.frame_receiver_thread = Thread(target = self.getframes, args=(self.stream_url,), daemon=True)
-        self.frame_receiver_thread.start() 
+        # frames are read, decoded to grayscale and handed over on a background thread
+        self.stream_url = f"http://{self.host}:{self.stream_port}"
         self.callback_fct = callback_fct
+        self.frames.callback = callback_fct
+        self.is_stream = True
+        if self.stream_reader is None:
+            self.stream_reader = MJPEGStreamReader(self.stream_url, frames=self.frames)
+        self.stream_reader.start()
 
     def stop_stream(self):
-        # Create and launch a thread    
         self.is_stream = False
-        self.frame_receiver_thread.join()
+        if self.stream_reader is not None:
+            self.stream_reader.stop()
+
+    def getStatistics(self):
+        """ Returns the number of frames received, dropped before they were
+        read, skipped in the stream and not decodable. """
+        if self.stream_reader is None:
+            return {}
+        return self.stream_reader.getStatistics()
 
     def getframe(self, is_triggered=False):
-        url = "http://"+self.host+":80/capture"
+        url = "http://"+self.host+":"+str(self.port)+"/capture"
         response = requests.get(url)
-        bytes_im = io.BytesIO(response.content)
-        frame = np.uint8(np.mean(np.array(Image.open(bytes_im)), -1))
-        return frame
-        
-    def getframes(self, url):           
-        bytesJPEG = bytes()
-        try:
-            stream = urllib.request.urlopen(url, timeout=2)
-        except Exception as e:
-            self.is_stream = False
-            self.__logger.error("Stream could not be opened")
-            self.__logger.error(e)
-        frameId = 0
-        errorCounter = 0
-        while self.is_stream:
-            try:
-                bytesJPEG += stream.read(2**14)
-                a = bytesJPEG.find(b'\xff\xd8')
-                b = bytesJPEG.find(b'\xff\xd9')
-                if a != -1 and b != -1:
-                    jpg = bytesJPEG[a:b+2]
-                    bytesJPEG = bytesJPEG[b+2:]
-                    try:
-                        frame = cv2.imdecode(np.fromstring(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        frame = np.mean(frame,-1)
-                        # flush stream and reset bytearray
-                        stream.flush()
-                        bytesJPEG = bytes() 
-                        if self.is_debug:  
-                            self.__logger.debug("Frame#"+str(frameId))
-                            self.__logger.debug("Error#"+str(errorCounter))
-                        frameId += 1
-                        
-                        if self.callback_fct is not None:
-                            self.callback_fct(frame)
-                        
-                    except Exception as e:
-                        errorCounter+=1
-                    
-                    # limit thread workload
-                    time.sleep(.1)
+        return decodeJPEG(response.content)
 
-                    
-            except Exception as e:
-                # reopen stream?
-                self.__logger.error(e)
-                stream = urllib.request.urlopen(url, timeout=2)
-
-
-        
     def soft_trigger(self):
         path = '/softtrigger'
         r = self.post_json(path)
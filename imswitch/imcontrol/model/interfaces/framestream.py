@@ -0,0 +1,352 @@
+import threading
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+SOI = b'\xff\xd8'  # JPEG start of image
+EOI = b'\xff\xd9'  # JPEG end of image
+ESP32CAM_SYNC = bytes(i % 2 for i in range(10))  # first pixels of an ESP32 serial camera frame
+
+
+def decodeJPEG(data, grayscale=True):
+    """ Decodes a JPEG (bytes or buffer) to a uint8 array; with grayscale
+    only the luminance is decoded, without a colour conversion. Returns None
+    if the data is not a valid JPEG. """
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+class LatestFrame:
+    """ Holds the newest frame of a stream and its frame id.
+
+    A frame that is replaced before anyone read it is counted as dropped.
+    An optional callback(frame) is called with every new frame. """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.frameId = -1
+        self.numDropped = 0
+        self._frame = None
+        self._readId = -1
+        self._condition = threading.Condition()
+
+    def put(self, frame):
+        with self._condition:
+            if self.frameId > self._readId:
+                self.numDropped += 1
+            self._frame = frame
+            self.frameId += 1
+            self._condition.notify_all()
+        if self.callback is not None:
+            self.callback(frame)
+
+    def get(self, returnFrameNumber=False):
+        """ Returns the newest frame (None if there is none yet). """
+        with self._condition:
+            self._readId = self.frameId
+            return (self._frame, self.frameId) if returnFrameNumber else self._frame
+
+    def waitForFrame(self, afterId=None, timeout=1.0):
+        """ Waits for a frame newer than afterId (default: the newest frame)
+        and returns it with its id, or (None, id) on timeout. """
+        with self._condition:
+            afterId = self.frameId if afterId is None else afterId
+            self._condition.wait_for(lambda: self.frameId > afterId, timeout)
+            if self.frameId <= afterId:
+                return None, self.frameId
+            self._readId = self.frameId
+            return self._frame, self.frameId
+
+
+class MJPEGScanner:
+    """ Finds the JPEG images in an MJPEG byte stream.
+
+    Data is appended to a bytearray and searched for the start and end
+    markers from where the previous search stopped, and the scanned bytes
+    are dropped, so the cost is linear in the stream length. feed() returns
+    the newest complete JPEG in the data so far (older complete ones are
+    counted as skipped) or None. If no frame ends within maxBufferSize
+    bytes, the buffer is discarded. """
+
+    def __init__(self, maxBufferSize=2**23):
+        self.maxBufferSize = maxBufferSize
+        self.numFrames = 0
+        self.numSkipped = 0
+        self.numOverflows = 0
+        self.reset()
+
+    def reset(self):
+        self._buffer = bytearray()
+        self._start = -1  # start of the frame in progress
+        self._position = 0  # where the next search continues
+
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        latest = None
+        numComplete = 0
+        position = self._position
+        while True:
+            if self._start < 0:
+                start = buffer.find(SOI, position)
+                if start < 0:
+                    break
+                self._start = start
+                position = start + len(SOI)
+            end = buffer.find(EOI, position)
+            if end < 0:
+                break
+            latest = (self._start, end + len(EOI))
+            numComplete += 1
+            self._start = -1
+            position = end + len(EOI)
+        # a marker may be split between two reads, so the last byte is searched again
+        position = max(position, len(buffer) - 1, 0)
+
+        jpeg = None if latest is None else bytes(buffer[latest[0]:latest[1]])
+        self.numFrames += numComplete
+        self.numSkipped += max(0, numComplete - 1)
+
+        drop = self._start if self._start >= 0 else position
+        if drop > 0:
+            del buffer[:drop]
+            position -= drop
+            if self._start >= 0:
+                self._start = 0
+        if len(buffer) > self.maxBufferSize:
+            self.numOverflows += 1
+            self.reset()
+            return jpeg
+        self._position = position
+        return jpeg
+
+
+class MJPEGStreamReader:
+    """ Reads an MJPEG HTTP stream on a background thread and keeps the
+    newest decoded frame in a LatestFrame.
+
+    Whatever arrived is read at once and scanned; only the newest complete
+    JPEG of a read is decoded, so a slow consumer never makes the reader fall
+    behind the stream. The stream is reopened after reconnectDelay if it
+    fails or ends. """
+
+    def __init__(self, url, frames=None, grayscale=True, chunkSize=2**16, timeout=2.0,
+                 reconnectDelay=0.5, name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self.url = url
+        self.frames = frames if frames is not None else LatestFrame()
+        self.grayscale = grayscale
+        self.chunkSize = chunkSize
+        self.timeout = timeout
+        self.reconnectDelay = reconnectDelay
+        self.scanner = MJPEGScanner()
+        self.numDecodeErrors = 0
+        self.numReconnects = 0
+        self.numBytes = 0
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._stream = None
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.isRunning:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='MJPEGStreamReader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(self.timeout + 1)
+        self._thread = None
+
+    def getStatistics(self):
+        return {'frames': self.frames.frameId + 1, 'dropped': self.frames.numDropped,
+                'skipped': self.scanner.numSkipped, 'decodeErrors': self.numDecodeErrors,
+                'overflows': self.scanner.numOverflows, 'reconnects': self.numReconnects,
+                'bytes': self.numBytes}
+
+    def _run(self):
+        chunk = bytearray(self.chunkSize)
+        view = memoryview(chunk)
+        while not self._stopEvent.is_set():
+            try:
+                self._stream = urllib.request.urlopen(self.url, timeout=self.timeout)
+            except Exception as e:
+                self.__logger.error(f'Stream {self.url} could not be opened: {e}')
+                self._stopEvent.wait(self.reconnectDelay)
+                continue
+            self.scanner.reset()
+            try:
+                while not self._stopEvent.is_set():
+                    numBytes = self._stream.readinto1(view)
+                    if not numBytes:
+                        break
+                    self.numBytes += numBytes
+                    jpeg = self.scanner.feed(view[:numBytes])
+                    if jpeg is None:
+                        continue
+                    frame = decodeJPEG(jpeg, self.grayscale)
+                    if frame is None:
+                        self.numDecodeErrors += 1
+                        continue
+                    self.frames.put(frame)
+            except Exception as e:
+                if not self._stopEvent.is_set():
+                    self.__logger.error(f'Stream {self.url} failed: {e}')
+            finally:
+                try:
+                    self._stream.close()
+                except Exception:
+                    pass
+                self._stream = None
+            if not self._stopEvent.is_set():
+                self.numReconnects += 1
+                self._stopEvent.wait(self.reconnectDelay)
+
+
+class SerialFrameReader:
+    """ Polls a serial camera for raw uint8 frames on a background thread
+    and keeps the newest one in a LatestFrame.
+
+    A frame is requested by writing request and is read with one blocking
+    read of width * height bytes, the next request is written as soon as a
+    frame is complete. Frames have to start with syncPattern; if a frame is
+    misaligned, the reader realigns on the pattern. Commands given to
+    sendCommand are written before the next request. After maxErrors failed
+    frames in a row, reconnect() is called if given, and should return a new
+    open serial device. """
+
+    def __init__(self, serialdevice, width, height, frames=None, request=b' \n',
+                 syncPattern=ESP32CAM_SYNC, maxErrors=10, reconnect=None, name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self.serialdevice = serialdevice
+        self.width = width
+        self.height = height
+        self.frames = frames if frames is not None else LatestFrame()
+        self.request = request
+        self.syncPattern = syncPattern
+        self.maxErrors = maxErrors
+        self.reconnect = reconnect
+        self.numTimeouts = 0
+        self.numResyncs = 0
+        self.numErrors = 0
+        self._commands = []
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def sendCommand(self, command):
+        """ Queues a command line, e.g. "t100", for the camera. """
+        with self._lock:
+            self._commands.append(command)
+
+    def start(self):
+        if self.isRunning or self.serialdevice is None:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='SerialFrameReader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def getStatistics(self):
+        return {'frames': self.frames.frameId + 1, 'dropped': self.frames.numDropped,
+                'timeouts': self.numTimeouts, 'resyncs': self.numResyncs,
+                'errors': self.numErrors}
+
+    def readFrame(self):
+        """ Requests one frame and returns it, or None if it was incomplete. """
+        with self._lock:
+            commands, self._commands = self._commands, []
+        for command in commands:
+            self.serialdevice.write(f'{command} \n'.encode())
+        self.serialdevice.write(self.request)
+
+        frameSize = self.width * self.height
+        data = self.serialdevice.read(frameSize)
+        if len(data) < frameSize:
+            self.numTimeouts += 1
+            return None
+        if self.syncPattern and not data.startswith(self.syncPattern):
+            # realign: the frame starts at the pattern, read its remainder
+            start = data.find(self.syncPattern, 1)
+            if start < 0:
+                self.numResyncs += 1
+                self.serialdevice.reset_input_buffer()
+                return None
+            remainder = self.serialdevice.read(start)
+            if len(remainder) < start:
+                self.numTimeouts += 1
+                return None
+            self.numResyncs += 1
+            data = data[start:] + remainder
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width)
+
+    def _run(self):
+        errors = 0
+        while not self._stopEvent.is_set():
+            try:
+                frame = self.readFrame()
+            except Exception as e:
+                self.__logger.debug(f'Failed to read frame: {e}')
+                frame = None
+            if frame is not None:
+                errors = 0
+                self.frames.put(frame)
+                continue
+
+            errors += 1
+            self.numErrors += 1
+            if errors >= self.maxErrors and self.reconnect is not None:
+                self.__logger.warning(f'{errors} failed frames in a row, reconnecting')
+                errors = 0
+                try:
+                    self.serialdevice = self.reconnect()
+                except Exception as e:
+                    self.__logger.error(f'Reconnecting failed: {e}')
+                if self.serialdevice is None:
+                    return
+            elif errors > 1:
+                # do not hammer a camera that stopped answering
+                self._stopEvent.wait(min(0.01 * errors, 0.5))
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
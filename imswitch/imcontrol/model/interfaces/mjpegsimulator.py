@@ -0,0 +1,135 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+class SimulatedMJPEGServer:
+    """ Local stand-in for the HTTP interface of an ESP32 network camera.
+
+    GET /stream (or /) sends an endless multipart MJPEG stream at frameRate
+    frames per second, GET /capture a single JPEG, and POST /postjson takes
+    the camera settings (exposuretime, gain, framesize, ledintensity). Frames
+    are colour JPEGs of a gradient that moves by one pixel per frame, whose
+    brightness cycles with the frame number. """
+
+    boundary = 'frame'
+
+    def __init__(self, host='127.0.0.1', port=0, shape=(240, 320), frameRate=30.0, quality=80):
+        self.__logger = initLogger(self)
+        self.shape = shape
+        self.frameRate = frameRate
+        self.quality = quality
+        self.settings = {}
+        self.numFramesSent = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        y, x = np.mgrid[:shape[0], :shape[1]]
+        self._gradient = ((x + y) % 256).astype(np.uint8)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                path = self.path.strip('/')
+                if path in ('', 'stream'):
+                    server._stream(self)
+                elif path == 'capture':
+                    jpeg = server.makeJPEG(server.numFramesSent)
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(jpeg)))
+                    self.end_headers()
+                    self.wfile.write(jpeg)
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    payload = {}
+                with server._lock:
+                    server.settings.update(payload)
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpServer = ThreadingHTTPServer((host, port), Handler)
+        self._httpServer.daemon_threads = True
+        self.host, self.port = self._httpServer.server_address[:2]
+        self._thread = threading.Thread(target=self._httpServer.serve_forever,
+                                        name='SimulatedMJPEGServer', daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def makeJPEG(self, frameNumber):
+        level = np.uint8(frameNumber * 8 % 256)
+        gray = np.roll(self._gradient, frameNumber, axis=1) // 2 + level // 2
+        frame = np.stack((gray, gray, gray), axis=-1)
+        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg.tobytes()
+
+    def close(self):
+        self._closed.set()
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+
+    def _stream(self, handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type',
+                            f'multipart/x-mixed-replace; boundary={self.boundary}')
+        handler.end_headers()
+        nextFrame = time.perf_counter()
+        while not self._closed.is_set():
+            with self._lock:
+                frameNumber = self.numFramesSent
+                self.numFramesSent += 1
+            jpeg = self.makeJPEG(frameNumber)
+            try:
+                handler.wfile.write(
+                    f'--{self.boundary}\r\nContent-Type: image/jpeg\r\n'
+                    f'Content-Length: {len(jpeg)}\r\n\r\n'.encode() + jpeg + b'\r\n'
+                )
+                handler.wfile.flush()
+            except OSError:
+                return
+            nextFrame += 1 / self.frameRate
+            self._closed.wait(max(0.0, nextFrame - time.perf_counter()))
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,697 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from serial.tools.list_ports_common import ListPortInfo
+
+from imswitch.imcommon.model import initLogger
+
+
+def moveDuration(distance, speed, acceleration=None):
+    """ Duration of a trapezoidal (or triangular) move profile. """
+    distance = abs(distance)
+    if distance == 0 or speed <= 0:
+        return 0.0
+    if not acceleration:
+        return distance / speed
+    if distance < speed ** 2 / acceleration:
+        return 2 * math.sqrt(distance / acceleration)
+    return distance / speed + speed / acceleration
+
+
+def movePosition(start, target, elapsed, speed, acceleration=None):
+    """ Position along a trapezoidal move profile, elapsed seconds after the
+    start of the move. """
+    distance = abs(target - start)
+    duration = moveDuration(distance, speed, acceleration)
+    if elapsed >= duration or distance == 0:
+        return target
+    direction = 1 if target > start else -1
+    if not acceleration:
+        return start + direction * speed * elapsed
+
+    rampTime = min(speed / acceleration, duration / 2)
+    peakSpeed = acceleration * rampTime
+    if elapsed < rampTime:
+        travelled = acceleration * elapsed ** 2 / 2
+    elif elapsed < duration - rampTime:
+        travelled = acceleration * rampTime ** 2 / 2 + peakSpeed * (elapsed - rampTime)
+    else:
+        remaining = duration - elapsed
+        travelled = distance - acceleration * remaining ** 2 / 2
+    return start + direction * travelled
+
+
+class SimulatedAxis:
+    """ Single motion axis with a trapezoidal move profile. """
+
+    def __init__(self, position=0.0):
+        self._start = position
+        self._target = position
+        self._startTime = 0.0
+        self._speed = 1.0
+        self._acceleration = None
+
+    def moveTo(self, target, speed, acceleration, now):
+        """ Starts a move and returns the time it will be done. """
+        self._start = self.position(now)
+        self._target = target
+        self._startTime = now
+        self._speed = speed
+        self._acceleration = acceleration
+        return now + moveDuration(target - self._start, speed, acceleration)
+
+    def position(self, now):
+        return movePosition(self._start, self._target, now - self._startTime,
+                            self._speed, self._acceleration)
+
+    @property
+    def target(self):
+        return self._target
+
+    def isMoving(self, now):
+        return self.position(now) != self._target
+
+    def setPosition(self, position):
+        self._start = self._target = position
+
+
+class SimulatedSerialDevice:
+    """ In-process serial device, driven by a firmware model.
+
+    The object behaves like an open pyserial port (write, read, readline,
+    in_waiting, timeout, close), so drivers can use it directly; openPty()
+    additionally exposes it as a pseudo terminal for clients that open a
+    device path. Transfers in both directions take 10 bit times per byte at
+    the configured baud rate (baudrate=None disables the limit), every
+    command costs commandTime seconds of firmware processing, and firmware
+    events such as the end of a move are replayed in time order, so runs
+    with the same input produce the same output. """
+
+    def __init__(self, firmware, baudrate=115200, commandTime=0.0, timeout=1.0,
+                 name='simulator'):
+        self.__logger = initLogger(self, instanceName=name)
+        self.firmware = firmware
+        self.baudrate = baudrate
+        self.commandTime = commandTime
+        self.timeout = timeout
+        self.port = name
+
+        self._condition = threading.Condition()
+        self._inbound = bytearray()
+        self._inboundReady = 0.0
+        self._lines = []  # (arrivalTime, line)
+        self._outbound = []  # (availableTime, bytes)
+        self._outboundReady = 0.0
+        self._events = []
+        self._eventCounter = itertools.count()
+        self._busyUntil = 0.0
+        self._isOpen = True
+        self._ptyThreads = []
+        self._ptyMaster = None
+        self._ptySlave = None
+
+        firmware.attach(self)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f'SimulatedSerialDevice {name}')
+        self._thread.start()
+
+    # pyserial compatible interface
+
+    @property
+    def is_open(self):
+        return self._isOpen
+
+    def isOpen(self):
+        return self._isOpen
+
+    def open(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        with self._condition:
+            return self._availableBytes(time.monotonic())
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        with self._condition:
+            now = time.monotonic()
+            self._inboundReady = max(self._inboundReady, now) + self._transferTime(len(data))
+            self._inbound += data
+            while b'\n' in self._inbound:
+                line, _, rest = bytes(self._inbound).partition(b'\n')
+                self._inbound = bytearray(rest)
+                self._lines.append((self._inboundReady, line.decode(errors='replace').strip('\r')))
+            if self.firmware.realtimeCommands:
+                self._extractRealtimeCommands()
+            self._condition.notify_all()
+        return len(data)
+
+    def read(self, size=1):
+        return self._readUntil(lambda buffer: len(buffer) >= size, size)
+
+    def readline(self, size=-1):
+        return self._readUntil(lambda buffer: b'\n' in buffer, size, b'\n')
+
+    def read_until(self, expected=b'\n', size=None):
+        return self._readUntil(lambda buffer: expected in buffer, size or -1, expected)
+
+    def reset_input_buffer(self):
+        with self._condition:
+            self._outbound = [item for item in self._outbound if item[0] > time.monotonic()]
+
+    def reset_output_buffer(self):
+        pass
+
+    def flushInput(self):
+        self.reset_input_buffer()
+
+    def flush(self):
+        pass
+
+    def setDTR(self, value=True):
+        pass
+
+    def setRTS(self, value=True):
+        pass
+
+    def close(self):
+        with self._condition:
+            self._isOpen = False
+            self._condition.notify_all()
+        if self._ptyMaster is not None:
+            os.close(self._ptyMaster)
+            os.close(self._ptySlave)
+            self._ptyMaster = None
+
+    # firmware side
+
+    def emit(self, text, at=None):
+        """ Sends text to the host, starting at time at (default: now). """
+        data = text.encode() if isinstance(text, str) else text
+        with self._condition:
+            start = max(self._outboundReady, at if at is not None else time.monotonic())
+            self._outboundReady = start + self._transferTime(len(data))
+            self._outbound.append((self._outboundReady, data))
+            self._condition.notify_all()
+
+    def schedule(self, at, callback):
+        """ Calls callback(at) on the device thread at time at. """
+        with self._condition:
+            heapq.heappush(self._events, (at, next(self._eventCounter), callback))
+            self._condition.notify_all()
+
+    def openPty(self):
+        """ Exposes the device as a pseudo terminal and returns the path of
+        its slave end. Only available on Unix. """
+        import tty  # Unix only
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._ptyMaster, self._ptySlave = master, slave
+        path = os.ttyname(slave)
+
+        def toDevice():
+            while self._isOpen:
+                try:
+                    data = os.read(master, 4096)
+                except OSError:
+                    return
+                if data:
+                    self.write(data)
+
+        def fromDevice():
+            while self._isOpen:
+                data = self._readUntil(lambda buffer: len(buffer) > 0, -1, timeout=0.1)
+                if data:
+                    try:
+                        os.write(master, data)
+                    except OSError:
+                        return
+
+        for target in (toDevice, fromDevice):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._ptyThreads.append(thread)
+        return path
+
+    def portInfo(self):
+        """ Returns pyserial port info for the pseudo terminal of the device,
+        opening it if needed. Pseudo terminals cannot toggle DTR/RTS, so the
+        port is described like the USB JTAG port of an ESP32-S3, which UC2-REST
+        connects to without a reset pulse. """
+        if self._ptyMaster is None:
+            self.openPty()
+        info = ListPortInfo(os.ttyname(self._ptySlave))
+        info.description = 'USB JTAG/serial debug unit'
+        return info
+
+    def _transferTime(self, numBytes):
+        return numBytes * 10 / self.baudrate if self.baudrate else 0.0
+
+    def _availableBytes(self, now):
+        return sum(len(data) for available, data in self._outbound if available <= now)
+
+    def _readUntil(self, done, size, expected=None, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                buffer = b''.join(data for available, data in self._outbound if available <= now)
+                if done(buffer) or not self._isOpen:
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                nextAvailable = min((available for available, _ in self._outbound
+                                     if available > now), default=None)
+                wait = deadline - now if deadline is not None else None
+                if nextAvailable is not None:
+                    wait = nextAvailable - now if wait is None else min(wait, nextAvailable - now)
+                self._condition.wait(wait)
+
+            end = len(buffer)
+            if expected is not None and expected in buffer:
+                end = buffer.index(expected) + len(expected)
+            if size >= 0:
+                end = min(end, size)
+            self._consume(end, now)
+            return buffer[:end]
+
+    def _consume(self, numBytes, now):
+        remaining = []
+        for available, data in self._outbound:
+            if numBytes > 0 and available <= now:
+                if len(data) <= numBytes:
+                    numBytes -= len(data)
+                    continue
+                data = data[numBytes:]
+                numBytes = 0
+            remaining.append((available, data))
+        self._outbound = remaining
+
+    def _extractRealtimeCommands(self):
+        for command in self.firmware.realtimeCommands:
+            if command in self._inbound:
+                self._inbound = self._inbound.replace(command, b'')
+                self._lines.append((self._inboundReady, command.decode()))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._isOpen:
+                    return
+                now = time.monotonic()
+                nextTimes = []
+                if self._events:
+                    nextTimes.append(self._events[0][0])
+                if self._lines:
+                    nextTimes.append(max(self._lines[0][0], self._busyUntil))
+                dueTime = min(nextTimes, default=None)
+                if dueTime is None or dueTime > now:
+                    self._condition.wait(None if dueTime is None else dueTime - now)
+                    continue
+
+                if self._events and self._events[0][0] <= dueTime:
+                    at, _, callback = heapq.heappop(self._events)
+                    line = None
+                else:
+                    at, line = max(self._lines[0][0], self._busyUntil), self._lines[0][1]
+
+            try:
+                if line is None:
+                    callback(at)
+                elif self.firmware.handleLine(line, at):
+                    with self._condition:
+                        self._lines.pop(0)
+                        self._busyUntil = at + self.commandTime
+                else:
+                    # The firmware cannot take the line yet, retry after its next event
+                    with self._condition:
+                        nextEvent = self._events[0][0] if self._events else at + 0.001
+                        self._busyUntil = max(at, nextEvent)
+            except Exception:
+                self.__logger.exception(f'Simulated firmware failed on {line!r}')
+                with self._condition:
+                    if line is not None and self._lines:
+                        self._lines.pop(0)
+
+
+class SimulatedFirmware:
+    """ Base class of the firmware models of SimulatedSerialDevice. """
+
+    realtimeCommands = ()
+
+    def attach(self, device):
+        self.device = device
+
+    def handleLine(self, line, now):
+        """ Processes a command line received at time now. Returns False if
+        the command cannot be accepted yet. """
+        raise NotImplementedError
+
+
+class UC2Firmware(SimulatedFirmware):
+    """ Model of the UC2-ESP32 JSON firmware.
+
+    Commands are JSON lines with a "task" and a "qid". Every command is
+    answered with a "++" / JSON / "--" framed acknowledgement; motor moves
+    additionally report the positions of the moved steppers with isDone set
+    once the move is over, which is what the position callbacks of the
+    clients listen to. Steppers 0-3 are the A, X, Y and Z axes, and the LED
+    matrix has numLEDs LEDs. """
+
+    def __init__(self, identity='UC2_Feather', numSteppers=4, defaultSpeed=20000,
+                 defaultAcceleration=None, numLEDs=64):
+        self.identity = identity
+        self.numLEDs = numLEDs
+        self.defaultSpeed = defaultSpeed
+        self.defaultAcceleration = defaultAcceleration
+        self.steppers = [SimulatedAxis() for _ in range(numSteppers)]
+        self.ledArray = {}
+        self.lasers = {}
+        self.numCommands = 0
+
+    def positions(self, now):
+        return [axis.position(now) for axis in self.steppers]
+
+    def handleLine(self, line, now):
+        line = line.strip()
+        if not line:
+            return True
+        try:
+            command = json.loads(line)
+        except ValueError:
+            self.device.emit('error\n', at=now)
+            return True
+
+        self.numCommands += 1
+        task = command.get('task', '')
+        qid = command.get('qid', 0)
+        handler = {
+            '/state_get': self._stateGet,
+            '/motor_act': self._motorAct,
+            '/motor_get': self._motorGet,
+            '/ledarr_act': self._ledArrayAct,
+            '/laser_act': self._laserAct,
+        }.get(task)
+        response = handler(command, now) if handler is not None else {}
+        response.setdefault('success', 1)
+        response['qid'] = qid
+        self._respond(response, now)
+        return True
+
+    def _respond(self, response, at):
+        self.device.emit('++\n' + json.dumps(response) + '\n--\n', at=at)
+
+    def _stateGet(self, command, now):
+        return {'identifier_name': self.identity, 'pindef': 'UC2_simulator'}
+
+    def _motorGet(self, command, now):
+        return {'motor': {'steppers': [{'stepperid': i, 'position': position}
+                                       for i, position in enumerate(self.positions(now))]}}
+
+    def _motorAct(self, command, now):
+        steppers = command.get('motor', {}).get('steppers', [])
+        qid = command.get('qid', 0)
+        doneTime = now
+        moved = []
+        for stepper in steppers:
+            stepperId = int(stepper.get('stepperid', 0))
+            if not 0 <= stepperId < len(self.steppers) or 'position' not in stepper:
+                continue
+            axis = self.steppers[stepperId]
+            target = stepper['position']
+            if not stepper.get('isabs', 0):
+                target += axis.position(now)
+            speed = abs(stepper.get('speed') or self.defaultSpeed)
+            acceleration = stepper.get('accel') or self.defaultAcceleration
+            doneTime = max(doneTime, axis.moveTo(target, speed, acceleration, now))
+            moved.append(stepperId)
+
+        if moved:
+            def done(at):
+                self._respond({'qid': qid, 'steppers': [
+                    {'stepperid': i, 'position': self.steppers[i].target, 'isDone': 1}
+                    for i in moved
+                ]}, at)
+
+            self.device.schedule(doneTime, done)
+        return {}
+
+    def _ledArrayAct(self, command, now):
+        led = command.get('led', {})
+        if led.get('action') == 'fill':
+            rgb = (led.get('r', 0), led.get('g', 0), led.get('b', 0))
+            self.ledArray = {i: rgb for i in range(self.numLEDs)}
+        for pixel in led.get('led_array', []):
+            self.ledArray[pixel.get('id', 0)] = (pixel.get('r', 0), pixel.get('g', 0),
+                                                 pixel.get('b', 0))
+        return {}
+
+    def _laserAct(self, command, now):
+        if 'LASERid' in command:
+            self.lasers[command['LASERid']] = command.get('LASERval', 0)
+        return {}
+
+
+class GRBLFirmware(SimulatedFirmware):
+    """ Model of a GRBL motion controller.
+
+    Supports G0/G1 moves (G90/G91, F in units per minute), G92, $H homing,
+    $$ and $<n>=<value> settings and the "?" status report. Moves are held in
+    a planner buffer of plannerSize blocks and executed one after another;
+    "ok" is sent when a block enters the planner, so a full planner delays
+    the answer like the real controller does. """
+
+    realtimeCommands = (b'?',)
+    _wordPattern = re.compile(r'([A-Z])([-+]?[0-9]*\.?[0-9]+)')
+
+    def __init__(self, axes='XYZ', plannerSize=15, defaultFeed=1000, acceleration=None,
+                 homingTime=0.5):
+        self.axes = {axis: SimulatedAxis() for axis in axes}
+        self.plannerSize = plannerSize
+        self.feed = defaultFeed
+        self.acceleration = acceleration
+        self.homingTime = homingTime
+        self.absolute = True
+        self.settings = {}
+        self._planner = []  # block end times
+        self._plannedTargets = {axis: 0.0 for axis in axes}
+        self._lastEnd = 0.0
+
+    def handleLine(self, line, now):
+        line = line.strip().upper()
+        self._planner = [end for end in self._planner if end > now]
+        if line == '?':
+            self.device.emit(self._status(now) + '\n', at=now)
+            return True
+        if not line:
+            self.device.emit('ok\n', at=now)
+            return True
+        if line == '$$':
+            for key, value in sorted(self.settings.items()):
+                self.device.emit(f'${key}={value}\n', at=now)
+            self.device.emit('ok\n', at=now)
+            return True
+        if line.startswith('$H'):
+            return self._home(now)
+        if line.startswith('$') and '=' in line:
+            key, value = line[1:].split('=', 1)
+            self.settings[key] = value
+            self.device.emit('ok\n', at=now)
+            return True
+
+        words = self._wordPattern.findall(line)
+        codes = [f'{letter}{int(float(value))}' for letter, value in words if letter in 'GM']
+        values = {letter: float(value) for letter, value in words if letter not in 'GM'}
+        if 'G90' in codes:
+            self.absolute = True
+        if 'G91' in codes:
+            self.absolute = False
+        if 'F' in values:
+            self.feed = values['F']
+        if 'G92' in codes:
+            for axis in self.axes:
+                if axis in values:
+                    self.axes[axis].setPosition(values[axis])
+                    self._plannedTargets[axis] = values[axis]
+        elif any(axis in values for axis in self.axes):
+            if len(self._planner) >= self.plannerSize:
+                return False
+            self._plan(values, now)
+        self.device.emit('ok\n', at=now)
+        return True
+
+    def _plan(self, values, now):
+        targets = dict(self._plannedTargets)
+        for axis in self.axes:
+            if axis in values:
+                targets[axis] = values[axis] if self.absolute else targets[axis] + values[axis]
+        distance = math.sqrt(sum((targets[a] - self._plannedTargets[a]) ** 2 for a in self.axes))
+        speed = self.feed / 60
+        start = max(now, self._lastEnd)
+        end = start + moveDuration(distance, speed, self.acceleration)
+        self._plannedTargets = targets
+        self._lastEnd = end
+        self._planner.append(end)
+
+        def startBlock(at):
+            # All axes arrive together, so each moves at its share of the feed
+            for axis, target in targets.items():
+                current = self.axes[axis].position(at)
+                axisSpeed = speed * abs(target - current) / distance if distance else speed
+                self.axes[axis].moveTo(target, axisSpeed or speed, self.acceleration, at)
+
+        self.device.schedule(start, startBlock)
+
+    def _home(self, now):
+        if self._planner:
+            return False
+        start = max(now, self._lastEnd)
+        end = start + self.homingTime
+        self._lastEnd = end
+        self._planner.append(end)
+
+        def homed(at):
+            for axis in self.axes.values():
+                axis.setPosition(0.0)
+            self._plannedTargets = {axis: 0.0 for axis in self.axes}
+            self.device.emit('ok\n', at=at)
+
+        self.device.schedule(end, homed)
+        return True
+
+    def _status(self, now):
+        state = 'Run' if any(end > now for end in self._planner) else 'Idle'
+        position = ','.join(f'{axis.position(now):.3f}' for axis in self.axes.values())
+        return f'<{state}|MPos:{position}|FS:{self.feed:.0f},0>'
+
+
+class ScriptedFirmware(SimulatedFirmware):
+    """ Generic RS232 device that answers commands from a table. Commands not
+    in the table are answered with defaultResponse; None means no answer. """
+
+    def __init__(self, responses=None, defaultResponse=None, termination='\r\n'):
+        self.responses = responses or {}
+        self.defaultResponse = defaultResponse
+        self.termination = termination
+        self.received = []
+
+    def handleLine(self, line, now):
+        line = line.strip()
+        self.received.append(line)
+        response = self.responses.get(line, self.defaultResponse)
+        if response is not None:
+            self.device.emit(f'{response}{self.termination}', at=now)
+        return True
+
+
+class ESP32CamFirmware(SimulatedFirmware):
+    """ Model of the serial firmware of an ESP32 camera (see
+    CameraESP32CamSerial).
+
+    A line without a command requests a frame, which is sent as width *
+    height raw uint8 pixels after frameTime. The first ten pixels hold the
+    0, 1, 0, 1, ... sync pattern and the next two the frame number (little
+    endian); the rest is a gradient that moves by one pixel per frame.
+    "t<value>" sets the exposure, "g<value>" the gain and "r" restarts. """
+
+    def __init__(self, width=320, height=240, frameTime=0.0):
+        self.width = width
+        self.height = height
+        self.frameTime = frameTime
+        self.exposure = 100
+        self.gain = 0
+        self.numFrames = 0
+        y, x = np.mgrid[:height, :width]
+        self._gradient = (x + y).astype(np.uint8).ravel()
+
+    def makeFrame(self):
+        frame = np.roll(self._gradient, self.numFrames)
+        frame[:10] = np.arange(10) % 2
+        frame[10:12] = (self.numFrames & 0xFF, (self.numFrames >> 8) & 0xFF)
+        return frame.tobytes()
+
+    def handleLine(self, line, now):
+        line = line.strip()
+        if line[:1] == 't' and line[1:].isdigit():
+            self.exposure = int(line[1:])
+        elif line[:1] == 'g' and line[1:].isdigit():
+            self.gain = int(line[1:])
+        elif line[:1] == 'r':
+            self.numFrames = 0
+        else:
+            self.device.emit(self.makeFrame(), at=now + self.frameTime)
+            self.numFrames += 1
+        return True
+
+
+class SimulatedRS232Driver:
+    """ RS232 driver talking to a SimulatedSerialDevice, with the interface
+    of RS232Driver. """
+
+    def __init__(self, device, settings):
+        self._device = device
+        self._sendTermination = settings.get('send_termination', '\r\n')
+        self._recvTermination = settings.get('recv_termination', '\r\n').encode()
+        self._encoding = settings.get('encoding', 'ascii')
+
+    def initialize(self):
+        return 'initialized?'
+
+    def query(self, arg):
+        self.write(arg)
+        response = self._device.read_until(self._recvTermination)
+        return response.decode(self._encoding).strip()
+
+    def write(self, arg):
+        self._device.write(f'{arg}{self._sendTermination}'.encode(self._encoding))
+        # Firmware models split commands on newlines
+        if not self._sendTermination.endswith('\n'):
+            self._device.write(b'\n')
+
+    def close(self):
+        self._device.close()
+
+
+def createSimulatedDevice(settings, name='simulator'):
+    """ Creates a SimulatedSerialDevice from setup file settings, e.g.
+    ``{"protocol": "uc2", "baudrate": 115200, "commandTime": 0.002}``.
+    Protocols are "uc2", "grbl", "esp32cam" and "scripted"; the remaining
+    settings are passed to the firmware model. """
+    settings = dict(settings)
+    protocol = settings.pop('protocol', 'scripted').lower()
+    deviceSettings = {key: settings.pop(key) for key in ('baudrate', 'commandTime', 'timeout')
+                      if key in settings}
+    firmwareClass = {
+        'uc2': UC2Firmware,
+        'grbl': GRBLFirmware,
+        'esp32cam': ESP32CamFirmware,
+        'scripted': ScriptedFirmware
+    }[protocol]
+    return SimulatedSerialDevice(firmwareClass(**settings), name=name, **deviceSettings)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
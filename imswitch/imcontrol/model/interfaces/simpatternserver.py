@@ -0,0 +1,133 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from imswitch.imcommon.model import initLogger
+
+
+class SimulatedPatternServer:
+    """ Local stand-in for the SIM pattern server that SIMClient talks to.
+
+    It answers the same endpoints (display_pattern, change_wavelength,
+    set_wait_time, start_viewer_single_loop, stop_viewer and
+    wait_for_viewer_completion) with JSON and records which pattern is shown
+    when. If triggered is True, a requested pattern is only shown at the next
+    call of trigger(), as with a display that is advanced by the camera's
+    trigger output. responseDelay adds a fixed latency to every answer. """
+
+    def __init__(self, host='127.0.0.1', port=0, triggered=False, responseDelay=0.0):
+        self.__logger = initLogger(self)
+        self.triggered = triggered
+        self.responseDelay = responseDelay
+        self.wavelength = None
+        self.waitTime = 0.0
+        self.numRequests = 0
+        self._pattern = None
+        self._pending = None
+        self._history = []  # (time, pattern)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                response = server._handle(self.path.strip('/').split('/'))
+                body = json.dumps(response).encode()
+                self.send_response(200 if response != -1 else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpServer = ThreadingHTTPServer((host, port), Handler)
+        self._httpServer.daemon_threads = True
+        self.host, self.port = self._httpServer.server_address[:2]
+        self._thread = threading.Thread(target=self._httpServer.serve_forever,
+                                        name='SimulatedPatternServer', daemon=True)
+        self._thread.start()
+
+    @property
+    def pattern(self):
+        """ The pattern that is shown now. """
+        with self._lock:
+            return self._pattern
+
+    def trigger(self, now=None):
+        """ Shows the pending pattern, if any. """
+        with self._lock:
+            if self._pending is not None:
+                self._show(self._pending, time.time() if now is None else now)
+                self._pending = None
+
+    def patternsBetween(self, start, stop):
+        """ Returns the patterns shown at any time in [start, stop). """
+        with self._lock:
+            patterns = set()
+            current = None
+            for changed, pattern in self._history:
+                if changed <= start:
+                    current = pattern
+                elif changed < stop:
+                    patterns.add(pattern)
+            patterns.add(current)
+            return patterns
+
+    def close(self):
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+
+    def _show(self, pattern, now):
+        self._pattern = pattern
+        self._history.append((now, pattern))
+
+    def _handle(self, parts):
+        time.sleep(self.responseDelay)
+        command, argument = parts[0], parts[1] if len(parts) > 1 else None
+        with self._lock:
+            self.numRequests += 1
+            if command == 'display_pattern':
+                pattern = int(argument)
+                if self.triggered:
+                    self._pending = pattern
+                else:
+                    self._show(pattern, time.time())
+                return {'pattern': pattern}
+            if command == 'change_wavelength':
+                self.wavelength = argument
+                return {'wavelength': argument}
+            if command == 'set_wait_time':
+                self.waitTime = float(argument)
+                return {'wait_time': self.waitTime}
+            if command in ('start_viewer', 'start_viewer_single_loop', 'stop_viewer',
+                           'wait_for_viewer_completion'):
+                return {'status': 'ok'}
+        self.__logger.warning(f'Unknown pattern server command "{command}"')
+        return -1
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,185 @@
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+import scipy.ndimage as ndi
+import tifffile as tif
+
+from imswitch.imcommon.model import initLogger
+
+
+def ismPatternIndex(nFrame, nUnitCell=16, nPixels=256):
+    """ Returns the flat indices of the lit scanner pixels of ISM pattern
+    nFrame on an nPixels x nPixels grid: one pixel per unit cell of
+    nUnitCell x nUnitCell pixels, at row nFrame // nUnitCell and column
+    nFrame % nUnitCell of the cell. """
+    iX, iY = divmod(nFrame, nUnitCell)
+    rows = np.arange(iX, nPixels, nUnitCell)
+    cols = np.arange(iY, nPixels, nUnitCell)
+    return (rows[:, None] * nPixels + cols[None, :]).ravel()
+
+
+def findSpots(frame, minDistance=4, threshold=0.3):
+    """ Returns the (row, column) positions of the illumination spots in
+    frame: local maxima at least minDistance pixels apart that rise more
+    than threshold times the peak-to-median range above the median. """
+    frame = np.asarray(frame, dtype=np.float32)
+    median = np.median(frame)
+    level = median + threshold * (frame.max() - median)
+    peaks = (ndi.maximum_filter(frame, size=2 * minDistance + 1) == frame) & (frame > level)
+    return np.argwhere(peaks)
+
+
+class PixelReassignmentPreview:
+    """ Builds an image scanning microscopy image frame by frame.
+
+    Around every illumination spot of a frame, the pixels within radius are
+    reassigned to halfway between the spot and the pixel, on a grid of twice
+    the camera sampling so that no rounding is needed. The sum of the frames
+    is kept as the widefield reference. Spots are found with findSpots
+    unless their positions are given. """
+
+    def __init__(self, radius=3, minDistance=4, threshold=0.3):
+        self.radius = radius
+        self.minDistance = minDistance
+        self.threshold = threshold
+        offsets = np.arange(-radius, radius + 1)
+        dy, dx = np.meshgrid(offsets, offsets, indexing='ij')
+        inside = dy ** 2 + dx ** 2 <= radius ** 2
+        self._offsets = np.stack((dy[inside], dx[inside]), axis=1)
+        self._image = None
+        self._widefield = None
+        self.numFrames = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._image = None
+            self._widefield = None
+            self.numFrames = 0
+
+    def add(self, frame, spots=None):
+        """ Adds frame; returns the number of spots that were reassigned. """
+        frame = np.asarray(frame)
+        if frame.ndim == 3:
+            frame = frame.mean(axis=-1)
+        if spots is None:
+            spots = findSpots(frame, self.minDistance, self.threshold)
+        height, width = frame.shape
+        spots = np.asarray(spots, dtype=np.int64).reshape(-1, 2)
+
+        # pixel p of spot s goes to s + (p - s) / 2, i.e. to 2s + (p - s) on the fine grid
+        pixels = spots[:, None, :] + self._offsets[None, :, :]
+        targets = 2 * spots[:, None, :] + self._offsets[None, :, :]
+        valid = ((pixels[..., 0] >= 0) & (pixels[..., 0] < height) &
+                 (pixels[..., 1] >= 0) & (pixels[..., 1] < width))
+        pixels, targets = pixels[valid], targets[valid]
+        values = frame[pixels[:, 0], pixels[:, 1]].astype(np.float64)
+        flatTargets = targets[:, 0] * (2 * width) + targets[:, 1]
+        reassigned = np.bincount(flatTargets, weights=values, minlength=4 * height * width)
+
+        with self._lock:
+            if self._image is None or self._widefield.shape != frame.shape:
+                self._image = np.zeros((2 * height, 2 * width))
+                self._widefield = np.zeros((height, width))
+                self.numFrames = 0
+            self._image += reassigned.reshape(2 * height, 2 * width)
+            self._widefield += frame
+            self.numFrames += 1
+        return len(spots)
+
+    def image(self):
+        """ Returns a copy of the reassigned image so far, or None. """
+        with self._lock:
+            return None if self._image is None else self._image.copy()
+
+    def widefield(self):
+        """ Returns a copy of the sum of the frames so far, or None. """
+        with self._lock:
+            return None if self._widefield is None else self._widefield.copy()
+
+
+class ISMStreamWriter:
+    """ Writes the frames of an ISM scan to a single BigTIFF file and adds
+    them to a PixelReassignmentPreview, on one background thread.
+
+    Every frame is one page whose description holds its pattern index and
+    further metadata as JSON. Frames wait in a queue of at most maxQueued
+    frames, so that a slow disk holds back the scan instead of filling the
+    memory. """
+
+    def __init__(self, filePath, preview=None, maxQueued=32):
+        self.__logger = initLogger(self)
+        self.filePath = filePath
+        self.preview = preview
+        self.numWritten = 0
+        self.maxQueueLength = 0
+        self.writeTime = 0.0
+        self.previewTime = 0.0
+        self._queue = queue.Queue(maxsize=maxQueued)
+        self._tiff = tif.TiffWriter(filePath, bigtiff=True)
+        self._thread = threading.Thread(target=self._run, name='ISMStreamWriter', daemon=True)
+        self._thread.start()
+
+    def write(self, patternIndex, frame, metadata=None):
+        """ Queues frame, taken with ISM pattern patternIndex. """
+        self._queue.put((frame, {'patternIndex': int(patternIndex), **(metadata or {})}))
+        self.maxQueueLength = max(self.maxQueueLength, self._queue.qsize())
+
+    def join(self):
+        """ Waits until all queued frames are written. """
+        self._queue.join()
+
+    def close(self):
+        """ Writes the remaining frames and closes the file. """
+        self._queue.put(None)
+        self._thread.join()
+        self._tiff.close()
+
+    def getStatistics(self):
+        return {'written': self.numWritten, 'maxQueueLength': self.maxQueueLength,
+                'writeTime': self.writeTime, 'previewTime': self.previewTime}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                frame, metadata = item
+                start = time.perf_counter()
+                try:
+                    self._tiff.write(np.asarray(frame), description=json.dumps(metadata),
+                                     metadata=None, contiguous=False)
+                    self.numWritten += 1
+                except Exception:
+                    self.__logger.exception(f'Failed to write frame to {self.filePath}')
+                self.writeTime += time.perf_counter() - start
+                if self.preview is not None:
+                    start = time.perf_counter()
+                    try:
+                        self.preview.add(frame)
+                    except Exception:
+                        self.__logger.exception('Failed to update the ISM preview')
+                    self.previewTime += time.perf_counter() - start
+            finally:
+                self._queue.task_done()
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
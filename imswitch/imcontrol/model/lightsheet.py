@@ -0,0 +1,191 @@
+import time
+
+import numpy as np
+import zarr
+
+
+class FrameClock:
+    """ Assigns acquisition times to frames that are collected in chunks.
+
+    The frames of a chunk were captured between the previous call and now, so
+    they are spread evenly over that interval. """
+
+    def __init__(self, start=None):
+        self._last = time.time() if start is None else start
+
+    def timestamps(self, numFrames, now=None):
+        now = time.time() if now is None else now
+        times = np.linspace(self._last, now, numFrames + 1)[1:]
+        self._last = now
+        return times
+
+
+class PositionTrack:
+    """ Stage positions sampled over time. Positions at other times are
+    linearly interpolated, and clamped to the first and last sample. """
+
+    def __init__(self):
+        self._times = []
+        self._positions = []
+
+    def addSample(self, position, timestamp=None):
+        self._times.append(time.time() if timestamp is None else timestamp)
+        self._positions.append(position)
+
+    def interpolate(self, timestamps):
+        if not self._times:
+            return np.full(len(timestamps), np.nan)
+        order = np.argsort(self._times)
+        return np.interp(timestamps, np.asarray(self._times)[order],
+                         np.asarray(self._positions, dtype=float)[order])
+
+
+class VolumeStore:
+    """ Chunked on-disk store of light-sheet volumes.
+
+    Frames are appended plane by plane and written to a zarr group in blocks
+    of chunkPlanes planes, so only one block is held in memory at a time. The
+    group holds the volumes of all tiles in "data" (tile, plane, y, x) and the
+    acquisition time and stage position of every plane in "timestamps" and
+    "positions" (tile, plane). The plane axis grows as frames arrive; tiles
+    with fewer planes are zero-padded and their plane count is stored in the
+    "planeCounts" attribute. The frame shape and data type are taken from
+    the first frames. """
+
+    def __init__(self, path, chunkPlanes=8, attrs=None):
+        self.path = path
+        self.chunkPlanes = chunkPlanes
+        self._root = zarr.open_group(path, mode='w')
+        self._data = None
+        self._timestamps = self._root.full('timestamps', np.nan, shape=(0, chunkPlanes),
+                                           chunks=(1, 1024), dtype='f8')
+        self._positions = self._root.full('positions', np.nan, shape=(0, chunkPlanes),
+                                          chunks=(1, 1024), dtype='f8')
+        self._root.attrs.update(attrs or {})
+
+        self.tilePositions = []
+        self.planeCounts = []
+        self.planeSpacings = []
+        self._tile = None
+        self._pending = []
+        self._pendingTimes = []
+        self._written = 0
+
+    @property
+    def numTiles(self):
+        return len(self.planeCounts)
+
+    def startTile(self, tilePosition=None):
+        """ Starts a new volume and returns its tile index. """
+        if self._tile is not None:
+            self.finishTile()
+        self._tile = self.numTiles
+        self.tilePositions.append(tilePosition or {})
+        self.planeCounts.append(0)
+        self.planeSpacings.append(None)
+        for array in self._arrays:
+            array.resize((self._tile + 1,) + array.shape[1:])
+        self._written = 0
+        return self._tile
+
+    def append(self, frames, timestamps):
+        """ Appends frames (numFrames, y, x) acquired at timestamps to the
+        current tile. """
+        if len(frames) == 0:
+            return
+        if self._data is None:
+            frameShape = tuple(np.shape(frames)[1:])
+            self._data = self._root.zeros(
+                'data', shape=self._timestamps.shape + frameShape,
+                chunks=(1, self.chunkPlanes) + frameShape, dtype=np.asarray(frames).dtype
+            )
+        self._pending.append(np.asarray(frames))
+        self._pendingTimes.append(np.asarray(timestamps, dtype=float))
+        self.planeCounts[self._tile] += len(frames)
+        if sum(len(block) for block in self._pending) >= self.chunkPlanes:
+            self._flush(complete=False)
+
+    def finishTile(self, positionTrack=None):
+        """ Writes the remaining frames of the current tile and, if a
+        PositionTrack is given, the interpolated stage position of every plane.
+        Returns the median plane spacing. """
+        if self._tile is None:
+            return None
+        self._flush(complete=True)
+        tile, count = self._tile, self.planeCounts[self._tile]
+        spacing = None
+        if positionTrack is not None and count > 0:
+            positions = positionTrack.interpolate(self._timestamps[tile, :count])
+            self._positions[tile, :count] = positions
+            if count > 1:
+                spacing = float(np.median(np.abs(np.diff(positions))))
+        self.planeSpacings[tile] = spacing
+        self._tile = None
+        self._writeAttrs()
+        return spacing
+
+    def preview(self, tile=-1, maxPlanes=200):
+        """ Returns the planes of a tile, subsampled along the plane axis to at
+        most maxPlanes planes. Only the returned planes are read. """
+        tile = range(self.numTiles)[tile]
+        count = self.planeCounts[tile]
+        step = max(1, int(np.ceil(count / maxPlanes)))
+        if self._data is None:
+            return None, step
+        return self._data[tile, :count:step], step
+
+    def close(self):
+        if self._tile is not None:
+            self.finishTile()
+        maxPlanes = max(self.planeCounts, default=0)
+        for array in self._arrays:
+            array.resize((array.shape[0], maxPlanes) + array.shape[2:])
+        self._writeAttrs()
+
+    def _flush(self, complete):
+        if not self._pending:
+            return
+        frames = np.concatenate(self._pending)
+        times = np.concatenate(self._pendingTimes)
+        numWrite = len(frames) if complete else len(frames) // self.chunkPlanes * self.chunkPlanes
+        start, stop = self._written, self._written + numWrite
+
+        if stop > self._data.shape[1]:
+            numPlanes = max(stop, 2 * self._data.shape[1])
+            for array in self._arrays:
+                array.resize((array.shape[0], numPlanes) + array.shape[2:])
+
+        self._data[self._tile, start:stop] = frames[:numWrite]
+        self._timestamps[self._tile, start:stop] = times[:numWrite]
+        self._written = stop
+        self._pending = [frames[numWrite:]] if numWrite < len(frames) else []
+        self._pendingTimes = [times[numWrite:]] if numWrite < len(frames) else []
+
+    @property
+    def _arrays(self):
+        arrays = [self._timestamps, self._positions]
+        return arrays + [self._data] if self._data is not None else arrays
+
+    def _writeAttrs(self):
+        self._root.attrs.update({
+            'tilePositions': self.tilePositions,
+            'planeCounts': self.planeCounts,
+            'planeSpacings': self.planeSpacings
+        })
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
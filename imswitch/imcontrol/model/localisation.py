@@ -0,0 +1,298 @@
+import concurrent.futures
+import pickle
+import threading
+from multiprocessing import shared_memory
+
+import h5py
+import numpy as np
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import initLogger
+
+
+class LocalisationTable:
+    """ Appendable, columnar on-disk table of localisations, stored as one
+    resizable, chunked HDF5 dataset per column. The datasets are created on
+    the first append; columns beyond the given names are called p<index>. """
+
+    def __init__(self, filePath, columns=('frame', 'x', 'y'), chunkSize=65536):
+        self.filePath = filePath
+        self.columns = list(columns)
+        self._chunkSize = chunkSize
+        self._file = h5py.File(filePath, 'w')
+        self._datasets = None
+        self._lock = threading.Lock()
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, rows):
+        """ Appends rows, an (N, numColumns) array, to the table. """
+        rows = np.asarray(rows)
+        if len(rows) < 1:
+            return
+        with self._lock:
+            if self._datasets is None:
+                self._createDatasets(rows.shape[1])
+            start, stop = self._length, self._length + len(rows)
+            for i, column in enumerate(self.columns):
+                dataset = self._datasets[column]
+                dataset.resize((stop,))
+                dataset[start:stop] = rows[:, i]
+            self._length = stop
+
+    def flush(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _createDatasets(self, numColumns):
+        self.columns = (self.columns[:numColumns] +
+                        [f'p{i}' for i in range(len(self.columns), numColumns)])
+        self._datasets = {
+            column: self._file.create_dataset(column, shape=(0,), maxshape=(None,),
+                                              dtype=np.float32, chunks=(self._chunkSize,))
+            for column in self.columns
+        }
+        self._file.attrs['columns'] = self.columns
+
+
+class IncrementalHistogram:
+    """ Super-resolved 2D histogram of localisations that only adds new
+    points. Coordinates are in camera pixels; each camera pixel is split into
+    upsampling x upsampling bins. """
+
+    def __init__(self, shape, upsampling=4):
+        self.upsampling = upsampling
+        self.image = np.zeros((shape[0] * upsampling, shape[1] * upsampling), dtype=np.uint32)
+        self._lock = threading.Lock()
+
+    def add(self, x, y):
+        col = np.floor(np.asarray(x) * self.upsampling).astype(np.intp)
+        row = np.floor(np.asarray(y) * self.upsampling).astype(np.intp)
+        valid = ((row >= 0) & (row < self.image.shape[0]) &
+                 (col >= 0) & (col < self.image.shape[1]))
+        with self._lock:
+            np.add.at(self.image.reshape(-1),
+                      row[valid] * self.image.shape[1] + col[valid], 1)
+
+    def snapshot(self):
+        with self._lock:
+            return self.image.copy()
+
+    def reset(self):
+        with self._lock:
+            self.image[:] = 0
+
+
+class LocalisationPipeline(SignalInterface):
+    """ Localises live frames in batches on a pool of worker processes.
+
+    Frames are copied once, into a fixed set of shared memory batch buffers,
+    and the workers read them from there. Localisations are appended to a
+    LocalisationTable and an IncrementalHistogram as batches complete. When
+    all batch buffers are busy, incoming frames are dropped and counted, so
+    memory stays bounded.
+
+    localiseFunc(frameIndex, frame, **localiseKwargs) must be a picklable
+    module-level function returning an (N, K) array whose first two columns
+    are x and y in camera pixels. If localiseKwargs cannot be pickled, a
+    thread pool is used instead of a process pool. """
+
+    sigLocalisationsAdded = Signal(int)  # (totalLocalisations)
+    _sigLocalisationsPending = Signal()
+
+    def __init__(self, frameShape, frameDtype, localiseFunc, localiseKwargs=None,
+                 table=None, upsampling=4, batchSize=16, numWorkers=None,
+                 numBuffers=None):
+        super().__init__()
+        self.__logger = initLogger(self)
+
+        self.frameShape = tuple(frameShape)
+        self.frameDtype = np.dtype(frameDtype)
+        self.batchSize = batchSize
+        self.table = table
+        self.histogram = IncrementalHistogram(self.frameShape, upsampling)
+
+        self._localiseFunc = localiseFunc
+        self._localiseKwargs = localiseKwargs or {}
+        self._lock = threading.RLock()
+        self._batchesDone = threading.Condition(self._lock)
+        self._numFramesAdded = 0
+        self._numFramesDropped = 0
+        self._numLocalisations = 0
+        self._signalPending = False
+
+        try:
+            pickle.dumps((localiseFunc, self._localiseKwargs))
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers)
+        except Exception:
+            self.__logger.debug('Localisation settings are not picklable, using threads')
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=numWorkers)
+        numWorkers = self._executor._max_workers
+
+        frameBytes = int(np.prod(self.frameShape)) * self.frameDtype.itemsize
+        self._buffers = [
+            shared_memory.SharedMemory(create=True, size=max(1, frameBytes * batchSize))
+            for _ in range(numBuffers or numWorkers + 1)
+        ]
+        self._freeBuffers = list(range(len(self._buffers)))
+        self._currentBuffer = None
+        self._currentCount = 0
+        self._currentFirstFrame = 0
+        self._futures = set()
+
+        self._sigLocalisationsPending.connect(self._deliverLocalisations)
+
+    @property
+    def numLocalisations(self):
+        return self._numLocalisations
+
+    def getStatistics(self):
+        with self._lock:
+            return {'framesAdded': self._numFramesAdded,
+                    'framesDropped': self._numFramesDropped,
+                    'localisations': self._numLocalisations,
+                    'batchesInFlight': len(self._futures)}
+
+    def addFrame(self, frame):
+        """ Queues a frame for localisation. Never blocks. Returns whether the
+        frame was accepted. """
+        with self._lock:
+            frameIndex = self._numFramesAdded + self._numFramesDropped
+            if np.shape(frame) != self.frameShape:
+                self._numFramesDropped += 1
+                return False
+            if self._currentBuffer is None:
+                if not self._freeBuffers:
+                    self._numFramesDropped += 1
+                    return False
+                self._currentBuffer = self._freeBuffers.pop()
+                self._currentCount = 0
+                self._currentFirstFrame = frameIndex
+
+            batch = self._batchView(self._currentBuffer)
+            batch[self._currentCount] = frame
+            self._currentCount += 1
+            self._numFramesAdded += 1
+            if self._currentCount >= self.batchSize:
+                self._submitCurrent()
+        return True
+
+    def flush(self, wait=True):
+        """ Submits the partially filled batch and optionally waits for all
+        batches to be localised. """
+        with self._lock:
+            if self._currentBuffer is not None:
+                self._submitCurrent()
+            if wait:
+                self._batchesDone.wait_for(lambda: not self._futures)
+        if wait and self.table is not None:
+            self.table.flush()
+
+    def close(self):
+        """ Finishes all pending batches and releases the workers and shared
+        memory. The table is closed as well. """
+        self.flush(wait=True)
+        self._executor.shutdown(wait=True)
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+        if self.table is not None:
+            self.table.close()
+
+    def _batchView(self, bufferIndex):
+        return np.ndarray((self.batchSize,) + self.frameShape, dtype=self.frameDtype,
+                          buffer=self._buffers[bufferIndex].buf)
+
+    def _submitCurrent(self):
+        bufferIndex, count = self._currentBuffer, self._currentCount
+        self._currentBuffer = None
+        future = self._executor.submit(
+            _localiseBatch, self._buffers[bufferIndex].name, self.frameShape,
+            self.frameDtype.str, count, self._currentFirstFrame,
+            self._localiseFunc, self._localiseKwargs
+        )
+        self._futures.add(future)
+        future.add_done_callback(
+            lambda f, bufferIndex=bufferIndex: self._batchDone(f, bufferIndex)
+        )
+
+    def _batchDone(self, future, bufferIndex):
+        try:
+            localisations = future.result()
+            if localisations is not None and len(localisations) > 0:
+                # Column 0 is the frame index, followed by x, y and the fit parameters
+                self.histogram.add(localisations[:, 1], localisations[:, 2])
+                if self.table is not None:
+                    self.table.append(localisations)
+                self._localisationsAdded(len(localisations))
+        except Exception:
+            self.__logger.exception('Localisation of batch failed')
+        finally:
+            with self._lock:
+                self._freeBuffers.append(bufferIndex)
+                self._futures.discard(future)
+                self._batchesDone.notify_all()
+
+    def _localisationsAdded(self, count):
+        with self._lock:
+            self._numLocalisations += count
+            notify = not self._signalPending
+            self._signalPending = True
+        if notify:
+            self._sigLocalisationsPending.emit()
+
+    def _deliverLocalisations(self):
+        with self._lock:
+            self._signalPending = False
+        self.sigLocalisationsAdded.emit(self._numLocalisations)
+
+
+def _localiseBatch(shmName, frameShape, dtype, count, firstFrameIndex, localiseFunc,
+                   localiseKwargs):
+    """ Worker side of LocalisationPipeline. Returns an (N, 1 + K) float32
+    array of localisations, prefixed with their frame index. """
+    shm = shared_memory.SharedMemory(name=shmName)
+    try:
+        frames = np.ndarray((count,) + tuple(frameShape), dtype=dtype, buffer=shm.buf)
+        results = []
+        for i in range(count):
+            params = localiseFunc(firstFrameIndex + i, frames[i], **localiseKwargs)
+            if params is None or len(params) < 1:
+                continue
+            params = np.asarray(params, dtype=np.float32).reshape(len(params), -1)
+            frameColumn = np.full((len(params), 1), firstFrameIndex + i, dtype=np.float32)
+            results.append(np.hstack((frameColumn, params)))
+        del frames
+    finally:
+        shm.close()
+
+    if not results:
+        return None
+    return np.concatenate(results)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
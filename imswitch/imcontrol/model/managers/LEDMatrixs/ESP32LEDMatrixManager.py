@@ -1,5 +1,5 @@
 from imswitch.imcommon.model import initLogger
-from .LEDMatrixManager import LEDMatrixManager
+from .LEDMatrixManager import LEDMatrixManager, _toLEDArray
 import numpy as np
 
 
@@ -48,16 +48,23 @@ class ESP32LEDMatrixManager(LEDMatrixManager):
 
         super().__init__(LEDMatrixInfo, name, isBinary=False, valueUnits='mW', valueDecimals=0)
 
+        # whoever sets the matrix outside of a sequence, the next sequence
+        # pattern has to be sent whole
+        self._rs232manager.addLEDMatrixListener(self._patternChanged)
+
     def setIndividualPattern(self, pattern, getReturn=False):
+        self._rs232manager.notifyLEDMatrixChanged()
         r = self.mLEDmatrix.send_LEDMatrix_array(pattern, getReturn = getReturn)
         return r
 
     def setAll(self, state=(0,0,0), intensity=None, getReturn=True):
         # dealing with on or off,
         # intensity is adjjusting the global value
+        self._rs232manager.notifyLEDMatrixChanged()
         self.mLEDmatrix.setAll(state=state, intensity=intensity, getReturn=getReturn)
 
     def setPattern(self, pattern):
+        self._rs232manager.notifyLEDMatrixChanged()
         self.mLEDmatrix.pattern(pattern)
 
     def getPattern(self):
@@ -71,6 +78,7 @@ class ESP32LEDMatrixManager(LEDMatrixManager):
         """Handles output power.
         Sends a RS232 command to the LEDMatrix specifying the new intensity.
         """
+        self._rs232manager.notifyLEDMatrixChanged()
         self.mLEDmatrix.setSingle(indexled, state=state)
 
     def setLEDIntensity(self, intensity=(0,0,0)):
@@ -80,8 +88,22 @@ class ESP32LEDMatrixManager(LEDMatrixManager):
         """Handles output power.
         Sends a RS232 command to the LEDMatrix specifying the new intensity.
         """
+        self._rs232manager.notifyLEDMatrixChanged()
         self.mLEDmatrix.setAll(1, (intensity, intensity, intensity))
 
+    def _showSequencePattern(self, sequence, index, shownPattern, getReturn):
+        """ The firmware only updates the LEDs listed in an array command, so
+        after the first pattern of a sequence only the LEDs that differ from
+        the shown pattern are sent. """
+        pattern = sequence[index]
+        if shownPattern is None or shownPattern.shape != pattern.shape:
+            ids = None
+        else:
+            ids = np.flatnonzero(np.any(pattern != shownPattern, axis=1))
+            if len(ids) == 0:
+                return
+        self.mLEDmatrix.send_LEDMatrix_array(_toLEDArray(pattern, ids), getReturn=getReturn)
+
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
@@ -1,6 +1,11 @@
+import hashlib
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Union
 
+import numpy as np
+
 
 class LEDMatrixManager(ABC):
     """ Abstract base class for managers that control LEDMatrixs. Each type of
@@ -30,6 +35,14 @@ class LEDMatrixManager(ABC):
         self.__freqRangeMin = None
         self.__freqRangeMax = None
         self.__freqRangeInit = None
+
+        self.maxCachedSequences = 16
+        self.__sequences = OrderedDict()
+        self.__activeSequence = None
+        self.__sequenceIndex = -1
+        self.__shownPattern = None
+        self.__numPatternChanges = 0
+        self.__sequenceLock = threading.RLock()
       
     def name(self) -> str:
         """ Unique LEDMatrix name, defined in the LEDMatrix's setup info. """
@@ -66,6 +79,82 @@ class LEDMatrixManager(ABC):
     def setValue(self, value) -> None:
         """ Sets the value of the LEDMatrix. """
         pass
+
+    def uploadPatternSequence(self, patterns) -> str:
+        """ Uploads a sequence of patterns, an array-like of shape
+        (numPatterns, numLEDs, 3) with the RGB value of every LED, and makes it
+        the active sequence. Sequences are cached by content, so uploading the
+        same patterns again costs nothing. Returns the key of the sequence. """
+        patterns = np.asarray(patterns, dtype=np.uint8)
+        patterns = patterns.reshape(patterns.shape[0], -1, 3)
+        key = hashlib.sha1(str(patterns.shape).encode() + patterns.tobytes()).hexdigest()[:16]
+        with self.__sequenceLock:
+            if key in self.__sequences:
+                self.__sequences.move_to_end(key)
+            else:
+                self.__sequences[key] = self._uploadSequence(patterns)
+                while len(self.__sequences) > self.maxCachedSequences:
+                    self.__sequences.popitem(last=False)
+            self.__activeSequence = key
+            self.__sequenceIndex = -1
+        return key
+
+    def setPatternSequenceIndex(self, index: int, key: str = None, getReturn: bool = False) -> None:
+        """ Shows pattern index of the sequence key (default: the active
+        sequence), and makes that sequence the active one. """
+        with self.__sequenceLock:
+            key = key or self.__activeSequence
+            if key not in self.__sequences:
+                raise ValueError(f'Pattern sequence "{key}" has not been uploaded')
+            sequence = self.__sequences[key]
+            index %= len(sequence)
+            numPatternChanges = self.__numPatternChanges
+            self._showSequencePattern(sequence, index, self.__shownPattern, getReturn)
+            self.__activeSequence = key
+            self.__sequenceIndex = index
+            # if the LEDs were set meanwhile, what is shown is not known
+            changed = self.__numPatternChanges != numPatternChanges
+            self.__shownPattern = None if changed else sequence[index]
+
+    def advancePatternSequence(self, getReturn: bool = False) -> int:
+        """ Shows the next pattern of the active sequence, wrapping around at
+        the end. Returns the index of the pattern shown. """
+        with self.__sequenceLock:
+            self.setPatternSequenceIndex(self.__sequenceIndex + 1, getReturn=getReturn)
+            return self.__sequenceIndex
+
+    def getPatternSequenceIndex(self) -> int:
+        """ Returns the index of the pattern of the active sequence that is
+        shown, or -1. """
+        return self.__sequenceIndex
+
+    def _patternChanged(self) -> None:
+        """ To be called by subclasses when the LEDs were set outside of a
+        pattern sequence, so that the next sequence pattern is sent whole.
+        May be called from any thread. """
+        self.__numPatternChanges += 1
+        self.__shownPattern = None
+
+    def _uploadSequence(self, patterns):
+        """ Prepares a (numPatterns, numLEDs, 3) sequence for display and
+        returns what _showSequencePattern gets passed. Devices that can store
+        patterns themselves upload them here; by default the patterns are kept
+        on the host. """
+        return patterns
+
+    def _showSequencePattern(self, sequence, index, shownPattern, getReturn):
+        """ Shows pattern index of an uploaded sequence. shownPattern is the
+        pattern currently shown from a sequence, or None. By default the whole
+        pattern is sent with setIndividualPattern. """
+        self.setIndividualPattern(_toLEDArray(sequence[index]), getReturn=getReturn)
+
+
+def _toLEDArray(pattern, ids=None):
+    """ Converts (numLEDs, 3) RGB values to a list of {"id", "r", "g", "b"}
+    dicts, for the LEDs in ids (default: all). """
+    ids = range(len(pattern)) if ids is None else ids
+    return [{"id": int(i), "r": int(pattern[i, 0]), "g": int(pattern[i, 1]), "b": int(pattern[i, 2])}
+            for i in ids]
     
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
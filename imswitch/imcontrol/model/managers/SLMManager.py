@@ -1,4 +1,5 @@
 import enum
+import functools
 import glob
 import math
 import os
@@ -36,6 +37,7 @@ class SLMManager(SignalInterface):
 
         self.__masksAber = [self.__maskAberLeft, self.__maskAberRight]
         self.__masksTilt = [self.__maskTiltLeft, self.__maskTiltRight]
+        self.setPhaseLut(self.__slmInfo.phaseLutLevels)
 
         self.update(maskChange=True, tiltChange=True, aberChange=True)
 
@@ -177,6 +179,12 @@ class SLMManager(SignalInterface):
         for idx, mask in enumerate(self.__masksTilt):
             mask.setTiltAngle(tilt_angle, inverts[idx])
 
+    def setPhaseLut(self, levels):
+        """ Enables lookup-table based phase quantisation with the given number
+        of levels for all phase masks, or disables it if levels is None. """
+        for mask in self.__masks + self.__masksAber:
+            mask.setPhaseLut(levels)
+
     def update(self, maskChange=False, tiltChange=False, aberChange=False):
         if maskChange:
             self.maskDouble = self.__masks[0].concat(self.__masks[1])
@@ -213,6 +221,8 @@ class Mask:
         self.angle_rotation = 0
         self.angle_tilt = 0
         self.pixelSize = 0
+        self.phaseLut = None
+        self.__phaseBuffer = None
         if wavelength == 561:
             self.value_max = 148
         elif wavelength == 491:
@@ -270,9 +280,24 @@ class Mask:
 
     def pi2uint8(self):
         """Method converting a phase image (values from 0 to 2Pi) into a uint8
-        image"""
-        self.img *= self.value_max / (2 * math.pi)
-        self.img = np.round(self.img).astype(np.uint8)
+        image. If a phase LUT has been set, the phase is quantised to the
+        number of levels of the LUT and mapped through it."""
+        if self.phaseLut is not None:
+            levels = len(self.phaseLut)
+            index = np.multiply(self.img, levels / (2 * math.pi), dtype=np.float32)
+            index = index.astype(np.intp)
+            np.remainder(index, levels, out=index)  # a phase of 2Pi is the same as 0
+            self.img = self.phaseLut[index]
+            return
+
+        img = np.multiply(self.img, self.value_max / (2 * math.pi), dtype=np.float32)
+        np.rint(img, out=img)
+        self.img = img.astype(np.uint8)
+
+    def setPhaseLut(self, levels=None):
+        """Sets up lookup-table based phase quantisation with the given number
+        of levels, or disables it if levels is None."""
+        self.phaseLut = _phaseLut(self.value_max, levels) if levels else None
 
     def load(self, img):
         """Initiates the mask with an existing image."""
@@ -289,11 +314,10 @@ class Mask:
     def setCircular(self):
         """This method sets to 0 all the values within Mask except the ones
         included in a circle centered in (centerx,centery) with a radius r"""
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        mask_bin = x * x + y * y <= self.radius * self.radius
-        result = np.zeros((self.height, self.width))
-        result[mask_bin] = self.img[mask_bin]
+        mask_bin = _circularSupport(self.height, self.width, self.centerx, self.centery,
+                                    self.radius)
+        result = np.zeros((self.height, self.width), dtype=np.float32)
+        np.copyto(result, self.img, where=mask_bin)
         self.img = result
 
     def setTilt(self, pixelsize=None):
@@ -301,42 +325,28 @@ class Mask:
         if pixelsize:
             self.pixelSize = pixelsize
         wavelength = self.wavelength * 10 ** -6  # conversion to mm
-        mask = np.indices((self.height, self.width), dtype="float")[1, :, :]
         # Spatial frequency, round to avoid aliasing
         f_spat = np.round(wavelength / (self.pixelSize * np.sin(self.angle_tilt)))
         if np.absolute(f_spat) < 3:
             self.__logger.debug(f"Spatial frequency: {f_spat} pixels")
-        period = 2 * math.pi / f_spat  # period
-        mask *= period  # getting a mask that is time along x-axis with a certain period
-        tilt = sg.sawtooth(mask) + 1  # creating the blazed grating
-        tilt *= self.value_max / 2  # normalizing it to range of [0 value_max]
-        tilt = np.round(tilt).astype(np.uint8)  # getting it in np.uint8 type
-        self.img = tilt
+        self.img = _tiltPattern(self.height, self.width, float(f_spat), self.value_max)
         self.mask_type = MaskMode.Tilt
 
     def setAberrationFactors(self, aber_params_info):
         self.aber_params_info = aber_params_info
 
     def setAberrations(self):
-        fTilt = self.aber_params_info["tilt"]
-        fTip = self.aber_params_info["tip"]
-        fDefoc = self.aber_params_info["defocus"]
-        fSph = self.aber_params_info["spherical"]
-        fVertComa = self.aber_params_info["verticalComa"]
-        fHozComa = self.aber_params_info["horizontalComa"]
-        fVertAst = self.aber_params_info["verticalAstigmatism"]
-        fOblAst = self.aber_params_info["obliqueAstigmatism"]
-
-        mask = np.fromfunction(lambda i, j: fTilt * 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) * np.sin(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fTip * 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) * np.cos(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fDefoc * np.sqrt(3) * (2 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) - 1), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fSph * np.sqrt(5) * (6 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)**4 - 6 * (((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2) + 1), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fVertComa * np.sqrt(8) * np.sin(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * (3 * (np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**3 - 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fHozComa * np.sqrt(8) * np.cos(np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * (3 * (np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**3 - 2 * np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2)), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fVertAst * np.sqrt(6) * np.cos(2 * np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * ((np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**2), (self.height, self.width), dtype="float")
-        mask += np.fromfunction(lambda i, j: fOblAst * np.sqrt(6) * np.sin(2 * np.arctan2(((j - self.centery) / self.radius), ((i - self.centerx) / self.radius))) * ((np.sqrt(((i - self.centerx) / self.radius)**2 + ((j - self.centery) / self.radius)**2))**2), (self.height, self.width), dtype="float")
-
-        mask %= 2 * math.pi
+        factors = np.array([self.aber_params_info[key] for key in _aberrationKeys],
+                           dtype=np.float32)
+        basis = _zernikeBasis(self.height, self.width, self.centerx, self.centery, self.radius)
+
+        # Weighted sum of the cached basis images, written into a reused buffer
+        if self.__phaseBuffer is None or self.__phaseBuffer.shape != (self.height, self.width):
+            self.__phaseBuffer = np.empty((self.height, self.width), dtype=np.float32)
+        mask = self.__phaseBuffer
+        np.dot(factors, basis.reshape(len(_aberrationKeys), -1), out=mask.reshape(-1))
+
+        np.mod(mask, 2 * math.pi, out=mask)
         self.img = mask
         self.pi2uint8()
         self.mask_type = MaskMode.Aber
@@ -374,14 +384,11 @@ class Mask:
     def setDonut(self, rotation=True):
         """This function generates a donut mask, with the center defined in the
         mask object."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        theta = np.arctan2(x, y)
+        theta = _thetaGrid(self.height, self.width, self.centerx, self.centery)
 
-        mask = theta % (2 * np.pi)
+        mask = np.mod(theta, 2 * np.pi)
         if rotation:
-            mask = np.ones((self.height, self.width), dtype="float") * (2 * np.pi) - mask
+            np.subtract(2 * np.pi, mask, out=mask)
 
         self.img = mask
         self.pi2uint8()
@@ -390,10 +397,8 @@ class Mask:
     def setTophat(self):
         """This function generates a tophat mask with a mid-radius defined by
         sigma, and with the center defined in the mask object."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        d = x ** 2 + y ** 2
+        mask = np.zeros((self.height, self.width), dtype=np.float32)
+        d = _distanceSqGrid(self.height, self.width, self.centerx, self.centery)
 
         mid_radius = self.sigma * np.sqrt(
             2 * np.log(2 / (1 + np.exp(-self.radius ** 2 / (2 * self.sigma ** 2))))
@@ -408,10 +413,9 @@ class Mask:
     def setHalf(self):
         """Sets the current masks to half masks, with the same center,
         for accurate center position determination."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        theta = np.arctan2(x, y) + self.angle_rotation
+        mask = np.zeros((self.height, self.width), dtype=np.float32)
+        theta = _thetaGrid(self.height, self.width, self.centerx, self.centery)
+        theta = theta + self.angle_rotation
 
         half_bool = (abs(theta) < np.pi / 2)
         mask[half_bool] = np.pi
@@ -423,10 +427,9 @@ class Mask:
     def setQuad(self):
         """Transforms the current mask in a quadrant pattern mask for testing
         aberrations."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        theta = np.arctan2(x, y) + self.angle_rotation
+        mask = np.zeros((self.height, self.width), dtype=np.float32)
+        theta = _thetaGrid(self.height, self.width, self.centerx, self.centery)
+        theta = theta + self.angle_rotation
 
         quad_bool = (theta < np.pi) * (theta > np.pi / 2) + (theta < 0) * (theta > -np.pi / 2)
         mask[quad_bool] = np.pi
@@ -438,10 +441,9 @@ class Mask:
     def setHex(self):
         """Transforms the current mask in a hex pattern mask for testing
         aberrations."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        theta = np.arctan2(x, y) + self.angle_rotation
+        mask = np.zeros((self.height, self.width), dtype=np.float32)
+        theta = _thetaGrid(self.height, self.width, self.centerx, self.centery)
+        theta = theta + self.angle_rotation
 
         hex_bool = ((theta < np.pi / 3) * (theta > 0) +
                     (theta > -2 * np.pi / 3) * (theta < -np.pi / 3) +
@@ -455,16 +457,14 @@ class Mask:
     def setSplit(self):
         """Transforms the current mask in a split bullseye pattern mask for
         testing aberrations."""
-        mask = np.zeros((self.height, self.width), dtype="float")
-        mask1 = np.zeros((self.height, self.width), dtype="float")
-        mask2 = np.zeros((self.height, self.width), dtype="float")
-        x, y = np.ogrid[-self.centerx: self.height - self.centerx,
-                        -self.centery: self.width - self.centery]
-        theta = np.arctan2(x, y) + self.angle_rotation
+        mask1 = np.zeros((self.height, self.width), dtype=np.float32)
+        mask2 = np.zeros((self.height, self.width), dtype=np.float32)
+        theta = _thetaGrid(self.height, self.width, self.centerx, self.centery)
+        theta = theta + self.angle_rotation
 
         radius_factor = 0.6
         mid_radius = radius_factor * self.radius
-        d = x ** 2 + y ** 2
+        d = _distanceSqGrid(self.height, self.width, self.centerx, self.centery)
         ring = (d > mid_radius ** 2)
         mask1[ring] = np.pi
         midLine = (abs(theta) < np.pi / 2)
@@ -509,6 +509,84 @@ class Mask:
             raise TypeError("Cannot add two masks with different shapes")
 
 
+_aberrationKeys = ("tilt", "tip", "defocus", "spherical", "verticalComa", "horizontalComa",
+                   "verticalAstigmatism", "obliqueAstigmatism")
+
+
+def _readOnly(array):
+    array.setflags(write=False)
+    return array
+
+
+@functools.lru_cache(maxsize=8)
+def _thetaGrid(height, width, centerx, centery):
+    """Angle grid around (centerx, centery), as used by the donut and
+    segmented masks."""
+    x, y = np.ogrid[-centerx: height - centerx, -centery: width - centery]
+    return _readOnly(np.arctan2(x, y).astype(np.float32))
+
+
+@functools.lru_cache(maxsize=8)
+def _distanceSqGrid(height, width, centerx, centery):
+    """Squared distance grid from (centerx, centery)."""
+    x, y = np.ogrid[-centerx: height - centerx, -centery: width - centery]
+    return _readOnly((x * x + y * y).astype(np.float32))
+
+
+@functools.lru_cache(maxsize=8)
+def _circularSupport(height, width, centerx, centery, radius):
+    """Binary disc of the given radius around (centerx, centery)."""
+    d = _distanceSqGrid(height, width, centerx, centery)
+    return _readOnly(d <= radius * radius)
+
+
+@functools.lru_cache(maxsize=4)
+def _polarGrid(height, width, centerx, centery, radius):
+    """Normalised polar coordinates (rho, phi) of the pupil of the given
+    radius around (centerx, centery)."""
+    x = (np.arange(height, dtype=np.float32) - centerx) / radius
+    y = (np.arange(width, dtype=np.float32) - centery) / radius
+    rho = np.sqrt(x[:, None] ** 2 + y[None, :] ** 2)
+    phi = np.arctan2(y[None, :], x[:, None])
+    return _readOnly(rho), _readOnly(phi)
+
+
+@functools.lru_cache(maxsize=4)
+def _zernikeBasis(height, width, centerx, centery, radius):
+    """Zernike basis images, stacked in the order of _aberrationKeys, for the
+    given mask geometry."""
+    rho, phi = _polarGrid(height, width, centerx, centery, radius)
+    rho2 = rho ** 2
+    basis = np.empty((len(_aberrationKeys), height, width), dtype=np.float32)
+    basis[0] = 2 * rho * np.sin(phi)  # tilt
+    basis[1] = 2 * rho * np.cos(phi)  # tip
+    basis[2] = np.sqrt(3) * (2 * rho2 - 1)  # defocus
+    basis[3] = np.sqrt(5) * (6 * rho2 ** 4 - 6 * rho2 + 1)  # spherical
+    radialComa = 3 * rho ** 3 - 2 * rho
+    basis[4] = np.sqrt(8) * np.sin(phi) * radialComa  # vertical coma
+    basis[5] = np.sqrt(8) * np.cos(phi) * radialComa  # horizontal coma
+    basis[6] = np.sqrt(6) * np.cos(2 * phi) * rho2  # vertical astigmatism
+    basis[7] = np.sqrt(6) * np.sin(2 * phi) * rho2  # oblique astigmatism
+    return _readOnly(basis)
+
+
+@functools.lru_cache(maxsize=8)
+def _tiltPattern(height, width, f_spat, value_max):
+    """Blazed grating along the x-axis with the given spatial frequency."""
+    period = 2 * math.pi / f_spat
+    # Every row is identical, so only compute one and broadcast it
+    tilt = sg.sawtooth(np.arange(width, dtype="float") * period) + 1
+    tilt *= value_max / 2
+    row = np.round(tilt).astype(np.uint8)
+    return _readOnly(np.broadcast_to(row, (height, width)))
+
+
+@functools.lru_cache(maxsize=8)
+def _phaseLut(value_max, levels):
+    """Lookup table mapping quantised phase levels in [0, 2Pi) to uint8."""
+    return _readOnly(np.round(np.arange(levels) * value_max / levels).astype(np.uint8))
+
+
 class MaskMode(enum.Enum):
     Donut = 1
     Tophat = 2
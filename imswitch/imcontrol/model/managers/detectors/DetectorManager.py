@@ -1,3 +1,4 @@
+import inspect
 import traceback
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
@@ -236,6 +237,12 @@ class DetectorManager(SignalInterface):
         """ Whether the detector is used for focus lock. """
         return self.__forFocusLock
 
+    @property
+    def supportsFrameNumbers(self) -> bool:
+        """ Whether getLatestFrame(returnFrameNumber=True) returns the frame
+        together with the number the detector gave it. """
+        return 'returnFrameNumber' in inspect.signature(self.getLatestFrame).parameters
+
     @property
     def scale(self) -> List[int]:
         """ The pixel sizes in micrometers, all axes, in the format high dim
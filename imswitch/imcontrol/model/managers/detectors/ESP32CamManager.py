@@ -15,6 +15,8 @@ class ESP32CamManager(DetectorManager):
       indexing starts at 0); set this string to an invalid value, e.g. the
       string "mock" to load a mocker
     - ``picamera`` -- dictionary of Allied Vision camera properties
+    - ``cameraStreamPort`` -- port of the MJPEG stream of the camera
+      (default 81)
     """
 
     def __init__(self, detectorInfo, name, **_lowLevelManagers):
@@ -22,7 +24,8 @@ class ESP32CamManager(DetectorManager):
 
         host = detectorInfo.managerProperties['cameraHost']
         port = detectorInfo.managerProperties['cameraPort']
-        self._camera = self._getESP32CamObj(host, port)
+        streamPort = detectorInfo.managerProperties.get('cameraStreamPort', 81)
+        self._camera = self._getESP32CamObj(host, port, streamPort)
 
         model = self._camera.model
         self._running = False
@@ -62,9 +65,11 @@ class ESP32CamManager(DetectorManager):
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
                          model=model, parameters=parameters, actions=actions, croppable=True)
 
-    def getLatestFrame(self, is_save=False):
+    def getLatestFrame(self, is_save=False, returnFrameNumber=False):
         if is_save:
             return self._camera.getLastChunk()
+        elif returnFrameNumber:
+            return self._camera.getLast(returnFrameNumber=True)
         else:
             return self._camera.getLast()
 
@@ -161,11 +166,11 @@ class ESP32CamManager(DetectorManager):
     def openPropertiesDialog(self):
         self._camera.openPropertiesGUI()
 
-    def _getESP32CamObj(self, host, port):
+    def _getESP32CamObj(self, host, port, streamPort=81):
         try:
             from imswitch.imcontrol.model.interfaces.esp32camera import CameraESP32Cam
             self.__logger.debug(f'Trying to initialize ESP32Camera {host}')
-            camera = CameraESP32Cam(host, port)
+            camera = CameraESP32Cam(host, port, streamPort)
         except Exception as e:
             self.__logger.warning(f'Failed to initialize PiCamera {e}, loading TIS mocker')
             from imswitch.imcontrol.model.interfaces.tiscamera_mock import MockCameraTIS
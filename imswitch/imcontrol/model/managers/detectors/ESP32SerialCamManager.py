@@ -6,6 +6,13 @@ from .DetectorManager import DetectorManager, DetectorAction, DetectorNumberPara
 
 class ESP32SerialCamManager(DetectorManager):
     """ DetectorManager that deals with the ESP32 Serial Cam 
+
+    Manager properties:
+
+    - ``port`` -- serial port of the camera; if not found, the first
+      Espressif device is used
+    - ``simulator`` -- if given, a simulated camera firmware is used instead,
+      e.g. ``{"frameTime": 0.03}``
     """
 
     def __init__(self, detectorInfo, name, **_lowLevelManagers):
@@ -21,6 +28,15 @@ class ESP32SerialCamManager(DetectorManager):
         except: 
             self.port = None 
 
+        # optionally talk to a simulated camera firmware instead of a board
+        self._simulator = None
+        simulatorSettings = detectorInfo.managerProperties.get('simulator')
+        if simulatorSettings is not None:
+            from imswitch.imcontrol.model.interfaces.serialsimulator import createSimulatedDevice
+            self._simulator = createSimulatedDevice(
+                {'protocol': 'esp32cam', 'baudrate': None, **simulatorSettings}, name=name
+            )
+
         # Prepare actions
         actions = {}
 
@@ -33,7 +49,7 @@ class ESP32SerialCamManager(DetectorManager):
             }          
         # initialize camera
 
-        self._camera = self._getESP32CamObj(self.port)
+        self._camera = self._getESP32CamObj(self.port, self._simulator)
 
         # init super-class
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
@@ -42,7 +58,9 @@ class ESP32SerialCamManager(DetectorManager):
         # assign camera object
 
 
-    def getLatestFrame(self, is_save=False):
+    def getLatestFrame(self, is_save=False, returnFrameNumber=False):
+        if returnFrameNumber:
+            return self._camera.getLast(returnFrameNumber=True)
         return self._camera.getLast() 
 
     def setParameter(self, name, value):
@@ -101,6 +119,9 @@ class ESP32SerialCamManager(DetectorManager):
         super().finalize()
         self.__logger.debug('Safely disconnecting the camera...')
         #TODO: IMPLEMENT self._camera.close()
+        if self._simulator is not None:
+            self._camera.close()
+            self._simulator.close()
 
     @property
     def pixelSizeUm(self):
@@ -116,11 +137,11 @@ class ESP32SerialCamManager(DetectorManager):
         self._camera.openPropertiesGUI()
 
 
-    def _getESP32CamObj(self, port ):
+    def _getESP32CamObj(self, port, serialdevice=None):
         try:
             from imswitch.imcontrol.model.interfaces.CameraESP32CamSerial import CameraESP32CamSerial
             self.__logger.debug(f'Trying to initialize ESP32Camera')
-            camera = CameraESP32CamSerial(port)
+            camera = CameraESP32CamSerial(port, serialdevice=serialdevice)
         except Exception as e:
             self.__logger.warning(f'Failed to initialize PiCamera {e}, loading TIS mocker')
             from imswitch.imcontrol.model.interfaces.tiscamera_mock import MockCameraTIS
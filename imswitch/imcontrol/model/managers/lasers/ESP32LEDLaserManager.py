@@ -44,6 +44,11 @@ class ESP32LEDLaserManager(LaserManager):
             self.laser_despeckle_period = 10 # ms
             self.__logger.debug("Laser despeckle disabled")
 
+        # all lasers and LEDs of the board share the setpoint coalescer of
+        # its serial link, getReturn=True bypasses it
+        self._setpoints = self._rs232manager._setpoints
+        self._setpoints.addChannel(self.channel_index, self._sendOutput)
+
         # set the laser to 0
         self.enabled = False
         self.setEnabled(self.enabled)
@@ -51,16 +56,7 @@ class ESP32LEDLaserManager(LaserManager):
     def setEnabled(self, enabled,  getReturn=False):
         """Turn on (N) or off (F) laser emission"""
         self.enabled = enabled
-        if self.channel_index == "LED":
-            #self._led.send_LEDMatrix_full(intensity = (self.power*self.enabled,self.power*self.enabled,self.power*self.enabled), getReturn=getReturn)
-            #self._led.setIntensity(intensity=(self.power*self.enabled,self.power*self.enabled,self.power*self.enabled), getReturn=getReturn)
-            self._led.setAll(state=self.enabled, intensity=(self.power, self.power, self.power), getReturn=getReturn)
-        else:
-            self._laser.set_laser(self.channel_index,
-                                                int(self.power*self.enabled),
-                                                despeckleAmplitude = self.laser_despeckle_amplitude,
-                                                despecklePeriod = self.laser_despeckle_period,
-                                                is_blocking=getReturn)
+        self._requestOutput(getReturn)
 
     def setValue(self, power, getReturn=False):
         """Handles output power.
@@ -68,21 +64,40 @@ class ESP32LEDLaserManager(LaserManager):
         """
         self.power = power
         if self.enabled:
-            
             if self.channel_index == "LED":
                 # ensure that in case it's not initialized yet, we display an all-on pattern
                 if self._led.ledpattern[0,0]==-1:
                     self._led.ledpattern[:]=1
-                self._led.setAll(state=1, intensity=(self.power, self.power, self.power), getReturn=getReturn)
-                #self._led.setAll(intensity=(self.power*self.enabled,self.power*self.enabled,self.power*self.enabled), getReturn=getReturn)
                 self.ledIntesity=self.power
-                #self._led.send_LEDMatrix_full(intensity = (self.power*self.enabled,self.power*self.enabled,self.power*self.enabled), getReturn=getReturn)
-            else:
-                self._laser.set_laser(self.channel_index,
-                                    int(self.power),
-                                    despeckleAmplitude = self.laser_despeckle_amplitude,
-                                    despecklePeriod = self.laser_despeckle_period,
-                                    is_blocking=getReturn)
+            self._requestOutput(getReturn)
+
+    def getSetpointState(self):
+        return self._setpoints.getState(self.channel_index)
+
+    def flushSetpoints(self, timeout=1.0):
+        return self._setpoints.flush(timeout)
+
+    def _requestOutput(self, getReturn=False):
+        if self.channel_index == "LED":
+            output = (bool(self.enabled), self.power)
+        else:
+            output = int(self.power*self.enabled)
+        if getReturn:
+            return self._setpoints.apply(self.channel_index, output,
+                                         send=lambda value: self._sendOutput(value, getReturn=True))
+        self._setpoints.request(self.channel_index, output)
+
+    def _sendOutput(self, output, getReturn=False):
+        if self.channel_index == "LED":
+            enabled, power = output
+            result = self._led.setAll(state=enabled, intensity=(power, power, power), getReturn=getReturn)
+            self._rs232manager.notifyLEDMatrixChanged()
+            return result
+        return self._laser.set_laser(self.channel_index,
+                                     output,
+                                     despeckleAmplitude = self.laser_despeckle_amplitude,
+                                     despecklePeriod = self.laser_despeckle_period,
+                                     is_blocking=getReturn)
 
     def sendTrigger(self, triggerId):
         self._esp32.digital.sendTrigger(triggerId)
@@ -98,13 +113,20 @@ class ESP32LEDLaserManager(LaserManager):
             scannerEnable, scannerxMin, scannerxMax, scanneryMin,
             scanneryMax, scannerXStep, scannerYStep, scannerLaserVal,
             scannerExposure, scannerDelay)
+    '''
+
+    def supportsScannerPatterns(self):
+        """ Whether the ESP32 client can display ISM scanner patterns; not
+        all uc2rest versions provide set_scanner_pattern. """
+        return hasattr(self._esp32, 'set_scanner_pattern')
 
     def sendScannerPattern(self, ismPatternIndex, scannernFrames=1,
             scannerLaserVal=32000, scannerExposure=500, scannerDelay=500, isBlocking=False):
-
-        self._rs232manager._esp32.set_scanner_pattern(ismPatternIndex, scannernFrames,
+        if not self.supportsScannerPatterns():
+            raise NotImplementedError('The ESP32 client does not support scanner patterns'
+                                      ' (no set_scanner_pattern in uc2rest)')
+        return self._esp32.set_scanner_pattern(ismPatternIndex, scannernFrames,
             scannerLaserVal, scannerExposure, scannerDelay, isBlocking)
-    '''
 
 
 
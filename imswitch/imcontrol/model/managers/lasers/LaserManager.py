@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from typing import Union
+from typing import Optional, Union
 
 
 class LaserManager(ABC):
@@ -123,6 +123,16 @@ class LaserManager(ABC):
     def setModulationDutyCycle(self, dutyCycle: int) -> None:
         """ Sets the laser modulation duty cycle. """
 
+    def getSetpointState(self) -> Optional[dict]:
+        """ Returns the requested and the applied output of the laser, if
+        the manager coalesces its setpoint commands, otherwise None. """
+        return None
+
+    def flushSetpoints(self, timeout: float = 1.0) -> bool:
+        """ Waits until requested setpoints that are held back have been
+        sent. Returns False on timeout. """
+        return True
+
     def setScanModeActive(self, active: bool) -> None:
         """ Sets whether the laser should be in scan mode (if the laser
         supports it). """
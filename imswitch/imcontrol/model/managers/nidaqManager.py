@@ -9,10 +9,14 @@ import numpy as np
 
 from imswitch.imcommon.framework import Signal, SignalInterface, Thread
 from imswitch.imcommon.model import initLogger
+from ..interfaces.daqsimulator import SimulatedDAQTask
+from ..scanstreaming import OutputStreamer, SignalStream
 
 
 class NidaqManager(SignalInterface):
-    """ For interaction with NI-DAQ hardware interfaces. """
+    """ For interaction with NI-DAQ hardware interfaces. setupInfo is the
+    SetupInfo of the setup, whose nidaq field configures the device and whose
+    devices are the targets of scans. """
 
     sigScanBuilt = Signal(object, object, object)  # (scanInfoDict, signalDict, deviceList)
     sigScanStarted = Signal()
@@ -20,7 +24,9 @@ class NidaqManager(SignalInterface):
 
     sigScanBuildFailed = Signal()
 
-    def __init__(self, setupInfo):
+    _sigStreamFailed = Signal(object)  # (exception)
+
+    def __init__(self, setupInfo, streamBufferChunks=4):
         super().__init__()
         self.__logger = initLogger(self)
 
@@ -29,10 +35,18 @@ class NidaqManager(SignalInterface):
         self.doTaskWaiter = None
         self.aoTaskWaiter = None
         self.timerTaskWaiter = None
+        self.streamer = None
+        self.streamBufferChunks = streamBufferChunks
         self.busy = False
-        if self.__setupInfo is not None:
-            self.__timerCounterChannel = setupInfo.getTimerCounterChannel()
-            self.__startTrigger = setupInfo.startTrigger
+        nidaqInfo = setupInfo.nidaq if setupInfo is not None else None
+        self.__simulated = nidaqInfo is not None and nidaqInfo.simulated
+        self.__timerCounterChannel = None
+        self.__startTrigger = False
+        if nidaqInfo is not None:
+            self.__timerCounterChannel = nidaqInfo.getTimerCounterChannel()
+            self.__startTrigger = nidaqInfo.startTrigger
+
+        self._sigStreamFailed.connect(self.__streamFailed)
 
     def __del__(self):
         for taskWaiter in [self.doTaskWaiter, self.aoTaskWaiter, self.timerTaskWaiter]:
@@ -59,6 +73,8 @@ class NidaqManager(SignalInterface):
                            reference_trigger='ai/StartTrigger'):
         """ Simplified function to create an analog output task """
         #self.__logger.debug(f'Create AO task: {name}')
+        if self.__simulated:
+            return self.__createSimulatedTask(name, acquisitionType, rate, sampsInScan)
         aotask = nidaqmx.Task(name)
         channels = np.atleast_1d(channels)
 
@@ -77,6 +93,8 @@ class NidaqManager(SignalInterface):
     def __createLineDOTask(self, name, lines, acquisitionType, source, rate, sampsInScan=1000,
                            starttrig=False, reference_trigger='ai/StartTrigger'):
         """ Simplified function to create a digital output task """
+        if self.__simulated:
+            return self.__createSimulatedTask(name, acquisitionType, rate, sampsInScan)
         dotask = nidaqmx.Task(name)
 
         lines = np.atleast_1d(lines)
@@ -122,13 +140,13 @@ class NidaqManager(SignalInterface):
         return citask
 
     def __createChanCOTask(self, name, channel, rate, sampsInScan=1000, starttrig=False,
-                           reference_trigger='ai/StartTrigger'):
+                           reference_trigger='ai/StartTrigger',
+                           acquisitionType=nidaqmx.constants.AcquisitionType.FINITE):
         cotask = nidaqmx.Task(name)
         self.cotaskchannel = cotask.co_channels.add_co_pulse_chan_freq(
             channel, freq=rate, units=nidaqmx.constants.FrequencyUnits.HZ
         )
-        # cotask.timing.cfg_implicit_timing(sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS)
-        cotask.timing.cfg_implicit_timing(sample_mode=nidaqmx.constants.AcquisitionType.FINITE,
+        cotask.timing.cfg_implicit_timing(sample_mode=acquisitionType,
                                           samps_per_chan=sampsInScan)
 
         if starttrig:
@@ -155,6 +173,22 @@ class NidaqManager(SignalInterface):
         #self.__logger.debug(f'Created AI task: {name}')
         return aitask
 
+    @staticmethod
+    def __createSimulatedTask(name, acquisitionType, rate, sampsInScan):
+        continuous = acquisitionType == nidaqmx.constants.AcquisitionType.CONTINUOUS
+        return SimulatedDAQTask(name, rate, numSamples=None if continuous else sampsInScan)
+
+    @staticmethod
+    def __configureStreaming(task, bufferSize):
+        """ Makes task generate from a buffer of bufferSize samples, that is
+        refilled while the task runs, instead of regenerating its buffer. """
+        if isinstance(task, SimulatedDAQTask):
+            task.bufferSize = bufferSize
+            task.regenerate = False
+        else:
+            task.out_stream.output_buf_size = bufferSize
+            task.out_stream.regen_mode = nidaqmx.constants.RegenerationMode.DONT_ALLOW_REGENERATION
+
     def startInputTask(self, taskName, taskType, *args):
         if taskType == 'ai':
             task = self.__createChanAITask(taskName, *args)
@@ -245,138 +279,213 @@ class NidaqManager(SignalInterface):
     def runScan(self, signalDic, scanInfoDict):
         """ Function assuming that the user wants to run a full scan with a stage
         controlled by analog voltage outputs and a cycle of TTL pulses continuously
-        running. """
+        running. signalDic is either the signal dict of the scan manager or a
+        SignalStream, whose chunks are written to the tasks while the scan runs
+        so that only a few chunks are held in the output buffers. """
+        self.__runScan(signalDic, scanInfoDict, continuous=False)
+
+    def runContinuousScan(self, signalDic, scanInfoDict):
+        """ Runs the scan in the signal dict signalDic, e.g. one frame, over
+        and over until stopScan is called. The signals are written once and
+        regenerated by the device, so that no tasks are created between the
+        repetitions. """
+        self.__runScan(signalDic, scanInfoDict, continuous=True)
+
+    def stopScan(self):
+        """ Stops the running scan and closes its tasks. """
+        if not self.busy:
+            return
+        for taskWaiter in [self.doTaskWaiter, self.aoTaskWaiter, self.timerTaskWaiter]:
+            if taskWaiter is not None:
+                taskWaiter.stopping = True  # errors of the stopped tasks are expected
+        if self.streamer is not None:
+            self.streamer.stop()
+        for taskName in list(self.tasks):
+            try:
+                self.stopTask(taskName)
+            except Exception:
+                self.__logger.error(traceback.format_exc())
+        self.scanDone()
+
+    def getScanStatistics(self):
+        """ Returns the streaming statistics of the running or last streamed
+        scan. """
+        return self.streamer.getStatistics() if self.streamer is not None else {}
+
+    def __runScan(self, signalDic, scanInfoDict, continuous):
         if not self.busy:
             self.busy = True
             self.signalSent = False
+            self.streamer = None
             self.__logger.debug('Create nidaq scan...')
 
             try:
-                # TODO: fill this
-                stageDic = signalDic['scanSignalsDict']
-                ttlDic = signalDic['TTLCycleSignalsDict']
+                isStream = isinstance(signalDic, SignalStream)
+                if isStream and continuous:
+                    raise NidaqManagerError('A signal stream cannot be regenerated')
+                if isStream:
+                    stageTargets = signalDic.scanTargets
+                    ttlTargets = signalDic.TTLTargets
+                else:
+                    stageTargets = stageDic = signalDic['scanSignalsDict']
+                    ttlTargets = ttlDic = signalDic['TTLCycleSignalsDict']
 
                 AOTargetChanPairs = self.__makeSortedTargets('getAnalogChannel')
                 AOdevices = []
-                AOsignals = []
                 AOchannels = []
 
                 for device, channel in AOTargetChanPairs:
                     #self.__logger.debug(f'Device {device}, channel {channel} is part of scan')
-                    if device not in stageDic:
+                    if device not in stageTargets:
                         continue
                     AOdevices.append(device)
-                    AOsignals.append(stageDic[device])
                     AOchannels.append(channel)
 
                 DOTargetChanPairs = self.__makeSortedTargets('getDigitalLine')
                 DOdevices = []
-                DOsignals = []
+                DOtargets = []
                 DOlines = []
 
                 for device, line in DOTargetChanPairs:
-                    if device not in ttlDic or 'Dev' not in line:
+                    if device not in ttlTargets or 'Dev' not in line:
                         continue
                     DOdevices.append(device)
-                    DOsignals.append(ttlDic[device])
+                    DOtargets.append(device)
                     DOlines.append(line)
                 
                 # check if line and frame clock should be outputted, if so add to DO lists
-                if self.__setupInfo.scan.lineClockLine:
+                scanInfo = self.__setupInfo.scan
+                if scanInfo is not None and scanInfo.lineClockLine:
                     DOdevices.append('LineClock')
-                    DOsignals.append(ttlDic['line_clock'])
-                    DOlines.append(self.__setupInfo.scan.lineClockLine)
-                if self.__setupInfo.scan.frameClockLine:
+                    DOtargets.append('line_clock')
+                    DOlines.append(scanInfo.lineClockLine)
+                if scanInfo is not None and scanInfo.frameClockLine:
                     DOdevices.append('FrameClock')
-                    DOsignals.append(ttlDic['frame_clock'])
-                    DOlines.append(self.__setupInfo.scan.frameClockLine)
+                    DOtargets.append('frame_clock')
+                    DOlines.append(scanInfo.frameClockLine)
 
-                if len(AOsignals) < 1 and len(DOsignals) < 1:
+                if len(AOdevices) < 1 and len(DOdevices) < 1:
                     raise NidaqManagerError('No signals to send')
 
+                if isStream:
+                    sampsInScan = signalDic.numSamples
+                    bufferSize = signalDic.chunkSize * self.streamBufferChunks
+                else:
+                    AOsignals = [stageDic[device] for device in AOdevices]
+                    DOsignals = [ttlDic[target] for target in DOtargets]
+                    sampsInScan = len((AOsignals + DOsignals)[0])
+
+                if continuous:
+                    acquisitionType = nidaqmx.constants.AcquisitionType.CONTINUOUS
+                else:
+                    acquisitionType = nidaqmx.constants.AcquisitionType.FINITE
+
                 # create task waiters and change constants for beginning scan
                 self.aoTaskWaiter = WaitThread()
                 self.doTaskWaiter = WaitThread()
-                if self.__timerCounterChannel is not None:
+                if self.__timerCounterChannel is not None and not self.__simulated:
                     self.timerTaskWaiter = WaitThread()
                     # create timer counter output task, to control the acquisition timing (1 MHz)
-                    detSampsInScan = int(
-                        len(AOsignals[0] if len(AOsignals) > 0 else DOsignals[0]) * (1e6/100e3)
-                    )
+                    detSampsInScan = int(sampsInScan * (1e6/100e3))
                     #self.__logger.debug(f'Total detection samples in scan: {detSampsInScan}')
                     self.timerTask = self.__createChanCOTask(
                         'TimerTask', channel=self.__timerCounterChannel, rate=1e6,
                         sampsInScan=detSampsInScan, starttrig=self.__startTrigger,
-                        reference_trigger='ao/StartTrigger'
-                    )
-                    self.timerTaskWaiter.connect(self.timerTask)
-                    self.timerTaskWaiter.sigWaitDone.connect(
-                        lambda: self.taskDone('timer', self.timerTaskWaiter)
+                        reference_trigger='ao/StartTrigger', acquisitionType=acquisitionType
                     )
                     self.tasks['timer'] = self.timerTask
-                acquisitionTypeFinite = nidaqmx.constants.AcquisitionType.FINITE
+                    if not continuous:
+                        self.timerTaskWaiter.connect(self.timerTask)
+                        self.timerTaskWaiter.sigWaitDone.connect(
+                            lambda: self.taskDone('timer', self.timerTaskWaiter)
+                        )
                 scanclock = r'100kHzTimebase'
                 clockDO = scanclock
-                if len(AOsignals) > 0:
-                    scanSampsInScan = len(AOsignals[0])
-                    self.__logger.debug(f'Total scan samples in scan: {scanSampsInScan}')
+                outputs = []
+                if len(AOdevices) > 0:
+                    self.__logger.debug(f'Total scan samples in scan: {sampsInScan}')
                     self.aoTask = self.__createChanAOTask('ScanAOTask', AOchannels,
-                                                          acquisitionTypeFinite, scanclock,
+                                                          acquisitionType, scanclock,
                                                           100000, min_val=-10, max_val=10,
-                                                          sampsInScan=scanSampsInScan,
+                                                          sampsInScan=sampsInScan,
                                                           starttrig=False)
                     self.tasks['ao'] = self.aoTask
 
-                    # Important to squeeze the array, otherwise we might get an "invalid number of
-                    # channels" error
-                    self.aoTask.write(np.array(AOsignals).squeeze(), auto_start=False)
-
-                    self.aoTaskWaiter.connect(self.aoTask)
-                    self.aoTaskWaiter.sigWaitDone.connect(
-                        lambda: self.taskDone('ao', self.aoTaskWaiter)
-                    )
+                    if isStream:
+                        self.__configureStreaming(self.aoTask, bufferSize)
+                        outputs.append((self.aoTask, 'scanSignalsDict', AOdevices, float))
+                    else:
+                        # Important to squeeze the array, otherwise we might get an "invalid
+                        # number of channels" error
+                        self.aoTask.write(np.array(AOsignals).squeeze(), auto_start=False)
+
+                    if not continuous:
+                        self.aoTaskWaiter.connect(self.aoTask)
+                        self.aoTaskWaiter.sigWaitDone.connect(
+                            lambda: self.taskDone('ao', self.aoTaskWaiter)
+                        )
                     clockDO = r'ao/SampleClock'
-                if len(DOsignals) > 0:
-                    scanSampsInScan = len(DOsignals[0])
+                if len(DOdevices) > 0:
                     self.doTask = self.__createLineDOTask('ScanDOTask', DOlines,
-                                                          acquisitionTypeFinite, clockDO,
-                                                          100000, sampsInScan=scanSampsInScan,
+                                                          acquisitionType, clockDO,
+                                                          100000, sampsInScan=sampsInScan,
                                                           starttrig=self.__startTrigger,
                                                           reference_trigger='ao/StartTrigger')
                     self.tasks['do'] = self.doTask
 
-                    # Important to squeeze the array, otherwise we might get an "invalid number of
-                    # channels" error
-                    self.doTask.write(np.array(DOsignals).squeeze(), auto_start=False)
+                    if isStream:
+                        self.__configureStreaming(self.doTask, bufferSize)
+                        outputs.append((self.doTask, 'TTLCycleSignalsDict', DOtargets, bool))
+                    else:
+                        # Important to squeeze the array, otherwise we might get an "invalid
+                        # number of channels" error
+                        self.doTask.write(np.array(DOsignals).squeeze(), auto_start=False)
+
+                    if not continuous:
+                        self.doTaskWaiter.connect(self.doTask)
+                        self.doTaskWaiter.sigWaitDone.connect(
+                            lambda: self.taskDone('do', self.doTaskWaiter)
+                        )
 
-                    self.doTaskWaiter.connect(self.doTask)
-                    self.doTaskWaiter.sigWaitDone.connect(
-                        lambda: self.taskDone('do', self.doTaskWaiter)
-                    )
+                if isStream:
+                    # fill the output buffers before the tasks start
+                    self.streamer = OutputStreamer(signalDic, outputs,
+                                                   prefillChunks=self.streamBufferChunks,
+                                                   onError=self._sigStreamFailed.emit)
+                    self.streamer.prefill()
             except Exception:
                 self.__logger.error(traceback.format_exc())
                 for task in self.tasks.values():
                     task.close()
                 self.tasks = {}
+                self.streamer = None
                 self.busy = False
                 self.sigScanBuildFailed.emit()
             else:
                 self.sigScanBuilt.emit(scanInfoDict, signalDic, AOdevices + DOdevices)
 
-                if self.__timerCounterChannel is not None:
+                if 'timer' in self.tasks:
                     self.tasks['timer'].start()
                     self.timerTaskWaiter.start()
-                if len(DOsignals) > 0:
+                if 'do' in self.tasks:
                     self.tasks['do'].start()
                     self.doTaskWaiter.start()
 
-                if len(AOsignals) > 0:
+                if 'ao' in self.tasks:
                     self.tasks['ao'].start()
                     self.aoTaskWaiter.start()
+                if self.streamer is not None:
+                    self.streamer.start()
                 self.sigScanStarted.emit()
                 self.__logger.info('Nidaq scan started!')
 
+    def __streamFailed(self, error):
+        self.__logger.error(f'Nidaq scan aborted: {error}')
+        self.stopScan()
+
     def stopTask(self, taskName):
+        if taskName not in self.tasks:
+            return
         self.tasks[taskName].stop()
         self.tasks[taskName].close()
         del self.tasks[taskName]
@@ -399,25 +508,29 @@ class NidaqManager(SignalInterface):
         self.__logger.info('Nidaq scan finished!')
         self.sigScanDone.emit()
 
-    def runContinuous(self, digital_targets, digital_signals):
-        pass
-
 
 class WaitThread(Thread):
     sigWaitDone = Signal()
 
     def __init__(self, *args, **lowLevelManagers):
         super().__init__(*args, **lowLevelManagers)
+        self.__logger = initLogger(self)
         self.task = None
         self.running = False
+        self.stopping = False
 
     def connect(self, task):
         self.task = task
         self.running = True
+        self.stopping = False
 
     def run(self):
         if self.running:
-            self.task.wait_until_done(nidaqmx.constants.WAIT_INFINITELY)
+            try:
+                self.task.wait_until_done(nidaqmx.constants.WAIT_INFINITELY)
+            except Exception:
+                if not self.stopping:
+                    self.__logger.error(traceback.format_exc())
             self.close()
         else:
             self.quit()
@@ -18,7 +18,8 @@ class ESP32StageManager(PositionerManager):
         self._homeModule = self._rs232manager._esp32.home
 
         # get bootup position and write to GUI
-        self._position = self.getPosition()
+        self._positionFromCallbacks = False
+        self._position = self.getPosition(refresh=True)
 
         # Calibrated stepsizes in steps/µm
         self.stepSizes = {}
@@ -145,6 +146,7 @@ class ESP32StageManager(PositionerManager):
         # try to register the callback
         try:
             self._motor.register_callback(0,callbackfct=self.setPositionFromDevice)
+            self._positionFromCallbacks = True
         except Exception as e:
             self.__logger.error(f"Could not register callback: {e}")
 
@@ -323,7 +325,15 @@ class ESP32StageManager(PositionerManager):
     def closeEvent(self):
         pass
 
-    def getPosition(self):
+    @property
+    def multiAxisMoves(self):
+        return ["XY", "XYZ"]
+
+    def getPosition(self, refresh=False):
+        # the device reports its position through the callback, so the cached
+        # position is served unless a refresh is requested
+        if self._positionFromCallbacks and not refresh:
+            return dict(self._position)
         # load position from device
         # t,x,y,z
         try:
@@ -1,3 +1,6 @@
+import concurrent.futures
+import inspect
+import threading
 from abc import ABC, abstractmethod
 
 from typing import Dict, List
@@ -50,6 +53,8 @@ class PositionerManager(ABC):
         self.__forPositioning = positionerInfo.forPositioning
         self.__forScanning = positionerInfo.forScanning
         self.__resetOnClose = positionerInfo.resetOnClose
+        self.__commandQueue = None
+        self.__commandQueueLock = threading.Lock()
         if not positionerInfo.forPositioning and not positionerInfo.forScanning:
             raise ValueError('At least one of forPositioning and forScanning must be set in'
                              ' PositionerInfo.')
@@ -103,6 +108,12 @@ class PositionerManager(ABC):
         """ Whether the positioner should be reset to 0-position upon closing. """
         return self.__resetOnClose
 
+    @property
+    def multiAxisMoves(self) -> List[str]:
+        """ The combined axes, e.g. ``XY``, that move() accepts a tuple of
+        values for. Used by the command queue to merge single-axis moves. """
+        return []
+
     @abstractmethod
     def move(self, dist: float, axis: str):
         """ Moves the positioner by the specified distance and returns the new
@@ -130,15 +141,198 @@ class PositionerManager(ABC):
 
         pass
 
+    def moveAsync(self, value, axis: str, is_absolute: bool = False,
+                  **kwargs) -> concurrent.futures.Future:
+        """ Queues a move and returns immediately with a future that resolves
+        to the position dict once the move is done. Moves are executed in
+        order on a worker thread; moves that are still waiting when a new one
+        is queued are merged with it (see PositionerCommandQueue). Extra
+        keyword arguments are passed on to move(). Raises an error right away
+        if move() of this positioner does not take the move. """
+        moveKwargs = dict(kwargs)
+        if _acceptsKeyword(self.move, 'is_absolute'):
+            moveKwargs['is_absolute'] = is_absolute
+        elif is_absolute:
+            raise ValueError(f'{type(self).__name__} does not support queued absolute moves')
+        try:
+            inspect.signature(self.move).bind(value, axis, **moveKwargs)
+        except TypeError as e:
+            raise TypeError(f'{type(self).__name__} does not support queued moves with these'
+                            f' arguments: {e}') from None
+
+        with self.__commandQueueLock:
+            if self.__commandQueue is None:
+                self.__commandQueue = PositionerCommandQueue(self)
+        return self.__commandQueue.submit(value, axis, is_absolute, **kwargs)
+
+    def waitForMoves(self, timeout: float = None) -> bool:
+        """ Blocks until all queued moves are done. Returns False on timeout. """
+        if self.__commandQueue is None:
+            return True
+        return self.__commandQueue.wait(timeout)
+
+    def getCommandQueueStatistics(self) -> Dict[str, int]:
+        """ Returns the number of submitted, executed and merged moves. """
+        if self.__commandQueue is None:
+            return {'submitted': 0, 'executed': 0, 'merged': 0}
+        return self.__commandQueue.getStatistics()
+
     def finalize(self) -> None:
         """ Close/cleanup positioner. """
-        pass
+        with self.__commandQueueLock:
+            if self.__commandQueue is not None:
+                self.__commandQueue.close()
     
     def enableMotors(self, enable: bool=None, autoenable:bool=None) -> None:
         """ Enable/disable motors. """
         pass
 
 
+class PositionerCommandQueue:
+    """ Executes the moves of a positioner in submission order on a worker
+    thread.
+
+    A move that is still waiting when a new one arrives is merged with it if
+    both use the same move() options: relative moves on the same axis add
+    up, absolute moves replace whatever was queued for their axis, and moves
+    on different axes are combined into one multi-axis move if the
+    positioner lists it in multiAxisMoves. The futures of all merged moves
+    resolve together. """
+
+    def __init__(self, positioner):
+        self._positioner = positioner
+        self._passAbsolute = _acceptsKeyword(positioner.move, 'is_absolute')
+        self._queue = []
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._numSubmitted = 0
+        self._numExecuted = 0
+        self._numMerged = 0
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f'PositionerCommandQueue {positioner.name}')
+        self._thread.start()
+
+    def submit(self, value, axis, is_absolute=False, **kwargs):
+        if isinstance(value, (tuple, list)):
+            targets = {a: (v, is_absolute) for a, v in zip(axis, value)}
+        else:
+            targets = {axis: (value, is_absolute)}
+        future = concurrent.futures.Future()
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f'The command queue of {self._positioner.name} is closed')
+            self._numSubmitted += 1
+            if self._queue and self._merge(self._queue[-1], targets, kwargs):
+                self._queue[-1]['futures'].append(future)
+                self._numMerged += 1
+            else:
+                self._queue.append({'targets': targets, 'kwargs': kwargs, 'futures': [future]})
+            self._condition.notify_all()
+        return future
+
+    def close(self, timeout=5.0):
+        """ Cancels the moves that have not started and stops the worker
+        thread once the running move is done. """
+        with self._condition:
+            self._closed = True
+            for command in self._queue:
+                for future in command['futures']:
+                    future.cancel()
+            self._queue = []
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def wait(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._busy,
+                                            timeout)
+
+    def getStatistics(self):
+        with self._condition:
+            return {'submitted': self._numSubmitted,
+                    'executed': self._numExecuted,
+                    'merged': self._numMerged}
+
+    def _merge(self, command, targets, kwargs):
+        if command['kwargs'] != kwargs:
+            return False
+
+        merged = dict(command['targets'])
+        for axis, (value, isAbsolute) in targets.items():
+            if axis in merged and not isAbsolute:
+                previousValue, previousIsAbsolute = merged[axis]
+                merged[axis] = (previousValue + value, previousIsAbsolute)
+            else:
+                merged[axis] = (value, isAbsolute)
+
+        if len(merged) > 1:
+            # A multi-axis move takes a single absolute/relative flag
+            if (self._multiAxisName(merged) is None
+                    or len({isAbsolute for _, isAbsolute in merged.values()}) > 1):
+                return False
+
+        command['targets'] = merged
+        return True
+
+    def _multiAxisName(self, targets):
+        for name in self._positioner.multiAxisMoves:
+            if set(name) == set(targets):
+                return name
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                command = self._queue.pop(0)
+                self._busy = True
+
+            try:
+                self._execute(command)
+                result = dict(self._positioner.position)
+                for future in command['futures']:
+                    future.set_result(result)
+            except Exception as e:
+                for future in command['futures']:
+                    future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._numExecuted += 1
+                    self._condition.notify_all()
+
+    def _execute(self, command):
+        targets, kwargs = command['targets'], command['kwargs']
+        if len(targets) > 1:
+            name = self._multiAxisName(targets)
+            isAbsolute = next(iter(targets.values()))[1]
+            value = tuple(targets[axis][0] for axis in name)
+            axis = name
+        else:
+            (axis, (value, isAbsolute)), = targets.items()
+
+        # move() signatures differ between positioners, only value and axis are common
+        if self._passAbsolute:
+            kwargs = dict(kwargs, is_absolute=isAbsolute)
+        self._positioner.move(value, axis, **kwargs)
+
+
+def _acceptsKeyword(func, name):
+    """ Returns whether func can be called with the keyword argument name. """
+    for parameter in inspect.signature(func).parameters.values():
+        if parameter.kind == inspect.Parameter.VAR_KEYWORD:
+            return True
+        if parameter.name == name and parameter.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                                         inspect.Parameter.KEYWORD_ONLY):
+            return True
+    return False
+
+
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -111,6 +111,7 @@ class SmarACTPositionerManager(PositionerManager):
 
         """
         self.__logger__.info('Closing system')
+        super().finalize()
         self.ExitIfError(SA_CloseSystem(self.mcsHandle))
 
 
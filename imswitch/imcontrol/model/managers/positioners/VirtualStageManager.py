@@ -39,6 +39,10 @@ class VirtualStageManager(PositionerManager):
 
         
 
+    @property
+    def multiAxisMoves(self):
+        return ["XY", "XYZ"]
+
     def moveForever(self, speed=(0, 0, 0, 0), is_stop=False):
         pass
 
@@ -1,6 +1,7 @@
 import uc2rest as uc2  # pip install UC2-REST
 from imswitch.imcommon.model import initLogger
 from imswitch.imcommon.model import APIExport
+from imswitch.imcontrol.model.setpoints import SetpointCoalescer
 
 class ESP32Manager:
     """ A low-level wrapper for TCP-IP communication (ESP32 REST API)
@@ -38,13 +39,45 @@ class ESP32Manager:
         except:
             baudrate = 115200
 
+        # optionally talk to a simulated UC2 firmware instead of a board
+        self._simulator = None
+        simulatorSettings = rs232Info.managerProperties.get('simulator')
+        if simulatorSettings is not None:
+            from imswitch.imcontrol.model.interfaces.serialsimulator import createSimulatedDevice
+            self._simulator = createSimulatedDevice(
+                {'protocol': 'uc2', 'baudrate': baudrate, **simulatorSettings}, name=name
+            )
+            self._serialport = self._simulator.portInfo()
+            self.__logger.info(f'Using simulated UC2 device on {self._serialport.device}')
 
         # initialize the ESP32 device adapter
         self._esp32 = uc2.UC2Client(host=self._host, port=80, identity=self._identity, serialport=self._serialport, baudrate=baudrate, DEBUG=self._debugging, logger=self.__logger)
 
+        # laser and LED setpoints share the link with stage and scan traffic,
+        # so bursts of changes are coalesced to one command per window
+        self._setpoints = SetpointCoalescer(
+            window=rs232Info.managerProperties.get('setpointWindow', 0.02), name=name
+        )
+
+        # the LED matrix is written by the LED matrix managers and the "LED"
+        # channel of the laser managers; they are told of each other's writes
+        self._ledMatrixListeners = []
+
+    def addLEDMatrixListener(self, callback):
+        """ Registers callback to be called, without arguments, whenever the
+        LED matrix of the board is set, see notifyLEDMatrixChanged. """
+        self._ledMatrixListeners.append(callback)
+
+    def notifyLEDMatrixChanged(self):
+        """ To be called after the LED matrix of the board was set. """
+        for callback in self._ledMatrixListeners:
+            callback()
 
     def finalize(self):
+        self._setpoints.close()
         self._esp32.close()
+        if self._simulator is not None:
+            self._simulator.close()
 
 
 # Copyright (C) 2020-2023 ImSwitch developers
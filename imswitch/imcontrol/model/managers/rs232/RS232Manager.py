@@ -20,6 +20,9 @@ class RS232Manager:
     - ``rtscts``
     - ``dsrdtr``
     - ``xonxoff``
+    - ``simulator`` -- optional settings of a simulated device to use
+      instead of the port, e.g. ``{"protocol": "grbl", "commandTime": 0.001}``
+      (see ``interfaces.serialsimulator.createSimulatedDevice``)
     """
 
     def __init__(self, rs232Info, name, **_lowLevelManagers):
@@ -28,7 +31,10 @@ class RS232Manager:
         self._settings = rs232Info.managerProperties
         self._name = name
         self._port = rs232Info.managerProperties['port']
-        self._rs232port = self._getRS232port(self._port, self._settings)
+        if self._settings.get('simulator') is not None:
+            self._rs232port = self._getSimulatedPort(name, self._settings)
+        else:
+            self._rs232port = self._getRS232port(self._port, self._settings)
 
     def query(self, arg: str) -> str:
         """ Sends the specified command to the RS232 device and returns a
@@ -54,6 +60,15 @@ class RS232Manager:
             from imswitch.imcontrol.model.interfaces.RS232Driver_mock import MockRS232Driver
             return MockRS232Driver(port, settings)
 
+    def _getSimulatedPort(self, name, settings):
+        from imswitch.imcontrol.model.interfaces.serialsimulator import (
+            SimulatedRS232Driver, createSimulatedDevice
+        )
+        simulatorSettings = dict(settings['simulator'])
+        simulatorSettings.setdefault('baudrate', settings.get('baudrate'))
+        self.__logger.info(f'Using simulated device for {name}')
+        return SimulatedRS232Driver(createSimulatedDevice(simulatorSettings, name=name), settings)
+
 
 # Copyright (C) 2020-2023 ImSwitch developers
 # This file is part of ImSwitch.
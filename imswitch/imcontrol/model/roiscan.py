@@ -0,0 +1,221 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcommon.model import initLogger
+
+
+@dataclass
+class ScanPosition:
+    """ A stage position visited by the ROI scan. """
+
+    id: int
+    x: float
+    y: float
+    z: float
+
+    @property
+    def xyz(self):
+        return np.array([self.x, self.y, self.z], dtype=float)
+
+
+def scanPositionsFromDicts(positions):
+    """ Returns ScanPositions for a list of {"x", "y", "z"} dicts with an
+    optional "id". Positions without an id get the lowest ids not given to
+    another position. Raises ValueError if an id is given twice. """
+    ids = [p["id"] for p in positions if "id" in p]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f'Duplicate scan position ids: {duplicates}')
+
+    taken = set(ids)
+    freeIds = (i for i in itertools.count(1) if i not in taken)
+    return [ScanPosition(p["id"] if "id" in p else next(freeIds), p["x"], p["y"], p["z"])
+            for p in positions]
+
+
+def pathLength(points, order, start=None):
+    """ Returns the length of the path visiting points (N, D) in order,
+    starting at start if given. """
+    path = points[list(order)]
+    if start is not None:
+        path = np.vstack([np.asarray(start, dtype=float)[None], path])
+    return float(np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1)))
+
+
+def orderPositions(points, start=None):
+    """ Returns the visiting order of points (N, D) that keeps the travel
+    distance short: a nearest-neighbour path from start (or the first point),
+    improved by 2-opt moves until no segment reversal shortens it. """
+    points = np.asarray(points, dtype=float)
+    numPoints = len(points)
+    if numPoints < 3:
+        if start is None or numPoints < 2:
+            return list(range(numPoints))
+        first = int(np.argmin(np.linalg.norm(points - np.asarray(start, dtype=float), axis=1)))
+        return [first, 1 - first]
+
+    # The path starts at a fixed node: start, or point 0 if there is none
+    nodes = points if start is None else np.vstack([np.asarray(start, dtype=float)[None], points])
+    distances = np.linalg.norm(nodes[:, None] - nodes[None], axis=-1)
+
+    path = [0]
+    unvisited = np.ones(len(nodes), dtype=bool)
+    unvisited[0] = False
+    for _ in range(len(nodes) - 1):
+        candidates = np.where(unvisited, distances[path[-1]], np.inf)
+        nextNode = int(np.argmin(candidates))
+        path.append(nextNode)
+        unvisited[nextNode] = False
+
+    # 2-opt on an open path: reverse path[i:j + 1] if it shortens the path
+    path = np.array(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            before = path[i - 1]
+            current = distances[before, path[i]]
+            for j in range(i + 1, len(path)):
+                after = path[j + 1] if j + 1 < len(path) else None
+                delta = distances[before, path[j]] - current
+                if after is not None:
+                    delta += distances[path[i], after] - distances[path[j], after]
+                if delta < -1e-9:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    current = distances[before, path[i]]
+                    improved = True
+
+    order = path.tolist() if start is None else [node - 1 for node in path[1:]]
+    return order
+
+
+class SettleModel:
+    """ Time to wait after a move for the stage to settle: minTime plus
+    timePerDistance for every stage unit moved, at most maxTime. """
+
+    def __init__(self, minTime=0.05, timePerDistance=2e-5, maxTime=0.5):
+        self.minTime = minTime
+        self.timePerDistance = timePerDistance
+        self.maxTime = maxTime
+
+    def settleTime(self, distance):
+        return min(self.maxTime, self.minTime + self.timePerDistance * abs(distance))
+
+
+class PositionStackWriter:
+    """ Writes the time series of every scan position to its own BigTIFF file
+    on a background thread.
+
+    Files are named <prefix>_pos<id>.tif and stay open for appending, so an
+    experiment produces one file per position however many rounds it runs.
+    Each page description holds the position coordinates, round and
+    timestamp as JSON. """
+
+    def __init__(self, dirPath, prefix, maxQueued=256):
+        self.__logger = initLogger(self)
+        self.dirPath = dirPath
+        self.prefix = prefix
+        self.numWritten = 0
+        self._files = {}
+        self._queue = queue.Queue(maxsize=maxQueued)
+        self._thread = threading.Thread(target=self._run, name='PositionStackWriter', daemon=True)
+        self._thread.start()
+
+    def filePath(self, positionId):
+        return os.path.join(self.dirPath, f'{self.prefix}_pos{positionId}.tif')
+
+    def write(self, position, frame, metadata):
+        """ Queues frame, taken at ScanPosition position. """
+        self._queue.put((position, frame, metadata))
+
+    def close(self):
+        """ Writes the remaining frames and closes all files. """
+        self._queue.put(None)
+        self._thread.join()
+        for tiff in self._files.values():
+            tiff.close()
+        self._files.clear()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            position, frame, metadata = item
+            try:
+                if position.id not in self._files:
+                    self._files[position.id] = tif.TiffWriter(
+                        self.filePath(position.id), bigtiff=True, append=True
+                    )
+                description = json.dumps({**asdict(position), **metadata})
+                self._files[position.id].write(np.asarray(frame), description=description,
+                                               metadata=None, contiguous=False)
+                self.numWritten += 1
+            except Exception:
+                self.__logger.exception(f'Failed to write frame of position {position.id}')
+
+
+class ROIScanRound:
+    """ Visits positions in a precomputed order, waits a settle time that
+    depends on the move distance and hands one frame per position to a
+    writer. Every other round runs the order backwards, so that a round starts
+    where the previous one ended. """
+
+    def __init__(self, positions, moveTo, grabFrame, writer, settleModel=None, start=None):
+        self.positions = list(positions)
+        self.order = orderPositions([p.xyz for p in self.positions], start)
+        self._moveTo = moveTo
+        self._grabFrame = grabFrame
+        self._writer = writer
+        self.settleModel = settleModel or SettleModel()
+        self._current = None if start is None else np.asarray(start, dtype=float)
+
+    def run(self, roundIndex, isRunning=lambda: True, onPosition=None):
+        """ Runs one round and returns the frames taken, in visiting order. """
+        order = self.order if roundIndex % 2 == 0 else self.order[::-1]
+        frames = []
+        for index in order:
+            if not isRunning():
+                break
+            position = self.positions[index]
+            if onPosition is not None:
+                onPosition(position)
+            distance = (np.linalg.norm(position.xyz - self._current)
+                        if self._current is not None else np.inf)
+            if distance > 0:
+                self._moveTo(position)
+                time.sleep(self.settleModel.settleTime(distance))
+            self._current = position.xyz
+
+            frame = self._grabFrame()
+            if frame is None:
+                continue
+            frame = np.array(frame)
+            self._writer.write(position, frame, {'round': roundIndex, 'timestamp': time.time()})
+            frames.append(frame)
+        return frames
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,197 @@
+import threading
+import time
+
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+UNDERRUN_ERROR_CODES = (-200290, -200621, -200018)  # NI-DAQmx output buffer under-run errors
+
+
+def isUnderrun(error):
+    """ Returns whether error is a DAQ output buffer under-run. """
+    return getattr(error, 'error_code', None) in UNDERRUN_ERROR_CODES
+
+
+class SignalStream:
+    """ The signals of a scan as a sequence of chunks, so that the scan does
+    not have to be held in memory at once.
+
+    Every chunk has the layout of the signal dict of makeFullScan, i.e.
+    {'scanSignalsDict': {target: signal}, 'TTLCycleSignalsDict': {target:
+    signal}}, with signals of equal length. makeChunks is called to start a
+    new iteration over the chunks. """
+
+    def __init__(self, scanTargets, TTLTargets, numSamples, makeChunks, chunkSize=None):
+        self.scanTargets = list(scanTargets)
+        self.TTLTargets = list(TTLTargets)
+        self.numSamples = numSamples
+        self.chunkSize = chunkSize
+        self._makeChunks = makeChunks
+
+    def __iter__(self):
+        return iter(self._makeChunks())
+
+    @classmethod
+    def fromSignals(cls, signalDic, chunkSize=2**15):
+        """ Streams the signals of signalDic in chunks of chunkSize samples.
+        The chunks are views of the signals. """
+        scanDic, TTLDic = signalDic['scanSignalsDict'], signalDic['TTLCycleSignalsDict']
+        numSamples = _signalLength(scanDic, TTLDic)
+
+        def makeChunks():
+            for start in range(0, numSamples, chunkSize):
+                yield _sliceSignals(scanDic, TTLDic, start, start + chunkSize)
+
+        return cls(scanDic.keys(), TTLDic.keys(), numSamples, makeChunks, chunkSize)
+
+    @classmethod
+    def fromFrames(cls, frameSignalDic, numFrames, stepSignals=None, chunkSize=None):
+        """ Streams the signals of one frame numFrames times, e.g. for a
+        time series or for the steps of an outer scan axis. stepSignals maps
+        scan targets that stay constant during a frame to their value in every
+        frame. Frames are split into chunks of chunkSize samples, or streamed
+        whole if chunkSize is None; only one frame is held in memory. """
+        scanDic = dict(frameSignalDic['scanSignalsDict'])
+        TTLDic = frameSignalDic['TTLCycleSignalsDict']
+        stepSignals = {target: np.asarray(values, dtype=float)
+                       for target, values in (stepSignals or {}).items()}
+        for target, values in stepSignals.items():
+            if len(values) != numFrames:
+                raise ValueError(f'{len(values)} step values of {target} for {numFrames} frames')
+            scanDic.pop(target, None)
+        frameLength = _signalLength(scanDic, TTLDic)
+        frameChunkSize = chunkSize or frameLength
+
+        def makeChunks():
+            for frame in range(numFrames):
+                for start in range(0, frameLength, frameChunkSize):
+                    chunk = _sliceSignals(scanDic, TTLDic, start, start + frameChunkSize)
+                    length = min(frameChunkSize, frameLength - start)
+                    for target, values in stepSignals.items():
+                        chunk['scanSignalsDict'][target] = np.full(length, values[frame])
+                    yield chunk
+
+        return cls(list(scanDic.keys()) + list(stepSignals.keys()), TTLDic.keys(),
+                   numFrames * frameLength, makeChunks, frameChunkSize)
+
+
+class OutputStreamer:
+    """ Feeds the chunks of a SignalStream to DAQ output tasks.
+
+    outputs is a list of (task, signalsKey, targets, dtype): every chunk
+    of chunk[signalsKey] is stacked in the order of targets and written to
+    task. The tasks should share a sample clock; they are written to in turn,
+    and every write blocks until the task's buffer has room, so the stream
+    is generated just ahead of the output. prefill() writes the first chunks
+    before the tasks are started, start() writes the remaining ones on a
+    background thread. If a write fails, e.g. because a buffer ran empty,
+    streaming stops and onError(exception) is called. """
+
+    def __init__(self, stream, outputs, prefillChunks=2, timeout=10.0, onError=None,
+                 name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self.stream = stream
+        self.outputs = outputs
+        self.prefillChunks = prefillChunks
+        self.timeout = timeout
+        self.onError = onError
+        self.numChunks = 0
+        self.numSamples = 0
+        self.maxWriteTime = 0.0
+        self.error = None
+        self._chunks = iter(stream)
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def isUnderrun(self):
+        return self.error is not None and isUnderrun(self.error)
+
+    def prefill(self):
+        for _ in range(self.prefillChunks):
+            if not self._writeNext():
+                break
+
+    def start(self):
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='OutputStreamer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.timeout)
+
+    def getStatistics(self):
+        return {'chunks': self.numChunks, 'samples': self.numSamples,
+                'totalSamples': self.stream.numSamples, 'maxWriteTime': self.maxWriteTime,
+                'underrun': self.isUnderrun,
+                'error': None if self.error is None else str(self.error)}
+
+    def _writeNext(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            return False
+        start = time.perf_counter()
+        length = 0
+        for task, signalsKey, targets, dtype in self.outputs:
+            # squeezed like in NidaqManager.runScan, for single-channel tasks
+            data = np.array([chunk[signalsKey][target] for target in targets], dtype=dtype)
+            task.write(data.squeeze(), auto_start=False, timeout=self.timeout)
+            length = data.shape[-1]
+        self.maxWriteTime = max(self.maxWriteTime, time.perf_counter() - start)
+        self.numChunks += 1
+        self.numSamples += length
+        return True
+
+    def _run(self):
+        try:
+            while not self._stopEvent.is_set():
+                if not self._writeNext():
+                    return
+        except Exception as e:
+            if self._stopEvent.is_set():
+                return
+            self.error = e
+            if isUnderrun(e):
+                self.__logger.error(f'Output buffer under-run after {self.numSamples} samples')
+            else:
+                self.__logger.error(f'Streaming the scan signals failed: {e}')
+            if self.onError is not None:
+                self.onError(e)
+
+
+def _signalLength(scanDic, TTLDic):
+    lengths = {len(signal) for signal in list(scanDic.values()) + list(TTLDic.values())}
+    if len(lengths) != 1:
+        raise ValueError(f'Signals of different lengths: {sorted(lengths)}')
+    return lengths.pop()
+
+
+def _sliceSignals(scanDic, TTLDic, start, stop):
+    return {'scanSignalsDict': {target: signal[start:stop] for target, signal in scanDic.items()},
+            'TTLCycleSignalsDict': {target: signal[start:stop] for target, signal in TTLDic.items()}}
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,221 @@
+import threading
+import time
+
+from imswitch.imcommon.model import initLogger
+
+
+class SetpointCoalescer:
+    """ Rate-limits the setpoint commands of the channels that share one
+    device link.
+
+    A request for a channel is sent right away if no command was sent during
+    the last window seconds. Otherwise it is held back, and a later request for
+    the same channel replaces it, so a burst of changes (a slider drag, a
+    scripted ramp) results in at most one command per window, carrying the
+    latest value of every channel that changed. If sendMany is given, the
+    held-back values of several channels are sent with one call to it;
+    otherwise every channel is sent with its own command.
+
+    Channels are registered with addChannel, together with the function that
+    sends a value to them. The requested and the last applied value of every
+    channel are reported by getState. """
+
+    def __init__(self, send=None, sendMany=None, window=0.02, name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self.window = window
+        self._defaultSend = send
+        self._sendMany = sendMany
+        self._senders = {}
+        self._state = {}
+        self._pending = {}
+        self._busy = False
+        self._lastSend = -float('inf')
+        self._closed = False
+        self._statistics = {'requests': 0, 'coalesced': 0, 'commands': 0, 'errors': 0}
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='SetpointCoalescer', daemon=True)
+        self._thread.start()
+
+    def addChannel(self, channel, send=None):
+        """ Registers channel; send(value) applies a value to it. Without
+        send, the send function passed to the constructor is called as
+        send(channel, value). """
+        with self._condition:
+            self._senders[channel] = send
+            self._state.setdefault(channel, {'requested': None, 'applied': None,
+                                             'requestTime': None, 'applyTime': None,
+                                             'error': None})
+
+    def request(self, channel, value):
+        """ Requests value for channel. It is sent now or within the next
+        window, unless it is replaced by a newer request before. """
+        with self._condition:
+            state = self._getState(channel)
+            state['requested'] = value
+            state['requestTime'] = time.time()
+            self._statistics['requests'] += 1
+            sendNow = (self._closed or self.window <= 0 or
+                       (not self._busy and not self._pending and
+                        time.monotonic() - self._lastSend >= self.window))
+            if sendNow:
+                self._pending.pop(channel, None)
+                self._condition.wait_for(lambda: not self._busy)
+                self._busy = True
+                self._lastSend = time.monotonic()
+            else:
+                if channel in self._pending:
+                    self._statistics['coalesced'] += 1
+                self._pending[channel] = value
+                self._condition.notify_all()
+                return
+        try:
+            self._send({channel: value})
+        finally:
+            self._release()
+
+    def apply(self, channel, value, send=None):
+        """ Sends value to channel right away on the calling thread, replacing
+        any held-back request, and returns the result of the send function.
+        A different send function can be given for this call. """
+        with self._condition:
+            state = self._getState(channel)
+            state['requested'] = value
+            state['requestTime'] = time.time()
+            self._statistics['requests'] += 1
+            self._pending.pop(channel, None)
+            self._condition.wait_for(lambda: not self._busy)
+            self._busy = True
+            self._lastSend = time.monotonic()
+        try:
+            return self._sendOne(channel, value, send)
+        finally:
+            self._release()
+
+    def flush(self, timeout=1.0):
+        """ Waits until all held-back requests are sent. Returns False if that
+        takes longer than timeout seconds. """
+        with self._condition:
+            self._lastSend = -float('inf')
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._pending and not self._busy,
+                                            timeout)
+
+    def getState(self, channel=None):
+        """ Returns the requested and applied value of channel, the times they
+        were requested and applied, whether a request is still held back and
+        the error of the last failed send; for all channels if channel is
+        None. """
+        with self._condition:
+            if channel is not None:
+                return self._stateOf(channel)
+            return {channel: self._stateOf(channel) for channel in self._state}
+
+    def getStatistics(self):
+        """ Returns the number of requests, of requests replaced by a newer
+        one, of commands sent and of failed sends. """
+        with self._condition:
+            return dict(self._statistics)
+
+    def close(self):
+        """ Sends the held-back requests and stops the worker thread. Later
+        requests are sent directly. """
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _getState(self, channel):
+        if channel not in self._state:
+            self.addChannel(channel)
+        return self._state[channel]
+
+    def _stateOf(self, channel):
+        return {**self._state[channel], 'pending': channel in self._pending}
+
+    def _release(self):
+        with self._condition:
+            self._busy = False
+            self._lastSend = time.monotonic()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    if self._pending and not self._busy:
+                        wait = self._lastSend + self.window - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+                batch, self._pending = self._pending, {}
+                self._busy = True
+                self._lastSend = time.monotonic()
+            try:
+                self._send(batch)
+            finally:
+                self._release()
+
+    def _send(self, batch):
+        if len(batch) > 1 and self._sendMany is not None:
+            try:
+                self._sendMany(dict(batch))
+            except Exception as e:
+                self._failed(batch, e)
+            else:
+                self._applied(batch)
+            return
+        for channel, value in batch.items():
+            try:
+                self._sendOne(channel, value)
+            except Exception:
+                pass  # logged and kept in the state of the channel
+
+    def _sendOne(self, channel, value, send=None):
+        send = send or self._senders.get(channel)
+        try:
+            if send is not None:
+                result = send(value)
+            else:
+                result = self._defaultSend(channel, value)
+        except Exception as e:
+            self._failed({channel: value}, e)
+            raise
+        self._applied({channel: value})
+        return result
+
+    def _applied(self, batch):
+        now = time.time()
+        with self._condition:
+            self._statistics['commands'] += 1
+            for channel, value in batch.items():
+                state = self._state[channel]
+                state.update(applied=value, applyTime=now, error=None)
+
+    def _failed(self, batch, error):
+        self.__logger.error(f'Failed to apply setpoints {batch}: {error}')
+        with self._condition:
+            self._statistics['errors'] += 1
+            for channel in batch:
+                self._state[channel]['error'] = str(error)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
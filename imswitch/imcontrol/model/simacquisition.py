@@ -0,0 +1,254 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+class FrameGrabber:
+    """ Collects the frames of a free-running detector on a background thread
+    and keeps the last maxFrames of them with their frame ids and arrival
+    times.
+
+    getFrame() returns (frame, frameId) and should block until a new frame is
+    available; if it returns a frame id that was seen before, the grabber
+    waits and asks again, starting with idleTime and doubling the wait up to
+    maxIdleTime or an eighth of the frame period. A frame is assumed to be
+    exposed during the frame period before it arrived, minus readoutTime. """
+
+    def __init__(self, getFrame, maxFrames=64, idleTime=0.001, maxIdleTime=0.02,
+                 readoutTime=0.001):
+        self.__logger = initLogger(self)
+        self._getFrame = getFrame
+        self.idleTime = idleTime
+        self.maxIdleTime = maxIdleTime
+        self.readoutTime = readoutTime
+        self._frames = collections.deque(maxlen=maxFrames)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='FrameGrabber', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def latestFrameId(self):
+        with self._condition:
+            return self._frames[-1][0] if self._frames else None
+
+    def waitForStart(self, afterId, startedAfter, timeout=2.0):
+        """ Waits until a frame with an id above afterId has started exposing
+        after the time startedAfter, and returns its id. The frame may still
+        be exposing; it started when the frame before it arrived. """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                period = self._period()
+                previous = None
+                for frameId, arrival, _ in self._frames:
+                    if previous is not None and frameId == previous[0] + 1:
+                        start = previous[1] - self.readoutTime
+                    elif period is not None:
+                        start = arrival - period - self.readoutTime
+                    else:
+                        start = -float('inf')
+                    if frameId > afterId and start >= startedAfter:
+                        return frameId
+                    previous = (frameId, arrival)
+                if previous is not None and previous[1] - self.readoutTime >= startedAfter:
+                    return previous[0] + 1
+                if not self._waitLocked(deadline):
+                    raise TimeoutError(f'No frame started after {startedAfter:.3f}')
+
+    def waitForFrame(self, frameId, timeout=2.0):
+        """ Waits for frame frameId and returns it. Raises KeyError if it
+        dropped out of the buffer or was skipped by the detector. """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                if self._frames and self._frames[-1][0] >= frameId:
+                    for currentId, _, frame in self._frames:
+                        if currentId == frameId:
+                            return frame
+                    raise KeyError(f'Frame {frameId} is not in the buffer')
+                if not self._waitLocked(deadline):
+                    raise TimeoutError(f'Frame {frameId} did not arrive')
+
+    def _period(self):
+        if len(self._frames) < 2:
+            return None
+        arrivals = [arrival for _, arrival, _ in list(self._frames)[-16:]]
+        return float(np.median(np.diff(arrivals)))
+
+    def _waitLocked(self, deadline):
+        remaining = deadline - time.time()
+        if remaining <= 0 or not self._running:
+            return False
+        self._condition.wait(remaining)
+        return True
+
+    def _run(self):
+        lastId = None
+        idleTime = self.idleTime
+        while self._running:
+            try:
+                frame, frameId = self._getFrame()
+            except Exception:
+                self.__logger.exception('Failed to grab frame')
+                time.sleep(0.1)
+                continue
+            arrival = time.time()
+            if frame is None or (lastId is not None and frameId <= lastId):
+                time.sleep(idleTime)
+                with self._condition:
+                    period = self._period()
+                maxIdleTime = self.maxIdleTime if period is None else min(self.maxIdleTime,
+                                                                          period / 8)
+                idleTime = max(self.idleTime, min(2 * idleTime, maxIdleTime))
+                continue
+            lastId = frameId
+            idleTime = self.idleTime
+            with self._condition:
+                self._frames.append((frameId, arrival, frame))
+                self._condition.notify_all()
+
+
+def detectorFrameSource(detector):
+    """ Returns a getFrame function for a FrameGrabber that reads detector.
+    If the detector can't return frame numbers, its frames are numbered here
+    and a frame counts as new when it differs from the one before; frames
+    that the grabber did not see are then not noticed as skipped. """
+    if getattr(detector, 'supportsFrameNumbers', False):
+        return lambda: detector.getLatestFrame(returnFrameNumber=True)
+
+    lastFrame, lastId = None, -1
+
+    def getFrame():
+        nonlocal lastFrame, lastId
+        frame = detector.getLatestFrame()
+        if frame is not None and not (frame is lastFrame or np.array_equal(frame, lastFrame)):
+            lastFrame, lastId = frame, lastId + 1
+        return lastFrame, lastId
+
+    return getFrame
+
+
+class FrameSyncedSIMAcquisition:
+    """ Acquires raw SIM stacks from a free-running detector, choosing every
+    frame by its frame id instead of waiting a fixed time per pattern.
+
+    The frame of a pattern is the first frame that started exposing after the
+    pattern server confirmed the pattern, plus displayDelay. If triggered is
+    True, the pattern server applies a requested pattern at the next camera
+    trigger, so pattern N+1 is requested as soon as the frame of pattern N
+    has started and a stack takes one frame per pattern. Otherwise the
+    pattern is shown immediately and pattern N+1 is only requested once the
+    frame of pattern N has arrived.
+
+    displayPattern(index) sends a pattern and returns a Future that is done
+    when the pattern server has confirmed it. """
+
+    def __init__(self, displayPattern, grabber, numPatterns=9, triggered=False,
+                 displayDelay=0.0, timeout=2.0):
+        self.__logger = initLogger(self)
+        self._displayPattern = displayPattern
+        self._grabber = grabber
+        self.numPatterns = numPatterns
+        self.triggered = triggered
+        self.displayDelay = displayDelay
+        self.timeout = timeout
+        self._statistics = {'stacks': 0, 'cycleTime': 0.0, 'framesSkipped': 0,
+                            'patternLatency': 0.0}
+
+    def acquire(self, onFrame=None, keepFrames=True, isRunning=None):
+        """ Returns the raw stack (numPatterns, y, x) and the ids of its
+        frames. onFrame(index, frame, frameId) is called with every frame as
+        soon as it arrived; if keepFrames is False, the frames are not kept
+        and the stack is None. The acquisition ends early once isRunning()
+        returns False. """
+        start = time.time()
+        frames, frameIds = [], []
+        latency = 0.0
+
+        request = self._request(0)
+        previousId = self._grabber.latestFrameId
+        previousId = -1 if previousId is None else previousId
+        for index in range(self.numPatterns):
+            if isRunning is not None and not isRunning():
+                break
+            confirmed, requestLatency = self._confirm(request)
+            latency += requestLatency
+            frameId = self._grabber.waitForStart(previousId, confirmed + self.displayDelay,
+                                                 self.timeout)
+            if index + 1 < self.numPatterns and self.triggered:
+                request = self._request(index + 1)
+            frame = self._grabber.waitForFrame(frameId, self.timeout)
+            frameIds.append(frameId)
+            if keepFrames:
+                frames.append(frame)
+            if index + 1 < self.numPatterns and not self.triggered:
+                request = self._request(index + 1)
+            if onFrame is not None:
+                onFrame(index, frame, frameId)
+            previousId = frameId
+
+        if not frameIds:
+            return (np.array(frames) if keepFrames else None), frameIds
+        self._statistics['stacks'] += 1
+        self._statistics['cycleTime'] += time.time() - start
+        self._statistics['framesSkipped'] += frameIds[-1] - frameIds[0] + 1 - len(frameIds)
+        self._statistics['patternLatency'] += latency / len(frameIds)
+        return (np.array(frames) if keepFrames else None), frameIds
+
+    def getStatistics(self):
+        """ Returns the number of stacks, the average time per stack and per
+        pattern confirmation, and the number of frames that were not used. """
+        stacks = max(1, self._statistics['stacks'])
+        return {
+            'stacks': self._statistics['stacks'],
+            'framesSkipped': self._statistics['framesSkipped'],
+            'cycleTimeMs': self._statistics['cycleTime'] / stacks * 1e3,
+            'patternLatencyMs': self._statistics['patternLatency'] / stacks * 1e3
+        }
+
+    def _request(self, index):
+        sent = time.time()
+        confirmed = []
+        future = self._displayPattern(index)
+        future.add_done_callback(lambda _: confirmed.append(time.time()))
+        return sent, future, confirmed
+
+    def _confirm(self, request):
+        sent, future, confirmed = request
+        if future.result(self.timeout) == -1:
+            self.__logger.warning('Pattern server did not confirm the pattern')
+        confirmed = confirmed[0] if confirmed else time.time()
+        return confirmed, confirmed - sent
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
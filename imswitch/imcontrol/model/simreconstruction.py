@@ -0,0 +1,254 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from imswitch.imcommon.model import initLogger
+
+
+def estimateCarriers(stack, numAngles=3, numPhases=3, minFrequency=0.02):
+    """ Estimates the illumination pattern of a raw SIM stack of numAngles
+    times numPhases frames (angle-major). Returns an array (numAngles, 4)
+    holding the carrier frequency kx, ky in cycles per pixel, the pattern
+    phase at the image centre in radians and the modulation depth of every
+    angle.
+
+    The phase steps of an angle are combined so that only the +1 order band
+    is left, whose spectrum peaks at the carrier frequency; frequencies below
+    minFrequency are ignored. This takes one FFT per angle and is meant to
+    detect pattern drift, not to replace the calibration of the
+    reconstruction. """
+    stack = np.asarray(stack, dtype=np.float32)
+    height, width = stack.shape[-2:]
+    fy = np.fft.fftfreq(height)[:, None]
+    fx = np.fft.fftfreq(width)[None, :]
+    lowFrequencies = fx ** 2 + fy ** 2 < minFrequency ** 2
+    steps = np.exp(-2j * np.pi * np.arange(numPhases) / numPhases).astype(np.complex64)
+
+    y, x = np.mgrid[:height, :width]
+    y, x = y - height // 2, x - width // 2
+
+    carriers = np.zeros((numAngles, 4))
+    for angle in range(numAngles):
+        frames = stack[angle * numPhases:(angle + 1) * numPhases]
+        band = np.tensordot(steps, frames, axes=1)
+        magnitude = np.abs(np.fft.fft2(band))
+        magnitude[lowFrequencies] = 0
+        iy, ix = np.unravel_index(np.argmax(magnitude), magnitude.shape)
+
+        # parabolic sub-pixel refinement of the peak
+        def offset(minus, centre, plus):
+            denominator = minus - 2 * centre + plus
+            return 0.5 * (minus - plus) / denominator if denominator != 0 else 0.0
+
+        dy = offset(magnitude[iy - 1, ix], magnitude[iy, ix], magnitude[(iy + 1) % height, ix])
+        dx = offset(magnitude[iy, ix - 1], magnitude[iy, ix], magnitude[iy, (ix + 1) % width])
+        kx, ky = fx[0, ix] + dx / width, fy[iy, 0] + dy / height
+
+        # phase and modulation by demodulating at the refined frequency
+        carrier = np.vdot(np.exp(2j * np.pi * (kx * x + ky * y)), band)
+        dc = np.abs(frames.sum())
+        carriers[angle] = (kx, ky, np.angle(carrier), 2 * np.abs(carrier) / dc if dc > 0 else 0.0)
+    return carriers
+
+
+def carriersDrifted(reference, carriers, shape, maxFrequencyShift=1.0,
+                    maxPhaseShift=np.pi / 4, minModulationRatio=0.5):
+    """ Returns whether the pattern described by carriers (see
+    estimateCarriers) has drifted from reference on an image of the given
+    shape: a carrier moved by more than maxFrequencyShift frequency bins, a
+    phase by more than maxPhaseShift or a modulation dropped below
+    minModulationRatio times its reference. """
+    reference, carriers = np.asarray(reference), np.asarray(carriers)
+    if reference.shape != carriers.shape:
+        return True
+    height, width = shape[-2:]
+    shift = np.hypot((carriers[:, 0] - reference[:, 0]) * width,
+                     (carriers[:, 1] - reference[:, 1]) * height)
+    phaseShift = np.abs(np.angle(np.exp(1j * (carriers[:, 2] - reference[:, 2]))))
+    return bool(np.any(shift > maxFrequencyShift) or np.any(phaseShift > maxPhaseShift) or
+                np.any(carriers[:, 3] < minModulationRatio * reference[:, 3]))
+
+
+class SIMCalibrationStore:
+    """ Calibration parameters of the SIM reconstruction, kept in memory and
+    in one .npz file per key in dirPath, so that they survive a restart. A
+    calibration is a dict of arrays; scalar metadata is stored alongside as
+    JSON. """
+
+    def __init__(self, dirPath):
+        self.__logger = initLogger(self)
+        self.dirPath = dirPath
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def makeKey(method, wavelength, NA, magnification, pixelsize):
+        """ Returns the key of the calibration of a wavelength and objective. """
+        key = f'{method}_{float(wavelength):g}_NA{float(NA):g}_M{float(magnification):g}' \
+              f'_px{float(pixelsize):g}'
+        return re.sub(r'[^\w.-]', '_', key)
+
+    def filePath(self, key):
+        return os.path.join(self.dirPath, f'{key}.npz')
+
+    def load(self, key):
+        """ Returns the arrays and the metadata of the calibration key, or
+        (None, None) if there is none. """
+        with self._lock:
+            if key not in self._cache:
+                if not os.path.isfile(self.filePath(key)):
+                    return None, None
+                try:
+                    with np.load(self.filePath(key), allow_pickle=False) as npz:
+                        arrays = {name: npz[name] for name in npz.files if name != '__meta__'}
+                        metadata = json.loads(str(npz['__meta__']))
+                except Exception:
+                    self.__logger.exception(f'Failed to load SIM calibration {key}')
+                    return None, None
+                self._cache[key] = (arrays, metadata)
+            return self._cache[key]
+
+    def save(self, key, arrays, metadata=None):
+        metadata = {**(metadata or {}), 'time': time.time()}
+        arrays = {name: np.asarray(array) for name, array in arrays.items() if array is not None}
+        with self._lock:
+            self._cache[key] = (arrays, metadata)
+            try:
+                os.makedirs(self.dirPath, exist_ok=True)
+                np.savez(self.filePath(key), __meta__=np.array(json.dumps(metadata)), **arrays)
+            except Exception:
+                self.__logger.exception(f'Failed to save SIM calibration {key}')
+
+    def remove(self, key=None):
+        """ Forgets the calibration key, or all calibrations if key is None. """
+        with self._lock:
+            keys = [key] if key is not None else list(self._cache)
+            if key is None and os.path.isdir(self.dirPath):
+                keys += [name[:-4] for name in os.listdir(self.dirPath) if name.endswith('.npz')]
+            for k in set(keys):
+                self._cache.pop(k, None)
+                if os.path.isfile(self.filePath(k)):
+                    os.remove(self.filePath(k))
+
+
+class SIMReconstructionService:
+    """ Reconstructs SIM stacks on a pool of worker threads.
+
+    Stacks wait in a queue of at most maxQueued entries. When it is full,
+    submit blocks (or raises queue.Full if block is False), so a slow
+    reconstruction holds back the acquisition instead of losing stacks.
+    Every result is a float32 array of its own, which the receiver may keep;
+    it is only converted if the reconstruction returns another type. """
+
+    def __init__(self, numWorkers=2, maxQueued=4, name=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self.maxQueued = maxQueued
+        self._queue = queue.Queue(maxsize=maxQueued)
+        self._statistics = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                            'maxQueueLength': 0, 'blockedTime': 0.0, 'reconstructionTime': 0.0}
+        self._statisticsLock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'SIMReconstruction{i}', daemon=True)
+            for i in range(numWorkers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, reconstruct, stack, block=True, timeout=None):
+        """ Queues reconstruct(stack) and returns a Future of its float32
+        result. """
+        future = Future()
+        item = (reconstruct, stack, future)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if not block:
+                self._count('rejected')
+                raise
+            self.__logger.warning('SIM reconstruction queue is full, waiting for a free slot')
+            start = time.perf_counter()
+            try:
+                self._queue.put(item, timeout=timeout)
+            except queue.Full:
+                self._count('rejected')
+                raise
+            finally:
+                self._count('blockedTime', time.perf_counter() - start)
+        self._count('submitted')
+        with self._statisticsLock:
+            self._statistics['maxQueueLength'] = max(self._statistics['maxQueueLength'],
+                                                     self._queue.qsize())
+        return future
+
+    def getStatistics(self):
+        """ Returns the number of stacks submitted, reconstructed, failed and
+        rejected, the current and maximum queue length, the total time
+        submit was blocked and the average reconstruction time. """
+        with self._statisticsLock:
+            statistics = dict(self._statistics)
+        done = max(1, statistics['completed'] + statistics['failed'])
+        statistics['queueLength'] = self._queue.qsize()
+        statistics['meanReconstructionMs'] = statistics.pop('reconstructionTime') / done * 1e3
+        return statistics
+
+    def join(self):
+        """ Waits until all queued stacks are reconstructed. """
+        self._queue.join()
+
+    def close(self):
+        """ Reconstructs the queued stacks and stops the workers. """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _count(self, name, value=1):
+        with self._statisticsLock:
+            self._statistics[name] += value
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                reconstruct, stack, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = np.asarray(reconstruct(stack), dtype=np.float32)
+                except Exception as e:
+                    self.__logger.exception('SIM reconstruction failed')
+                    self._count('failed')
+                    future.set_exception(e)
+                else:
+                    self._count('completed')
+                    future.set_result(result)
+                finally:
+                    self._count('reconstructionTime', time.perf_counter() - start)
+            finally:
+                self._queue.task_done()
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
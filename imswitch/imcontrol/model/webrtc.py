@@ -0,0 +1,209 @@
+import asyncio
+import concurrent.futures
+import fractions
+import time
+
+import cv2
+import numpy as np
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from aiortc.stats import RTCRemoteInboundRtpStreamStats
+from av import VideoFrame
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+
+class StreamFrameScaler:
+    """ Converts camera frames to 8-bit video frames of at most maxWidth x
+    maxHeight pixels.
+
+    Frames are downsampled with area interpolation first, and the display
+    levels are then taken from the minimum and maximum of the small frame, so
+    12/16-bit data is scaled instead of truncated. Grayscale frames are
+    written straight into the luma plane of a reused yuv420p buffer whose
+    chroma planes stay neutral; colour frames are returned as rgb24. Buffers
+    are reused, so instances must not be shared between threads. """
+
+    def __init__(self, maxWidth=1280, maxHeight=720):
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self._yuvBuffer = None
+
+    def outputSize(self, width, height):
+        """ Returns the even (width, height) that frames of the given size are
+        scaled to. """
+        scale = min(1.0, self.maxWidth / width, self.maxHeight / height)
+        return (max(2, int(width * scale) // 2 * 2),
+                max(2, int(height * scale) // 2 * 2))
+
+    def __call__(self, frame):
+        """ Returns (array, format), ready for VideoFrame.from_ndarray. """
+        frame = np.asarray(frame)
+        height, width = frame.shape[:2]
+        outWidth, outHeight = self.outputSize(width, height)
+        if (outWidth, outHeight) != (width, height):
+            frame = cv2.resize(frame, (outWidth, outHeight), interpolation=cv2.INTER_AREA)
+
+        if frame.ndim == 3:
+            return self._toUint8(frame), 'rgb24'
+
+        if self._yuvBuffer is None or self._yuvBuffer.shape != (outHeight * 3 // 2, outWidth):
+            self._yuvBuffer = np.full((outHeight * 3 // 2, outWidth), 128, dtype=np.uint8)
+        self._toUint8(frame, out=self._yuvBuffer[:outHeight])
+        return self._yuvBuffer, 'yuv420p'
+
+    @staticmethod
+    def _toUint8(frame, out=None):
+        if frame.dtype == np.uint8:
+            if out is None:
+                return frame
+            np.copyto(out, frame)
+            return out
+
+        if frame.ndim == 2:
+            low, high, _, _ = cv2.minMaxLoc(frame)
+        else:
+            low, high = float(frame.min()), float(frame.max())
+        alpha = 255 / (high - low) if high > low else 0.0
+        if out is None:
+            return cv2.convertScaleAbs(frame, alpha=alpha, beta=-low * alpha)
+        cv2.convertScaleAbs(frame, dst=out, alpha=alpha, beta=-low * alpha)
+        return out
+
+
+class DetectorVideoTrack(MediaStreamTrack):
+    """ Video track that streams the latest frames of a detector.
+
+    Frames are paced to the target frame rate, and grabbing, scaling and
+    colour conversion run on a worker thread so that the asyncio loop only
+    hands finished frames to the encoder. The output size is reduced when the
+    receiver reports packet loss and raised again once the link recovers;
+    the encoder bitrate itself follows the receiver's REMB estimates. """
+
+    kind = 'video'
+
+    def __init__(self, grabFrame, fps=15, maxWidth=1280, maxHeight=720):
+        super().__init__()
+        self._grabFrame = grabFrame
+        self._scaler = StreamFrameScaler(maxWidth, maxHeight)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='DetectorVideoTrack'
+        )
+
+        self.fps = fps
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self.scale = 1.0
+        self.minScale = 0.25
+
+        self._start = None
+        self._timestamp = 0
+        self._lastSize = (maxWidth // 2 * 2, maxHeight // 2 * 2)
+        self._numFrames = 0
+        self._processingTime = 0.0
+
+    def setTarget(self, fps=None, maxWidth=None, maxHeight=None):
+        """ Sets the frame rate and maximum size requested by the client. """
+        if fps:
+            self.fps = fps
+        if maxWidth:
+            self.maxWidth = maxWidth
+        if maxHeight:
+            self.maxHeight = maxHeight
+
+    def adapt(self, fractionLost):
+        """ Adapts the output size to the fraction of packets (0-1) the
+        receiver reported lost. """
+        if fractionLost > 0.1:
+            self.scale = max(self.minScale, self.scale * 0.75)
+        elif fractionLost < 0.02:
+            self.scale = min(1.0, self.scale * 1.1)
+
+    def getStatistics(self):
+        return {
+            'framesSent': self._numFrames,
+            'processingMs': (self._processingTime / self._numFrames * 1e3
+                             if self._numFrames > 0 else None),
+            'fps': self.fps,
+            'scale': self.scale,
+            'size': self._lastSize
+        }
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+
+        if self._start is None:
+            self._start = time.time()
+        else:
+            self._timestamp += int(VIDEO_CLOCK_RATE / self.fps)
+            wait = self._start + self._timestamp / VIDEO_CLOCK_RATE - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            else:
+                # Fell behind, restart the schedule instead of bursting
+                self._start -= wait
+
+        loop = asyncio.get_running_loop()
+        array, format = await loop.run_in_executor(self._executor, self._produce)
+        frame = VideoFrame.from_ndarray(array, format=format)
+        frame.pts = self._timestamp
+        frame.time_base = VIDEO_TIME_BASE
+        return frame
+
+    def stop(self):
+        super().stop()
+        self._executor.shutdown(wait=False)
+
+    def _produce(self):
+        start = time.perf_counter()
+        self._scaler.maxWidth = max(2, int(self.maxWidth * self.scale))
+        self._scaler.maxHeight = max(2, int(self.maxHeight * self.scale))
+
+        frame = self._grabFrame()
+        if frame is None:
+            width, height = self._lastSize
+            blank = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+            blank[:height] = 0
+            result = blank, 'yuv420p'
+        else:
+            result = self._scaler(frame)
+            height, width = result[0].shape[:2]
+            if result[1] == 'yuv420p':
+                height = height * 2 // 3
+            self._lastSize = (width, height)
+
+        self._numFrames += 1
+        self._processingTime += time.perf_counter() - start
+        return result
+
+
+async def adaptToReceiverReports(sender, track, interval=1.0):
+    """ Periodically feeds the packet loss from the RTCP receiver reports of
+    sender to track, until the track ends. The reported loss fraction is in
+    units of 1/256. """
+    while track.readyState == 'live':
+        await asyncio.sleep(interval)
+        stats = await sender.getStats()
+        for report in stats.values():
+            if isinstance(report, RTCRemoteInboundRtpStreamStats):
+                track.adapt(report.fractionLost / 256)
+                break
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -1,8 +1,9 @@
 import numpy as np
+from napari.utils.transforms import Affine
 from qtpy import QtWidgets
 
 from imswitch.imcommon.model import shortcut
-from imswitch.imcommon.view.guitools import naparitools
+from imswitch.imcommon.view.guitools import displayRegion, naparitools
 
 
 class ImageWidget(QtWidgets.QWidget):
@@ -19,6 +20,8 @@ class ImageWidget(QtWidgets.QWidget):
         self.NapariResetViewWidget = naparitools.NapariResetViewWidget.addToViewer(self.napariViewer, 'right')
         self.NapariShiftWidget = naparitools.NapariShiftWidget.addToViewer(self.napariViewer)
         self.imgLayers = {}
+        self.liveImages = {}
+        self.levelOfDetail = True
 
         self.viewCtrlLayout = QtWidgets.QVBoxLayout()
         self.viewCtrlLayout.addWidget(self.napariViewer.get_widget())
@@ -32,6 +35,10 @@ class ImageWidget(QtWidgets.QWidget):
         self.crosshair.hide()
         self.addItem(self.crosshair)
 
+        # Redraw the live layers at the new level of detail when the view changes
+        self.napariViewer.camera.events.zoom.connect(self._viewChanged)
+        self.napariViewer.camera.events.center.connect(self._viewChanged)
+
     def setLiveViewLayers(self, names, isRGB = [False]):
         for name, img in self.imgLayers.items():
             if name not in names:
@@ -75,14 +82,49 @@ class ImageWidget(QtWidgets.QWidget):
         return self.napariViewer.active_layer.name
 
     def getImage(self, name):
+        if name in self.liveImages:
+            return self.liveImages[name][0]
         return self.imgLayers[name].data
 
     def setImage(self, name, im, scale):
-        self.imgLayers[name].data = np.squeeze(im)        
-        self.imgLayers[name].scale = tuple(scale)
+        """ Shows a new live frame. Unless levelOfDetail is disabled, only the
+        visible part of the frame is passed to napari, subsampled to about the
+        screen resolution. """
+        self.liveImages[name] = (np.squeeze(im), tuple(scale))
+        self._drawLiveImage(name)
 
     def clearImage(self, name):
-        self.setImage(name, np.zeros((1, 1)))
+        self.setImage(name, np.zeros((1, 1)), (1, 1))
+
+    def _drawLiveImage(self, name):
+        im, scale = self.liveImages[name]
+        layer = self.imgLayers[name]
+        if not self.levelOfDetail or len(scale) != 2:
+            layer.data = im
+            layer.scale = scale
+            self._setDetailOffset(layer, (0,) * layer.ndim)
+            return
+
+        # The layer translate belongs to the user (e.g. the shift widget), the
+        # offset of the drawn region is added on top of it with the affine
+        canvasHeight, canvasWidth = self.napariViewer.window._qt_viewer.canvas.size
+        viewCenter = np.subtract(self.napariViewer.camera.center[-2:], layer.translate[-2:])
+        rowStart, rowStop, colStart, colStop, step = displayRegion(
+            im.shape, scale, viewCenter, (canvasHeight, canvasWidth),
+            self.napariViewer.camera.zoom
+        )
+        layer.data = im[rowStart:rowStop:step, colStart:colStop:step]
+        layer.scale = (scale[0] * step, scale[1] * step)
+        self._setDetailOffset(layer, (rowStart * scale[0], colStart * scale[1]))
+
+    @staticmethod
+    def _setDetailOffset(layer, offset):
+        if not np.array_equal(layer.affine.translate, offset):
+            layer.affine = Affine(translate=offset)
+
+    def _viewChanged(self, event=None):
+        for name in self.liveImages:
+            self._drawLiveImage(name)
 
     def getImageDisplayLevels(self, name):
         return self.imgLayers[name].contrast_limits
@@ -107,6 +149,12 @@ class ImageWidget(QtWidgets.QWidget):
         self.crosshair.setVisible(visible)
 
     def resetView(self):
+        # Fit the view to the full frames, not to the currently drawn region
+        for name in self.liveImages:
+            im, scale = self.liveImages[name]
+            layer = self.imgLayers[name]
+            layer.data, layer.scale = im, scale
+            self._setDetailOffset(layer, (0,) * layer.ndim)
         self.napariViewer.reset_view()
 
     def addItem(self, item):
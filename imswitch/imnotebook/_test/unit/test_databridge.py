@@ -0,0 +1,115 @@
+import io
+import subprocess
+import sys
+import textwrap
+
+import h5py
+import numpy as np
+import pytest
+
+from imswitch.imcommon.model import VFileItem
+from imswitch.imnotebook.model.databridge import DataBridge, connect
+from imswitch.imnotebook.model.sharedmemory import SharedFrameRing
+
+
+@pytest.fixture
+def bridge(tmp_path):
+    bridge = DataBridge(str(tmp_path / 'databridge.json'), numSlots=4)
+    yield bridge
+    bridge.close()
+
+
+def test_ring_drops_frames_instead_of_overwriting_unread_ones():
+    ring = SharedFrameRing.create((2, 3), np.uint16, numSlots=4)
+    reader = SharedFrameRing.attach(ring.description)
+    try:
+        accepted = [ring.put(np.full((2, 3), i)) for i in range(5)]
+        assert accepted == [True, True, True, False, False] and ring.numDropped == 2
+
+        frame, frameNumber, _ = reader.get(timeout=0)
+        assert frameNumber == 0 and not frame.flags.writeable
+        assert ring.put(np.full((2, 3), 5))  # the reader made room for one frame
+        assert not ring.put(np.full((2, 3), 6))
+        assert np.all(frame == 0)  # the frame being looked at is not overwritten
+
+        frame, frameNumber, _ = reader.latest(timeout=0)
+        assert frameNumber == 3 and np.all(frame == 5)
+        assert reader.get(timeout=0.01) is None
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_ring_without_reader_keeps_the_newest_frames():
+    ring = SharedFrameRing.create((4,), np.float32, numSlots=2)
+    try:
+        assert all(ring.put(np.full(4, i)) for i in range(10))
+        reader = SharedFrameRing.attach(ring.description)
+        assert reader.latest(timeout=0.01) is None  # attaching skips earlier frames
+        ring.put(np.full(4, 10))
+        assert reader.latest(timeout=0)[0][0] == 10
+        reader.close()
+        assert all(ring.put(np.full(4, i)) for i in range(5))  # reader detached
+    finally:
+        ring.close()
+
+
+def test_frames_are_only_copied_while_a_notebook_reads(bridge):
+    bridge.publishFrame('Camera', np.zeros((8, 8), dtype=np.uint8))
+    ring = bridge._rings['Camera']
+    for i in range(3):
+        bridge.publishFrame('Camera', np.full((8, 8), i, dtype=np.uint8))
+    assert ring.numWritten == 0
+
+    with connect(bridge.manifestPath) as client:
+        reader = client.frames('Camera')
+        bridge.publishFrame('Camera', np.full((8, 8), 7, dtype=np.uint8))
+        frame, frameNumber, _ = reader.latest(timeout=1)
+        assert frameNumber == 4 and np.all(frame == 7)
+    bridge.publishFrame('Camera', np.zeros((8, 8), dtype=np.uint8))
+    assert ring.numWritten == 1
+
+
+def test_notebook_process_reads_frames_without_copying(bridge):
+    bridge.publishFrame('Camera', np.zeros((64, 64), dtype=np.uint16), False, [1, 1], True)
+    script = textwrap.dedent(f'''
+        from imswitch.imnotebook.model.databridge import connect
+        bridge = connect({bridge.manifestPath!r})
+        ring = bridge.frames('Camera')
+        print('ready', flush=True)
+        frame, frameNumber, _ = ring.get(timeout=10)
+        print(frame.base is not None, frame.sum(), frameNumber, flush=True)
+        bridge.close()
+    ''')
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == 'ready'
+        bridge.publishFrame('Camera', np.ones((64, 64), dtype=np.uint16), False, [1, 1], True)
+        assert process.stdout.readline().split() == ['True', str(64 * 64), '1']
+    finally:
+        process.wait(10)
+
+    # the frames are still shared after the notebook process exited
+    with connect(bridge.manifestPath) as client:
+        ring = client.frames('Camera')
+        bridge.publishFrame('Camera', np.full((64, 64), 2, dtype=np.uint16))
+        assert ring.latest(timeout=1)[0][0, 0] == 2
+
+
+def test_memory_recordings_are_shared_within_limit(bridge):
+    data = np.arange(60, dtype=np.uint16).reshape(3, 4, 5)
+    buffer = io.BytesIO()
+    with h5py.File(buffer, 'w') as file:
+        file.create_dataset('Camera/data', data=data)
+
+    bridge.shareRecording('rec.hdf5', VFileItem(data=buffer, filePath='rec.hdf5',
+                                                savedToDisk=False))
+    with connect(bridge.manifestPath) as client:
+        assert client.recordings() == ['rec.hdf5']
+        np.testing.assert_array_equal(client.recording('rec.hdf5')['Camera/data'], data)
+
+    bridge.removeRecording('rec.hdf5')
+    bridge.maxBytes = bridge.numBytes + 100
+    bridge.shareRecording('rec.hdf5', VFileItem(data=buffer, filePath='rec.hdf5',
+                                                savedToDisk=False))
+    assert connect(bridge.manifestPath).recordings() == []
@@ -1,6 +1,8 @@
 from imswitch.imcommon.controller import MainController
+from imswitch.imcommon.framework import FrameworkUtils
 from imswitch.imcommon.model import generateAPI, pythontools, APIExport
 from imswitch.imscripting.model import getActionsScope
+from ..model.databridge import DataBridge
 from .CommunicationChannel import CommunicationChannel
 from .ImScrMainViewController import ImScrMainViewController
 from .basecontrollers import ImScrWidgetControllerFactory
@@ -33,6 +35,17 @@ class ImScrMainController(MainController):
         # Connect signals from ModuleCommunicationChannel
         self.__moduleCommChannel.sigRunScript.connect(self.__commChannel.sigRunScript)
 
+        # Share live frames and memory recordings with notebooks
+        self.__dataBridge = DataBridge()
+        if 'imcontrol' in moduleMainControllers:
+            # Copy frames on the thread that emits them
+            imconCommChannel = moduleMainControllers['imcontrol'].commChannel
+            FrameworkUtils.connectDirect(imconCommChannel.sigUpdateImage,
+                                         self.__dataBridge.publishFrame)
+        memoryRecordings = self.__moduleCommChannel.memoryRecordings
+        memoryRecordings.sigDataSet.connect(self.__dataBridge.shareRecording)
+        memoryRecordings.sigDataRemoved.connect(self.__dataBridge.removeRecording)
+
 
         # create jupyter notebook controller
         #self._startJupyterNotebook()
@@ -62,6 +75,7 @@ class ImScrMainController(MainController):
         return self.__scriptScope
     
     def closeEvent(self):
+        self.__dataBridge.close()
         self.__factory.closeAllCreatedControllers()
 
 
@@ -1,11 +1,11 @@
 import importlib.util
 import logging
 import os
-import time
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
-from imswitch.imcommon.framework import Signal, FrameworkUtils
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import APIExport, generateAPI, initLogger
+from imswitch.imscripting.model.scheduler import signalFuture
 
 
 class _Actions:
@@ -54,24 +54,18 @@ class _Actions:
     def getWaitForSignal(self, signal: Signal,
                          pollIntervalSeconds: float = 1.0) -> Callable[[], None]:
         """ Returns a function that will wait for the specified signal to emit.
-        The returned function will continuously check whether the signal has
-        been emitted since its creation. The polling interval defaults to one
-        second, and can be customized. """
-
-        emitted = False
-
-        def setEmitted():
-            nonlocal emitted
-            emitted = True
-
-        signal.connect(setEmitted)
-
-        def wait():
-            while not emitted:
-                FrameworkUtils.processPendingEventsCurrThread()
-                time.sleep(pollIntervalSeconds)
-
-            signal.disconnect(setEmitted)
+        The returned function returns as soon as the signal has been emitted
+        since its creation, and takes an optional timeout in seconds after
+        which TimeoutError is raised. pollIntervalSeconds is no longer used,
+        and is only kept for existing scripts. """
+
+        future = signalFuture(signal)
+
+        def wait(timeout: Optional[float] = None):
+            try:
+                future.result(timeout)
+            finally:
+                future.cancel()
 
         return wait
 
@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+from io import IOBase
+
+import h5py
+import numpy as np
+
+from imswitch.imcommon.model import dirtools, initLogger
+from .sharedmemory import SharedArray, SharedFrameRing
+
+
+MANIFEST_ENV = 'IMSWITCH_DATABRIDGE'
+
+
+def getDefaultManifestPath():
+    return os.path.join(dirtools.UserFileDirs.Root, 'imnotebook', 'databridge.json')
+
+
+class DataBridge:
+    """ Shares live data of ImSwitch with notebooks through shared memory.
+
+    The frames of every detector go to a SharedFrameRing, created on the
+    first frame (and again when the frame shape or dtype changes), and the
+    datasets of memory recordings are copied to SharedArrays. Frames are
+    only copied to a ring while a notebook reads from it, so the bridge
+    costs nothing per frame as long as no notebook is attached. What is shared
+    is listed in a JSON manifest, whose path is also set in the environment
+    variable IMSWITCH_DATABRIDGE for notebook servers started afterwards.
+    Shared memory is limited to maxBytes; what does not fit is not shared.
+    """
+
+    def __init__(self, manifestPath=None, numSlots=4, maxBytes=2**31):
+        self.__logger = initLogger(self)
+        self.manifestPath = manifestPath or getDefaultManifestPath()
+        self.numSlots = numSlots
+        self.maxBytes = maxBytes
+        self._rings = {}
+        self._recordings = {}
+        self._frameNumbers = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._writeManifest()
+        os.environ[MANIFEST_ENV] = self.manifestPath
+
+    @property
+    def numBytes(self):
+        """ The size of the shared memory in use. """
+        with self._lock:
+            return self._numBytes()
+
+    def publishFrame(self, detectorName, image, *_args):
+        """ Puts image into the frame ring of detectorName. Takes the
+        arguments of sigUpdateImage, and can be connected to it directly so
+        that frames are copied on the thread that emits them. Frames are
+        counted but not copied while no reader is attached. """
+        image = np.asarray(image)
+        with self._lock:
+            if self._closed:
+                return
+            if detectorName in self._rings and self._rings[detectorName] is None:
+                return  # too large to share
+            frameNumber = self._frameNumbers.get(detectorName, -1) + 1
+            self._frameNumbers[detectorName] = frameNumber
+            ring = self._rings.get(detectorName)
+            if ring is None or ring.shape != image.shape or ring.dtype != image.dtype:
+                if ring is not None:
+                    del self._rings[detectorName]
+                    ring.close()
+                ring = self._createRing(detectorName, image)
+                if ring is None:
+                    return
+            if ring.hasReader:
+                ring.put(image, frameNumber)
+
+    def shareRecording(self, name, vFileItem):
+        """ Copies the datasets of the memory recording name, a VFileItem of
+        an HDF5 file, to shared memory. Can be connected to the sigDataSet
+        signal of the memory recordings. """
+        data = vFileItem.data
+        if not isinstance(data, (IOBase, h5py.File)):
+            return
+        file = h5py.File(data, 'r') if isinstance(data, IOBase) else data
+        try:
+            datasets = {}
+            file.visititems(lambda key, item: datasets.__setitem__(key, item)
+                            if isinstance(item, h5py.Dataset) else None)
+
+            with self._lock:
+                if self._closed:
+                    return
+                self._removeRecording(name)
+                size = sum(dataset.nbytes for dataset in datasets.values())
+                if self._numBytes() + size > self.maxBytes:
+                    self.__logger.warning(f'Recording "{name}" ({size} bytes) does not fit in'
+                                          f' the shared memory limit, not sharing it')
+                    return
+                self._recordings[name] = {key: SharedArray.create(dataset[()])
+                                          for key, dataset in datasets.items()}
+                self._writeManifest()
+        finally:
+            if file is not data:
+                file.close()
+
+    def removeRecording(self, name):
+        """ Stops sharing the recording name. """
+        with self._lock:
+            if self._removeRecording(name):
+                self._writeManifest()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for ring in self._rings.values():
+                if ring is not None:
+                    ring.close()
+            for name in list(self._recordings):
+                self._removeRecording(name)
+            self._rings = {}
+            try:
+                os.remove(self.manifestPath)
+            except OSError:
+                pass
+        if os.environ.get(MANIFEST_ENV) == self.manifestPath:
+            del os.environ[MANIFEST_ENV]
+
+    def _createRing(self, detectorName, image):
+        size = SharedFrameRing._size(image.shape, image.dtype, self.numSlots)
+        if self._numBytes() + size > self.maxBytes:
+            self.__logger.warning(f'Frames of {detectorName} do not fit in the shared memory'
+                                  f' limit, not sharing them')
+            self._rings[detectorName] = None  # don't retry on every frame
+            return None
+        ring = SharedFrameRing.create(image.shape, image.dtype, self.numSlots)
+        self._rings[detectorName] = ring
+        self._writeManifest()
+        return ring
+
+    def _removeRecording(self, name):
+        arrays = self._recordings.pop(name, None)
+        if arrays is None:
+            return False
+        for array in arrays.values():
+            array.close()
+        return True
+
+    def _numBytes(self):
+        return (sum(ring.shm.size for ring in self._rings.values() if ring is not None)
+                + sum(array.shm.size for arrays in self._recordings.values()
+                      for array in arrays.values()))
+
+    def _writeManifest(self):
+        manifest = {
+            'pid': os.getpid(),
+            'frames': {name: ring.description for name, ring in self._rings.items()
+                       if ring is not None},
+            'recordings': {name: {key: array.description for key, array in arrays.items()}
+                           for name, arrays in self._recordings.items()}
+        }
+        os.makedirs(os.path.dirname(self.manifestPath), exist_ok=True)
+        temporaryPath = f'{self.manifestPath}.tmp'
+        with open(temporaryPath, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(temporaryPath, self.manifestPath)  # readers never see a partial manifest
+
+
+class DataBridgeClient:
+    """ Notebook side of a DataBridge, see connect(). """
+
+    def __init__(self, manifestPath):
+        self.manifestPath = manifestPath
+        self._rings = {}
+        self._recordings = {}
+
+    @property
+    def manifest(self):
+        with open(self.manifestPath) as file:
+            return json.load(file)
+
+    def detectors(self):
+        """ Returns the names of the detectors whose frames are shared. """
+        return list(self.manifest['frames'])
+
+    def recordings(self):
+        """ Returns the names of the shared memory recordings. """
+        return list(self.manifest['recordings'])
+
+    def frames(self, detectorName):
+        """ Returns the SharedFrameRing of detectorName, for reading frames
+        with get() or latest(). """
+        description = self.manifest['frames'][detectorName]
+        ring = self._rings.get(detectorName)
+        if ring is None or ring.name != description['name']:
+            if ring is not None:
+                ring.close()  # the frame shape changed
+            ring = self._rings[detectorName] = SharedFrameRing.attach(description)
+        return ring
+
+    def latestFrame(self, detectorName, timeout=None):
+        """ Returns a view of the newest frame of detectorName, waiting up to
+        timeout seconds for a new one. """
+        result = self.frames(detectorName).latest(timeout)
+        return None if result is None else result[0]
+
+    def recording(self, name):
+        """ Returns the datasets of the memory recording name, as a dict of
+        read-only arrays in shared memory. """
+        if name not in self._recordings:
+            descriptions = self.manifest['recordings'][name]
+            self._recordings[name] = {key: SharedArray.attach(description)
+                                      for key, description in descriptions.items()}
+        return {key: array.array for key, array in self._recordings[name].items()}
+
+    def close(self):
+        for ring in self._rings.values():
+            ring.close()
+        for arrays in self._recordings.values():
+            for array in arrays.values():
+                array.close()
+        self._rings = {}
+        self._recordings = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+def connect(manifestPath=None):
+    """ Connects a notebook to the data of a running ImSwitch instance, e.g.:
+
+        from imswitch.imnotebook.model.databridge import connect
+        bridge = connect()
+        frame = bridge.latestFrame(bridge.detectors()[0])
+
+    manifestPath defaults to the one of the ImSwitch instance that started
+    the notebook server. """
+    manifestPath = manifestPath or os.environ.get(MANIFEST_ENV) or getDefaultManifestPath()
+    if not os.path.exists(manifestPath):
+        raise FileNotFoundError(f'No ImSwitch data bridge at {manifestPath}')
+    return DataBridgeClient(manifestPath)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
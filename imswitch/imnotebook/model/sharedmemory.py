@@ -0,0 +1,259 @@
+import os
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import psutil
+
+
+_MAGIC = 0x494d5357  # "IMSW"
+_HEADER_FIELDS = 8  # magic, numSlots, writeCount, readCount, dropped, readerPid, -, -
+_WRITE_COUNT, _READ_COUNT, _DROPPED, _READER_PID = 2, 3, 4, 5
+_SLOT_FIELDS = 2  # frameNumber, timestamp (ns)
+_ALIGNMENT = 64
+
+
+def attachSharedMemory(name):
+    """ Opens the existing shared memory block name without taking over its
+    lifetime, which stays with the process that created it. """
+    try:
+        return SharedMemory(name, track=False)  # Python >= 3.13
+    except TypeError:
+        shm = SharedMemory(name)
+        if os.name == 'posix':
+            # The resource tracker would otherwise unlink the block when this
+            # process exits, while the creator still uses it
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def closeSharedMemory(shm, unlink=False):
+    """ Closes shm, unlinking it first if unlink is True. If views of it are
+    still in use, the mapping stays until they are garbage collected. """
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+class SharedArray:
+    """ A NumPy array in a shared memory block. create() copies an array
+    into a new block, attach() maps it in another process without copying.
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def description(self):
+        """ What attach() needs, as a JSON-serialisable dict. """
+        return {'name': self.name, 'shape': list(self.array.shape),
+                'dtype': self.array.dtype.str}
+
+    @classmethod
+    def create(cls, array):
+        array = np.asarray(array)
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype, owner=True)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, description):
+        shared = cls(attachSharedMemory(description['name']), tuple(description['shape']),
+                     np.dtype(description['dtype']), owner=False)
+        shared.array.flags.writeable = False
+        return shared
+
+    def close(self):
+        self.array = None
+        closeSharedMemory(self.shm, unlink=self.owner)
+
+
+class SharedFrameRing:
+    """ A ring of numSlots frames in shared memory, written by one process
+    and read by (at most) one other, without copying on the reading side.
+
+    The writer never blocks: put() copies a frame into the next free slot,
+    or drops it and counts it in numDropped when the reader has fallen
+    behind by numSlots - 1 frames. That is the back-pressure of the ring;
+    what a reader has not read, or still looks at, is never overwritten.
+    While no reader is attached, the oldest frames are overwritten.
+
+    A reader gets frames with get() (the next unread frame) or latest() (the
+    newest, skipping the others) as read-only views into the ring. A view
+    stays valid until the next call of get() or latest(); copy it to keep
+    it longer. Waiting readers poll the counters of the ring, as there is no
+    signalling between the processes. """
+
+    def __init__(self, shm, shape, dtype, numSlots, owner):
+        self.shm = shm
+        self.owner = owner
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.numSlots = numSlots
+        headerSize = (_HEADER_FIELDS + _SLOT_FIELDS * numSlots) * 8
+        dataOffset = -(-headerSize // _ALIGNMENT) * _ALIGNMENT
+        self._header = np.ndarray(_HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        self._slotInfo = np.ndarray((numSlots, _SLOT_FIELDS), dtype=np.int64, buffer=shm.buf,
+                                    offset=_HEADER_FIELDS * 8)
+        self._slots = np.ndarray((numSlots,) + self.shape, dtype=self.dtype, buffer=shm.buf,
+                                 offset=dataOffset)
+        self._attached = False
+
+    @staticmethod
+    def _size(shape, dtype, numSlots):
+        headerSize = (_HEADER_FIELDS + _SLOT_FIELDS * numSlots) * 8
+        dataOffset = -(-headerSize // _ALIGNMENT) * _ALIGNMENT
+        return dataOffset + numSlots * int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    @classmethod
+    def create(cls, shape, dtype, numSlots=4):
+        """ Creates a ring for frames of the given shape and dtype. """
+        if numSlots < 2:
+            raise ValueError('A frame ring needs at least 2 slots')
+        shm = SharedMemory(create=True, size=cls._size(shape, dtype, numSlots))
+        ring = cls(shm, shape, dtype, numSlots, owner=True)
+        ring._header[:] = 0
+        ring._header[1] = numSlots
+        ring._header[0] = _MAGIC
+        return ring
+
+    @classmethod
+    def attach(cls, description):
+        """ Opens the ring of description as its reader. Frames written
+        before are skipped. """
+        shm = attachSharedMemory(description['name'])
+        ring = cls(shm, description['shape'], description['dtype'], description['numSlots'],
+                   owner=False)
+        if ring._header[0] != _MAGIC or ring._header[1] != ring.numSlots:
+            closeSharedMemory(shm)
+            raise ValueError(f'{description["name"]} is not a frame ring')
+        ring._slots.flags.writeable = False
+        ring._header[_READ_COUNT] = ring._header[_WRITE_COUNT]
+        ring._header[_READER_PID] = os.getpid()
+        ring._attached = True
+        return ring
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def description(self):
+        """ What attach() needs, as a JSON-serialisable dict. """
+        return {'name': self.name, 'shape': list(self.shape), 'dtype': self.dtype.str,
+                'numSlots': self.numSlots}
+
+    @property
+    def numWritten(self):
+        return int(self._header[_WRITE_COUNT])
+
+    @property
+    def numDropped(self):
+        return int(self._header[_DROPPED])
+
+    @property
+    def hasReader(self):
+        """ Whether a reader is attached. A reader that exited without
+        detaching counts until put() notices it is gone. """
+        return self._header[_READER_PID] != 0
+
+    @property
+    def numAvailable(self):
+        """ The number of frames the reader has not read yet. """
+        return int(self._header[_WRITE_COUNT] - self._header[_READ_COUNT])
+
+    def put(self, frame, frameNumber=None):
+        """ Writes frame to the ring. Returns False if it was dropped because
+        the reader is behind. """
+        writeCount = int(self._header[_WRITE_COUNT])
+        readerPid = int(self._header[_READER_PID])
+        if readerPid != 0:
+            # the slot of the frame before readCount is held by the reader
+            if writeCount - int(self._header[_READ_COUNT]) >= self.numSlots - 1:
+                if psutil.pid_exists(readerPid):
+                    self._header[_DROPPED] += 1
+                    return False
+                self._header[_READER_PID] = 0  # the reader is gone without detaching
+
+        slot = writeCount % self.numSlots
+        self._slots[slot] = frame
+        self._slotInfo[slot] = (writeCount if frameNumber is None else frameNumber,
+                                time.time_ns())
+        self._header[_WRITE_COUNT] = writeCount + 1  # publishes the frame
+        return True
+
+    def get(self, timeout=None, pollInterval=0.001):
+        """ Returns (frame, frameNumber, timestamp) of the next unread frame,
+        waiting up to timeout seconds (forever if None) for it to be
+        written. Returns None on timeout. """
+        readCount = int(self._header[_READ_COUNT])
+        if not self._waitFor(lambda: self._header[_WRITE_COUNT] > readCount, timeout,
+                             pollInterval):
+            return None
+        result = self._frame(readCount)
+        self._header[_READ_COUNT] = readCount + 1  # releases the previous frame
+        return result
+
+    def latest(self, timeout=None, pollInterval=0.001):
+        """ Returns (frame, frameNumber, timestamp) of the newest frame and
+        marks all frames as read, waiting up to timeout seconds for a frame
+        if none was written since the last call. Returns None on timeout. """
+        if not self._waitFor(lambda: self._header[_WRITE_COUNT] > self._header[_READ_COUNT],
+                             timeout, pollInterval):
+            return None
+        writeCount = int(self._header[_WRITE_COUNT])
+        self._header[_READ_COUNT] = writeCount  # holds the newest frame, releases the others
+        return self._frame(writeCount - 1)
+
+    def close(self):
+        """ Detaches the reader, or removes the ring if this is its writer.
+        """
+        if self._attached and self._header[_READER_PID] == os.getpid():
+            self._header[_READER_PID] = 0
+        self._header = self._slotInfo = self._slots = None
+        closeSharedMemory(self.shm, unlink=self.owner)
+
+    def _frame(self, index):
+        slot = index % self.numSlots
+        frameNumber, timestamp = self._slotInfo[slot]
+        return self._slots[slot], int(frameNumber), int(timestamp)
+
+    @staticmethod
+    def _waitFor(condition, timeout, pollInterval):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not condition():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(pollInterval)
+        return True
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imscripting.model.actions import getActionsScope
+from imswitch.imscripting.model.scheduler import Scheduler, runAsync, signalFuture
+
+
+class Device(SignalInterface):
+    sigDone = Signal(int)
+
+    def finishLater(self, value, delay=0.05):
+        threading.Timer(delay, self.sigDone.emit, args=(value,)).start()
+
+
+@pytest.fixture
+def actions():
+    return getActionsScope({})
+
+
+def test_signal_future_resolves_from_another_thread_without_event_loop():
+    device = Device()
+    future = signalFuture(device.sigDone, condition=lambda value: value > 1)
+    device.sigDone.emit(1)  # does not fulfil the condition
+    device.finishLater(2)
+    assert future.result(timeout=1) == 2
+
+    device.sigDone.emit(3)  # disconnected once done
+    assert future.result() == 2
+
+
+def test_wait_for_signal_and_start_action(actions):
+    device = Device()
+    wait = actions['getWaitForSignal'](device.sigDone)
+    device.finishLater(1)
+    start = time.perf_counter()
+    wait(timeout=1)
+    assert time.perf_counter() - start < 0.5
+
+    with pytest.raises(TimeoutError):
+        actions['getWaitForSignal'](device.sigDone)(timeout=0.01)
+
+    # an action that finishes at once is not missed
+    future = actions['startAction'](device.sigDone, device.sigDone.emit, 5)
+    assert future.done() and future.result() == 5
+
+
+def test_branches_overlap(actions):
+    device = Device()
+    steps = []
+
+    def record():
+        recording = actions['startAction'](device.sigDone, device.finishLater, 7, delay=0.2)
+        steps.append('recording started')
+        value = yield recording
+        steps.append('recording ended')
+        return value
+
+    def move():
+        position = yield runAsync(lambda: time.sleep(0.1) or 10)
+        steps.append('moved')
+        yield 0.05
+        return position
+
+    start = time.perf_counter()
+    assert actions['runConcurrently'](record, move(), runAsync(lambda: 3)) == [7, 10, 3]
+    assert time.perf_counter() - start < 0.3  # instead of 0.35 one after the other
+    assert steps == ['recording started', 'moved', 'recording ended']
+
+
+def test_scheduler_reports_errors_and_timeouts():
+    def failing():
+        yield 0.01
+        raise ValueError('failed')
+
+    def waitingForError():
+        with pytest.raises(ZeroDivisionError):
+            yield runAsync(lambda: 1 / 0)
+        return 'handled'
+
+    scheduler = Scheduler()
+    handled = scheduler.spawn(waitingForError)
+    scheduler.spawn(failing)
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert handled.result() == 'handled'
+
+    closed = []
+
+    def endless():
+        try:
+            while True:
+                yield 1
+        finally:
+            closed.append(True)
+
+    scheduler = Scheduler()
+    scheduler.spawn(endless)
+    with pytest.raises(TimeoutError):
+        scheduler.run(timeout=0.05)
+    assert closed == [True]
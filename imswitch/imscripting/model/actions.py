@@ -1,11 +1,12 @@
 import importlib.util
 import logging
 import os
-import time
-from typing import Any, Callable
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, List, Optional
 
-from imswitch.imcommon.framework import Signal, FrameworkUtils
+from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import APIExport, generateAPI, initLogger
+from .scheduler import Scheduler, gatherFutures, runAsync, signalFuture, startAction
 
 
 class _Actions:
@@ -54,26 +55,65 @@ class _Actions:
     def getWaitForSignal(self, signal: Signal,
                          pollIntervalSeconds: float = 1.0) -> Callable[[], None]:
         """ Returns a function that will wait for the specified signal to emit.
-        The returned function will continuously check whether the signal has
-        been emitted since its creation. The polling interval defaults to one
-        second, and can be customized. """
+        The returned function returns as soon as the signal has been emitted
+        since its creation, and takes an optional timeout in seconds after
+        which TimeoutError is raised. pollIntervalSeconds is no longer used,
+        and is only kept for existing scripts. """
 
-        emitted = False
+        future = signalFuture(signal)
 
-        def setEmitted():
-            nonlocal emitted
-            emitted = True
+        def wait(timeout: Optional[float] = None):
+            try:
+                future.result(timeout)
+            finally:
+                future.cancel()
 
-        signal.connect(setEmitted)
+        return wait
 
-        def wait():
-            while not emitted:
-                FrameworkUtils.processPendingEventsCurrThread()
-                time.sleep(pollIntervalSeconds)
+    @APIExport()
+    def getSignalFuture(self, signal: Signal,
+                        condition: Optional[Callable[..., bool]] = None) -> Future:
+        """ Returns a future that is resolved by the next emission of the
+        specified signal (for which condition(*args) is true, if a condition
+        is given). Its result is the argument of the signal, a tuple of the
+        arguments if there are several, or None. """
+        return signalFuture(signal, condition)
 
-            signal.disconnect(setEmitted)
+    @APIExport()
+    def startAction(self, doneSignal: Signal, action: Callable, *args, **kwargs) -> Future:
+        """ Calls action with the given arguments, e.g.
+        api.imcontrol.startRecording, and returns a future that is resolved
+        when doneSignal is emitted afterwards. The signal is connected before
+        the action is started, so it cannot be missed. """
+        return startAction(doneSignal, action, *args, **kwargs)
 
-        return wait
+    @APIExport()
+    def runAsync(self, func: Callable, *args, **kwargs) -> Future:
+        """ Calls func with the given arguments on a background thread and
+        returns a future of its return value. """
+        return runAsync(func, *args, **kwargs)
+
+    @APIExport()
+    def waitForAll(self, futures: Iterable[Future],
+                   timeout: Optional[float] = None) -> List[Any]:
+        """ Waits until all of the specified futures are done and returns
+        their results. Raises the first exception of any of them, or
+        TimeoutError after timeout seconds. """
+        return gatherFutures(futures).result(timeout)
+
+    @APIExport()
+    def runConcurrently(self, *branches, timeout: Optional[float] = None) -> List[Any]:
+        """ Runs the specified branches of the script concurrently and returns
+        their return values once all of them are done. A branch is a
+        generator (or a function returning one) that yields a future, a list
+        of futures or a number of seconds whenever it has to wait; the other
+        branches run in the meantime, and the branch is resumed with the
+        result of what it waited for. Futures can also be passed as branches.
+        After timeout seconds, TimeoutError is raised. """
+        scheduler = Scheduler()
+        for branch in branches:
+            scheduler.spawn(branch)
+        return scheduler.run(timeout)
 
 
 def getActionsScope(otherScope, scriptPath=None):
@@ -0,0 +1,262 @@
+import heapq
+import inspect
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from imswitch.imcommon.framework import FrameworkUtils
+
+
+_executor = None
+_executorLock = threading.Lock()
+
+
+def runAsync(func, *args, **kwargs):
+    """ Calls func(*args, **kwargs) on a shared pool of worker threads and
+    returns a Future of its result. """
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ScriptAction')
+    return _executor.submit(func, *args, **kwargs)
+
+
+def signalFuture(signal, condition=None):
+    """ Returns a Future that is resolved by the next emission of signal for
+    which condition(*args) is true (any emission if condition is None).
+
+    The result is None for a signal without arguments, the argument for a
+    signal with one, and a tuple of the arguments otherwise. The signal is
+    connected directly, so the future is resolved in the emitting thread
+    without waiting for an event loop, and it is disconnected again once the
+    future is done or cancelled. """
+    future = Future()
+    lock = threading.Lock()
+
+    def emitted(*args):
+        if condition is not None and not condition(*args):
+            return
+        with lock:
+            if future.done():
+                return
+            future.set_result(None if not args else args[0] if len(args) == 1 else args)
+
+    def disconnect(_):
+        try:
+            signal.disconnect(emitted)
+        except (TypeError, RuntimeError):
+            pass  # already disconnected, or the signal's object is gone
+
+    FrameworkUtils.connectDirect(signal, emitted)
+    future.add_done_callback(disconnect)
+    return future
+
+
+def startAction(doneSignal, action, *args, condition=None, **kwargs):
+    """ Calls action(*args, **kwargs) and returns a Future that is resolved
+    when doneSignal is emitted afterwards. The signal is connected before
+    the action is started, so a quick action cannot be missed. If the action
+    raises, the signal is disconnected and the exception is raised. """
+    future = signalFuture(doneSignal, condition)
+    try:
+        action(*args, **kwargs)
+    except Exception:
+        future.cancel()
+        raise
+    return future
+
+
+def gatherFutures(futures):
+    """ Returns a Future of the list of results of futures. It fails with
+    the first exception of any of them. """
+    futures = list(futures)
+    gathered = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(future):
+        with lock:
+            if gathered.done():
+                return
+            if future.cancelled():
+                gathered.set_exception(RuntimeError('A gathered future was cancelled'))
+                return
+            if future.exception() is not None:
+                gathered.set_exception(future.exception())
+                return
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                gathered.set_result([f.result() for f in futures])
+
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return gathered
+
+
+class _Branch:
+    def __init__(self, generator, index):
+        self.generator = generator
+        self.index = index
+        self.future = Future()
+        self.awaiting = None
+
+
+class Scheduler:
+    """ Runs generator branches of a script cooperatively on one thread.
+
+    A branch runs until it yields what it waits for, and is resumed once
+    that is done, while the other branches go on in the meantime:
+
+     - a Future (e.g. from runAsync, startAction or signalFuture): the
+       branch is resumed with its result, or its exception is raised there
+     - a list or tuple of futures: resumed with the list of results
+     - a number: resumed after that many seconds
+     - None: resumed after the branches that are ready to run
+
+    The waiting thread sleeps on a condition that completed futures and
+    deadlines wake up, so there is no polling. Branches run until they
+    return; run() returns their return values in order of spawning. """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._completed = deque()  # (branch, future) whose future is done
+        self._ready = deque()  # (branch, value, exception)
+        self._sleeping = []  # heap of (deadline, counter, branch)
+        self._counter = itertools.count()
+        self._branches = []
+        self._numRunning = 0
+
+    def spawn(self, branch):
+        """ Adds a branch: a generator, a function returning one, or a
+        Future to wait for. Returns a Future of the branch's return value.
+        """
+        if callable(branch):
+            branch = branch()
+        if isinstance(branch, Future):
+            branch = self._waitFor(branch)
+        if not inspect.isgenerator(branch):
+            raise TypeError(f'A branch must be a generator or a future, not {type(branch)}')
+
+        branch = _Branch(branch, len(self._branches))
+        self._branches.append(branch)
+        self._numRunning += 1
+        self._ready.append((branch, None, None))
+        return branch.future
+
+    def run(self, timeout=None):
+        """ Runs the branches until all of them returned, and returns their
+        return values. If a branch raised, the others still run to the end
+        and the first exception is raised afterwards. After timeout seconds,
+        the unfinished branches are closed and TimeoutError is raised. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._numRunning > 0:
+            while self._ready:
+                self._step(*self._ready.popleft())
+            if self._numRunning == 0:
+                break
+
+            with self._condition:
+                now = time.monotonic()
+                wakeUp = self._sleeping[0][0] if self._sleeping else None
+                if deadline is not None:
+                    if now >= deadline:
+                        self._closeAll()
+                        raise TimeoutError(f'Branches still running after {timeout} s')
+                    wakeUp = deadline if wakeUp is None else min(wakeUp, deadline)
+                if not self._completed and (wakeUp is None or wakeUp > now):
+                    self._condition.wait(None if wakeUp is None else wakeUp - now)
+                while self._completed:
+                    branch, future = self._completed.popleft()
+                    try:
+                        self._ready.append((branch, future.result(), None))
+                    except BaseException as e:
+                        self._ready.append((branch, None, e))
+
+            now = time.monotonic()
+            while self._sleeping and self._sleeping[0][0] <= now:
+                self._ready.append((heapq.heappop(self._sleeping)[2], None, None))
+
+        for branch in self._branches:
+            if branch.future.exception() is not None:
+                raise branch.future.exception()
+        return [branch.future.result() for branch in self._branches]
+
+    def _step(self, branch, value, exception):
+        branch.awaiting = None
+        try:
+            if exception is not None:
+                awaited = branch.generator.throw(exception)
+            else:
+                awaited = branch.generator.send(value)
+        except StopIteration as e:
+            self._finish(branch, result=e.value)
+            return
+        except Exception as e:
+            self._finish(branch, exception=e)
+            return
+
+        if awaited is None:
+            self._ready.append((branch, None, None))
+        elif isinstance(awaited, (int, float)):
+            deadline = time.monotonic() + max(0.0, awaited)
+            heapq.heappush(self._sleeping, (deadline, next(self._counter), branch))
+        elif isinstance(awaited, (list, tuple)):
+            self._await(branch, gatherFutures(awaited))
+        elif isinstance(awaited, Future):
+            self._await(branch, awaited)
+        else:
+            self._ready.append((branch, None, TypeError(
+                f'Branches can yield futures, lists of futures, seconds or None,'
+                f' not {type(awaited)}'
+            )))
+
+    def _await(self, branch, future):
+        branch.awaiting = future
+
+        def done(_):
+            with self._condition:
+                self._completed.append((branch, future))
+                self._condition.notify()
+
+        future.add_done_callback(done)
+
+    def _finish(self, branch, result=None, exception=None):
+        self._numRunning -= 1
+        if exception is not None:
+            branch.future.set_exception(exception)
+        else:
+            branch.future.set_result(result)
+
+    def _closeAll(self):
+        for branch in self._branches:
+            if not branch.future.done():
+                if branch.awaiting is not None:
+                    branch.awaiting.cancel()  # disconnects signal futures
+                branch.generator.close()
+                branch.future.cancel()
+        self._numRunning = 0
+
+    @staticmethod
+    def _waitFor(future):
+        return (yield future)
+
+
+# Copyright (C) 2020-2023 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.